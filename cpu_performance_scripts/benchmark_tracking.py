@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""
+benchmark_tracking.py: "Offline benchmarks of the cpu.txt readers and the tracker."
+
+A synthetic cpu.txt (see generate_cpu_txt.py) is written to a temporary
+folder and the following are measured, each in its own process so that its
+peak memory (RSS) can be reported:
+    legacy_event      cost of one event with the original handler, which
+                      re-read the whole file and parsed its last 35 lines
+    tail_event        cost of one event with CPUTailReader (one new step)
+    full_parse        CPUTailReader throughput over the whole file
+    backfill          parsing the whole file into a ProgressStore
+    store_load        loading every column of that store
+    latency           time from a step being completely written to it being
+                      available in the tracker (CPUHandler.snapshot)
+
+Usage: benchmark_tracking.py [options]
+
+Options:
+    -h, --help                  Show this screen
+    --size=<size>               Size of the synthetic cpu.txt [default: 200M]
+    --timers=<set>              Timer set: full or minimal [default: full]
+    --events=<n>                Number of events timed for the per-event benchmarks [default: 20]
+    --latency_steps=<n>         Number of streamed steps for the latency benchmark [default: 50]
+    --rate=<steps_per_sec>      Streaming rate for the latency benchmark [default: 10]
+    --backend=<backend>         Tracker backend for the latency benchmark: inotify or poll [default: inotify]
+    --debounce=<sec>            Tracker debounce window for the latency benchmark [default: 0.05]
+    --tmp_dir=<dir>             Where to create the temporary folder (default: system temp)
+    --json=<file>               Also save the results as JSON
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import resource
+import contextlib
+import multiprocessing
+import numpy as np
+from docopt import docopt
+from watchdog.observers import Observer
+from generate_cpu_txt import CPUTxtGenerator, TIMER_SETS, parse_size, write_cpu_txt, stream_cpu_txt
+from track_job import CPUTailReader, CPUHandler, backfill_store
+from progress_store import ProgressStore
+
+
+def legacy_read_event(path):
+    # Per-event work of the original CPUHandler.on_modified
+    with open(path, 'r') as f:
+        lines = f.readlines()[-35:]
+        data = {}
+        for line in lines:
+            if "Step" in line:
+                data['Simulation Time'] = float(line.split(',')[1].split()[1])
+            else:
+                parts = line.strip().split()
+                if len(parts) > 1:
+                    data[parts[0]] = parts[1]
+    return data
+
+def bench_legacy_event(path, timers, events):
+    generator = CPUTxtGenerator(TIMER_SETS[timers], seed=1)
+    times = []
+    for _ in range(events):
+        write_cpu_txt(path, steps=1, generator=generator)
+        start = time.perf_counter()
+        legacy_read_event(path)
+        times.append(time.perf_counter() - start)
+    return {'median_s': float(np.median(times)), 'max_s': float(np.max(times))}
+
+def bench_tail_event(path, timers, events):
+    generator = CPUTxtGenerator(TIMER_SETS[timers], seed=2)
+    reader = CPUTailReader(path)
+    reader.seek_end()
+    times = []
+    for _ in range(events):
+        write_cpu_txt(path, steps=1, generator=generator)
+        start = time.perf_counter()
+        reader.read_new()
+        times.append(time.perf_counter() - start)
+    return {'median_s': float(np.median(times)), 'max_s': float(np.max(times))}
+
+def bench_full_parse(path):
+    size = os.path.getsize(path)
+    reader = CPUTailReader(path)
+    steps = 0
+    start = time.perf_counter()
+    while True:
+        blocks = reader.read_new(max_bytes=64 << 20)
+        if not blocks:
+            break
+        steps += len(blocks)
+    elapsed = time.perf_counter() - start
+    return {'seconds': elapsed, 'steps': steps, 'MB_per_s': size / elapsed / 1e6, 'steps_per_s': steps / elapsed}
+
+def bench_backfill(path, store_dir):
+    shutil.rmtree(store_dir, ignore_errors=True)
+    store = ProgressStore(store_dir)
+    start = time.perf_counter()
+    backfill_store(CPUTailReader(path), store)
+    elapsed = time.perf_counter() - start
+    return {'seconds': elapsed, 'steps': store.num_rows, 'steps_per_s': store.num_rows / elapsed}
+
+def bench_store_load(store_dir):
+    start = time.perf_counter()
+    store = ProgressStore(store_dir, create=False)
+    columns = store.load_columns()
+    # Touch the data so memory-mapped columns are actually read
+    checksum = sum(float(np.nansum(values)) for values in columns.values())
+    elapsed = time.perf_counter() - start
+    return {'seconds': elapsed, 'columns': len(columns), 'rows': store.num_rows, 'checksum': checksum}
+
+def bench_latency(tmp_dir, timers, steps, rate, backend, debounce):
+    out_dir = os.path.join(tmp_dir, "latency") + "/"
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    cpu_txt = os.path.join(out_dir, "cpu.txt")
+    open(cpu_txt, 'w').close()
+    handler = CPUHandler(os.path.join(out_dir, "progress.csv"), cpu_txt, debounce=debounce, flush_rows=1000)
+    observer = Observer()
+    if backend == "poll":
+        handler.enable_polling(0.01, 1.0)
+    else:
+        observer.schedule(handler, path=out_dir, recursive=False)
+    observer.start()
+
+    written = {}
+    writer = threading.Thread(target=stream_cpu_txt, args=(cpu_txt, steps, rate),
+                              kwargs={'generator': CPUTxtGenerator(TIMER_SETS[timers], seed=3),
+                                      'on_step': lambda step, t: written.__setitem__(step, t)})
+    # Silence the per-step print of the handler
+    devnull = open(os.devnull, 'w')
+    latencies = []
+    seen = -1
+    with contextlib.redirect_stdout(devnull):
+        writer.start()
+        deadline = time.time() + steps / rate + 30
+        while seen < steps - 1 and time.time() < deadline:
+            if handler.poll_interval is not None:
+                handler.check_file()
+            handler.poll()
+            snapshot = handler.snapshot
+            if snapshot is not None and snapshot['step'] > seen:
+                now = time.time()
+                for step in range(seen + 1, snapshot['step'] + 1):
+                    if step in written:
+                        latencies.append(now - written[step])
+                seen = snapshot['step']
+            time.sleep(0.002)
+        writer.join()
+    observer.stop()
+    observer.join()
+    devnull.close()
+    if not latencies:
+        return {'steps_seen': 0}
+    return {'steps_seen': len(latencies), 'median_s': float(np.median(latencies)),
+            'p95_s': float(np.percentile(latencies, 95)), 'max_s': float(np.max(latencies))}
+
+def _run_child(queue, function, arguments):
+    result = function(*arguments)
+    result['peak_rss_MB'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    queue.put(result)
+
+def run_isolated(function, *arguments):
+    """
+    Run a benchmark in a child process and return its results plus its peak RSS.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_child, args=(queue, function, arguments))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    tmp_dir = tempfile.mkdtemp(prefix="cpu_txt_bench_", dir=args['--tmp_dir'])
+    cpu_txt = os.path.join(tmp_dir, "cpu.txt")
+    store_dir = os.path.join(tmp_dir, "progress_store")
+    events = int(args['--events'])
+    timers = args['--timers']
+
+    try:
+        size = parse_size(args['--size'])
+        print(f"Writing {size / 1e6:.0f} MB synthetic cpu.txt to {tmp_dir}...")
+        start = time.perf_counter()
+        steps = write_cpu_txt(cpu_txt, size=size, generator=CPUTxtGenerator(TIMER_SETS[timers]))
+        print(f"{steps} steps written in {time.perf_counter() - start:.1f} s\n")
+
+        results = {
+            'legacy_event': run_isolated(bench_legacy_event, cpu_txt, timers, events),
+            'tail_event': run_isolated(bench_tail_event, cpu_txt, timers, events),
+            'full_parse': run_isolated(bench_full_parse, cpu_txt),
+            'backfill': run_isolated(bench_backfill, cpu_txt, store_dir),
+            'store_load': run_isolated(bench_store_load, store_dir),
+            'latency': run_isolated(bench_latency, tmp_dir, timers, int(args['--latency_steps']),
+                                    float(args['--rate']), args['--backend'], float(args['--debounce'])),
+        }
+        results['file'] = {'bytes': os.path.getsize(cpu_txt), 'timers': timers}
+
+        for name, result in results.items():
+            values = ", ".join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                               for key, value in result.items())
+            print(f"{name:<14} {values}")
+        if args['--json']:
+            with open(args['--json'], 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+cpu_index.py: "Random access into cpu.txt by step or simulation time range."
+
+The progress store kept by track_job.py holds the byte offset of every "Step"
+block in cpu.txt (the "Offset" column), so a query only seeks to and parses
+the blocks it asks for. Steps written after the store's last flush are found
+by reading cpu.txt from the store's recorded position onwards. Stores created
+before offsets were recorded have no usable offsets; rebuild them with
+"track_job.py --backfill" into an empty store folder.
+
+Usage: cpu_index.py [options]
+
+Options:
+    -h, --help                  Show this screen
+    --out_dir=<output>          Path to the output folder [default: ../output/]
+    --steps=<first:last>        Range of step numbers (either end may be left out)
+    --times=<start:end>         Range of simulation times (either end may be left out)
+    --columns=<columns>         Comma separated columns to print (default: Step, Simulation Time and all timers)
+    --csv=<file>                Write the selected steps to a CSV file instead of printing them
+"""
+
+import os
+import csv
+import numpy as np
+from docopt import docopt
+from progress_store import ProgressStore
+from track_job import CPUTailReader, parse_step_block, BACKFILL_BATCH_BYTES
+
+
+def parse_range(text, convert=float):
+    """
+    Parse "a:b", "a:" or ":b" into (a, b) with None for an open end.
+    """
+    if text is None:
+        return None
+    low, _, high = text.partition(':')
+    return (convert(low) if low.strip() else None, convert(high) if high.strip() else None)
+
+def _matches(value, value_range):
+    if value_range is None:
+        return True
+    low, high = value_range
+    return (low is None or value >= low) and (high is None or value <= high)
+
+def _in_range(values, value_range):
+    selection = np.ones(len(values), dtype=bool)
+    if value_range is not None:
+        low, high = value_range
+        if low is not None:
+            selection &= values >= low
+        if high is not None:
+            selection &= values <= high
+    return selection
+
+def _read_blocks(f, start, end):
+    # Parse the blocks between two byte offsets
+    f.seek(start)
+    position = start
+    block_start = start
+    block = []
+    blocks = []
+    for raw in f.read(end - start).split(b"\n"):
+        line = raw.decode('ascii', errors='replace').rstrip()
+        if line.startswith("Step"):
+            if block:
+                blocks.append(_finish(block, block_start))
+            block = [line]
+            block_start = position
+        elif not line.strip():
+            if block:
+                blocks.append(_finish(block, block_start))
+            block = []
+        elif block:
+            block.append(line)
+        position += len(raw) + 1
+    if block:
+        blocks.append(_finish(block, block_start))
+    return blocks
+
+def _finish(block, offset):
+    data = parse_step_block(block, detail=True)
+    data['Offset'] = offset
+    return data
+
+def query_steps(out_dir, step_range=None, time_range=None, store_dir=None):
+    """
+    Parse the cpu.txt blocks whose step number and simulation time fall in the
+    given ranges, with every column of every timer (see track_job.parse_step_block).
+
+    Inputs:
+        out_dir: Output folder of the run
+        step_range: (first, last) step numbers, either may be None
+        time_range: (start, end) simulation times, either may be None
+        store_dir: Progress store location (default: <out_dir>/progress_store/)
+    Returns:
+        List of step dictionaries in file order
+    """
+    cpu_txt_path = os.path.join(out_dir, 'cpu.txt')
+    if store_dir is None:
+        store_dir = os.path.join(out_dir, 'progress_store')
+    store = ProgressStore(store_dir, create=False)
+    steps = store.load('Step')
+    times = store.load('Simulation Time')
+    offsets = store.load('Offset')
+    source = store.source_state
+
+    usable = source is not None and source['inode'] == os.stat(cpu_txt_path).st_ino and \
+        (len(offsets) == 0 or offsets.min() >= 0)
+    if not usable:
+        print("The progress store has no usable offsets for this cpu.txt, scanning the whole file")
+        indexed = np.zeros(0, dtype=np.int64)
+    else:
+        indexed = np.nonzero(_in_range(steps, step_range) & _in_range(times, time_range))[0]
+
+    results = []
+    with open(cpu_txt_path, 'rb') as f:
+        # Contiguous runs of selected rows are read in one go
+        if len(indexed):
+            breaks = np.nonzero(np.diff(indexed) != 1)[0] + 1
+            for run in np.split(indexed, breaks):
+                start = int(offsets[run[0]])
+                # Up to the next stored block, or to where the store's last flush ended
+                end = int(offsets[run[-1] + 1]) if run[-1] + 1 < len(offsets) else source['offset']
+                blocks = _read_blocks(f, start, end)[:len(run)] if end > start else []
+                if not blocks or blocks[0]['Step'] != steps[run[0]]:
+                    print("The progress store does not match cpu.txt, scanning the whole file")
+                    usable = False
+                    results = []
+                    break
+                results.extend(blocks)
+
+    # Steps not covered by the store (or everything if it is unusable)
+    reader = CPUTailReader(cpu_txt_path, detail=True)
+    if usable:
+        reader.resume(source)
+    while True:
+        blocks = reader.read_new(max_bytes=BACKFILL_BATCH_BYTES)
+        if not blocks:
+            break
+        for data in blocks:
+            if _matches(data['Step'], step_range) and _matches(data['Simulation Time'], time_range):
+                results.append(data)
+    return results
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    out_dir = args['--out_dir']
+    if out_dir[-1] != "/":
+        out_dir += "/"
+    step_range = parse_range(args['--steps'], int)
+    time_range = parse_range(args['--times'], float)
+    blocks = query_steps(out_dir, step_range, time_range)
+    if not blocks:
+        print("No steps found")
+        exit(0)
+
+    if args['--columns']:
+        columns = args['--columns'].split(',')
+    else:
+        columns = [key for key in blocks[0] if not key.endswith((" %", " cumulative")) and key != 'Offset']
+
+    if args['--csv']:
+        with open(args['--csv'], 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(blocks)
+        print(f"{len(blocks)} steps written to {args['--csv']}")
+    else:
+        print("  ".join(columns))
+        for data in blocks:
+            print("  ".join(str(data.get(column, "")) for column in columns))
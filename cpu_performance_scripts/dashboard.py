@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+"""
+dashboard.py: "Live terminal dashboard and static HTML export of the progress of one or more runs."
+
+Four panels per run: simulation time against wall time, the cost per step
+of the main timers, and the step rate and simulation time rate (per compute
+hour, over blocks of steps). The history comes from the tracker's
+progress store, read one chunk at a time, and the steps written to cpu.txt
+after the store's last flush are followed incrementally. Each series is
+reduced on the fly to at most --buckets min/max buckets (the bucket width
+doubles as the run grows), and every panel is drawn from at most --points
+points picked from those by largest-triangle-three-buckets, so drawing costs
+the same whatever the length of the run.
+
+Usage: dashboard.py [options] [<out_dirs>...]
+
+Options:
+    -h, --help                  Show this screen
+    --out_dir=<output>          Path to the output folder [default: ../output/]
+    --store_dir=<store>         Path to the progress store [default: <out_dir>/progress_store/]
+    --html=<file>               Write a static HTML dashboard to this file instead of opening the terminal one
+    --interval=<sec>            Refresh every this many seconds (with --html, keep rewriting the file) [default: 5]
+    --once                      With --html, write the file once and exit
+    --timers=<n>                Number of timers in the cost panel [default: 6]
+    --points=<n>                Points per drawn series [default: 1000]
+    --buckets=<n>               Min/max buckets kept per series [default: 2000]
+    --rate_block=<steps>        Number of steps per point of the step rate panel [default: 100]
+"""
+
+import os
+import time
+import html
+import numpy as np
+from docopt import docopt
+from progress_store import ProgressStore
+from track_job import CPUTailReader, read_timer_tree, resolve_output_dirs, get_run_name, get_timer_names, \
+    get_store_dir, BACKFILL_BATCH_BYTES
+
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22',
+          '#17becf']
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-triangle-three-buckets downsampling: keep the first and last
+    points and, from every one of n_out - 2 buckets in between, the point
+    forming the largest triangle with the previously kept point and the mean
+    of the next bucket.
+
+    Returns:
+        (x, y) with at most n_out points
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area)) if end > start else start
+        keep[i + 1] = previous
+    return x[keep], y[keep]
+
+
+class StreamingMinMax:
+    """
+    Running min/max reduction of a series that only grows. Points are grouped
+    into buckets of `width` consecutive points, each keeping its lowest and
+    highest point; when there are more than max_buckets buckets, neighbouring
+    buckets are merged and the width doubles. Appending costs O(new points).
+
+    Inputs:
+        max_buckets: Maximum number of buckets kept
+    """
+    def __init__(self, max_buckets=2000):
+        self.max_buckets = max_buckets
+        self.width = 1
+        self.count = 0
+        # Per complete bucket: x and y of its minimum and maximum, in point order
+        self._buckets = np.empty((0, 4))
+        self._partial_x = np.empty(0)
+        self._partial_y = np.empty(0)
+
+    def extend(self, x, y):
+        x = np.concatenate([self._partial_x, np.asarray(x, dtype=float)])
+        y = np.concatenate([self._partial_y, np.asarray(y, dtype=float)])
+        self.count += len(x) - len(self._partial_x)
+        full = len(x) // self.width * self.width
+        if full:
+            self._buckets = np.concatenate([self._buckets, self._reduce(x[:full], y[:full], self.width)])
+        self._partial_x, self._partial_y = x[full:], y[full:]
+        while len(self._buckets) > self.max_buckets:
+            self._merge()
+
+    @staticmethod
+    def _reduce(x, y, width):
+        x = x.reshape(-1, width)
+        y = y.reshape(-1, width)
+        rows = np.arange(len(y))
+        # NaNs (missing timers) never win
+        low = np.argmin(np.where(np.isnan(y), np.inf, y), axis=1)
+        high = np.argmax(np.where(np.isnan(y), -np.inf, y), axis=1)
+        return np.column_stack([x[rows, low], y[rows, low], x[rows, high], y[rows, high]])
+
+    def _merge(self):
+        if len(self._buckets) % 2:
+            # The odd bucket out is turned back into points of the next bucket
+            last = self._buckets[-1]
+            self._buckets = self._buckets[:-1]
+            self._partial_x = np.concatenate([[last[0], last[2]], self._partial_x])
+            self._partial_y = np.concatenate([[last[1], last[3]], self._partial_y])
+        pairs = self._buckets.reshape(-1, 2, 4)
+        low = np.where(pairs[:, 0, 1] <= pairs[:, 1, 1], 0, 1)
+        high = np.where(pairs[:, 0, 3] >= pairs[:, 1, 3], 0, 1)
+        rows = np.arange(len(pairs))
+        self._buckets = np.column_stack([pairs[rows, low, 0], pairs[rows, low, 1],
+                                         pairs[rows, high, 2], pairs[rows, high, 3]])
+        self.width *= 2
+
+    def points(self):
+        """
+        The reduced series: two points per bucket plus the points not yet in a bucket, ordered by x.
+        """
+        x = np.concatenate([self._buckets[:, [0, 2]].ravel(), self._partial_x])
+        y = np.concatenate([self._buckets[:, [1, 3]].ravel(), self._partial_y])
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+        finite = np.isfinite(y)
+        return x[finite], y[finite]
+
+
+class RunFeed:
+    """
+    Downsampled panel series of one run, kept up to date incrementally: the
+    progress store is read once, chunk by chunk, and update() then parses only
+    the steps appended to cpu.txt since the previous call. Nothing is written
+    to the store.
+
+    Inputs:
+        out_dir: Output folder of the run
+        store_dir: Progress store location (default: <out_dir>/progress_store/)
+        num_timers: Number of timers shown in the cost panel
+        max_buckets: Min/max buckets kept per series
+        rate_block: Number of steps per point of the step rate series
+    """
+    def __init__(self, out_dir, store_dir=None, num_timers=6, max_buckets=2000, rate_block=100):
+        self.out_dir = out_dir
+        self.name = get_run_name(out_dir)
+        self.cpu_txt_path = os.path.join(out_dir, 'cpu.txt')
+        self.store_dir = store_dir if store_dir else os.path.join(out_dir, 'progress_store')
+        self.num_timers = num_timers
+        self.max_buckets = max_buckets
+        self.rate_block = rate_block
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.last = None
+        self.timers = None
+        self.wall_time = 0.0
+        self.series = {'sim_time': StreamingMinMax(self.max_buckets),
+                       'steps_per_hour': StreamingMinMax(self.max_buckets),
+                       'sim_time_per_hour': StreamingMinMax(self.max_buckets)}
+        self._block_total = np.empty(0)
+        self._block_sim_time = np.empty(0)
+        self._block_wall = np.empty(0)
+        self._previous_sim_time = None
+        self._pending_choice = False
+
+        store = ProgressStore(self.store_dir, create=False)
+        self._choose_timers(get_timer_names(store.columns))
+        names = ['Step', 'Simulation Time', 'total'] + self.timers
+        for columns in store.iter_chunks(names):
+            self._add(columns)
+        self.reader = CPUTailReader(self.cpu_txt_path)
+        self.reader.resume(store.source_state)
+        self.update()
+
+    def _choose_timers(self, timers):
+        # The direct sub-timers of "total", or all timers if the nesting is unknown;
+        # the largest ones are picked once the first steps are known
+        if not timers:
+            self.timers = []
+            return
+        try:
+            tree = read_timer_tree(self.cpu_txt_path)
+        except (FileNotFoundError, IndexError):
+            tree = {}
+        children = [name for name in timers if tree.get(name) == 'total']
+        self.timers = children if children else [name for name in timers if name != 'total']
+        self._pending_choice = True
+
+    def _add(self, columns):
+        total = np.nan_to_num(np.asarray(columns['total'], dtype=float))
+        if len(total) == 0:
+            return
+        if self._pending_choice:
+            # Keep the timers with the most time in the first data seen
+            sums = {name: np.nansum(columns[name]) if name in columns else 0.0 for name in self.timers}
+            self.timers = sorted(self.timers, key=lambda name: -sums[name])[:self.num_timers]
+            self._pending_choice = False
+            for name in self.timers:
+                self.series['timer ' + name] = StreamingMinMax(self.max_buckets)
+        steps = np.asarray(columns['Step'], dtype=float)
+        sim_time = np.asarray(columns['Simulation Time'], dtype=float)
+        wall = (self.wall_time + np.cumsum(total)) / 3600.
+        self.wall_time += total.sum()
+
+        self.series['sim_time'].extend(wall, sim_time)
+        for name in self.timers:
+            values = columns[name] if name in columns else np.full(len(total), np.nan)
+            self.series['timer ' + name].extend(steps, values)
+
+        # Rates over complete blocks of steps
+        block_total = np.concatenate([self._block_total, total])
+        block_sim_time = np.concatenate([self._block_sim_time, sim_time])
+        block_wall = np.concatenate([self._block_wall, wall])
+        full = len(block_total) // self.rate_block * self.rate_block
+        if full:
+            seconds = block_total[:full].reshape(-1, self.rate_block).sum(axis=1)
+            ends = block_sim_time[self.rate_block - 1:full:self.rate_block]
+            starts = np.concatenate([[self._previous_sim_time if self._previous_sim_time is not None
+                                      else block_sim_time[0]], ends[:-1]])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.series['steps_per_hour'].extend(block_wall[self.rate_block - 1:full:self.rate_block],
+                                                     3600. * self.rate_block / seconds)
+                self.series['sim_time_per_hour'].extend(block_wall[self.rate_block - 1:full:self.rate_block],
+                                                        3600. * (ends - starts) / seconds)
+            self._previous_sim_time = ends[-1]
+        self._block_total = block_total[full:]
+        self._block_sim_time = block_sim_time[full:]
+        self._block_wall = block_wall[full:]
+
+        self.steps += len(total)
+        self.last = {'step': int(steps[-1]), 'sim_time': float(sim_time[-1]), 'wall_hours': float(wall[-1])}
+
+    def update(self):
+        """
+        Add the steps written to cpu.txt since the previous call.
+
+        Returns:
+            Number of new steps
+        """
+        inode = self.reader.inode
+        new = 0
+        while True:
+            blocks = self.reader.read_new(max_bytes=BACKFILL_BATCH_BYTES)
+            if inode is not None and self.reader.inode != inode:
+                # cpu.txt was replaced, start over from the store
+                self.reset()
+                return self.steps
+            if not blocks:
+                break
+            if self.timers is None or (not self.timers and not self.steps):
+                self._choose_timers(get_timer_names(blocks[0]))
+            names = ['Step', 'Simulation Time', 'total'] + self.timers
+            self._add({name: np.array([block.get(name, np.nan) for block in blocks], dtype=float)
+                       for name in names})
+            new += len(blocks)
+        return new
+
+    def panels(self, points=1000):
+        """
+        Panels to draw: list of (title, x label, y label, [(label, x, y), ...]).
+        """
+        def series(key, label):
+            x, y = self.series[key].points()
+            x, y = lttb(x, y, points)
+            return (label, x, y)
+        return [
+            ("Simulation time", "wall time [h]", "simulation time", [series('sim_time', "simulation time")]),
+            ("Cost per step", "step", "seconds", [series('timer ' + name, name) for name in self.timers]),
+            ("Step rate", "wall time [h]", "steps per compute hour", [series('steps_per_hour', "steps")]),
+            ("Simulation time rate", "wall time [h]", "simulation time per compute hour",
+             [series('sim_time_per_hour', "simulation time")]),
+        ]
+
+
+def _ticks(low, high, count=5):
+    if not np.isfinite(low) or not np.isfinite(high) or high <= low:
+        return [low] if np.isfinite(low) else []
+    step = 10 ** np.floor(np.log10((high - low) / count))
+    for factor in (1, 2, 5, 10):
+        if (high - low) / (step * factor) <= count:
+            step *= factor
+            break
+    return list(np.arange(np.ceil(low / step) * step, high + step / 2, step))
+
+def svg_panel(title, x_label, y_label, series, width=560, height=300):
+    """
+    One panel as an inline SVG line plot.
+    """
+    left, right, top, bottom = 70, 20, 30, 45
+    plot_width, plot_height = width - left - right, height - top - bottom
+    xs = [x for _, x, _ in series if len(x)]
+    ys = [y for _, _, y in series if len(y)]
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif" '
+             f'font-size="11"><text x="{width / 2}" y="16" text-anchor="middle" font-size="13">{html.escape(title)}</text>']
+    if not xs:
+        parts.append(f'<text x="{width / 2}" y="{height / 2}" text-anchor="middle">no data</text></svg>')
+        return "".join(parts)
+    x_low, x_high = min(x.min() for x in xs), max(x.max() for x in xs)
+    y_low, y_high = min(y.min() for y in ys), max(y.max() for y in ys)
+    if x_high == x_low:
+        x_high = x_low + 1
+    if y_high == y_low:
+        y_high = y_low + 1
+
+    def px(x):
+        return left + (x - x_low) / (x_high - x_low) * plot_width
+
+    parts.append(f'<rect x="{left}" y="{top}" width="{plot_width}" height="{plot_height}" fill="none" stroke="#999"/>')
+    for tick in _ticks(x_low, x_high):
+        parts.append(f'<text x="{px(tick):.1f}" y="{top + plot_height + 15}" text-anchor="middle">{tick:g}</text>')
+    for tick in _ticks(y_low, y_high):
+        y = top + plot_height - (tick - y_low) / (y_high - y_low) * plot_height
+        parts.append(f'<text x="{left - 5}" y="{y + 4:.1f}" text-anchor="end">{tick:.3g}</text>')
+    parts.append(f'<text x="{left + plot_width / 2}" y="{height - 8}" text-anchor="middle">{html.escape(x_label)}</text>')
+    parts.append(f'<text x="14" y="{top + plot_height / 2}" text-anchor="middle" '
+                 f'transform="rotate(-90 14 {top + plot_height / 2})">'
+                 f'{html.escape(y_label)}</text>')
+
+    for i, (label, x, y) in enumerate(series):
+        if not len(x):
+            continue
+        coordinates = " ".join(f"{px(a):.1f},{top + plot_height - (b - y_low) / (y_high - y_low) * plot_height:.1f}"
+                               for a, b in zip(x, y))
+        color = COLORS[i % len(COLORS)]
+        parts.append(f'<polyline fill="none" stroke="{color}" stroke-width="1" points="{coordinates}"/>')
+        parts.append(f'<text x="{left + 8}" y="{top + 14 + 13 * i}" fill="{color}">{html.escape(label)}</text>')
+    parts.append('</svg>')
+    return "".join(parts)
+
+def export_html(feeds, path, points=1000, refresh=None):
+    """
+    Write a self-contained HTML page with the panels of every run.
+
+    Inputs:
+        feeds: List of RunFeed
+        path: Output file (written atomically)
+        points: Points per drawn series
+        refresh: If given, the page reloads itself every this many seconds
+    """
+    body = []
+    for feed in feeds:
+        summary = "no steps yet"
+        if feed.last is not None:
+            summary = (f"step {feed.last['step']}, simulation time {feed.last['sim_time']:.6g}, "
+                       f"{feed.last['wall_hours']:.1f} compute hours, {feed.steps} steps")
+        body.append(f"<h2>{html.escape(feed.name)}</h2><p>{html.escape(summary)}</p><div>")
+        body.extend(svg_panel(*panel) for panel in feed.panels(points))
+        body.append("</div>")
+    meta = f'<meta http-equiv="refresh" content="{int(refresh)}">' if refresh else ""
+    page = (f'<!DOCTYPE html><html><head><meta charset="utf-8">{meta}<title>GIZMO progress</title></head>'
+            f'<body style="font-family:sans-serif">{"".join(body)}'
+            f'<p style="color:#888">Updated {time.strftime("%Y-%m-%d %H:%M:%S")}</p></body></html>')
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(page)
+    os.replace(tmp_path, path)
+
+def draw_panel(screen, top, left, height, width, panel):
+    """
+    Draw one panel in a curses window with one character per cell.
+    """
+    import curses
+    title, x_label, y_label, series = panel
+    screen.addnstr(top, left, f" {title} ", width - 1, curses.A_BOLD)
+    plot_top, plot_height = top + 1, height - 3
+    plot_left, plot_width = left + 10, width - 12
+    xs = [x for _, x, _ in series if len(x)]
+    if not xs or plot_height < 2 or plot_width < 10:
+        return
+    x_low, x_high = min(x.min() for x in xs), max(x.max() for x in xs)
+    y_low = min(y.min() for _, _, y in series if len(y))
+    y_high = max(y.max() for _, _, y in series if len(y))
+    x_span = (x_high - x_low) or 1.0
+    y_span = (y_high - y_low) or 1.0
+    marks = "*+o#x%@&"
+    for i, (label, x, y) in enumerate(series):
+        if not len(x):
+            continue
+        columns = ((x - x_low) / x_span * (plot_width - 1)).astype(int)
+        rows = (plot_height - 1 - (y - y_low) / y_span * (plot_height - 1)).astype(int)
+        attribute = curses.color_pair(i % 6 + 1) if curses.has_colors() else 0
+        for column, row in zip(columns, rows):
+            try:
+                screen.addch(plot_top + row, plot_left + column, marks[i % len(marks)], attribute)
+            except curses.error:
+                pass
+    screen.addnstr(plot_top, left, f"{y_high:9.3g}", 9)
+    screen.addnstr(plot_top + plot_height - 1, left, f"{y_low:9.3g}", 9)
+    axis = f"{x_low:.4g}  {x_label}  {x_high:.4g}"
+    screen.addnstr(plot_top + plot_height, plot_left, axis.center(plot_width), plot_width)
+    legend = "  ".join(f"{marks[i % len(marks)]} {label}" for i, (label, _, _) in enumerate(series))
+    screen.addnstr(plot_top + plot_height + 1, plot_left, legend, plot_width)
+
+def run_tui(feeds, interval=5.0, points=1000):
+    """
+    Curses dashboard: one run at a time, n/p switch runs, q quits.
+    """
+    import curses
+
+    def main(screen):
+        curses.curs_set(0)
+        screen.timeout(200)
+        if curses.has_colors():
+            curses.start_color()
+            curses.use_default_colors()
+            for i, color in enumerate([curses.COLOR_CYAN, curses.COLOR_YELLOW, curses.COLOR_GREEN,
+                                       curses.COLOR_RED, curses.COLOR_MAGENTA, curses.COLOR_BLUE], 1):
+                curses.init_pair(i, color, -1)
+        current = 0
+        next_update = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= next_update:
+                for feed in feeds:
+                    feed.update()
+                next_update = now + interval
+                redraw = True
+            key = screen.getch()
+            if key in (ord('q'), ord('Q')):
+                return
+            if key in (ord('n'), ord('\t')):
+                current, redraw = (current + 1) % len(feeds), True
+            elif key == ord('p'):
+                current, redraw = (current - 1) % len(feeds), True
+            elif key == curses.KEY_RESIZE:
+                redraw = True
+            if not redraw:
+                continue
+            redraw = False
+            feed = feeds[current]
+            screen.erase()
+            height, width = screen.getmaxyx()
+            status = f"[{current + 1}/{len(feeds)}] {feed.name}"
+            if feed.last is not None:
+                status += (f"  step {feed.last['step']}  t={feed.last['sim_time']:.6g}  "
+                           f"{feed.last['wall_hours']:.1f} h  {feed.steps} steps")
+            screen.addnstr(0, 0, status + "   (n/p: run, q: quit)", width - 1, curses.A_REVERSE)
+            panels = feed.panels(min(points, 4 * width))
+            panel_height = (height - 1) // len(panels)
+            for i, panel in enumerate(panels):
+                draw_panel(screen, 1 + i * panel_height, 0, panel_height, width, panel)
+            screen.refresh()
+
+    curses.wrapper(main)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    if args['<out_dirs>']:
+        out_dirs = resolve_output_dirs(args['<out_dirs>'])
+    else:
+        out_dirs = resolve_output_dirs([args['--out_dir']])
+    if not out_dirs:
+        print("No output folders given. Exiting...")
+        exit(1)
+
+    feeds = [RunFeed(out_dir, get_store_dir(out_dir, args['--store_dir']), num_timers=int(args['--timers']),
+                     max_buckets=int(args['--buckets']), rate_block=int(args['--rate_block']))
+             for out_dir in out_dirs]
+    interval = float(args['--interval'])
+    points = int(args['--points'])
+    if args['--html']:
+        refresh = None if args['--once'] else interval
+        export_html(feeds, args['--html'], points, refresh)
+        print(f"Dashboard written to {args['--html']}")
+        try:
+            while not args['--once']:
+                time.sleep(interval)
+                if sum(feed.update() for feed in feeds):
+                    export_html(feeds, args['--html'], points, refresh)
+        except KeyboardInterrupt:
+            pass
+    else:
+        run_tui(feeds, interval, points)
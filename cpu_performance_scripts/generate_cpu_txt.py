@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+generate_cpu_txt.py: "Write a synthetic GIZMO cpu.txt for testing and benchmarking the trackers."
+
+The file follows GIZMO's layout: a "Step" header line, the column header,
+one indented line per timer and a blank line. Either a fixed number of
+steps or a target file size can be written at full speed, or steps can be
+streamed at a given rate, each one split into several partial writes the
+way GIZMO's buffered output reaches the filesystem.
+
+Usage: generate_cpu_txt.py [options]
+
+Options:
+    -h, --help                  Show this screen
+    --out=<file>                File to write [default: ./cpu.txt]
+    --steps=<n>                 Number of steps to write
+    --size=<size>               Write steps until the file reaches this size (e.g. 500M, 20G) [default: 10M]
+    --timers=<set>              Timer set: full or minimal [default: full]
+    --cpus=<n>                  Number of CPUs in the step headers [default: 128]
+    --rate=<steps_per_sec>      Stream steps at this rate instead of writing at full speed
+    --bursts=<n>                Number of partial writes per step when streaming [default: 4]
+    --seed=<seed>               Random seed [default: 42]
+"""
+
+import time
+import random
+from docopt import docopt
+
+# (name, depth) in GIZMO's order, with the typical share of the step time at the leaves
+FULL_TIMERS = [
+    ("total", 0, None),
+    ("treegrav", 1, None),
+    ("treebuild", 2, None),
+    ("insert", 3, 0.010),
+    ("branches", 3, 0.005),
+    ("toplevel", 3, 0.003),
+    ("treecostm", 2, 0.004),
+    ("treewalk", 2, None),
+    ("treewalk1", 3, 0.200),
+    ("treewalk2", 3, 0.050),
+    ("treeback", 2, 0.005),
+    ("treedyn", 2, 0.002),
+    ("treecomm", 2, 0.030),
+    ("treeimbal", 2, 0.060),
+    ("pmgrav", 1, 0.010),
+    ("hydro", 1, None),
+    ("density", 2, None),
+    ("denswalk", 3, 0.120),
+    ("denscomm", 3, 0.020),
+    ("densimbal", 3, 0.040),
+    ("hydforce", 2, None),
+    ("hydwalk", 3, 0.180),
+    ("hydcomm", 3, 0.030),
+    ("hydimbal", 3, 0.050),
+    ("hydmisc", 2, 0.020),
+    ("domain", 1, 0.060),
+    ("peano", 1, 0.010),
+    ("drift", 1, 0.005),
+    ("kicks", 1, 0.010),
+    ("i/o", 1, 0.010),
+    ("misc", 1, 0.046),
+]
+MINIMAL_TIMERS = [
+    ("total", 0, None),
+    ("treegrav", 1, 0.4),
+    ("hydro", 1, 0.4),
+    ("domain", 1, 0.1),
+    ("misc", 1, 0.1),
+]
+TIMER_SETS = {'full': FULL_TIMERS, 'minimal': MINIMAL_TIMERS}
+NAME_WIDTH = 26
+
+
+def parse_size(size):
+    """
+    Parse a size such as "500M" or "20G" into bytes.
+    """
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+class CPUTxtGenerator:
+    """
+    Produce successive "Step" blocks of a synthetic cpu.txt.
+
+    Inputs:
+        timers: List of (name, depth, share) (see FULL_TIMERS)
+        cpus: Number of CPUs written in the headers
+        step_time: Mean wall clock seconds per step
+        dt: Mean simulation time advance per step
+        seed: Random seed
+    """
+    def __init__(self, timers=FULL_TIMERS, cpus=128, step_time=1.0, dt=1e-5, seed=42):
+        self.timers = timers
+        self.cpus = cpus
+        self.step_time = step_time
+        self.dt = dt
+        self.random = random.Random(seed)
+        self.step = 0
+        self.time = 0.0
+        self.cumulative = {name: 0.0 for name, _, _ in timers}
+
+    def next_block(self):
+        """
+        Text of the next step block, ending with the blank line.
+        """
+        total = self.step_time * self.random.lognormvariate(0, 0.3)
+        # Leaf times, then parents as the sum of their children
+        diff = {}
+        for name, _, share in self.timers:
+            if share is not None:
+                diff[name] = total * share * self.random.uniform(0.8, 1.2)
+        for i in reversed(range(len(self.timers))):
+            name, depth, share = self.timers[i]
+            if share is None:
+                children = 0.0
+                for child, child_depth, _ in self.timers[i + 1:]:
+                    if child_depth <= depth:
+                        break
+                    if child_depth == depth + 1:
+                        children += diff[child]
+                diff[name] = children
+        for name in diff:
+            self.cumulative[name] += diff[name]
+
+        lines = [f"Step {self.step}, Time: {self.time:g}, CPUs: {self.cpus}, MultiDomains: 8, "
+                 f"HighestActiveTimeBin: {self.random.randint(18, 24)}",
+                 " " * NAME_WIDTH + "diff               cumulative"]
+        total, cumulative_total = diff['total'], self.cumulative['total']
+        for name, depth, _ in self.timers:
+            label = " " * (2 * depth) + name
+            lines.append(f"{label:<{NAME_WIDTH}}{diff[name]:6.2f}  {100 * diff[name] / total:5.1f}%  "
+                         f"{self.cumulative[name]:10.2f}  {100 * self.cumulative[name] / cumulative_total:5.1f}%")
+        self.step += 1
+        self.time += self.dt * self.random.uniform(0.5, 1.5)
+        return "\n".join(lines) + "\n\n"
+
+
+def write_cpu_txt(path, steps=None, size=None, generator=None):
+    """
+    Append steps to path at full speed, until `steps` steps have been written
+    or the file reaches `size` bytes.
+
+    Returns:
+        Number of steps written
+    """
+    if generator is None:
+        generator = CPUTxtGenerator()
+    written = 0
+    with open(path, 'a') as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        buffer = []
+        buffer_size = 0
+        while (steps is None or written < steps) and (size is None or file_size + buffer_size < size):
+            block = generator.next_block()
+            buffer.append(block)
+            buffer_size += len(block)
+            written += 1
+            if buffer_size > (1 << 22):
+                f.write("".join(buffer))
+                file_size += buffer_size
+                buffer, buffer_size = [], 0
+        f.write("".join(buffer))
+    return written
+
+def stream_cpu_txt(path, steps, rate, bursts=4, generator=None, on_step=None):
+    """
+    Append steps to path at `rate` steps per second, each one split into
+    `bursts` flushed partial writes at random points.
+
+    Inputs:
+        on_step: Optional callback called with (step number, time.time()) once
+                 a step has been completely written
+    """
+    if generator is None:
+        generator = CPUTxtGenerator()
+    with open(path, 'a') as f:
+        for _ in range(steps):
+            start = time.time()
+            step = generator.step
+            block = generator.next_block()
+            cuts = sorted(generator.random.randint(1, len(block) - 1) for _ in range(bursts - 1))
+            for begin, end in zip([0] + cuts, cuts + [len(block)]):
+                f.write(block[begin:end])
+                f.flush()
+            if on_step is not None:
+                on_step(step, time.time())
+            time.sleep(max(0.0, 1.0 / rate - (time.time() - start)))
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    generator = CPUTxtGenerator(timers=TIMER_SETS[args['--timers']], cpus=int(args['--cpus']),
+                                seed=int(args['--seed']))
+    steps = int(args['--steps']) if args['--steps'] else None
+    if args['--rate']:
+        if steps is None:
+            print("--steps is required with --rate. Exiting...")
+            exit(1)
+        stream_cpu_txt(args['--out'], steps, float(args['--rate']), int(args['--bursts']), generator)
+    else:
+        size = None if steps is not None else parse_size(args['--size'])
+        written = write_cpu_txt(args['--out'], steps, size, generator)
+        print(f"Wrote {written} steps to {args['--out']}")
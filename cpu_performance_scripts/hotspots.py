@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+hotspots.py: "Where does the wall time of a run go? Per-timer ranking and drift detection."
+
+The run is cut into windows of --window steps. For every window the share of
+the wall time and the mean cost per step of each timer (nested sub-timers
+included) are computed and compared with the first --baseline windows. A
+timer is flagged when its share moves by more than --share_drift or its cost
+per step changes by more than --cost_drift (relative).
+
+Usage: hotspots.py [options] <out_dirs>...
+
+Options:
+    -h, --help                  Show this screen
+    --window=<steps>            Number of steps per window [default: 1000]
+    --baseline=<windows>        Number of initial windows used as the reference [default: 1]
+    --share_drift=<share>       Flag a change in share of the wall time larger than this [default: 0.1]
+    --cost_drift=<fraction>     Flag a relative change in cost per step larger than this [default: 0.5]
+    --min_share=<share>         Ignore timers below this share in both baseline and window [default: 0.02]
+    --skip_steps=<n>            Ignore this many initial steps (start-up) [default: 10]
+    --top=<n>                   Number of timers in the rankings [default: 15]
+"""
+
+import os
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history, read_timer_tree, resolve_output_dirs, get_run_name, get_timer_names
+
+
+def window_breakdown(history, timers, window=1000, skip_steps=10):
+    """
+    Per-window wall time share and cost per step of each timer.
+
+    Inputs:
+        history: Dictionary of columns from track_job.load_run_history
+        timers: Timer names to include ("total" must be in the history)
+        window: Number of steps per window
+        skip_steps: Number of initial steps to ignore
+    Returns:
+        (first step of each window, shares, costs); shares and costs have one
+        row per window and one column per timer
+    """
+    steps = history['Step'][skip_steps:]
+    if len(steps) == 0:
+        return steps, np.zeros((0, len(timers))), np.zeros((0, len(timers)))
+    starts = np.arange(0, len(steps), window)
+    counts = np.diff(np.append(starts, len(steps)))
+    total = np.add.reduceat(np.nan_to_num(history['total'][skip_steps:]), starts)
+
+    sums = np.empty((len(starts), len(timers)))
+    for i, timer in enumerate(timers):
+        sums[:, i] = np.add.reduceat(np.nan_to_num(history[timer][skip_steps:]), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = sums / total[:, None]
+    costs = sums / counts[:, None]
+    return steps[starts], shares, costs
+
+def detect_drift(starts, shares, costs, timers, baseline=1, share_drift=0.1, cost_drift=0.5, min_share=0.02):
+    """
+    Compare every window after the baseline with the baseline windows.
+
+    Returns:
+        List of alerts (dictionaries with the window's first step, the timer,
+        the baseline and current share and cost per step, and the reason)
+    """
+    if len(starts) <= baseline:
+        return []
+    base_share = np.nanmean(shares[:baseline], axis=0)
+    base_cost = np.nanmean(costs[:baseline], axis=0)
+
+    alerts = []
+    for w in range(baseline, len(starts)):
+        for i, timer in enumerate(timers):
+            if timer == "total" or max(base_share[i], shares[w, i]) < min_share:
+                continue
+            reasons = []
+            if abs(shares[w, i] - base_share[i]) > share_drift:
+                reasons.append("share")
+            if base_cost[i] > 0 and abs(costs[w, i] / base_cost[i] - 1) > cost_drift:
+                reasons.append("cost")
+            if reasons:
+                alerts.append({'step': int(starts[w]), 'timer': timer,
+                               'base_share': base_share[i], 'share': shares[w, i],
+                               'base_cost': base_cost[i], 'cost': costs[w, i], 'reason': "+".join(reasons)})
+    return alerts
+
+def get_depth(timer, tree):
+    depth = 0
+    while tree.get(timer) is not None:
+        timer = tree[timer]
+        depth += 1
+    return depth
+
+def print_ranking(title, timers, shares, costs, tree, top=15):
+    print(f"\n{title}")
+    print(f"{'timer':<28}{'share':>8}{'s/step':>12}")
+    order = np.argsort(-np.nan_to_num(shares))
+    shown = 0
+    for i in order:
+        if timers[i] == "total":
+            continue
+        name = "  " * max(get_depth(timers[i], tree) - 1, 0) + timers[i]
+        print(f"{name:<28}{shares[i]:>8.1%}{costs[i]:>12.4g}")
+        shown += 1
+        if shown >= top:
+            break
+
+def analyze_run(out_dir, window=1000, baseline=1, share_drift=0.1, cost_drift=0.5, min_share=0.02,
+                skip_steps=10, top=15):
+    """
+    Print the wall time ranking of a run (whole run and last window) and the drift alerts.
+    """
+    history = load_run_history(out_dir)
+    timers = get_timer_names(history)
+    if 'total' not in timers or len(history['Step']) <= skip_steps:
+        print("Not enough steps in cpu.txt")
+        return []
+    tree = read_timer_tree(os.path.join(out_dir, 'cpu.txt'))
+
+    starts, shares, costs = window_breakdown(history, timers, window, skip_steps)
+    sums = np.array([np.nansum(history[timer][skip_steps:]) for timer in timers])
+    num_steps = len(history['Step']) - skip_steps
+    print_ranking(f"Whole run ({num_steps} steps):", timers, sums / sums[timers.index('total')],
+                  sums / num_steps, tree, top)
+    print_ranking(f"Last window (from step {starts[-1]}):", timers, shares[-1], costs[-1], tree, top)
+
+    alerts = detect_drift(starts, shares, costs, timers, baseline, share_drift, cost_drift, min_share)
+    if alerts:
+        print(f"\nDrift relative to the first {baseline} window(s):")
+        print(f"{'from step':>10}  {'timer':<20}{'share':>16}{'s/step':>22}  reason")
+        for alert in alerts:
+            print(f"{alert['step']:>10}  {alert['timer']:<20}"
+                  f"{alert['base_share']:>7.1%} -> {alert['share']:>5.1%}"
+                  f"{alert['base_cost']:>10.3g} -> {alert['cost']:>8.3g}  {alert['reason']}")
+    else:
+        print("\nNo drift detected")
+    return alerts
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    for out_dir in resolve_output_dirs(args['<out_dirs>']):
+        print(f"=== {get_run_name(out_dir)} ===")
+        analyze_run(out_dir, window=int(args['--window']), baseline=int(args['--baseline']),
+                    share_drift=float(args['--share_drift']), cost_drift=float(args['--cost_drift']),
+                    min_share=float(args['--min_share']), skip_steps=int(args['--skip_steps']),
+                    top=int(args['--top']))
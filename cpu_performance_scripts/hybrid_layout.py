@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+hybrid_layout.py: "Pick the MPI ranks x OpenMP threads layout per node type from measured cpu.txt timings."
+
+For GIZMO built with OPENMP, the same cores of a node can run many MPI ranks
+with one thread each or fewer ranks with several threads. The submit scripts
+take --omp-threads and append the layout of every job (cluster, node type,
+nodes, ranks per node, threads) to job_layout.txt next to the parameter file.
+Runs on the same node type and node count are compared over the simulation
+time interval they all covered, and ranked by simulation time per wall hour.
+Runs without a job_layout.txt record are taken as one thread per rank unless
+their folder name holds the thread count (e.g. MHD_omp4).
+
+Benchmark mode writes one parameter file per thread count (output to
+output_omp<t>/, TimeLimitCPU of --bench_minutes) and submits one short job
+for each with the given submit command. Once they have run, --record
+analyses them and stores the winning layout per node type and node count
+in the layouts file, where later runs find it through --node_type.
+
+Usage: hybrid_layout.py [options] [<out_dirs>...]
+
+Options:
+    -h, --help                  Show this screen
+    --skip_steps=<n>            Ignore this many initial steps of each run (start-up) [default: 10]
+    --layouts=<file>            Benchmark runs and winning layouts [default: ../hybrid_layouts.json]
+    --record                    Store the best layout of each node type and node count in the layouts file
+                                (analyses the recorded benchmark runs if no output folders are given)
+    --benchmark=<command>       Submit command to run once per thread count, e.g.
+                                "python job_submit_rusty.py --cpu-type rome --num-nodes 2"
+    --threads=<list>            Comma separated OpenMP threads per rank to benchmark [default: 1,2,4,8]
+    --param_file=<params>       Parameter file the benchmark jobs start from [default: ../params.txt]
+    --bench_minutes=<min>       Minutes GIZMO runs in each benchmark job [default: 20]
+    --node_type=<type>          Show the stored best layout of this node type, as cluster/type (e.g. Rusty/rome)
+    --nodes=<n>                 Node count to show the stored layout for (default: the closest one stored)
+"""
+
+import os
+import sys
+import re
+import json
+import shlex
+import datetime
+import subprocess
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history, resolve_output_dirs, get_run_name
+from scaling_analysis import summarize_run
+from predict_eta import read_params
+
+# node_types.py sits next to the submit scripts, in setup_scripts/system_setup_scripts of the repository
+SETUP_SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "setup_scripts", "system_setup_scripts")
+sys.path.append(SETUP_SCRIPTS)
+from node_types import SUBMIT_OPTIONS
+
+LAYOUT_FILE = "job_layout.txt"
+
+
+def read_layout(out_dir, levels=3):
+    """
+    Layout of the last job that wrote to out_dir, from the job_layout.txt of
+    the folders above it (the parameter file of each record gives its OutputDir).
+
+    Inputs:
+        out_dir: Output folder of the run
+        levels: Number of parent folders searched for job_layout.txt
+    Returns:
+        Dictionary with cluster, node_type, nodes, ranks_per_node and
+        omp_threads (numbers as int), or None if no record matches
+    """
+    out_dir = os.path.normpath(os.path.abspath(out_dir))
+    folder = out_dir
+    for _ in range(levels):
+        folder = os.path.dirname(folder)
+        layout_path = os.path.join(folder, LAYOUT_FILE)
+        if not os.path.exists(layout_path):
+            continue
+        layout = None
+        output_dirs = {}
+        with open(layout_path, 'r') as f:
+            for line in f:
+                record = dict(field.split("=", 1) for field in line.split() if "=" in field)
+                param_file = record.get('param_file')
+                if param_file is None:
+                    continue
+                if param_file not in output_dirs:
+                    param_path = os.path.join(folder, param_file)
+                    params = read_params(param_path) if os.path.exists(param_path) else {}
+                    output_dirs[param_file] = os.path.normpath(os.path.join(folder, params.get('OutputDir', '')))
+                if output_dirs[param_file] == out_dir:
+                    layout = record
+        if layout is not None:
+            for key in ('nodes', 'ranks_per_node', 'omp_threads'):
+                layout[key] = int(layout.get(key, 1))
+            return layout
+    return None
+
+def guess_layout(out_dir, history):
+    """
+    Layout of a run without a job_layout.txt record: threads from an
+    omp<t> tag in the run name (default 1), ranks from cpu.txt (None if it
+    has no steps).
+    """
+    match = re.search(r'omp[_-]?(\d+)', get_run_name(out_dir))
+    cpus = history['CPUs'][np.isfinite(history['CPUs'])] if 'CPUs' in history else []
+    return {
+        'cluster': "unknown",
+        'node_type': "unknown",
+        'nodes': None,
+        'ranks_per_node': int(np.median(cpus)) if len(cpus) else None,
+        'omp_threads': int(match.group(1)) if match else 1,
+    }
+
+def compare_layouts(runs, skip_steps=10):
+    """
+    Rank runs on the same node type and node count by simulation time per
+    wall hour over the simulation time interval they all covered.
+
+    Inputs:
+        runs: List of (name, history, layout) of one node type and node count
+        skip_steps: Number of initial steps to ignore in each run
+    Returns:
+        List of run summaries (see scaling_analysis.summarize_run) with name,
+        layout, rate (simulation time per wall hour) and relative (rate over
+        the best rate), fastest first
+    """
+    usable = []
+    for name, history, layout in runs:
+        if 'Step' not in history or len(history['Step']) <= skip_steps:
+            print(f"Skipping {name}: no more than {skip_steps} steps")
+            continue
+        usable.append((name, history, layout))
+    if not usable:
+        return []
+    sim_time_end = min(float(np.nanmax(history['Simulation Time'])) for _, history, _ in usable)
+
+    results = []
+    for name, history, layout in usable:
+        summary = summarize_run(history, sim_time_end, skip_steps)
+        if summary is None or summary['wall_time'] <= 0 or summary['sim_time'] <= 0:
+            print(f"Skipping {name}: no usable steps")
+            continue
+        summary.update({'name': name, 'layout': layout,
+                        'rate': summary['sim_time'] / summary['wall_time'] * 3600.})
+        results.append(summary)
+    results.sort(key=lambda result: -result['rate'])
+    for result in results:
+        result['relative'] = result['rate'] / results[0]['rate']
+    return results
+
+def submit_options(layout):
+    """
+    Options of the cluster's submit script selecting a layout, as a list of strings.
+    """
+    options = SUBMIT_OPTIONS.get(layout['cluster'])
+    if options is None:
+        return ['--omp-threads', str(layout['omp_threads'])]
+    command = []
+    if options['type'] is not None and layout['node_type'] != "default":
+        command += [options['type'], layout['node_type']]
+    if layout['nodes'] is not None:
+        command += [options['nodes'], str(layout['nodes'])]
+    ranks = layout['ranks_per_node']
+    if layout['cluster'] == "CITA_starq":
+        # --ppn counts the cores, the ranks per node follow from --omp-threads
+        ranks *= layout['omp_threads']
+    return command + [options['ranks'], str(ranks), options['threads'], str(layout['omp_threads'])]
+
+def print_comparison(group, results):
+    cluster, node_type, nodes = group
+    print(f"\n{cluster}/{node_type}, {nodes if nodes is not None else '?'} node(s):")
+    print(f"{'run':<28}{'ranks/node':>11}{'threads':>9}{'steps':>8}{'sim time/h':>13}{'relative':>10}")
+    for result in results:
+        layout = result['layout']
+        ranks = layout['ranks_per_node'] if layout['ranks_per_node'] is not None else '?'
+        print(f"{result['name']:<28}{ranks:>11}{layout['omp_threads']:>9}{result['steps']:>8}"
+              f"{result['rate']:>13.4g}{result['relative']:>10.2f}")
+    print(f"Best layout: {' '.join(submit_options(results[0]['layout']))}")
+
+def load_layouts(path):
+    if not os.path.exists(path):
+        return {'benchmarks': [], 'winners': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_layouts(layouts, path):
+    with open(path, 'w') as f:
+        json.dump(layouts, f, indent=1)
+
+def closest_winner(layouts, node_type, nodes=None):
+    """
+    Stored best layout of a node type ("cluster/type") for the node count
+    closest to nodes (or the most recent one if nodes is None), or None.
+    """
+    winners = layouts['winners'].get(node_type, {})
+    if not winners:
+        return None
+    if nodes is None:
+        return max(winners.values(), key=lambda winner: winner['date'])
+    return winners[min(winners, key=lambda count: abs(int(count) - nodes))]
+
+def write_benchmark_params(param_file, threads, minutes):
+    """
+    Copy the parameter file for a benchmark with the given thread count:
+    output to output_omp<t>/, GIZMO stopping after the given minutes.
+
+    Returns:
+        Path of the new parameter file
+    """
+    overrides = {'OutputDir': f"output_omp{threads}/", 'TimeLimitCPU': str(int(minutes * 60)), 'ResubmitOn': "0"}
+    lines = []
+    with open(param_file, 'r') as f:
+        for line in f:
+            parts = line.split('%')[0].split()
+            if len(parts) >= 2 and parts[0] in overrides:
+                line = f"{parts[0]}    {overrides[parts[0]]}\n"
+            lines.append(line)
+    root, extension = os.path.splitext(param_file)
+    path = f"{root}_omp{threads}{extension}"
+    with open(path, 'w') as f:
+        f.writelines(lines)
+    return path
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    skip_steps = int(args['--skip_steps'])
+    layouts = load_layouts(args['--layouts'])
+
+    if args['--node_type']:
+        winner = closest_winner(layouts, args['--node_type'], int(args['--nodes']) if args['--nodes'] else None)
+        if winner is None:
+            print(f"No layout stored for {args['--node_type']} in {args['--layouts']}. Exiting...")
+            exit(1)
+        print(f"Best measured layout ({winner['date']}, {winner['rate']:.4g} sim time/h): "
+              f"{' '.join(submit_options(winner['layout']))}")
+        exit(0)
+
+    if args['--benchmark']:
+        params = read_params(args['--param_file'])
+        if 'OutputDir' not in params:
+            print(f"OutputDir not found in {args['--param_file']}. Exiting...")
+            exit(1)
+        gizmo_dir = os.path.dirname(os.path.abspath(args['--param_file']))
+        for threads in [int(threads) for threads in args['--threads'].split(',')]:
+            param_path = write_benchmark_params(args['--param_file'], threads, float(args['--bench_minutes']))
+            command = shlex.split(args['--benchmark']) + [
+                '--param-file', os.path.basename(param_path), '--omp-threads', str(threads),
+                '--job-name', f"bench_omp{threads}", '--num-jobs', '1', '--chain-mode', 'afterany', '--new-chain']
+            print(f"Running: {' '.join(command)}")
+            subprocess.run(command, check=True)
+            layouts['benchmarks'].append({'out_dir': os.path.join(gizmo_dir, f"output_omp{threads}/"),
+                                          'omp_threads': threads, 'date': datetime.datetime.now().isoformat()})
+        save_layouts(layouts, args['--layouts'])
+        print(f"Benchmark runs saved to {args['--layouts']}; once they have run, analyse them with --record")
+        exit(0)
+
+    out_dirs = args['<out_dirs>']
+    if not out_dirs:
+        out_dirs = [benchmark['out_dir'] for benchmark in layouts['benchmarks']]
+        if not out_dirs:
+            print(f"No output folders given and no benchmark runs in {args['--layouts']}. Exiting...")
+            exit(1)
+
+    groups = {}
+    for out_dir in resolve_output_dirs(out_dirs):
+        name = get_run_name(out_dir)
+        history = load_run_history(out_dir)
+        if 'Step' not in history or len(history['Step']) == 0:
+            print(f"Skipping {name}: no steps in cpu.txt")
+            continue
+        layout = read_layout(out_dir) or guess_layout(out_dir, history)
+        groups.setdefault((layout['cluster'], layout['node_type'], layout['nodes']), []).append(
+            (name, history, layout))
+    if not groups:
+        print("No output folders with a cpu.txt found. Exiting...")
+        exit(1)
+
+    for group, runs in groups.items():
+        results = compare_layouts(runs, skip_steps)
+        if not results:
+            print(f"\n{group[0]}/{group[1]}: no usable runs")
+            continue
+        print_comparison(group, results)
+        if len(results) < 2:
+            print("Only one layout measured, run --benchmark to compare others")
+        cluster, node_type, nodes = group
+        if args['--record'] and cluster != "unknown":
+            layouts['winners'].setdefault(f"{cluster}/{node_type}", {})[str(nodes)] = {
+                'layout': results[0]['layout'], 'rate': results[0]['rate'],
+                'compared': len(results), 'date': datetime.datetime.now().isoformat()}
+
+    if args['--record']:
+        save_layouts(layouts, args['--layouts'])
+        print(f"\nBest layouts saved to {args['--layouts']}")
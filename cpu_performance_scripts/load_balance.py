@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""
+load_balance.py: "How much time is lost to load imbalance, and would domain tuning help?"
+
+The waiting time of every step is the sum of the imbalance timers of cpu.txt
+(treeimbal, densimbal, hydimbal, ...), and its imbalance factor is
+total / (total - waiting), i.e. the slowest task over the average one. Where
+balance.txt or timings.txt are available, their imbalance (share of the
+balance bar lost to waiting, work-load balance) is shown next to it. The
+factors are reported over windows of steps and per highest active time bin
+(small time bins have few active particles and usually balance worst).
+
+Domain decompositions are the steps with a noticeable "domain" timer. GIZMO
+decomposes once the forces computed since the last decomposition exceed
+TreeDomainUpdateFrequency times the number of particles, and every task holds
+MultipleDomains pieces of the Peano-Hilbert curve. From the measured cost of
+one decomposition C and the growth s of the waiting time per step with the
+number of steps since the last decomposition, the interval minimizing
+C / k + s k / 2 is k = sqrt(2 C / s); TreeDomainUpdateFrequency is scaled by
+the ratio of that interval to the current one. MultipleDomains is raised when
+waiting dominates over decomposition and lowered when the opposite holds.
+The current MultipleDomains is taken from the cpu.txt headers and
+TreeDomainUpdateFrequency from the parameter file, if given.
+
+Usage: load_balance.py [options] <out_dirs>...
+
+Options:
+    -h, --help                  Show this screen
+    --params=<file>             GIZMO parameter file of the run (for TreeDomainUpdateFrequency)
+    --window=<steps>            Number of steps per window [default: 1000]
+    --skip_steps=<n>            Ignore this many initial steps (start-up) [default: 10]
+    --last=<steps>              Base the recommendations on the last this many steps (0: all) [default: 0]
+    --wait_share=<share>        Waiting share of the wall time above which more domains are suggested [default: 0.1]
+    --domain_share=<share>      Decomposition share of the wall time above which fewer domains are suggested [default: 0.1]
+"""
+
+import os
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history, load_log_history, resolve_output_dirs, get_run_name, get_timer_names
+from predict_eta import read_params
+from step_cost import join_on_step, window_means
+
+# Steps with a domain timer above this fraction of its 95th percentile are decompositions
+DECOMPOSITION_THRESHOLD = 0.1
+# Limits of the suggested MultipleDomains
+MIN_MULTIPLE_DOMAINS = 1
+MAX_MULTIPLE_DOMAINS = 64
+
+
+def get_waiting(history):
+    """
+    Waiting time of every step: the sum of the imbalance timers.
+
+    Returns:
+        (waiting seconds per step, names of the timers used)
+    """
+    timers = [name for name in get_timer_names(history) if "imbal" in name]
+    waiting = np.zeros(len(history['Step']))
+    for name in timers:
+        waiting += np.nan_to_num(history[name])
+    return waiting, timers
+
+def imbalance_factor(total, waiting):
+    """
+    Slowest over average task time of every step, from the step time and the waiting time.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return total / (total - waiting)
+
+def find_decompositions(domain):
+    """
+    Boolean mask of the steps in which a domain decomposition took place.
+    """
+    if len(domain) == 0 or not np.any(domain > 0):
+        return np.zeros(len(domain), dtype=bool)
+    return domain > max(DECOMPOSITION_THRESHOLD * np.percentile(domain, 95), 0.0)
+
+def steps_since(events):
+    """
+    Number of steps since the last True in events (NaN before the first one).
+    """
+    index = np.arange(len(events))
+    last = np.maximum.accumulate(np.where(events, index, -1))
+    age = (index - last).astype(float)
+    age[last < 0] = np.nan
+    return age
+
+def per_bin(bins, values):
+    """
+    Number of steps and mean of every value array per time bin.
+
+    Inputs:
+        bins: Highest active time bin of every step
+        values: Dictionary of name -> array aligned with bins
+    Returns:
+        List of (bin, number of steps, {name: mean})
+    """
+    rows = []
+    for number in np.unique(bins[np.isfinite(bins)]):
+        selection = bins == number
+        means = {}
+        for name, array in values.items():
+            part = array[selection]
+            means[name] = np.nanmean(part) if np.isfinite(part).any() else np.nan
+        rows.append((int(number), int(selection.sum()), means))
+    return rows
+
+def recommend_interval(domain, waiting, decompositions):
+    """
+    Decomposition interval (in steps) minimizing decomposition plus waiting time.
+
+    Returns:
+        Dictionary with the cost of one decomposition, the current mean interval,
+        the growth of the waiting time per step since the last decomposition and
+        the optimal interval (None when the waiting does not grow)
+    """
+    count = int(decompositions.sum())
+    if count < 2:
+        return None
+    cost = float(np.mean(domain[decompositions]))
+    positions = np.nonzero(decompositions)[0]
+    interval = float(np.mean(np.diff(positions)))
+    age = steps_since(decompositions)
+    usable = np.isfinite(age) & ~decompositions
+    growth = np.nan
+    if usable.sum() > 2 and np.ptp(age[usable]) > 0:
+        growth = float(np.polyfit(age[usable], waiting[usable], 1)[0])
+    optimal = float(np.sqrt(2 * cost / growth)) if growth > 0 else None
+    return {'decompositions': count, 'cost': cost, 'interval': interval, 'growth': growth, 'optimal': optimal}
+
+def recommend(history, params=None, wait_share=0.1, domain_share=0.1):
+    """
+    MultipleDomains and TreeDomainUpdateFrequency recommendations for a run.
+
+    Inputs:
+        history: Columns from track_job.load_run_history (the steps to base the advice on)
+        params: Optional dictionary from predict_eta.read_params
+        wait_share: Waiting share of the wall time above which more domains are suggested
+        domain_share: Decomposition share above which fewer domains are suggested
+    Returns:
+        Dictionary with the measured shares, the interval analysis and the
+        suggested values (None where no change is advised), plus a list of
+        explanations
+    """
+    total = np.nan_to_num(history['total'])
+    waiting, _ = get_waiting(history)
+    domain = np.nan_to_num(history['domain']) if 'domain' in history else np.zeros(len(total))
+    wall = total.sum()
+    result = {'wait_share': waiting.sum() / wall if wall > 0 else np.nan,
+              'domain_share': domain.sum() / wall if wall > 0 else np.nan,
+              'MultipleDomains': None, 'TreeDomainUpdateFrequency': None, 'notes': []}
+
+    multi_domains = None
+    if 'MultiDomains' in history and np.isfinite(history['MultiDomains']).any():
+        multi_domains = int(history['MultiDomains'][np.isfinite(history['MultiDomains'])][-1])
+    frequency = None
+    if params is not None and 'TreeDomainUpdateFrequency' in params:
+        frequency = float(params['TreeDomainUpdateFrequency'])
+    result['current_MultipleDomains'] = multi_domains
+    result['current_TreeDomainUpdateFrequency'] = frequency
+
+    interval = recommend_interval(domain, waiting, find_decompositions(domain))
+    result['interval'] = interval
+    if interval is None:
+        result['notes'].append("Fewer than two domain decompositions, no advice on TreeDomainUpdateFrequency")
+    elif interval['optimal'] is None:
+        result['notes'].append("Waiting does not grow between decompositions; decomposing less often "
+                               "(larger TreeDomainUpdateFrequency) saves decomposition time at no cost")
+        if frequency is not None and result['domain_share'] > 0.02:
+            if 2 * frequency <= 1.0:
+                result['TreeDomainUpdateFrequency'] = 2 * frequency
+            else:
+                result['notes'].append(f"TreeDomainUpdateFrequency {frequency:g} cannot be doubled, "
+                                       f"it is already at (or within a factor 2 of) its maximum of 1")
+    else:
+        ratio = interval['optimal'] / interval['interval']
+        result['notes'].append(f"One decomposition costs {interval['cost']:.3g} s and waiting grows by "
+                               f"{interval['growth']:.3g} s per step after it: decompose every "
+                               f"{interval['optimal']:.1f} steps instead of {interval['interval']:.1f}")
+        if frequency is not None and (ratio < 0.75 or ratio > 1.33):
+            suggested = float(np.clip(frequency * ratio, 1e-4, 1.0))
+            if suggested != frequency:
+                result['TreeDomainUpdateFrequency'] = suggested
+            else:
+                result['notes'].append(f"TreeDomainUpdateFrequency is already at its limit ({frequency:g})")
+
+    if multi_domains is not None:
+        if result['wait_share'] > wait_share and result['domain_share'] < result['wait_share'] / 2:
+            result['MultipleDomains'] = min(2 * multi_domains, MAX_MULTIPLE_DOMAINS)
+            result['notes'].append(f"Waiting takes {result['wait_share']:.1%} of the wall time against "
+                                   f"{result['domain_share']:.1%} for decomposition: finer domains should balance better")
+        elif result['domain_share'] > domain_share and result['wait_share'] < result['domain_share'] / 2:
+            result['MultipleDomains'] = max(multi_domains // 2, MIN_MULTIPLE_DOMAINS)
+            result['notes'].append(f"Decomposition takes {result['domain_share']:.1%} of the wall time against "
+                                   f"{result['wait_share']:.1%} waiting: coarser domains are cheaper")
+        if result['MultipleDomains'] == multi_domains:
+            result['MultipleDomains'] = None
+    return result
+
+def analyze_run(out_dir, params=None, window=1000, skip_steps=10, last=0, wait_share=0.1, domain_share=0.1):
+    """
+    Print the imbalance of a run over time and per time bin, and the domain tuning advice.
+    """
+    history = load_run_history(out_dir)
+    if 'total' not in history or len(history['Step']) <= skip_steps:
+        print("Not enough steps in cpu.txt")
+        return None
+    history = {name: values[skip_steps:] for name, values in history.items()}
+    steps = history['Step']
+    total = np.asarray(history['total'], dtype=float)
+    waiting, timers = get_waiting(history)
+    if not timers:
+        print("No imbalance timers in cpu.txt")
+    values = {'s/step': total, 'wait/step': waiting, 'factor': imbalance_factor(total, waiting)}
+
+    balance = join_on_step(steps, load_log_history(out_dir, 'balance.txt'), 'Imbalance Fraction')
+    if np.isfinite(balance).any():
+        values['balance.txt'] = 1 / (1 - balance)
+    work_load = join_on_step(steps, load_log_history(out_dir, 'timings.txt'), 'work-load balance')
+    if np.isfinite(work_load).any():
+        values['timings.txt'] = work_load
+
+    names = list(values)
+    header = "".join(f"{name:>13}" for name in names)
+    starts = np.arange(0, len(steps), window)
+    print(f"Imbalance timers: {', '.join(timers) if timers else 'none'}")
+    print(f"\n{'from step':>10}{header}")
+    means = {name: window_means(array, starts) for name, array in values.items()}
+    for w, start in enumerate(starts):
+        print(f"{steps[start]:>10}" + "".join(f"{means[name][w]:>13.3g}" for name in names))
+
+    if 'HighestActiveTimeBin' in history:
+        print(f"\n{'time bin':>10}{'steps':>8}{header}")
+        for number, count, bin_means in per_bin(np.asarray(history['HighestActiveTimeBin'], dtype=float), values):
+            print(f"{number:>10}{count:>8}" + "".join(f"{bin_means[name]:>13.3g}" for name in names))
+
+    if last:
+        history = {name: array[-last:] for name, array in history.items()}
+    advice = recommend(history, params, wait_share, domain_share)
+    print(f"\nWaiting: {advice['wait_share']:.1%} of the wall time, domain decomposition: {advice['domain_share']:.1%}")
+    for note in advice['notes']:
+        print(f"  {note}")
+    for name in ('MultipleDomains', 'TreeDomainUpdateFrequency'):
+        current = advice['current_' + name]
+        if advice[name] is not None:
+            print(f"Suggested {name}: {advice[name]:g} (currently {current:g})")
+        else:
+            print(f"{name}: no change suggested" + (f" (currently {current:g})" if current is not None else ""))
+    return advice
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    params = None
+    if args['--params']:
+        if not os.path.exists(args['--params']):
+            print(f"Parameter file {args['--params']} not found. Exiting...")
+            exit(1)
+        params = read_params(args['--params'])
+    for out_dir in resolve_output_dirs(args['<out_dirs>']):
+        print(f"=== {get_run_name(out_dir)} ===")
+        analyze_run(out_dir, params, window=int(args['--window']), skip_steps=int(args['--skip_steps']),
+                    last=int(args['--last']), wait_share=float(args['--wait_share']),
+                    domain_share=float(args['--domain_share']))
@@ -0,0 +1,399 @@
+"""
+log_readers.py: "Incremental parsers for the log files GIZMO writes to the output folder."
+
+LogTailReader follows one log file, reading only the bytes appended since the
+previous call, and hands every completed record to parse_record(). One
+subclass per file turns records into dictionaries of columns, ready for a
+ProgressStore:
+    cpu.txt       CPUTailReader (in track_job.py), timers of every step
+    timings.txt   TimingsTailReader, gravity tree statistics of every step
+                  (Nf, work-load and particle-load balance, ...)
+    balance.txt   BalanceTailReader, time of every step and the fraction of it
+                  spent waiting on other tasks
+    info.txt      InfoTailReader, sync points (step, time, system step) and,
+    timebin.txt   when present, the occupied time bins and active particles
+    energy.txt    EnergyTailReader, energy statistics (keyed by time only)
+    memory.txt    MemoryTailReader, memory reports of mymalloc (also finds
+                  them in GIZMO's standard output)
+Every record of a step-based log has a "Step" column matching cpu.txt, so the
+logs can be joined on it (see step_cost.py). Further logs are supported by
+adding a subclass to LOG_READERS.
+"""
+
+import os
+import re
+
+# Size of the chunks read from a log when catching up on new data
+READ_CHUNK_SIZE = 1 << 20
+# "key= value" or "key: value" pairs, e.g. "Nf= 0000012345" or "max. nodes: 1234"
+KEY_VALUE = re.compile(r"([A-Za-z][\w./-]*(?: [a-z][\w./-]*)*)\s*[=:]\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+
+
+def parse_key_values(lines):
+    """
+    Collect the numeric "key= value" and "key: value" pairs of some lines; the
+    first occurrence of a key wins.
+    """
+    data = {}
+    for line in lines:
+        for key, value in KEY_VALUE.findall(line):
+            if key not in data:
+                data[key] = float(value)
+    return data
+
+
+class LogTailReader:
+    """
+    Follow a log file incrementally. The reader remembers the byte offset (and
+    the inode, so that truncation or replacement of the file is noticed)
+    reached by the previous call, reads only the bytes appended since then and
+    parses the records that have been completed. A record starts with a line
+    beginning with record_start and ends at a blank line or at the next record;
+    single line records end with their line. Subclasses implement parse_record.
+
+    Inputs:
+        path: Path to the log file
+        detail: Keep every available column (see the subclasses)
+    """
+    # Lines starting with this begin a record (None: every non-blank line)
+    record_start = None
+    # Every record is a single line
+    single_line = False
+
+    def __init__(self, path, detail=False):
+        self.path = path
+        self.detail = detail
+        self.inode = None
+        self.offset = 0
+        self._partial = b""
+        self._block = []
+        # File positions of the start of self._partial and of the open block
+        self._line_start = 0
+        self._block_start = 0
+
+    def parse_record(self, lines):
+        """
+        Turn the lines of one record into a dictionary of columns, or None to skip it.
+        """
+        raise NotImplementedError
+
+    def _reset(self, inode, offset=0):
+        self.inode = inode
+        self.offset = offset
+        self._partial = b""
+        self._block = []
+        self._line_start = offset
+        self._block_start = offset
+
+    def state(self):
+        """
+        Position to resume from: the start of the first record not yet reported.
+        """
+        offset = self._block_start if self._block else self._line_start
+        return {'inode': self.inode, 'offset': offset}
+
+    def resume(self, state):
+        """
+        Continue from a position returned by state(). If the file has since been
+        replaced or truncated, reading starts again from the top.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if state and state['inode'] == st.st_ino and state['offset'] <= st.st_size:
+            self._reset(st.st_ino, state['offset'])
+        else:
+            self._reset(st.st_ino)
+
+    def seek_end(self):
+        """
+        Skip everything already in the file, so only new records are reported.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        self._reset(st.st_ino, st.st_size)
+
+    def read_new(self, max_bytes=None):
+        """
+        Read the bytes appended since the last call.
+
+        Inputs:
+            max_bytes: Stop after reading about this many bytes (default: read to the end)
+        Returns:
+            List of dictionaries (see parse_record), one per completed record
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            # File was replaced or truncated, start again from the top
+            self._reset(st.st_ino)
+        if st.st_size == self.offset:
+            return []
+
+        blocks = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            read_bytes = 0
+            while max_bytes is None or read_bytes < max_bytes:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                read_bytes += len(chunk)
+                self.offset += len(chunk)
+                lines = (self._partial + chunk).split(b"\n")
+                # Keep the incomplete last line for the next read
+                self._partial = lines.pop()
+                for line in lines:
+                    line_start = self._line_start
+                    self._line_start += len(line) + 1
+                    self._feed_line(line.decode('ascii', errors='replace').rstrip(), line_start, blocks)
+        return blocks
+
+    def _feed_line(self, line, line_start, blocks):
+        starts_record = line.startswith(self.record_start) if self.record_start else bool(line.strip())
+        if self.single_line:
+            if starts_record:
+                self._block = [line]
+                self._block_start = line_start
+                self._close_block(blocks)
+                self._block = []
+        elif starts_record:
+            if self._block:
+                self._close_block(blocks)
+            self._block = [line]
+            self._block_start = line_start
+        elif not line.strip():
+            # A blank line closes the current record
+            if self._block:
+                self._close_block(blocks)
+            self._block = []
+        elif self._block:
+            self._block.append(line)
+
+    def _close_block(self, blocks):
+        data = self.parse_record(self._block)
+        if data is not None:
+            # Byte offset of the record's first line, for random access (see cpu_index.py)
+            data['Offset'] = self._block_start
+            blocks.append(data)
+
+
+class TimingsTailReader(LogTailReader):
+    """
+    timings.txt: one block per step with the gravity tree statistics, e.g.
+        Step= 1234  t= 0.0123  dt= 1.2e-06
+        Nf= 0000012345  total-Nf= 0012345678  ex-frac= 0 (0) iter= 1
+        work-load balance: 1.21 (1.35 1.1)   max=0.52 avg=0.43
+        particle-load balance: 1.02
+        ...
+    Every numeric "key= value" or "key: value" pair becomes a column ("t" is
+    stored as "Simulation Time"); the exact set depends on the GIZMO version.
+    """
+    record_start = "Step="
+
+    def parse_record(self, lines):
+        values = parse_key_values(lines)
+        if 'Step' not in values:
+            return None
+        data = {'Step': int(values.pop('Step'))}
+        if 't' in values:
+            data['Simulation Time'] = values.pop('t')
+        data.update(values)
+        return data
+
+
+class BalanceTailReader(LogTailReader):
+    """
+    balance.txt: one line per step,
+        Step=   1234  sec=     0.512  Nf= 0000012345  ----**===;;;;<<<...
+    where the bar of symbols splits the step time between the code parts. The
+    legend at the top of the file ("treewalk1 = 'a' / 'A'") gives the symbol
+    of every part and of the time lost to imbalance in it; the share of the
+    bar taken by imbalance symbols is stored as "Imbalance Fraction" (and with
+    detail, the share of every part as "<part> share").
+    """
+    record_start = "Step="
+    single_line = True
+    LEGEND = re.compile(r"^\s*(\S[^=']*?)\s*=\s*'(.)'\s*/\s*'(.)'")
+
+    def __init__(self, path, detail=False):
+        super().__init__(path, detail)
+        self._legend = None
+
+    def _read_legend(self):
+        # The legend is written once at the top, read it directly so that
+        # resuming in the middle of the file works too
+        symbols, imbalance = {}, {}
+        try:
+            with open(self.path, 'r', errors='replace') as f:
+                for line in f:
+                    if line.startswith(self.record_start):
+                        break
+                    match = self.LEGEND.match(line)
+                    if match:
+                        symbols[match.group(2)] = match.group(1)
+                        imbalance[match.group(3)] = match.group(1)
+        except FileNotFoundError:
+            pass
+        return symbols, imbalance
+
+    def parse_record(self, lines):
+        line = lines[0]
+        values = parse_key_values([line])
+        if 'Step' not in values:
+            return None
+        data = {'Step': int(values.pop('Step'))}
+        data.update(values)
+
+        if self._legend is None or not self._legend[0]:
+            self._legend = self._read_legend()
+        symbols, imbalance = self._legend
+        bar = line.split()[-1] if symbols else ""
+        if bar and all(symbol in symbols or symbol in imbalance for symbol in bar):
+            data['Imbalance Fraction'] = sum(symbol in imbalance for symbol in bar) / len(bar)
+            if self.detail:
+                for symbol in bar:
+                    part = symbols.get(symbol, imbalance.get(symbol))
+                    data[part + " share"] = data.get(part + " share", 0.0) + 1.0 / len(bar)
+        return data
+
+
+class InfoTailReader(LogTailReader):
+    """
+    info.txt (and timebin.txt): one block per sync point,
+        Sync-Point 1234, Time: 0.0123, Redshift: 9.1, Systemstep: 1.2e-06, Dloga: 1.3e-06
+    optionally followed by the table of occupied time bins,
+         X  bin=20          12345          678     0.000001234567         1234 <  ...
+        ...
+        Total active:          12345          678    Sum:        13023
+    The sync point number is stored as "Step". When the table is there, the
+    active gas and other particles ("Active Gas", "Active Other", "Active"),
+    the number of occupied and active bins and the lowest active bin are
+    stored too (with detail, also the particles in every bin as "bin <n>").
+    """
+    record_start = "Sync-Point"
+
+    def parse_record(self, lines):
+        fields = [field.strip() for field in lines[0].split(',')]
+        try:
+            data = {'Step': int(fields[0].split()[1])}
+        except (IndexError, ValueError):
+            return None
+        for field in fields[1:]:
+            key, _, value = field.partition(':')
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+            data['Simulation Time' if key.strip() == "Time" else key.strip()] = value
+
+        occupied, active, lowest = 0, 0, None
+        for line in lines[1:]:
+            parts = line.split()
+            if line.startswith("Total active:") and len(parts) >= 4:
+                data['Active Gas'] = int(parts[2])
+                data['Active Other'] = int(parts[3])
+                data['Active'] = data['Active Gas'] + data['Active Other']
+                continue
+            match = re.search(r"bin=\s*(\d+)\s+(\d+)\s+(\d+)", line)
+            if match is None:
+                continue
+            number = int(match.group(1))
+            occupied += 1
+            if line.lstrip().startswith("X"):
+                active += 1
+                lowest = number if lowest is None else min(lowest, number)
+            if self.detail:
+                data[f"bin {number}"] = int(match.group(2)) + int(match.group(3))
+        if occupied:
+            data['Occupied Bins'] = occupied
+            data['Active Bins'] = active
+            data['Lowest Active Bin'] = lowest
+        return data
+
+
+class EnergyTailReader(LogTailReader):
+    """
+    energy.txt: one line of numbers per energy output (every TimeBetStatistics),
+    the time followed by the internal, potential and kinetic energy, the same
+    three per particle type and the mass per particle type. Columns beyond
+    those are stored as "column <n>". There is no step number, the rows are
+    keyed by "Simulation Time".
+    """
+    single_line = True
+    NAMES = ['Simulation Time', 'EnergyInt', 'EnergyPot', 'EnergyKin'] + \
+        [f"{name}_{ptype}" for name in ('EnergyInt', 'EnergyPot', 'EnergyKin') for ptype in range(6)] + \
+        [f"Mass_{ptype}" for ptype in range(6)]
+
+    def parse_record(self, lines):
+        try:
+            values = [float(value) for value in lines[0].split()]
+        except ValueError:
+            return None
+        names = self.NAMES if self.detail else self.NAMES[:4]
+        data = {}
+        for i, value in enumerate(values):
+            if i < len(names):
+                data[names[i]] = value
+            elif self.detail:
+                data[f"column {i}"] = value
+        return data
+
+
+class MemoryTailReader(LogTailReader):
+    """
+    memory.txt, or GIZMO's standard output: the memory reports of mymalloc,
+        MEMORY:  Largest Allocation = 1234.5 Mbyte  |  Largest Allocation Without Generic = 1100.2 Mbyte
+    stored as "Largest Allocation" and "Largest Allocation Without Generic"
+    (MB in use on the task using the most memory), the start-up report
+        Allocated 2000 MByte for particle storage.
+    stored as "Allocated", and failed allocations (MaxMemSize too small)
+        Not enough memory in mymalloc_fullinfo() to allocate 345.6 MB for variable 'P' ...
+    stored as "Failed Allocation". Every other line is skipped. There is no
+    step number, records are in the order they were written.
+    """
+    single_line = True
+    NUMBER = r"([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+    PATTERNS = [
+        ('Largest Allocation', re.compile(r"Largest Allocation\s*=\s*" + NUMBER, re.IGNORECASE)),
+        ('Largest Allocation Without Generic',
+         re.compile(r"Largest Allocation Without Generic\s*=\s*" + NUMBER, re.IGNORECASE)),
+        ('Allocated', re.compile(r"^\s*Allocated\s+" + NUMBER + r"\s*MByte", re.IGNORECASE)),
+        ('Failed Allocation', re.compile(r"Not enough memory.*?to allocate\s+" + NUMBER + r"\s*MB", re.IGNORECASE)),
+    ]
+
+    def parse_record(self, lines):
+        line = lines[0]
+        if "llocat" not in line and "memory" not in line:
+            return None
+        data = {}
+        for name, pattern in self.PATTERNS:
+            match = pattern.search(line)
+            if match:
+                data[name] = float(match.group(1))
+        return data if data else None
+
+
+# Log files the tracker can ingest besides cpu.txt: file name -> reader class
+LOG_READERS = {
+    'timings.txt': TimingsTailReader,
+    'balance.txt': BalanceTailReader,
+    'info.txt': InfoTailReader,
+    'timebin.txt': InfoTailReader,
+    'energy.txt': EnergyTailReader,
+    'memory.txt': MemoryTailReader,
+}
+
+
+def get_log_store_dir(store_dir, log_name):
+    """
+    Store location of a log next to the cpu.txt store: a sub-folder named
+    after the log ("<store_dir>/timings/" for timings.txt).
+    """
+    return os.path.join(store_dir, os.path.splitext(log_name)[0])
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+memory_usage.py: "Peak memory per MPI rank of a run, and the node count that keeps it in memory."
+
+GIZMO reserves MaxMemSize MB per rank at start-up and reports the largest
+use of that reserve over all ranks ("MEMORY: Largest Allocation = ...") in
+memory.txt and/or its standard output. The peak of these reports plus a
+margin is the MaxMemSize the run needs; a rank then occupies that plus some
+overhead (code, MPI buffers) of node memory. Failed allocations ("Not
+enough memory ...") are added on top of the reserve they ran out of.
+
+For every node type of the cluster, the ranks per node are the cores of a
+node or as many ranks as fit in its memory, whichever is smaller, and the
+node count the one needed for the run's number of MPI ranks (by default
+those of the last cpu.txt step), with the ranks spread evenly over the nodes.
+
+Usage: memory_usage.py [options]
+
+Options:
+    -h, --help                  Show this screen
+    --out_dir=<output>          Path to the output folder [default: ../output/]
+    --param_file=<params>       GIZMO parameter file holding MaxMemSize [default: ../params.txt]
+    --stdout=<files>            Comma separated files or globs with GIZMO's standard output
+                                [default: <out_dir>/../shell_*.out,<out_dir>/../mpi_output_*.txt]
+    --cluster=<cluster>         Cluster whose node types are considered (see node_types.py) [default: Rusty]
+    --node_type=<type>          Node type to recommend for (default: the one needing the fewest nodes)
+    --node_memory=<GB>          Override the memory per node of the node type(s), in GB
+    --ranks=<n>                 Number of MPI ranks (default: the CPUs of the last cpu.txt step)
+    --margin=<fraction>         Head room on top of the peak memory per rank [default: 0.2]
+    --overhead=<MB>             Memory per rank outside of MaxMemSize [default: 500]
+    --submit=<command>          Submit command to run with the node type, node count and ranks per node
+                                appended, e.g. "python job_submit_rusty.py --param-file params.txt --restart 1"
+"""
+
+import os
+import sys
+import glob
+import math
+import shlex
+import subprocess
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history, load_log_history
+from log_readers import MemoryTailReader
+from predict_eta import read_params
+
+# node_types.py sits next to the submit scripts, in setup_scripts/system_setup_scripts of the repository
+SETUP_SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "setup_scripts", "system_setup_scripts")
+sys.path.append(SETUP_SCRIPTS)
+from node_types import NODE_TYPES, SUBMIT_OPTIONS, USABLE_MEMORY_FRACTION, get_node_type
+
+
+def read_memory_reports(path):
+    """
+    All memory reports in one file (see log_readers.MemoryTailReader).
+
+    Returns:
+        Dictionary of column name -> numpy array
+    """
+    reader = MemoryTailReader(path)
+    records = []
+    while True:
+        blocks = reader.read_new(max_bytes=64 << 20)
+        if not blocks:
+            break
+        records.extend(blocks)
+    names = ('Largest Allocation', 'Allocated', 'Failed Allocation')
+    return {name: np.array([record[name] for record in records if name in record]) for name in names}
+
+def measure_memory(out_dir, stdout_files=(), max_mem_size=None):
+    """
+    Peak memory use per rank of a run from memory.txt and standard output files.
+
+    Returns:
+        Dictionary with the peak "Largest Allocation" (MB), the largest failed
+        allocation (MB, or None), the MaxMemSize reserved at start-up and the
+        number of reports found
+    """
+    reports = [load_log_history(out_dir, 'memory.txt')]
+    reports.extend(read_memory_reports(path) for path in stdout_files)
+    peaks, failed, allocated = [], [], []
+    for report in reports:
+        peaks.extend(np.asarray(report.get('Largest Allocation', []), dtype=float))
+        failed.extend(np.asarray(report.get('Failed Allocation', []), dtype=float))
+        allocated.extend(np.asarray(report.get('Allocated', []), dtype=float))
+    failed = [value for value in failed if np.isfinite(value)]
+    peaks = [value for value in peaks if np.isfinite(value)]
+    return {
+        'peak': max(peaks) if peaks else None,
+        'failed': max(failed) if failed else None,
+        'reserved': max_mem_size if max_mem_size is not None else (max(allocated) if allocated else None),
+        'reports': len(peaks),
+    }
+
+def required_per_rank(memory, margin=0.2, overhead=500.0):
+    """
+    MaxMemSize the run needs and the node memory one rank occupies with it, in MB.
+
+    Returns:
+        (MaxMemSize, footprint per rank), or (None, None) without any measurement
+    """
+    need = memory['peak']
+    if memory['failed'] is not None:
+        # The run ran out of its reserve: it needed at least the reserve plus the failed request
+        base = memory['reserved'] if memory['reserved'] is not None else (need or 0.0)
+        need = max(need or 0.0, base + memory['failed'])
+    if need is None:
+        if memory['reserved'] is None:
+            return None, None
+        # No usage reports, keep the current reserve
+        return memory['reserved'], memory['reserved'] + overhead
+    max_mem_size = math.ceil(need * (1 + margin))
+    return max_mem_size, max_mem_size + overhead
+
+def plan_nodes(ranks, footprint, cores, memory_gb):
+    """
+    Ranks per node and node count for one node type.
+
+    Inputs:
+        ranks: Number of MPI ranks of the run
+        footprint: Node memory per rank in MB
+        cores: Cores per node
+        memory_gb: Memory per node in GB
+    Returns:
+        Dictionary with the ranks per node, the node count, whether memory
+        (rather than cores) limits the ranks per node and the idle cores; None
+        if not even one rank fits on a node
+    """
+    usable = USABLE_MEMORY_FRACTION * memory_gb * 1024
+    fit = int(usable // footprint)
+    if fit < 1:
+        return None
+    per_node = min(cores, fit)
+    nodes = math.ceil(ranks / per_node)
+    # Spread the ranks evenly over the nodes
+    per_node = math.ceil(ranks / nodes)
+    return {'ranks_per_node': per_node, 'nodes': nodes, 'memory_bound': fit < cores,
+            'idle_cores': nodes * cores - ranks, 'memory_per_node_gb': per_node * footprint / 1024}
+
+def get_ranks(out_dir):
+    """
+    Number of MPI ranks of the last step in cpu.txt (None if unknown).
+    """
+    history = load_run_history(out_dir)
+    if 'CPUs' not in history or len(history['CPUs']) == 0:
+        return None
+    return int(history['CPUs'][-1])
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    out_dir = args['--out_dir']
+    if out_dir[-1] != "/":
+        out_dir += "/"
+    if args['--cluster'] not in NODE_TYPES:
+        print(f"Unknown cluster {args['--cluster']}, choose from {', '.join(NODE_TYPES)}. Exiting...")
+        exit(1)
+
+    max_mem_size = None
+    if os.path.exists(args['--param_file']):
+        params = read_params(args['--param_file'])
+        if 'MaxMemSize' in params:
+            max_mem_size = float(params['MaxMemSize'])
+    stdout_files = []
+    for pattern in args['--stdout'].split(','):
+        pattern = pattern.strip().replace("<out_dir>/", out_dir)
+        stdout_files.extend(path for path in sorted(glob.glob(pattern)) if path not in stdout_files)
+
+    memory = measure_memory(out_dir, stdout_files, max_mem_size)
+    ranks = int(args['--ranks']) if args['--ranks'] else get_ranks(out_dir)
+    if ranks is None:
+        print("Number of MPI ranks unknown (no cpu.txt), give --ranks. Exiting...")
+        exit(1)
+    max_mem_size, footprint = required_per_rank(memory, float(args['--margin']), float(args['--overhead']))
+    if footprint is None:
+        print("No memory reports found and no MaxMemSize in the parameter file. Exiting...")
+        exit(1)
+
+    print(f"Memory reports: {memory['reports']} (memory.txt and {len(stdout_files)} output file(s))")
+    if memory['peak'] is not None:
+        print(f"Peak use per rank: {memory['peak']:.0f} MB")
+    if memory['failed'] is not None:
+        print(f"Failed allocations found, largest {memory['failed']:.0f} MB: the run ran out of MaxMemSize")
+    if memory['reserved'] is not None:
+        print(f"Current MaxMemSize: {memory['reserved']:.0f} MB")
+    print(f"Suggested MaxMemSize: {max_mem_size} MB, {footprint / 1024:.2f} GB of node memory per rank")
+    print(f"MPI ranks: {ranks}\n")
+
+    node_types = [args['--node_type']] if args['--node_type'] else list(NODE_TYPES[args['--cluster']])
+    plans = {}
+    print(f"{'node type':<14}{'cores':>6}{'GB':>7}{'nodes':>7}{'ranks/node':>12}{'idle cores':>12}  limit")
+    for node_type in node_types:
+        try:
+            cores, memory_gb = get_node_type(args['--cluster'], node_type)
+        except ValueError as e:
+            print(f"{e}. Exiting...")
+            exit(1)
+        if args['--node_memory']:
+            memory_gb = float(args['--node_memory'])
+        plan = plan_nodes(ranks, footprint, cores, memory_gb)
+        if plan is None:
+            print(f"{node_type:<14}{cores:>6}{memory_gb:>7.0f}  a single rank does not fit")
+            continue
+        plans[node_type] = plan
+        print(f"{node_type:<14}{cores:>6}{memory_gb:>7.0f}{plan['nodes']:>7}{plan['ranks_per_node']:>12}"
+              f"{plan['idle_cores']:>12}  {'memory' if plan['memory_bound'] else 'cores'}")
+    if not plans:
+        print("No node type can hold a rank. Exiting...")
+        exit(1)
+
+    best = min(plans, key=lambda name: (plans[name]['nodes'], plans[name]['idle_cores']))
+    plan = plans[best]
+    options = SUBMIT_OPTIONS.get(args['--cluster'])
+    print(f"\nRecommended: {plan['nodes']} {best} node(s) with {plan['ranks_per_node']} ranks each")
+    if plan['memory_bound']:
+        print("Memory limits the ranks per node; the idle cores can run OpenMP threads instead")
+    if options is not None:
+        command = []
+        if options['type'] is not None:
+            command += [options['type'], best]
+        command += [options['nodes'], str(plan['nodes']), options['ranks'], str(plan['ranks_per_node'])]
+        print(f"Submit options: {' '.join(command)}")
+        if args['--submit']:
+            command = shlex.split(args['--submit']) + command
+            print(f"Running: {' '.join(command)}")
+            subprocess.run(command, check=True)
@@ -0,0 +1,105 @@
+"""
+metrics_exporter.py: "Serve the latest state of tracked runs in OpenMetrics format."
+
+Used by track_job.py --serve. Every scrape is answered from the snapshots the
+tracker keeps in memory (CPUHandler.snapshot), files are never read.
+"""
+
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# name, type, help
+METRICS = [
+    ("gizmo_step", "gauge", "Number of the last step written to cpu.txt"),
+    ("gizmo_simulation_time", "gauge", "Simulation time of the last step"),
+    ("gizmo_steps_per_hour", "gauge", "Steps per compute hour over the recent steps"),
+    ("gizmo_simulation_time_per_hour", "gauge", "Simulation time per compute hour over the recent steps"),
+    ("gizmo_step_timer_seconds", "gauge", "Wall clock seconds spent in each timer during the last step"),
+    ("gizmo_last_update_age_seconds", "gauge", "Seconds since the tracker last saw a new step"),
+    ("gizmo_job_running", "gauge", "Whether a job of the run's chain is running (track_job.py --job_status)"),
+    ("gizmo_jobs_queued", "gauge", "Jobs of the run's chain waiting in the queue (track_job.py --job_status)"),
+]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def format_openmetrics(handlers, now=None):
+    """
+    Render the snapshots of all handlers as an OpenMetrics text exposition.
+
+    Inputs:
+        handlers: Objects with run_name and snapshot attributes (track_job.CPUHandler)
+        now: Current time (default: time.time())
+    Returns:
+        The exposition as a string, terminated by "# EOF"
+    """
+    if now is None:
+        now = time.time()
+    samples = {name: [] for name, _, _ in METRICS}
+    for handler in handlers:
+        run = _labels(run=handler.run_name)
+        job = getattr(handler, 'job', None)
+        if job is not None:
+            samples["gizmo_job_running"].append(f"gizmo_job_running{run} {int(job['running'] > 0)}")
+            samples["gizmo_jobs_queued"].append(f"gizmo_jobs_queued{run} {job['pending']}")
+        snapshot = handler.snapshot
+        if snapshot is None:
+            continue
+        samples["gizmo_step"].append(f"gizmo_step{run} {snapshot['step']}")
+        samples["gizmo_simulation_time"].append(f"gizmo_simulation_time{run} {snapshot['sim_time']!r}")
+        if snapshot['steps_per_hour'] is not None:
+            samples["gizmo_steps_per_hour"].append(f"gizmo_steps_per_hour{run} {snapshot['steps_per_hour']!r}")
+            samples["gizmo_simulation_time_per_hour"].append(
+                f"gizmo_simulation_time_per_hour{run} {snapshot['sim_time_per_hour']!r}")
+        for timer, seconds in snapshot['timers'].items():
+            samples["gizmo_step_timer_seconds"].append(
+                f"gizmo_step_timer_seconds{_labels(run=handler.run_name, timer=timer)} {seconds!r}")
+        samples["gizmo_last_update_age_seconds"].append(
+            f"gizmo_last_update_age_seconds{run} {now - snapshot['last_update']:.3f}")
+
+    lines = []
+    for name, metric_type, help_text in METRICS:
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"# HELP {name} {help_text}")
+        lines.extend(samples[name])
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = format_openmetrics(self.server.run_handlers).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the tracker's output
+        return
+
+
+def start_metrics_server(handlers, port, host="127.0.0.1"):
+    """
+    Serve /metrics for the given handlers from a background thread.
+
+    Returns:
+        The server; call shutdown() on it to stop
+    """
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.run_handlers = handlers
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
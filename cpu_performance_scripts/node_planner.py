@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+node_planner.py: "Time to solution and core-hour cost of each node count and node type, from a core-count sweep."
+
+Earlier runs of the same setup at different core counts are compared over
+the simulation time interval they all covered (see scaling_analysis.py). The
+wall hours per unit of simulation time t(p) on p cores are fitted with
+    t(p) = serial + parallel / p + communication * log2(p)
+(Amdahl's law plus a communication term growing with the number of ranks,
+all coefficients non-negative). The fit predicts the remaining simulation
+time for whole nodes of every node type of the cluster; core hours are
+charged for all cores of the nodes. Node types other than the measured one
+are scaled by their per-core speed relative to it (--core_speed, 1 if not
+given); the communication term is not scaled. Predictions more than twice
+beyond the largest measured core count are marked with a "*".
+
+With a deadline the cheapest plan finishing in time is recommended, with a
+core-hour budget the fastest plan within it (both: the cheapest meeting
+both). Otherwise the fastest plan whose parallel efficiency relative to one
+node of its type is at least --efficiency is recommended.
+
+Usage: node_planner.py [options] <out_dirs>...
+
+Options:
+    -h, --help                  Show this screen
+    --skip_steps=<n>            Ignore this many initial steps of each run (start-up) [default: 10]
+    --param_file=<params>       GIZMO parameter file holding TimeMax [default: ../params.txt]
+    --remaining=<time>          Simulation time still to run (default: TimeMax minus the furthest run)
+    --cluster=<cluster>         Cluster whose node types are planned for (see node_types.py) [default: Rusty]
+    --node_type=<type>          Only plan for this node type
+    --measured_on=<type>        Node type the runs were measured on (default: from job_layout.txt, else rome)
+    --core_speed=<list>         Per-core speed relative to the measured node type, e.g. genoa:1.3,skylake:0.8
+    --max_nodes=<n>             Largest node count considered [default: 32]
+    --deadline=<hours>          Wall hours the remaining simulation has to finish in
+    --budget=<core_hours>       Core hours the remaining simulation may use
+    --efficiency=<eff>          Parallel efficiency threshold without deadline or budget [default: 0.7]
+    --submit=<command>          Submit command to run with the node type and node count appended, e.g.
+                                "python job_submit_rusty.py --param-file params.txt --restart 1"
+"""
+
+import os
+import sys
+import math
+import shlex
+import itertools
+import subprocess
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history, resolve_output_dirs, get_run_name
+from scaling_analysis import analyze_sweep
+from predict_eta import read_params
+from hybrid_layout import read_layout
+
+# The submit scripts, node_types.py and node_selection.py sit in setup_scripts/system_setup_scripts of the repository
+SETUP_SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "setup_scripts", "system_setup_scripts")
+sys.path.append(SETUP_SCRIPTS)
+from node_types import NODE_TYPES, SUBMIT_OPTIONS, get_node_type
+from node_selection import parse_speeds
+
+TERMS = ('serial', 'parallel', 'communication')
+
+
+def _design(cores):
+    cores = np.asarray(cores, dtype=float)
+    return np.column_stack([np.ones_like(cores), 1.0 / cores, np.log2(cores)])
+
+def fit_scaling(cores, hours_per_sim_time):
+    """
+    Fit t(p) = serial + parallel / p + communication * log2(p) with
+    non-negative coefficients, by least squares over every subset of terms
+    (at most as many terms as measured core counts).
+
+    Inputs:
+        cores: Core count of each run
+        hours_per_sim_time: Wall hours per unit of simulation time of each run
+    Returns:
+        Dictionary of term -> coefficient, plus the relative rms residual
+    """
+    design = _design(cores)
+    measured = np.asarray(hours_per_sim_time, dtype=float)
+    best = None
+    for size in range(1, min(len(TERMS), len(set(cores))) + 1):
+        for terms in itertools.combinations(range(len(TERMS)), size):
+            coefficients, _, _, _ = np.linalg.lstsq(design[:, terms], measured, rcond=None)
+            if (coefficients < 0).any():
+                continue
+            residual = np.sqrt(np.mean(((design[:, terms] @ coefficients - measured) / measured) ** 2))
+            if best is None or residual < best[0] - 1e-12:
+                best = (residual, terms, coefficients)
+    model = {term: 0.0 for term in TERMS}
+    if best is None:
+        return None
+    for index, coefficient in zip(best[1], best[2]):
+        model[TERMS[index]] = float(coefficient)
+    model['residual'] = float(best[0])
+    return model
+
+def predict_hours(model, cores, speed=1.0):
+    """
+    Wall hours per unit of simulation time on the given cores, for cores
+    running at speed times the measured per-core speed.
+    """
+    return (model['serial'] + model['parallel'] / cores) / speed + model['communication'] * math.log2(cores)
+
+def plan(model, remaining, cluster, node_types, speeds, max_nodes, measured_max):
+    """
+    Time to solution and core-hour cost of every node count of every node type.
+
+    Returns:
+        List of dictionaries with node_type, nodes, cores, hours, core_hours,
+        efficiency (relative to one node of the type) and extrapolated
+    """
+    plans = []
+    for node_type in node_types:
+        cores_per_node, _ = get_node_type(cluster, node_type)
+        speed = speeds.get(node_type, 1.0)
+        single = predict_hours(model, cores_per_node, speed)
+        for nodes in range(1, max_nodes + 1):
+            cores = nodes * cores_per_node
+            hours_per_sim_time = predict_hours(model, cores, speed)
+            hours = remaining * hours_per_sim_time
+            plans.append({
+                'node_type': node_type,
+                'nodes': nodes,
+                'cores': cores,
+                'hours': hours,
+                'core_hours': hours * cores,
+                'efficiency': single / (nodes * hours_per_sim_time),
+                'extrapolated': cores > 2 * measured_max,
+            })
+    return plans
+
+def choose(plans, deadline=None, budget=None, efficiency=0.7):
+    """
+    Recommended plan (see the module description), or None if no plan meets
+    the deadline and/or budget.
+    """
+    candidates = [plan for plan in plans
+                  if (deadline is None or plan['hours'] <= deadline)
+                  and (budget is None or plan['core_hours'] <= budget)]
+    if not candidates:
+        return None
+    if deadline is not None:
+        return min(candidates, key=lambda plan: (plan['core_hours'], plan['nodes']))
+    if budget is not None:
+        return min(candidates, key=lambda plan: (plan['hours'], plan['core_hours']))
+    efficient = [plan for plan in candidates if plan['efficiency'] >= efficiency] or candidates
+    return min(efficient, key=lambda plan: (plan['hours'], plan['core_hours']))
+
+def sbatch_directives(node_type, nodes):
+    """
+    #SBATCH lines of job_submit_rusty.create_sbatch_script for a plan, or
+    None if the submit script is not found.
+    """
+    # The submit scripts sit in the run folder once copied by gizmo_setup.py,
+    # or in setup_scripts/system_setup_scripts/Rusty of the repository
+    sys.path.extend([os.path.join(SETUP_SCRIPTS, "Rusty"), ".."])
+    try:
+        from job_submit_rusty import create_sbatch_script
+    except ModuleNotFoundError:
+        return None
+    script = create_sbatch_script(1, "params.txt", None, nodes, "gizmo_sim", cpu_type=node_type)
+    return [line for line in script.splitlines() if line.startswith("#SBATCH")]
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    cluster = args['--cluster']
+    if cluster not in NODE_TYPES:
+        print(f"Unknown cluster: {cluster}. Valid options: {list(NODE_TYPES.keys())}. Exiting...")
+        exit(1)
+
+    histories = {}
+    measured_on = args['--measured_on']
+    threads = {}
+    for out_dir in resolve_output_dirs(args['<out_dirs>']):
+        name = get_run_name(out_dir)
+        print(f"Loading {name}...")
+        histories[name] = load_run_history(out_dir)
+        layout = read_layout(out_dir)
+        if layout is not None:
+            threads[name] = layout['omp_threads']
+            if measured_on is None:
+                measured_on = layout['node_type']
+    if measured_on is None:
+        measured_on = "rome"
+
+    runs = analyze_sweep(histories, int(args['--skip_steps']))
+    for run in runs:
+        # Hybrid runs use threads times as many cores as cpu.txt lists ranks
+        run['cores'] *= threads.get(run['name'], 1)
+    runs = [run for run in runs if run['sim_time'] > 0]
+    if len(set(run['cores'] for run in runs)) < 2:
+        print("Need runs at two or more core counts to fit the scaling. Exiting...")
+        exit(1)
+
+    cores = [run['cores'] for run in runs]
+    measured = [run['wall_time'] / 3600. / run['sim_time'] for run in runs]
+    model = fit_scaling(cores, measured)
+    if model is None:
+        print("No scaling model fits the runs. Exiting...")
+        exit(1)
+
+    print(f"\n{'run':<28}{'cores':>8}{'h/sim time':>13}{'fit':>12}")
+    for run, hours in zip(runs, measured):
+        print(f"{run['name']:<28}{run['cores']:>8}{hours:>13.4g}{predict_hours(model, run['cores']):>12.4g}")
+    print(f"t(p) = {model['serial']:.4g} + {model['parallel']:.4g} / p + {model['communication']:.4g} log2(p) "
+          f"wall hours per simulation time (rms deviation {100 * model['residual']:.1f}%, measured on {measured_on})")
+
+    if args['--remaining']:
+        remaining = float(args['--remaining'])
+    else:
+        if not os.path.exists(args['--param_file']):
+            print(f"{args['--param_file']} not found, give --remaining. Exiting...")
+            exit(1)
+        params = read_params(args['--param_file'])
+        if 'TimeMax' not in params:
+            print(f"TimeMax not found in {args['--param_file']}. Exiting...")
+            exit(1)
+        furthest = max(float(np.nanmax(history['Simulation Time'])) for history in histories.values())
+        remaining = max(float(params['TimeMax']) - furthest, 0.0)
+    print(f"Remaining simulation time: {remaining:.6g}\n")
+
+    node_types = [args['--node_type']] if args['--node_type'] else list(NODE_TYPES[cluster])
+    speeds = parse_speeds(args['--core_speed'])
+    try:
+        plans = plan(model, remaining, cluster, node_types, speeds, int(args['--max_nodes']), max(cores))
+    except ValueError as e:
+        print(f"{e}. Exiting...")
+        exit(1)
+
+    deadline = float(args['--deadline']) if args['--deadline'] else None
+    budget = float(args['--budget']) if args['--budget'] else None
+    best = choose(plans, deadline, budget, float(args['--efficiency']))
+
+    print(f"{'node type':<14}{'nodes':>6}{'cores':>8}{'hours':>10}{'core hours':>13}{'efficiency':>12}")
+    for node_type in node_types:
+        for entry in plans:
+            if entry['node_type'] != node_type:
+                continue
+            # Full table for the recommended type, powers of two for the others
+            if entry is not best and (best is None or node_type != best['node_type']) and \
+                    entry['nodes'] & (entry['nodes'] - 1):
+                continue
+            marker = " <" if entry is best else ""
+            print(f"{node_type:<14}{entry['nodes']:>6}{entry['cores']:>7}{'*' if entry['extrapolated'] else ' '}"
+                  f"{entry['hours']:>10.1f}{entry['core_hours']:>13.0f}{entry['efficiency']:>12.2f}{marker}")
+
+    if best is None:
+        fastest = min(plans, key=lambda entry: entry['hours'])
+        cheapest = min(plans, key=lambda entry: entry['core_hours'])
+        print(f"\nNo plan meets the deadline/budget. Fastest: {fastest['nodes']} {fastest['node_type']} node(s), "
+              f"{fastest['hours']:.1f} h; cheapest: {cheapest['nodes']} {cheapest['node_type']} node(s), "
+              f"{cheapest['core_hours']:.0f} core hours. Exiting...")
+        exit(1)
+
+    print(f"\nRecommended: {best['nodes']} {best['node_type']} node(s), {best['hours']:.1f} h, "
+          f"{best['core_hours']:.0f} core hours")
+    if best['extrapolated']:
+        print("This is more than twice the largest measured core count, measure a run closer to it to confirm")
+    options = SUBMIT_OPTIONS.get(cluster)
+    if options is not None:
+        command = []
+        if options['type'] is not None:
+            command += [options['type'], best['node_type']]
+        command += [options['nodes'], str(best['nodes'])]
+        print(f"Submit options: {' '.join(command)}")
+        if cluster == "Rusty":
+            directives = sbatch_directives(best['node_type'], best['nodes'])
+            if directives is not None:
+                print("\n".join(directives))
+        if args['--submit']:
+            command = shlex.split(args['--submit']) + command
+            print(f"Running: {' '.join(command)}")
+            subprocess.run(command, check=True)
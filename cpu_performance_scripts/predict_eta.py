@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+predict_eta.py: "Predict when a run reaches TimeMax and how many chained jobs it still needs."
+
+The rate of simulation time per wall clock hour is measured over the most
+recent part of the run (--recent wall hours, cut into --blocks blocks whose
+scatter gives the uncertainty). Wall time here is the time GIZMO spent
+computing (sum of the "total" timer), so queue waits between jobs do not
+count. The number of jobs is sized from the conservative (rate - 2 sigma)
+estimate.
+
+Usage: predict_eta.py [options]
+
+Options:
+    -h, --help                  Show this screen
+    --out_dir=<output>          Path to the output folder [default: ../output/]
+    --param_file=<params>       GIZMO parameter file holding TimeMax [default: ../params.txt]
+    --time_max=<time>           Target simulation time (overrides TimeMax from the parameter file)
+    --wall_time=<hours>         Wall time of each job in the chain [default: 24]
+    --overhead=<hours>          Time lost per job to start-up, restart reading and writing [default: 0.25]
+    --recent=<hours>            Wall hours at the end of the run used to measure the rate [default: 12]
+    --blocks=<n>                Number of blocks the recent part is cut into [default: 6]
+    --submit=<command>          Submit command to run with --num-jobs <n> appended, e.g.
+                                "python job_submit_nia.py --param-file params.txt --restart 1"
+"""
+
+import math
+import shlex
+import subprocess
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history
+
+
+def read_params(param_file):
+    """
+    Read a GIZMO parameter file into a dictionary of name -> value (as strings).
+    Comments (starting with %) and blank lines are skipped.
+    """
+    params = {}
+    with open(param_file, 'r') as f:
+        for line in f:
+            line = line.split('%')[0].strip()
+            parts = line.split()
+            if len(parts) >= 2:
+                params[parts[0]] = parts[1]
+    return params
+
+def measure_rate(sim_time, wall_time, recent=12.0, blocks=6):
+    """
+    Recent rate of simulation time per wall clock hour.
+
+    Inputs:
+        sim_time: Simulation time of each step
+        wall_time: Cumulative wall time of each step, in seconds
+        recent: Number of wall hours at the end of the run to use
+        blocks: Number of equal wall time blocks the recent part is cut into
+    Returns:
+        (rate, uncertainty of the rate), in simulation time per wall hour
+    """
+    wall_hours = wall_time / 3600.
+    start = wall_hours[-1] - recent
+    edges = np.linspace(max(start, wall_hours[0]), wall_hours[-1], blocks + 1)
+    # Simulation time reached at each block edge
+    sim_at_edges = np.interp(edges, wall_hours, sim_time)
+    rates = np.diff(sim_at_edges) / np.diff(edges)
+    rates = rates[np.isfinite(rates)]
+    if len(rates) == 0:
+        return np.nan, np.nan
+    if len(rates) == 1:
+        return rates[0], np.nan
+    return rates.mean(), rates.std(ddof=1) / math.sqrt(len(rates))
+
+def count_jobs(remaining_hours, wall_time=24.0, overhead=0.25):
+    """
+    Number of jobs of the given wall time needed for the remaining compute hours.
+    """
+    usable = wall_time - overhead
+    if usable <= 0:
+        raise ValueError("Job wall time must be longer than the per-job overhead")
+    return max(1, math.ceil(remaining_hours / usable))
+
+def predict(out_dir, time_max, wall_time=24.0, overhead=0.25, recent=12.0, blocks=6):
+    """
+    Predict the remaining compute time of a run and the jobs needed to finish it.
+
+    Returns:
+        Dictionary with the current simulation time, the rate and its
+        uncertainty, the central and conservative remaining wall hours and the
+        number of jobs for each
+    """
+    history = load_run_history(out_dir)
+    if len(history['Step']) < 2:
+        raise ValueError(f"Not enough steps in {out_dir}cpu.txt")
+    sim_time = np.asarray(history['Simulation Time'])
+    current = float(sim_time[-1])
+    rate, error = measure_rate(sim_time, np.asarray(history['Wall Time']), recent, blocks)
+    if not rate > 0:
+        raise ValueError("Simulation time is not advancing, cannot predict")
+
+    conservative_rate = rate - 2 * error if np.isfinite(error) and rate - 2 * error > 0 else rate
+    remaining = max(time_max - current, 0.0)
+    hours = remaining / rate
+    hours_conservative = remaining / conservative_rate
+    return {
+        'sim_time': current,
+        'time_max': time_max,
+        'rate': rate,
+        'rate_error': error,
+        'hours': hours,
+        'hours_conservative': hours_conservative,
+        'jobs': count_jobs(hours, wall_time, overhead),
+        'jobs_conservative': count_jobs(hours_conservative, wall_time, overhead),
+    }
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    out_dir = args['--out_dir']
+    if out_dir[-1] != "/":
+        out_dir += "/"
+
+    if args['--time_max']:
+        time_max = float(args['--time_max'])
+    else:
+        params = read_params(args['--param_file'])
+        if 'TimeMax' not in params:
+            print(f"TimeMax not found in {args['--param_file']}. Exiting...")
+            exit(1)
+        time_max = float(params['TimeMax'])
+
+    wall_time = float(args['--wall_time'])
+    prediction = predict(out_dir, time_max, wall_time, float(args['--overhead']),
+                         float(args['--recent']), int(args['--blocks']))
+
+    print(f"Simulation time: {prediction['sim_time']:.6g} / {time_max:.6g}")
+    print(f"Rate: {prediction['rate']:.4g} +- {prediction['rate_error']:.2g} simulation time per wall hour")
+    print(f"Remaining compute time: {prediction['hours']:.1f} h "
+          f"(conservative: {prediction['hours_conservative']:.1f} h)")
+    print(f"Jobs of {wall_time:g} h needed: {prediction['jobs']} "
+          f"(conservative: {prediction['jobs_conservative']})")
+
+    if args['--submit']:
+        command = shlex.split(args['--submit']) + ['--num-jobs', str(prediction['jobs_conservative'])]
+        print(f"Running: {' '.join(command)}")
+        subprocess.run(command, check=True)
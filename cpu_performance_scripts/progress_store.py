@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""
+progress_store.py: "Columnar, memory-mappable store of the per-step history parsed from cpu.txt."
+
+The store is a directory holding one NPY file per column and chunk, plus a
+small JSON index (store.json) describing the columns, the chunks and where in
+cpu.txt the last flushed step ended. Every column is float64 except "Step"
+and "Offset" (byte offset of the step's block in cpu.txt), which are int64.
+"Wall Time" is the running sum of the "total" timer, i.e. the wall clock
+seconds the simulation has spent up to and including that step. The other
+logs recorded by track_job.py (see log_readers.py) use the same store, in
+sub-folders, without the "Wall Time" column.
+
+Usage: progress_store.py [options]
+
+Options:
+    -h, --help                  Show this screen
+    --store_dir=<store>         Path to the store [default: ../output/progress_store/]
+    --compact                   Merge all chunks into a single chunk
+"""
+
+import os
+import re
+import json
+import shutil
+import numpy as np
+from docopt import docopt
+
+INDEX_FILE = "store.json"
+INT_COLUMNS = ('Step', 'Offset')
+# Merge the trailing small chunks once there are more than this many of them
+MAX_SMALL_CHUNKS = 16
+
+
+class ProgressStore:
+    """
+    Append-only columnar store of parsed cpu.txt steps.
+
+    Inputs:
+        path: Directory of the store (created when the first rows are flushed, so
+              that logs a run does not write leave no empty store behind)
+        chunk_rows: Number of buffered rows after which the store should be flushed
+        create: False to open the store read-only: nothing is created or written
+                (an absent store is empty), rows can still be appended in memory
+    """
+    def __init__(self, path, chunk_rows=4096, create=True):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.read_only = not create
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'files': {}, 'chunks': [], 'wall_time': 0.0, 'source': None}
+        self._rows = []
+
+    @property
+    def columns(self):
+        names = list(self.index['files'].keys())
+        for row in self._rows:
+            for key in row:
+                if key not in names:
+                    names.append(key)
+        return names
+
+    @property
+    def num_rows(self):
+        return sum(chunk['rows'] for chunk in self.index['chunks']) + len(self._rows)
+
+    @property
+    def pending(self):
+        return len(self._rows)
+
+    @property
+    def source_state(self):
+        """
+        State of the cpu.txt reader at the last flush (inode and byte offset), or None.
+        """
+        return self.index['source']
+
+    def append(self, rows):
+        """
+        Buffer parsed steps (dictionaries from track_job.parse_step_block).
+        The wall time column is filled in from the "total" timer, for rows
+        that have one.
+        """
+        for row in rows:
+            row = dict(row)
+            if 'total' in row:
+                self.index['wall_time'] += row['total']
+                row['Wall Time'] = self.index['wall_time']
+            self._rows.append(row)
+
+    def flush(self, source_state=None):
+        """
+        Write the buffered rows as a new chunk and update the index.
+
+        Inputs:
+            source_state: Reader state matching the rows written so far, stored
+                          so that tracking can resume from there
+        """
+        self._check_writable()
+        if self._rows:
+            names = []
+            for row in self._rows:
+                for key in row:
+                    if key not in names:
+                        names.append(key)
+            columns = {}
+            for name in names:
+                if name in INT_COLUMNS:
+                    columns[name] = np.array([row.get(name, -1) for row in self._rows], dtype=np.int64)
+                else:
+                    columns[name] = np.array([_to_float(row.get(name)) for row in self._rows], dtype=np.float64)
+            self._write_chunk(columns)
+            self._rows = []
+            self._compact_tail()
+        if source_state is not None:
+            self.index['source'] = source_state
+        if os.path.isdir(self.path):
+            self._save_index()
+
+    def load(self, name):
+        """
+        Load one column over all chunks, followed by the rows not flushed yet.
+        A single chunk is returned as a read-only memory map, otherwise the parts
+        are concatenated. Chunks written before a column first appeared are
+        filled with NaN.
+        """
+        arrays = []
+        for chunk in self.index['chunks']:
+            if name in chunk['columns']:
+                arrays.append(np.load(self._file(chunk, name), mmap_mode='r'))
+            elif name in INT_COLUMNS:
+                arrays.append(np.full(chunk['rows'], -1, dtype=np.int64))
+            else:
+                arrays.append(np.full(chunk['rows'], np.nan))
+        if self._rows:
+            if name in INT_COLUMNS:
+                arrays.append(np.array([row.get(name, -1) for row in self._rows], dtype=np.int64))
+            else:
+                arrays.append(np.array([_to_float(row.get(name)) for row in self._rows], dtype=np.float64))
+        if not arrays:
+            return np.array([], dtype=np.int64 if name in INT_COLUMNS else np.float64)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.concatenate(arrays)
+
+    def iter_chunks(self, names):
+        """
+        Yield the given columns one chunk at a time (memory maps where
+        possible, see load), followed by the rows not flushed yet, so that a
+        long history can be processed without holding it in memory.
+        """
+        for chunk in self.index['chunks']:
+            columns = {}
+            for name in names:
+                if name in chunk['columns']:
+                    columns[name] = np.load(self._file(chunk, name), mmap_mode='r')
+                elif name in INT_COLUMNS:
+                    columns[name] = np.full(chunk['rows'], -1, dtype=np.int64)
+                else:
+                    columns[name] = np.full(chunk['rows'], np.nan)
+            yield columns
+        if self._rows:
+            yield {name: np.array([row.get(name, -1) for row in self._rows], dtype=np.int64) if name in INT_COLUMNS
+                   else np.array([_to_float(row.get(name)) for row in self._rows], dtype=np.float64)
+                   for name in names}
+
+    def load_columns(self, names=None):
+        """
+        Load several columns (all of them by default) as a dictionary of arrays.
+        """
+        if names is None:
+            names = self.columns
+        return {name: self.load(name) for name in names}
+
+    def compact(self, chunks=None):
+        """
+        Merge chunks (all of them by default) into a single chunk.
+        """
+        self._check_writable()
+        if chunks is None:
+            chunks = list(self.index['chunks'])
+        if len(chunks) < 2:
+            return
+        names = []
+        for chunk in chunks:
+            for name in chunk['columns']:
+                if name not in names:
+                    names.append(name)
+        columns = {}
+        for name in names:
+            parts = []
+            for chunk in chunks:
+                if name in chunk['columns']:
+                    parts.append(np.load(self._file(chunk, name)))
+                elif name in INT_COLUMNS:
+                    parts.append(np.full(chunk['rows'], -1, dtype=np.int64))
+                else:
+                    parts.append(np.full(chunk['rows'], np.nan))
+            columns[name] = np.concatenate(parts)
+
+        position = self.index['chunks'].index(chunks[0])
+        for chunk in chunks:
+            self.index['chunks'].remove(chunk)
+        self._write_chunk(columns, position=position)
+        self._save_index()
+        for chunk in chunks:
+            shutil.rmtree(os.path.join(self.path, chunk['name']), ignore_errors=True)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError(f"Progress store {self.path} is opened read-only")
+
+    def _compact_tail(self):
+        tail = []
+        for chunk in reversed(self.index['chunks']):
+            if chunk['rows'] >= self.chunk_rows:
+                break
+            tail.insert(0, chunk)
+        if len(tail) > MAX_SMALL_CHUNKS:
+            self.compact(tail)
+
+    def _write_chunk(self, columns, position=None):
+        number = self.index.get('next_chunk', 0)
+        self.index['next_chunk'] = number + 1
+        chunk = {'name': f"chunk_{number:06d}", 'rows': len(next(iter(columns.values()))),
+                 'columns': list(columns.keys())}
+        os.makedirs(os.path.join(self.path, chunk['name']), exist_ok=True)
+        for name, values in columns.items():
+            if name not in self.index['files']:
+                self.index['files'][name] = self._file_name(name)
+            np.save(self._file(chunk, name), values)
+        if position is None:
+            self.index['chunks'].append(chunk)
+        else:
+            self.index['chunks'].insert(position, chunk)
+
+    def _file_name(self, name):
+        base = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+        file_name = base
+        counter = 1
+        while file_name in self.index['files'].values():
+            counter += 1
+            file_name = f"{base}_{counter}"
+        return file_name
+
+    def _file(self, chunk, name):
+        return os.path.join(self.path, chunk['name'], self.index['files'][name] + ".npy")
+
+    def _save_index(self):
+        # Write to a temporary file first so readers never see a partial index
+        index_path = os.path.join(self.path, INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, index_path)
+
+
+def _to_float(value):
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    store = ProgressStore(args['--store_dir'])
+    if args['--compact']:
+        store.compact()
+    print(f"{store.num_rows} steps in {len(store.index['chunks'])} chunks")
+    print(f"Columns: {', '.join(store.columns)}")
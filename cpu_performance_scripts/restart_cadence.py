@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+restart_cadence.py: "Restart interval and TimeLimitCPU for a job's wall time, from the measured restart cost and failure rate."
+
+From the run's cpu.txt history:
+  - restart write cost: the extra i/o time of the steps that write files
+    (restart files and snapshots; override with --restart_cost),
+  - longest step: the 99th percentile of the step wall times without the file writes,
+  - failures: jobs that ended without writing restart files (node failure,
+    preemption, wall time reached) make the next job repeat steps; their
+    number over the compute hours of the run gives the mean time between
+    failures (override with --mtbf, e.g. for the preempt partition).
+The restart interval minimizing the compute lost to writing restart files
+and to redoing steps after a failure is Daly's refinement of Young's
+sqrt(2 x restart cost x MTBF). TimeLimitCPU is set so that GIZMO ends each job
+(writing restart files) a margin before the wall time runs out: start-up,
+the longest step and the restart write, so no compute is lost at the
+boundary between two jobs of the chain.
+
+Usage: restart_cadence.py [options]
+
+Options:
+    -h, --help                  Show this screen
+    --out_dir=<output>          Path to the output folder [default: ../output/]
+    --param_file=<params>       GIZMO parameter file with the current CpuTimeBetRestartFile [default: ../params.txt]
+    --wall_time=<hours>         Wall time of each job in the chain [default: 24]
+    --startup=<minutes>         Start-up and restart reading time of a job [default: 5]
+    --restart_cost=<seconds>    Time to write the restart files (default: measured)
+    --mtbf=<hours>              Mean compute hours between failures (default: measured, at least 168)
+    --skip_steps=<n>            Ignore this many initial steps (start-up) [default: 10]
+    --submit=<command>          Submit command to run with the wall time, margin and restart interval
+                                appended, e.g. "python job_submit_nia.py --param-file params.txt --restart 1"
+"""
+
+import os
+import sys
+import math
+import shlex
+import subprocess
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history
+from predict_eta import read_params
+
+IO_TIMER = "i/o"
+# Mean time between failures assumed when the run has had none, in hours
+MIN_MTBF = 168.0
+
+
+def find_failures(steps, wall_time):
+    """
+    Jobs that ended without restart files: the next job starts again at an
+    earlier step.
+
+    Inputs:
+        steps: Step number of each record
+        wall_time: Cumulative wall time of each record, in seconds
+    Returns:
+        List of (index of the first repeated record, seconds of steps redone)
+    """
+    failures = []
+    for i in np.nonzero(np.diff(steps) <= 0)[0] + 1:
+        j = i - 1
+        while j > 0 and steps[j - 1] >= steps[i] and steps[j - 1] < steps[j]:
+            j -= 1
+        failures.append((int(i), float(wall_time[i - 1] - (wall_time[j - 1] if j > 0 else 0.0))))
+    return failures
+
+def measure_restart_cost(io_time):
+    """
+    Extra i/o seconds of the steps writing files, over the typical step's
+    i/o time, or None if no step stands out.
+    """
+    io_time = io_time[np.isfinite(io_time)]
+    if len(io_time) == 0:
+        return None
+    baseline = float(np.median(io_time))
+    writes = io_time[io_time > max(5 * baseline, baseline + 1.0)]
+    if len(writes) == 0:
+        return None
+    return float(np.median(writes)) - baseline
+
+def optimal_interval(restart_cost, mtbf):
+    """
+    Daly's restart interval minimizing the expected lost compute time.
+
+    Inputs:
+        restart_cost: Time to write the restart files
+        mtbf: Mean time between failures, in the same unit
+    Returns:
+        (Daly's interval, Young's interval sqrt(2 restart_cost mtbf))
+    """
+    young = math.sqrt(2 * restart_cost * mtbf)
+    if restart_cost >= 2 * mtbf:
+        return mtbf, young
+    ratio = restart_cost / (2 * mtbf)
+    return young * (1 + math.sqrt(ratio) / 3 + ratio / 9) - restart_cost, young
+
+def lost_fraction(interval, restart_cost, mtbf):
+    """
+    Expected fraction of compute time spent writing restart files or redoing
+    steps after failures, for restart files every interval (first order).
+    """
+    return restart_cost / interval + (interval + restart_cost) / (2 * mtbf)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    out_dir = args['--out_dir']
+    if out_dir[-1] != "/":
+        out_dir += "/"
+    skip_steps = int(args['--skip_steps'])
+
+    history = load_run_history(out_dir)
+    if len(history['Step']) <= skip_steps + 1:
+        print(f"Not enough steps in {out_dir}cpu.txt. Exiting...")
+        exit(1)
+    steps = np.asarray(history['Step'])
+    wall = np.asarray(history['Wall Time'])
+    compute_hours = float(wall[-1]) / 3600.
+
+    step_times = np.asarray(history['total'])[skip_steps:]
+    if IO_TIMER in history:
+        # The file writes are counted in the restart cost
+        io_time = np.asarray(history[IO_TIMER])[skip_steps:]
+        step_times = step_times - np.clip(io_time - np.nanmedian(io_time), 0, None)
+    longest_step = float(np.nanpercentile(step_times, 99))
+
+    if args['--restart_cost']:
+        restart_cost = float(args['--restart_cost'])
+    else:
+        restart_cost = measure_restart_cost(np.asarray(history[IO_TIMER])[skip_steps:]) \
+            if IO_TIMER in history else None
+        if restart_cost is None:
+            print("No restart writes found in the i/o timer, give --restart_cost. Exiting...")
+            exit(1)
+
+    failures = find_failures(steps, wall)
+    redone = sum(seconds for _, seconds in failures) / 3600.
+    if args['--mtbf']:
+        mtbf = float(args['--mtbf'])
+    elif failures:
+        mtbf = compute_hours / len(failures)
+    else:
+        mtbf = max(compute_hours, MIN_MTBF)
+
+    wall_time = float(args['--wall_time'])
+    startup = float(args['--startup'])
+    margin = math.ceil(startup + (restart_cost + longest_step) / 60.)
+
+    interval, young = optimal_interval(restart_cost / 3600., mtbf)
+    # Restart files are also written when each job ends
+    usable = wall_time - margin / 60.
+    interval = min(interval, usable)
+
+    print(f"Compute hours: {compute_hours:.1f}, failures: {len(failures)} "
+          f"({redone:.2f} h of steps redone)")
+    print(f"Mean time between failures: {mtbf:.1f} h" + ("" if failures or args['--mtbf'] else " (assumed)"))
+    print(f"Restart write: {restart_cost:.1f} s, longest step: {longest_step:.1f} s, start-up: {startup:g} min")
+    print(f"Restart interval: {interval:.2f} h (Young: {young:.2f} h), "
+          f"expected loss {100 * lost_fraction(interval, restart_cost / 3600., mtbf):.2f}%")
+    if os.path.exists(args['--param_file']):
+        current = read_params(args['--param_file']).get('CpuTimeBetRestartFile')
+        if current is not None and float(current) > 0:
+            current = float(current) / 3600.
+            print(f"Current interval: {current:.2f} h, expected loss "
+                  f"{100 * lost_fraction(current, restart_cost / 3600., mtbf):.2f}%")
+    print(f"Margin before the wall time: {margin} min ({100 * margin / 60. / wall_time:.1f}% of a {wall_time:g} h job)")
+
+    # time_limits.py sits next to the submit scripts, in setup_scripts/system_setup_scripts of the repository
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "setup_scripts",
+                                 "system_setup_scripts"))
+    try:
+        from time_limits import time_limit_params
+    except ModuleNotFoundError:
+        time_limit_params = None
+    if time_limit_params is not None:
+        params = time_limit_params(wall_time, margin, interval)
+        print(f"Parameters: TimeLimitCPU {params['TimeLimitCPU']}, "
+              f"CpuTimeBetRestartFile {params['CpuTimeBetRestartFile']}")
+
+    options = ['--wall-time', f"{wall_time:g}", '--sync-time-limits', '--time-margin', str(margin),
+               '--restart-interval', f"{interval:.3f}"]
+    print(f"Submit options: {' '.join(options)}")
+    if args['--submit']:
+        command = shlex.split(args['--submit']) + options
+        print(f"Running: {' '.join(command)}")
+        subprocess.run(command, check=True)
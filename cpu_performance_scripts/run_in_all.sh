@@ -51,3 +51,9 @@ for x in {32,64,128,256,512} ; do
     echo MHD_"$b"_core"$x"
     ls -lh ./MHD_"$b"_core"$x"/output/
 done
+
+# Track all runs above from a single process
+#python track_job.py ./MHD_*_core*/output/ &
+
+# Strong-scaling summary of the sweeps above
+#python scaling_analysis.py ./MHD_*_core*/output/ --plot=scaling.pdf
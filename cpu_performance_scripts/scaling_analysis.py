@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+scaling_analysis.py: "Strong-scaling analysis of a core-count sweep of the same GIZMO setup."
+
+Every run is compared over the simulation time interval that all runs have
+covered, so runs that got further than others do not skew the comparison.
+Runs are grouped into sweeps by their folder name with the core count
+removed, e.g. MHD_1e-1_core32 and MHD_1e-1_core512 form the sweep MHD_1e-1.
+
+Usage: scaling_analysis.py [options] <out_dirs>...
+
+Options:
+    -h, --help                  Show this screen
+    --skip_steps=<n>            Ignore this many initial steps of each run (start-up) [default: 10]
+    --efficiency=<eff>          Parallel efficiency below which a timer counts as no longer scaling [default: 0.7]
+    --timers=<timers>           Comma separated timers to report (default: all)
+    --plot=<file>               Save speedup/efficiency plots to this file (one page per sweep)
+"""
+
+import os
+import re
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history, resolve_output_dirs, get_run_name, get_timer_names
+
+
+def get_sweep_name(run_name):
+    """
+    Name of the sweep a run belongs to: the run name without its core count.
+    """
+    sweep = re.sub(r'[_-]?cores?[_-]?\d+', '', run_name)
+    return sweep if sweep else run_name
+
+def summarize_run(history, sim_time_end, skip_steps=10):
+    """
+    Wall clock time spent by a run between its first analysed step and the
+    last step before sim_time_end, in total and per timer.
+
+    Inputs:
+        history: Dictionary of columns from track_job.load_run_history
+        sim_time_end: Simulation time up to which the run is analysed
+        skip_steps: Number of initial steps to ignore
+    Returns:
+        Dictionary with the core count, number of steps, simulation time
+        covered, wall time and per-timer wall time
+    """
+    sim_time = history['Simulation Time']
+    selection = np.zeros(len(sim_time), dtype=bool)
+    selection[skip_steps:] = True
+    selection &= sim_time <= sim_time_end
+    if not selection.any():
+        return None
+
+    timers = {}
+    for name in get_timer_names(history):
+        timers[name] = float(np.nansum(history[name][selection]))
+
+    cores = history['CPUs'][selection]
+    covered = sim_time[selection]
+    return {
+        'cores': int(np.nanmedian(cores)) if np.isfinite(cores).any() else None,
+        'steps': int(selection.sum()),
+        'sim_time': float(covered[-1] - covered[0]),
+        'wall_time': timers.get('total', float(np.sum(np.diff(history['Wall Time'][selection])))),
+        'timers': timers,
+    }
+
+def analyze_sweep(histories, skip_steps=10):
+    """
+    Speedup, parallel efficiency and cost of each run of a sweep, relative to
+    the run with the fewest cores.
+
+    Inputs:
+        histories: Dictionary of run name -> history (see summarize_run)
+        skip_steps: Number of initial steps to ignore in each run
+    Returns:
+        List of run summaries sorted by core count, each extended with
+        speedup, efficiency, core_hours_per_sim_time and timer_efficiency
+    """
+    usable = {name: history for name, history in histories.items() if len(history['Step']) > skip_steps}
+    if not usable:
+        return []
+    # Common simulation time interval covered by all runs
+    sim_time_end = min(float(np.nanmax(history['Simulation Time'])) for history in usable.values())
+
+    runs = []
+    for name, history in usable.items():
+        summary = summarize_run(history, sim_time_end, skip_steps)
+        if summary is None or summary['cores'] is None or summary['wall_time'] <= 0:
+            print(f"Skipping {name}: no usable steps")
+            continue
+        summary['name'] = name
+        runs.append(summary)
+    runs.sort(key=lambda run: run['cores'])
+    if not runs:
+        return runs
+
+    reference = runs[0]
+    for run in runs:
+        run['speedup'] = reference['wall_time'] / run['wall_time']
+        run['efficiency'] = run['speedup'] * reference['cores'] / run['cores']
+        if run['sim_time'] > 0:
+            run['core_hours_per_sim_time'] = run['cores'] * run['wall_time'] / 3600. / run['sim_time']
+        else:
+            run['core_hours_per_sim_time'] = np.nan
+        run['timer_efficiency'] = {}
+        for timer, seconds in run['timers'].items():
+            reference_seconds = reference['timers'].get(timer, 0.0)
+            if seconds > 0 and reference_seconds > 0:
+                run['timer_efficiency'][timer] = reference_seconds * reference['cores'] / (seconds * run['cores'])
+    return runs
+
+def find_scaling_limits(runs, efficiency=0.7):
+    """
+    For every timer, the smallest core count at which its parallel efficiency
+    drops below the threshold.
+
+    Returns:
+        List of (timer, core count or None, efficiency at the largest core count),
+        timers that stop scaling first come first
+    """
+    timers = []
+    for run in runs:
+        for timer in run['timer_efficiency']:
+            if timer not in timers:
+                timers.append(timer)
+
+    limits = []
+    for timer in timers:
+        limit = None
+        for run in runs:
+            if run['timer_efficiency'].get(timer, 1.0) < efficiency:
+                limit = run['cores']
+                break
+        last = runs[-1]['timer_efficiency'].get(timer, np.nan)
+        limits.append((timer, limit, last))
+    limits.sort(key=lambda item: (item[1] is None, item[1] if item[1] is not None else 0, item[2]))
+    return limits
+
+def print_sweep(sweep, runs, efficiency=0.7, timers=None):
+    print(f"\n=== {sweep} ===")
+    print(f"{'run':<30}{'cores':>8}{'steps':>10}{'wall [s]':>12}{'speedup':>10}{'eff.':>8}{'core-h/sim time':>18}")
+    for run in runs:
+        print(f"{run['name']:<30}{run['cores']:>8d}{run['steps']:>10d}{run['wall_time']:>12.1f}"
+              f"{run['speedup']:>10.2f}{run['efficiency']:>8.2f}{run['core_hours_per_sim_time']:>18.4g}")
+
+    limits = find_scaling_limits(runs, efficiency)
+    if timers:
+        limits = [limit for limit in limits if limit[0] in timers]
+    print(f"\nTimers by scaling limit (efficiency < {efficiency}):")
+    print(f"{'timer':<20}{'stops at':>10}{'eff. @ max cores':>18}{'share @ max cores':>19}")
+    last = runs[-1]
+    for timer, limit, last_efficiency in limits:
+        share = last['timers'].get(timer, 0.0) / last['wall_time']
+        stops = str(limit) if limit is not None else "-"
+        print(f"{timer:<20}{stops:>10}{last_efficiency:>18.2f}{share:>18.1%}")
+
+def plot_sweeps(sweeps, plot_file, efficiency=0.7, timers=None):
+    """
+    Speedup (with the ideal line) and per-timer efficiency for each sweep. A
+    PDF gets one page per sweep, other formats one file per sweep
+    (<name>_<sweep>.<ext>) when there are several sweeps.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    pdf = PdfPages(plot_file) if plot_file.endswith('.pdf') else None
+    for sweep, runs in sweeps.items():
+        cores = np.array([run['cores'] for run in runs])
+        fig, (ax_speedup, ax_efficiency) = plt.subplots(1, 2, figsize=(12, 5))
+        ax_speedup.loglog(cores, [run['speedup'] for run in runs], 'o-', label='measured')
+        ax_speedup.loglog(cores, cores / cores[0], 'k--', label='ideal')
+        ax_speedup.set_xlabel('cores')
+        ax_speedup.set_ylabel('speedup')
+        ax_speedup.legend()
+
+        limits = find_scaling_limits(runs, efficiency)
+        names = [limit[0] for limit in limits if not timers or limit[0] in timers]
+        for timer in names[:10]:
+            ax_efficiency.semilogx(cores, [run['timer_efficiency'].get(timer, np.nan) for run in runs],
+                                   'o-', label=timer)
+        ax_efficiency.axhline(efficiency, color='k', ls=':')
+        ax_efficiency.set_xlabel('cores')
+        ax_efficiency.set_ylabel('parallel efficiency')
+        ax_efficiency.legend(fontsize='small')
+        fig.suptitle(sweep)
+
+        if pdf is not None:
+            pdf.savefig(fig)
+        elif len(sweeps) > 1:
+            root, ext = os.path.splitext(plot_file)
+            fig.savefig(f"{root}_{sweep}{ext}")
+        else:
+            fig.savefig(plot_file)
+        plt.close(fig)
+    if pdf is not None:
+        pdf.close()
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    skip_steps = int(args['--skip_steps'])
+    efficiency = float(args['--efficiency'])
+    timers = args['--timers'].split(',') if args['--timers'] else None
+
+    sweep_histories = {}
+    for out_dir in resolve_output_dirs(args['<out_dirs>']):
+        name = get_run_name(out_dir)
+        print(f"Loading {name}...")
+        sweep_histories.setdefault(get_sweep_name(name), {})[name] = load_run_history(out_dir)
+
+    sweeps = {}
+    for sweep, histories in sweep_histories.items():
+        runs = analyze_sweep(histories, skip_steps)
+        if len(runs) < 2:
+            print(f"Sweep {sweep}: need at least two core counts, skipping")
+            continue
+        sweeps[sweep] = runs
+        print_sweep(sweep, runs, efficiency, timers)
+
+    if args['--plot'] and sweeps:
+        plot_sweeps(sweeps, args['--plot'], efficiency, timers)
+        print(f"\nPlots saved to {args['--plot']}")
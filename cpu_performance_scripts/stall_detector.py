@@ -0,0 +1,211 @@
+"""
+stall_detector.py: "Notice runs that stopped writing cpu.txt or whose timestep collapsed."
+
+Used by track_job.py. Two conditions are watched for every run:
+    stall     cpu.txt has not received a new step for longer than --stall_factor
+              typical step times (and at least --stall_min seconds)
+    collapse  the simulation time gained per step or per compute hour over the
+              last steps has fallen below --collapse times the longer-term rate
+Each condition raises one alert when it trips and re-arms once it clears.
+Note that a run waiting in the queue between two jobs of a chain also stops
+writing cpu.txt. With track_job.py --job_status the stall clock is held while
+the chain's next job is queued; otherwise pick --stall_min (and the hooks)
+with that in mind.
+"""
+
+import os
+import re
+import time
+import shlex
+import subprocess
+from collections import deque
+
+import numpy as np
+
+# Number of recent steps compared with the longer-term window
+SHORT_WINDOW_STEPS = 50
+# Number of steps of the longer-term window
+LONG_WINDOW_STEPS = 2000
+
+
+class StallDetector:
+    """
+    Stall and timestep collapse detection for one run.
+
+    Inputs:
+        stall_factor: Number of typical step times without a new step that counts as a stall
+        stall_min: Minimum number of seconds without a new step before a stall is reported
+        collapse: Fraction of the longer-term rate below which the recent rate counts as collapsed
+        last_step_time: Time (time.time()) of the last known step, e.g. the mtime of cpu.txt
+    """
+    def __init__(self, stall_factor=20.0, stall_min=600.0, collapse=0.1, last_step_time=None):
+        self.stall_factor = stall_factor
+        self.stall_min = stall_min
+        self.collapse = collapse
+        self.last_step_time = last_step_time
+        # (compute seconds, simulation time) of the last steps
+        self._steps = deque(maxlen=LONG_WINDOW_STEPS)
+        self._active = set()
+
+    def add_steps(self, blocks, now=None):
+        """
+        Record newly parsed steps (dictionaries from track_job.parse_step_block).
+        """
+        if not blocks:
+            return
+        for data in blocks:
+            self._steps.append((data.get('total', 0.0), data['Simulation Time']))
+        self.last_step_time = time.time() if now is None else now
+
+    def typical_step_time(self):
+        """
+        Median compute time of the recent steps in seconds, or None if unknown.
+        """
+        if not self._steps:
+            return None
+        return float(np.median([seconds for seconds, _ in list(self._steps)[-SHORT_WINDOW_STEPS:]]))
+
+    def _rates(self, steps):
+        # Simulation time per step and per compute second over the given steps
+        seconds = sum(total for total, _ in steps[1:])
+        advance = steps[-1][1] - steps[0][1]
+        per_step = advance / (len(steps) - 1)
+        per_second = advance / seconds if seconds > 0 else np.nan
+        return per_step, per_second
+
+    def check(self, now=None, queued=False):
+        """
+        Evaluate both conditions.
+
+        Inputs:
+            now: Current time (default: time.time())
+            queued: The run's next job is waiting in the queue; the stall clock
+                    is restarted instead, so a job gets the full limit from its start
+        Returns:
+            List of (kind, message) for the conditions that tripped since the last check
+        """
+        if now is None:
+            now = time.time()
+        tripped = {}
+
+        if queued:
+            self.last_step_time = now
+        elif self.last_step_time is not None:
+            typical = self.typical_step_time()
+            limit = self.stall_min if typical is None else max(self.stall_min, self.stall_factor * typical)
+            idle = now - self.last_step_time
+            if idle > limit:
+                tripped['stall'] = f"no new step in cpu.txt for {idle:.0f} s (limit {limit:.0f} s)"
+
+        if len(self._steps) >= 2 * SHORT_WINDOW_STEPS:
+            steps = list(self._steps)
+            long_step, long_second = self._rates(steps[:-SHORT_WINDOW_STEPS + 1])
+            short_step, short_second = self._rates(steps[-SHORT_WINDOW_STEPS:])
+            if long_step > 0 and short_step < self.collapse * long_step:
+                tripped['collapse'] = (f"simulation time per step fell to {short_step:.3g} "
+                                       f"from {long_step:.3g}")
+            elif long_second > 0 and short_second < self.collapse * long_second:
+                tripped['collapse'] = (f"simulation time per compute hour fell to {3600 * short_second:.3g} "
+                                       f"from {3600 * long_second:.3g}")
+
+        alerts = [(kind, message) for kind, message in tripped.items() if kind not in self._active]
+        self._active = set(tripped)
+        return alerts
+
+
+class AlertHooks:
+    """
+    Actions taken when a detector raises an alert. The message is always printed.
+
+    Inputs:
+        command: Shell command to run; GIZMO_RUN, GIZMO_OUT_DIR, GIZMO_ALERT and
+                 GIZMO_ALERT_MESSAGE are set in its environment
+        flag_file: Name of a file created in the output folder (alerts are appended to it)
+        scancel_name: Base job name of a chain (job_submit_*.py --job-name); all of
+                      the SLURM jobs of that name are cancelled (see cancel_chain).
+                      "ledger" cancels the jobs that the chain ledger records for
+                      the alerting run's chain instead (see cancel_ledger_jobs)
+    """
+    def __init__(self, command=None, flag_file=None, scancel_name=None):
+        self.command = command
+        self.flag_file = flag_file
+        self.scancel_name = scancel_name
+
+    def run(self, run_name, out_dir, kind, message, job=None):
+        """
+        Take the actions for one alert. job is the summary of the run's job
+        chain (see job_status.summarize), needed when scancel_name is "ledger".
+        """
+        print(f"ALERT [{run_name}] {kind}: {message}")
+        if self.flag_file:
+            with open(os.path.join(out_dir, self.flag_file), 'a') as f:
+                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {kind}: {message}\n")
+        if self.command:
+            env = dict(os.environ, GIZMO_RUN=run_name, GIZMO_OUT_DIR=out_dir,
+                       GIZMO_ALERT=kind, GIZMO_ALERT_MESSAGE=message)
+            try:
+                subprocess.run(self.command, shell=True, env=env, check=True)
+            except subprocess.CalledProcessError as e:
+                print(f"Error running alert command: {e}")
+        if self.scancel_name == "ledger":
+            if job is None:
+                print(f"No chain of {out_dir} in the chain ledger, nothing cancelled")
+            else:
+                cancel_ledger_jobs(job)
+        elif self.scancel_name:
+            cancel_chain(self.scancel_name)
+
+
+def cancel_ledger_jobs(job):
+    """
+    Cancel the links of a chain that have not ended, by the job IDs recorded
+    in the chain ledger and with the chain's own scheduler, so that other
+    chains sharing its job name are left alone.
+
+    Inputs:
+        job: Summary of the chain (see job_status.summarize)
+    """
+    # schedulers.py sits next to job_status.py, which track_job.py --job_status found
+    from schedulers import SCHEDULERS
+    if not job['live_jobs']:
+        print(f"No live jobs of chain {job['job_name']} in the chain ledger")
+        return
+    try:
+        SCHEDULERS[job['scheduler']].cancel(job['live_jobs'])
+        print(f"Cancelled {' '.join(shlex.quote(job_id) for job_id in job['live_jobs'])}")
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"Error cancelling jobs: {e}")
+
+def cancel_chain(job_name):
+    """
+    Cancel all of the user's SLURM jobs of one job chain: jobs named
+    <job_name>_<n> (afterany chains), <job_name> (job arrays) or
+    <job_name>_chain<n> (singleton chains, see job_chain.py). A job array is
+    cancelled as a whole.
+    """
+    try:
+        result = subprocess.run(['squeue', '-h', '-u', os.environ.get('USER', ''), '-o', '%i %j'],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"Error listing jobs: {e}")
+        return
+    chain_name = re.compile(re.escape(job_name) + r"(_(chain)?\d+)?$")
+    job_ids = []
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        if chain_name.match(parts[1]):
+            # Array tasks are listed as <array id>_<index> or <array id>_[<pending range>]
+            job_id = parts[0].split("_")[0]
+            if job_id not in job_ids:
+                job_ids.append(job_id)
+    if not job_ids:
+        print(f"No jobs of chain {job_name} found")
+        return
+    try:
+        subprocess.run(['scancel'] + job_ids, check=True)
+        print(f"Cancelled {' '.join(shlex.quote(job_id) for job_id in job_ids)}")
+    except subprocess.CalledProcessError as e:
+        print(f"Error cancelling jobs: {e}")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+step_cost.py: "Did the problem get harder or did the code get slower?"
+
+The wall time of every step (cpu.txt) is joined on the step number with the
+number of active particles (info.txt/timebin.txt "Total active", otherwise
+Nf from timings.txt or balance.txt) and the load imbalance (timings.txt
+work-load balance, balance.txt, or the share of the "imbal" timers of
+cpu.txt). The run is cut into windows of --window steps and for every window
+the wall time per step is split into
+
+    seconds per step = active particles per step x seconds per active particle
+
+Relative to the first --baseline windows, a growing wall time per step with a
+constant cost per particle means the problem got harder (more particles are
+active, e.g. a collapsing region); a growing cost per particle means the
+code got slower (imbalance, communication, neighbour searches, ...).
+The logs are read from the progress store (see track_job.py --logs) plus the
+part of each file written since its last flush.
+
+Usage: step_cost.py [options] <out_dirs>...
+
+Options:
+    -h, --help                  Show this screen
+    --window=<steps>            Number of steps per window [default: 1000]
+    --baseline=<windows>        Number of initial windows used as the reference [default: 1]
+    --skip_steps=<n>            Ignore this many initial steps (start-up) [default: 10]
+    --threshold=<fraction>      Report a relative change in wall time per step larger than this [default: 0.25]
+"""
+
+import numpy as np
+from docopt import docopt
+from track_job import load_run_history, load_log_history, resolve_output_dirs, get_run_name, get_timer_names
+
+
+def join_on_step(steps, log, column):
+    """
+    Values of a log column for the given steps (NaN where the log has no record).
+    A step repeated after a restart takes its last record.
+
+    Inputs:
+        steps: Step numbers to look up
+        log: Dictionary of columns from track_job.load_log_history
+        column: Column to return
+    """
+    values = np.full(len(steps), np.nan)
+    if column not in log or 'Step' not in log or len(log['Step']) == 0:
+        return values
+    # Last occurrence of every step
+    reversed_steps = log['Step'][::-1]
+    unique, first = np.unique(reversed_steps, return_index=True)
+    last = len(reversed_steps) - 1 - first
+    position = np.clip(np.searchsorted(unique, steps), 0, len(unique) - 1)
+    found = unique[position] == steps
+    values[found] = np.asarray(log[column], dtype=float)[last[position[found]]]
+    return values
+
+def get_step_work(out_dir, steps):
+    """
+    Active particles per step from the first log that has them.
+
+    Returns:
+        (values aligned with steps, description of the source) or (None, None)
+    """
+    for log_name, column in (('info.txt', 'Active'), ('timebin.txt', 'Active'),
+                             ('timings.txt', 'Nf'), ('balance.txt', 'Nf')):
+        values = join_on_step(steps, load_log_history(out_dir, log_name), column)
+        if np.isfinite(values).any():
+            return values, f"{log_name} {column}"
+    return None, None
+
+def get_step_imbalance(out_dir, history, skip_steps=0):
+    """
+    Fraction of every step (after the first skip_steps of the history) lost to
+    load imbalance, from the first source that has it.
+
+    Returns:
+        (values aligned with steps, description of the source)
+    """
+    steps = history['Step'][skip_steps:]
+    timings = load_log_history(out_dir, 'timings.txt')
+    balance = join_on_step(steps, timings, 'work-load balance')
+    if np.isfinite(balance).any():
+        # max/avg work per task, the fraction of the step the average task waits
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 1 - 1 / balance, "timings.txt work-load balance"
+    values = join_on_step(steps, load_log_history(out_dir, 'balance.txt'), 'Imbalance Fraction')
+    if np.isfinite(values).any():
+        return values, "balance.txt"
+    imbalance_timers = [name for name in get_timer_names(history) if "imbal" in name]
+    if imbalance_timers:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = sum(np.nan_to_num(history[name][skip_steps:]) for name in imbalance_timers) / \
+                history['total'][skip_steps:]
+        return values, "cpu.txt " + "+".join(imbalance_timers)
+    return np.full(len(steps), np.nan), None
+
+def window_means(values, starts):
+    """
+    Mean of values over every window (NaNs ignored).
+    """
+    ends = np.append(starts[1:], len(values))
+    means = np.full(len(starts), np.nan)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        part = values[start:end]
+        if np.isfinite(part).any():
+            means[i] = np.nanmean(part)
+    return means
+
+def classify(wall_ratio, work_ratio, threshold=0.25):
+    """
+    Attribute a change in wall time per step to the amount of work or to the
+    cost per unit of work, using log(wall) = log(work) + log(cost).
+    """
+    if not np.isfinite(wall_ratio) or abs(wall_ratio - 1) <= threshold:
+        return "unchanged"
+    if not np.isfinite(work_ratio) or work_ratio <= 0:
+        return "slower" if wall_ratio > 1 else "faster"
+    work_part = np.log(work_ratio) / np.log(wall_ratio)
+    if work_part >= 0.5:
+        return "harder problem" if wall_ratio > 1 else "easier problem"
+    return "code slower" if wall_ratio > 1 else "code faster"
+
+def analyze_run(out_dir, window=1000, baseline=1, skip_steps=10, threshold=0.25):
+    """
+    Print the per-window wall time, work, cost per particle and imbalance of a run.
+
+    Returns:
+        List of per-window dictionaries
+    """
+    history = load_run_history(out_dir)
+    if 'total' not in history or len(history['Step']) <= skip_steps:
+        print("Not enough steps in cpu.txt")
+        return []
+    steps = history['Step'][skip_steps:]
+    seconds = np.asarray(history['total'][skip_steps:], dtype=float)
+    work, work_source = get_step_work(out_dir, steps)
+    imbalance, imbalance_source = get_step_imbalance(out_dir, history, skip_steps)
+    if work is None:
+        print("No active particle counts found (info.txt, timebin.txt, timings.txt or balance.txt), "
+              "only wall time and imbalance are shown")
+        work = np.full(len(steps), np.nan)
+    print(f"Work: {work_source}, imbalance: {imbalance_source}")
+
+    starts = np.arange(0, len(steps), window)
+    wall = window_means(seconds, starts)
+    active = window_means(work, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost = window_means(seconds / work, starts)
+    lost = window_means(imbalance, starts)
+    base_wall = np.nanmean(wall[:baseline])
+    base_active = np.nanmean(active[:baseline]) if np.isfinite(active[:baseline]).any() else np.nan
+
+    print(f"{'from step':>10}{'s/step':>10}{'active':>12}{'us/particle':>13}{'imbal':>8}"
+          f"{'x wall':>8}{'x work':>8}{'x cost':>8}  verdict")
+    windows = []
+    for w in range(len(starts)):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wall_ratio = wall[w] / base_wall
+            work_ratio = active[w] / base_active
+        verdict = classify(wall_ratio, work_ratio, threshold) if w >= baseline else "baseline"
+        windows.append({'step': int(steps[starts[w]]), 'seconds_per_step': wall[w], 'active': active[w],
+                        'seconds_per_particle': cost[w], 'imbalance': lost[w], 'wall_ratio': wall_ratio,
+                        'work_ratio': work_ratio, 'verdict': verdict})
+        print(f"{steps[starts[w]]:>10}{wall[w]:>10.3g}{active[w]:>12.4g}{1e6 * cost[w]:>13.4g}{lost[w]:>8.1%}"
+              f"{wall_ratio:>8.2f}{work_ratio:>8.2f}{wall_ratio / work_ratio:>8.2f}  {verdict}")
+    return windows
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    for out_dir in resolve_output_dirs(args['<out_dirs>']):
+        print(f"=== {get_run_name(out_dir)} ===")
+        analyze_run(out_dir, window=int(args['--window']), baseline=int(args['--baseline']),
+                    skip_steps=int(args['--skip_steps']), threshold=float(args['--threshold']))
@@ -2,11 +2,47 @@
 """
 track_job.py: "Track the progress of your simulation. Run this script as a background process."
 
-Usage: track_job.py [options]
+Several runs can be followed from one process by listing their output
+folders (shell globs are expanded, e.g. "MHD_*_core*/output") or by giving a
+manifest file with one output folder (or glob) per line.
+
+Usage: track_job.py [options] [<out_dirs>...]
 
 Options:
     -h, --help                  Show this screen
     --out_dir=<output>          Path to the output folder [default: ../output/]
+    --manifest=<file>           File listing output folders to track, one per line
+    --store_dir=<store>         Path to the columnar progress store [default: <out_dir>/progress_store/]
+    --backfill                  Parse the whole cpu.txt (and the other logs) into the progress store and exit
+    --all_columns               Record the percentage and cumulative columns of every timer too
+                                (and every column of the other logs)
+    --logs=<files>              Other GIZMO logs recorded in sub-folders of the store, comma
+                                separated, or none
+                                [default: timings.txt,balance.txt,info.txt,energy.txt,memory.txt]
+    --debounce=<sec>            Merge cpu.txt events arriving within this many seconds [default: 0.5]
+    --flush_interval=<sec>      Write buffered rows at least this often [default: 30]
+    --flush_rows=<n>            Write buffered rows once this many are waiting [default: 100]
+    --backend=<backend>         How to notice changes: inotify, poll or auto (poll on parallel
+                                filesystems such as Lustre/GPFS, inotify elsewhere) [default: auto]
+    --poll_min=<sec>            Shortest polling interval per run [default: 1]
+    --poll_max=<sec>            Longest polling interval per run, reached when cpu.txt is idle [default: 60]
+    --max_stat_rate=<n>         Upper bound on stat calls per second over all polled runs [default: 20]
+    --serve=<port>              Expose the latest metrics of every run in OpenMetrics format on
+                                http://<host>:<port>/metrics
+    --host=<host>               Address the metrics endpoint listens on [default: 127.0.0.1]
+    --stall_factor=<n>          Alert when no step arrives for this many typical step times [default: 20]
+    --stall_min=<sec>           ... but never before this many seconds without a step [default: 600]
+    --collapse=<fraction>       Alert when the recent simulation time per step or per compute hour
+                                falls below this fraction of the longer-term rate [default: 0.1]
+    --on_alert=<command>        Shell command run on an alert (see stall_detector.py)
+    --alert_flag=<name>         File created in the output folder on an alert
+    --alert_scancel=<job_name>  Cancel the SLURM jobs with this base job name on an alert (one run
+                                only); "ledger" cancels the jobs that the chain ledger records for
+                                the alerting run's chain, which needs --job_status
+    --job_status                Follow the job chain of every run in the chain ledger (job_status.py of
+                                the submit scripts): no stall alerts while the next job waits in the
+                                queue, and the job state is added to the metrics
+    --status_ttl=<sec>          Seconds between two scheduler queries, for all runs together [default: 60]
 """
 
 
@@ -19,80 +55,673 @@ Options:
 
 
 import os
+import sys
 import time
 import csv
+import glob
+from collections import deque
 from docopt import docopt
 from datetime import datetime
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from progress_store import ProgressStore
+from log_readers import LogTailReader, LOG_READERS, get_log_store_dir
+from metrics_exporter import start_metrics_server
+from stall_detector import StallDetector, AlertHooks
+
+# Amount of cpu.txt parsed at a time when backfilling the progress store
+BACKFILL_BATCH_BYTES = 64 << 20
+# Events keep being merged for at most this many debounce windows, so a
+# steadily written cpu.txt is still processed
+MAX_DEBOUNCE_WINDOWS = 10
+# Polling interval growth factor while cpu.txt is idle
+POLL_BACKOFF = 1.5
+# Filesystems on which inotify does not see writes made by other nodes
+POLLING_FILESYSTEMS = ('lustre', 'gpfs', 'nfs', 'nfs4', 'beegfs', 'cifs', 'smb3', 'panfs', 'ceph', 'wekafs')
+# Number of recent steps used for the step and simulation time rates
+RATE_WINDOW_STEPS = 100
+# Columns of a parsed step that are not timers
+NON_TIMER_COLUMNS = ('Step', 'Simulation Time', 'Wall Time', 'Real World Time', 'Offset', 'CPUs', 'MultiDomains',
+                     'HighestActiveTimeBin')
+
+
+def parse_timer_line(line):
+    """
+    Parse one timer line of cpu.txt, e.g.
+    "    treebuild             0.00    0.0%      8.69    0.4%"
+
+    Returns:
+        Dictionary with the timer name, its nesting depth (from the indentation),
+        the time spent in this step and its share, and the cumulative time and
+        its share; None if the line is not a timer line
+    """
+    parts = line.split()
+    if len(parts) < 5:
+        return None
+    try:
+        return {
+            'name': parts[0],
+            'indent': len(line) - len(line.lstrip()),
+            'diff': float(parts[1]),
+            'diff_percent': float(parts[2].rstrip('%')),
+            'cumulative': float(parts[3]),
+            'cumulative_percent': float(parts[4].rstrip('%')),
+        }
+    except ValueError:
+        return None
+
+def get_timer_tree(lines):
+    """
+    Nesting of the timers of one "Step" block.
+
+    Inputs:
+        lines: Lines of the block, starting with the "Step" header line
+    Returns:
+        Dictionary of timer name -> parent timer name (None for "total")
+    """
+    parents = {}
+    stack = []
+    for line in lines[1:]:
+        timer = parse_timer_line(line)
+        if timer is None:
+            continue
+        while stack and stack[-1][1] >= timer['indent']:
+            stack.pop()
+        parents[timer['name']] = stack[-1][0] if stack else None
+        stack.append((timer['name'], timer['indent']))
+    return parents
+
+def read_timer_tree(cpu_txt_path, tail_bytes=65536):
+    """
+    Timer nesting (see get_timer_tree) of the last complete step in cpu.txt,
+    reading only the end of the file.
+    """
+    with open(cpu_txt_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - tail_bytes))
+        lines = f.read().decode('ascii', errors='replace').splitlines()
+    starts = [i for i, line in enumerate(lines) if line.startswith("Step")]
+    # The last block may still be being written, use the one before if possible
+    for start in reversed(starts):
+        block = lines[start:]
+        end = next((i for i, line in enumerate(block[1:], 1) if not line.strip() or line.startswith("Step")), None)
+        if end is not None:
+            return get_timer_tree(block[:end])
+    return get_timer_tree(lines[starts[-1]:]) if starts else {}
+
+def parse_step_block(lines, detail=False):
+    """
+    Parse one "Step" block of cpu.txt into a dictionary.
+
+    Inputs:
+        lines: Lines of the block, starting with the "Step" header line
+        detail: Also keep the percentage and cumulative columns of every timer,
+                as "<timer> %", "<timer> cumulative" and "<timer> cumulative %"
+    Returns:
+        Dictionary with the step number, the simulation time, the remaining
+        header fields (CPUs, MultiDomains, ...) and the time spent in each timer
+        (CPUTailReader adds the block's byte offset in cpu.txt as "Offset")
+    """
+    fields = [field.strip() for field in lines[0].split(',')]
+    data = {'Step': int(fields[0].split()[1])}
+    for field in fields[1:]:
+        key, _, value = field.partition(':')
+        key = key.strip()
+        if key == "Time":
+            data['Simulation Time'] = float(value)
+            continue
+        try:
+            data[key] = int(value)
+        except ValueError:
+            data[key] = float(value)
+
+    for line in lines[1:]:
+        timer = parse_timer_line(line)
+        if timer is None:
+            # Column header line ("diff  cumulative")
+            continue
+        data[timer['name']] = timer['diff']
+        if detail:
+            data[timer['name'] + " %"] = timer['diff_percent']
+            data[timer['name'] + " cumulative"] = timer['cumulative']
+            data[timer['name'] + " cumulative %"] = timer['cumulative_percent']
+    return data
+
+
+class CPUTailReader(LogTailReader):
+    """
+    Follow cpu.txt incrementally (see log_readers.LogTailReader), reporting
+    every completed "Step" block parsed by parse_step_block.
+
+    Inputs:
+        path: Path to the cpu.txt file
+        detail: Keep every column of every timer (see parse_step_block)
+    """
+    record_start = "Step"
+
+    def parse_record(self, lines):
+        return parse_step_block(lines, self.detail)
+
 
 # Define the event handler
 class CPUHandler(FileSystemEventHandler):
-    def __init__(self, output_csv):
+    """
+    Watchdog handler for one run. Modification events only mark cpu.txt as
+    changed; poll() (called from the main loop) parses the new steps once the
+    burst of events is over, and buffered rows are written to progress.csv and
+    the progress store in batches.
+
+    Inputs:
+        output_csv: Path to progress.csv
+        cpu_txt_path: Path to cpu.txt
+        store: Optional ProgressStore receiving every step
+        name: Run name used to prefix printed steps
+        debounce: Seconds without events after which cpu.txt is parsed
+        flush_interval: Maximum number of seconds rows stay buffered
+        flush_rows: Number of buffered rows that triggers a write
+        detail: Record every column of every timer (see parse_step_block)
+        detector: Optional StallDetector watching this run
+        hooks: AlertHooks run when the detector raises an alert (default: print only)
+        log_stores: Optional dictionary of log file name (a key of
+                    log_readers.LOG_READERS) -> ProgressStore; these logs are
+                    read along with cpu.txt and recorded in their own stores
+        job_status: Optional job_status.JobStatusService; the state of the
+                    run's job chain is then kept in job
+    """
+    def __init__(self, output_csv, cpu_txt_path, store=None, name=None,
+                 debounce=0.5, flush_interval=30.0, flush_rows=100, detail=False,
+                 detector=None, hooks=None, log_stores=None, job_status=None):
         self.output_csv = output_csv
+        self.name = name
+        self.debounce = debounce
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self._first_event = None
+        self._last_event = None
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self.cpu_txt_path = cpu_txt_path
+        self.poll_interval = None
+        self.run_name = name if name else get_run_name(os.path.dirname(cpu_txt_path))
+        # Latest state of the run, replaced (never modified) on every update so
+        # that other threads can read it without locking
+        self.snapshot = None
+        self._recent = deque(maxlen=RATE_WINDOW_STEPS)
+        self.detector = detector
+        self.hooks = hooks if hooks is not None else AlertHooks()
+        self.job_status = job_status
+        # Summary of the run's job chain (see job_status.summarize), None if unknown
+        self.job = None
+        self.store = store
+        self.reader = CPUTailReader(cpu_txt_path, detail)
+        if store is None:
+            self.reader.seek_end()
+        else:
+            # Catch up on everything written since the store was last flushed,
+            # these steps go to the store only since their real world time is unknown
+            backfill_store(self.reader, store)
+        # The other logs are only recorded in stores, so always catch up on them
+        self.logs = {}
+        for log_name, log_store in (log_stores or {}).items():
+            reader = LOG_READERS[log_name](os.path.join(os.path.dirname(cpu_txt_path), log_name), detail)
+            backfill_store(reader, log_store)
+            self.logs[log_name] = (reader, log_store)
+        self.fieldnames = None
+        if os.path.exists(output_csv) and os.path.getsize(output_csv) > 0:
+            with open(output_csv, 'r', newline='') as csv_file:
+                self.fieldnames = next(csv.reader(csv_file), None)
 
     def on_modified(self, event):
-        if "cpu.txt" in event.src_path:
-            with open(event.src_path, 'r') as f:
-                lines = f.readlines()[-35:]
-                data = {}
-                for line in lines:
-                    if "Step" in line:
-                        data['Simulation Time'] = float(line.split(',')[1].split()[1])
-                        data['Real World Time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        print (data)
-                    else:
-                        parts = line.strip().split()
-                        if len(parts) > 1:
-                            key = parts[0]
-                            value = parts[1]
-                            data[key] = value
-
-                # Write to CSV
-                with open(self.output_csv, 'a', newline='') as csv_file:
-                    writer = csv.DictWriter(csv_file, fieldnames=data.keys())
-                    writer.writerow(data)
-
-def track_simulation_progress(base_dir):
-    # Define the base output directory
-    #base_dir = "./output"
-    
-    # Construct paths
-    cpu_txt_path = os.path.join(base_dir, 'cpu.txt')
-    output_csv_path = os.path.join(base_dir, 'progress.csv')
-
-    # Initialize CSV file if it doesn't exist
-    if not os.path.exists(output_csv_path):
-        with open(output_csv_path, 'w', newline='') as csv_file:
-            writer = csv.writer(csv_file)
-            # Initial dummy write to determine the fieldnames from the first read
-            with open(cpu_txt_path, 'r') as f:
-                lines = f.readlines()[-35:]
-                data = {}
-                for line in lines:
-                    parts = line.strip().split()
-                    if len(parts) > 1:
-                        key = parts[0]
-                        value = parts[1]
-                        data[key] = value
-                dict_writer = csv.DictWriter(csv_file, fieldnames=data.keys())
-                dict_writer.writeheader()
-
-    event_handler = CPUHandler(output_csv=output_csv_path)
+        name = os.path.basename(event.src_path)
+        if name == "cpu.txt" or name in self.logs:
+            self._mark_modified(time.monotonic())
+
+    def _mark_modified(self, now):
+        if self._first_event is None:
+            self._first_event = now
+        self._last_event = now
+
+    def enable_polling(self, min_interval, max_interval):
+        """
+        Use stat() polling (see check_file) instead of filesystem events.
+
+        Inputs:
+            min_interval: Shortest interval between two checks, in seconds
+            max_interval: Longest interval between two checks, in seconds
+        """
+        self.min_poll_interval = min_interval
+        self.max_poll_interval = max_interval
+        self.poll_interval = min_interval
+        self._stat_key = self._stat_cpu_txt()
+        self._next_check = 0.0
+
+    def _stat_cpu_txt(self):
+        try:
+            st = os.stat(self.cpu_txt_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def check_file(self, now=None):
+        """
+        Polling backend: stat cpu.txt if the polling interval has elapsed. The
+        interval is halved when the file has changed and grows while it is idle.
+        """
+        if now is None:
+            now = time.monotonic()
+        if now < self._next_check:
+            return
+        stat_key = self._stat_cpu_txt()
+        if stat_key != self._stat_key:
+            self._stat_key = stat_key
+            self._mark_modified(now)
+            self.poll_interval = max(self.min_poll_interval, self.poll_interval / 2)
+        else:
+            self.poll_interval = min(self.max_poll_interval, self.poll_interval * POLL_BACKOFF)
+        self._next_check = now + self.poll_interval
+
+    def poll(self, now=None):
+        """
+        Parse cpu.txt if a burst of events has settled, and write the buffered
+        rows if the size or time threshold has been reached.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self._last_event is not None and \
+            (now - self._last_event >= self.debounce or
+             now - self._first_event >= MAX_DEBOUNCE_WINDOWS * self.debounce):
+            self._first_event = None
+            self._last_event = None
+            self.process_new_steps()
+        if self.job_status is not None:
+            # Served from the cache, the scheduler is queried at most once per TTL for all runs
+            self.job = self.job_status.run_status(os.path.dirname(self.cpu_txt_path))
+        if self.detector is not None:
+            queued = self.job is not None and self.job['running'] == 0 and self.job['pending'] > 0
+            for kind, message in self.detector.check(queued=queued):
+                self.hooks.run(self.run_name, os.path.dirname(self.cpu_txt_path), kind, message, self.job)
+        pending = len(self._rows) + sum(log_store.pending for _, log_store in self.logs.values())
+        if len(self._rows) >= self.flush_rows or \
+            (pending and now - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def process_new_steps(self):
+        blocks = self.reader.read_new()
+        # The store keeps numeric columns only (it copies the rows), the time
+        # the step was seen is for the printout and the CSV
+        if self.store is not None and blocks:
+            self.store.append(blocks)
+        for data in blocks:
+            data['Real World Time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if self.name is None:
+                print (data)
+            else:
+                print (f"[{self.name}] {data}")
+        self._rows.extend(blocks)
+        if blocks:
+            self.update_snapshot(blocks)
+            if self.detector is not None:
+                self.detector.add_steps(blocks)
+        # GIZMO writes the other logs at the same sync points as cpu.txt, so
+        # they are checked whenever cpu.txt (or one of them) has changed
+        for reader, log_store in self.logs.values():
+            log_store.append(reader.read_new())
+
+    def update_snapshot(self, blocks):
+        """
+        Update the latest state of the run (see snapshot) from newly parsed steps.
+        """
+        for data in blocks:
+            self._recent.append((data.get('total', 0.0), data['Simulation Time']))
+        latest = blocks[-1]
+        snapshot = {
+            'step': latest['Step'],
+            'sim_time': latest['Simulation Time'],
+            'timers': {name: latest[name] for name in get_timer_names(latest)},
+            'last_update': time.time(),
+            'steps_per_hour': None,
+            'sim_time_per_hour': None,
+        }
+        if len(self._recent) > 1:
+            # Rates over the compute time of the recent steps (the first step
+            # only provides the starting simulation time)
+            seconds = sum(total for total, _ in list(self._recent)[1:])
+            if seconds > 0:
+                snapshot['steps_per_hour'] = 3600. * (len(self._recent) - 1) / seconds
+                snapshot['sim_time_per_hour'] = 3600. * (self._recent[-1][1] - self._recent[0][1]) / seconds
+        self.snapshot = snapshot
+
+    def flush(self):
+        """
+        Write the buffered rows to progress.csv and the progress store.
+        """
+        if self._rows:
+            self.write_rows(self._rows)
+            self._rows = []
+        if self.store is not None and self.store.pending:
+            self.store.flush(self.reader.state())
+        for reader, log_store in self.logs.values():
+            if log_store.pending:
+                log_store.flush(reader.state())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.process_new_steps()
+        self.flush()
+        if self.store is not None:
+            self.store.flush(self.reader.state())
+        for reader, log_store in self.logs.values():
+            log_store.flush(reader.state())
+
+    def write_rows(self, rows):
+        # Write to CSV, the header is taken from the first step seen
+        write_header = self.fieldnames is None
+        if write_header:
+            self.fieldnames = ['Step', 'Simulation Time', 'Real World Time'] + \
+                [key for key in rows[0] if key not in ('Step', 'Simulation Time', 'Real World Time', 'Offset')]
+        with open(self.output_csv, 'a', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=self.fieldnames, extrasaction='ignore')
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+
+def backfill_store(reader, store):
+    """
+    Parse everything the reader has not seen yet into the store, resuming from
+    the position recorded at the store's last flush.
+
+    Inputs:
+        reader: CPUTailReader following cpu.txt
+        store: ProgressStore to append to
+    """
+    reader.resume(store.source_state)
+    while True:
+        blocks = reader.read_new(max_bytes=BACKFILL_BATCH_BYTES)
+        if not blocks:
+            break
+        store.append(blocks)
+        if store.pending >= store.chunk_rows:
+            store.flush(reader.state())
+    store.flush(reader.state())
+
+def load_run_history(out_dir, store_dir=None):
+    """
+    Load the full per-step history of a run without modifying anything on disk:
+    the run's progress store (if any) plus the part of cpu.txt written since
+    the store was last flushed.
+
+    Inputs:
+        out_dir: Output folder of the run
+        store_dir: Progress store location (default: <out_dir>/progress_store/)
+    Returns:
+        Dictionary of column name -> numpy array (see progress_store.py)
+    """
+    return load_log_history(out_dir, 'cpu.txt', store_dir)
+
+def load_log_history(out_dir, log_name, store_dir=None):
+    """
+    Load the full history of one of the run's logs (cpu.txt or a key of
+    log_readers.LOG_READERS) in the same way as load_run_history. Logs other
+    than cpu.txt are stored in a sub-folder of the store (see
+    log_readers.get_log_store_dir); a log that was never recorded is parsed
+    from the start.
+
+    Returns:
+        Dictionary of column name -> numpy array (empty if the log does not exist)
+    """
+    if store_dir is None:
+        store_dir = os.path.join(out_dir, 'progress_store')
+    if log_name == 'cpu.txt':
+        reader = CPUTailReader(os.path.join(out_dir, log_name))
+    else:
+        store_dir = get_log_store_dir(store_dir, log_name)
+        reader = LOG_READERS[log_name](os.path.join(out_dir, log_name))
+    store = ProgressStore(store_dir, create=False)
+    reader.resume(store.source_state)
+    while True:
+        blocks = reader.read_new(max_bytes=BACKFILL_BATCH_BYTES)
+        if not blocks:
+            break
+        store.append(blocks)
+    return store.load_columns()
+
+def get_timer_names(columns):
+    """
+    Timer names among the columns of a run history (percentage and cumulative
+    columns excluded).
+    """
+    return [name for name in columns if name not in NON_TIMER_COLUMNS and
+            not name.endswith((" %", " cumulative"))]
+
+def resolve_output_dirs(out_dirs, manifest=None):
+    """
+    Expand output folders given on the command line and/or in a manifest file.
+
+    Inputs:
+        out_dirs: List of output folders or glob patterns
+        manifest: Optional file with one output folder or glob per line
+                  (blank lines and lines starting with # are ignored,
+                  relative paths are taken relative to the manifest)
+    Returns:
+        Sorted list of unique existing output folders, each ending in "/"
+    """
+    patterns = list(out_dirs)
+    if manifest:
+        with open(manifest, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    # Relative entries are relative to the manifest's folder
+                    patterns.append(os.path.join(os.path.dirname(manifest), line))
+
+    resolved = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if not os.path.isdir(path):
+                print(f"Skipping {path}: not a directory")
+                continue
+            if path[-1] != "/":
+                path += "/"
+            if path not in resolved:
+                resolved.append(path)
+    return resolved
+
+def get_run_name(out_dir):
+    """
+    Name of a run for log messages: the folder above "output", if that is the
+    output folder's name, otherwise the output folder itself.
+    """
+    path = os.path.normpath(os.path.abspath(out_dir))
+    if os.path.basename(path) == "output":
+        path = os.path.dirname(path)
+    return os.path.basename(path)
+
+def get_store_dir(out_dir, store_dir):
+    """
+    Store location for one output folder; "<out_dir>/" in store_dir is replaced
+    by the output folder.
+    """
+    if not store_dir:
+        return None
+    return store_dir.replace("<out_dir>/", out_dir)
+
+def get_filesystem_type(path):
+    """
+    Type of the filesystem holding path, from /proc/mounts (None if unknown).
+    """
+    path = os.path.realpath(path)
+    mount_point = ""
+    fs_type = None
+    try:
+        with open("/proc/mounts", 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mount = parts[1].replace("\\040", " ")
+                if (path == mount or path.startswith(mount.rstrip("/") + "/")) and len(mount) > len(mount_point):
+                    mount_point = mount
+                    fs_type = parts[2]
+    except OSError:
+        return None
+    return fs_type
+
+def choose_backend(base_dir, backend):
+    """
+    Resolve the "auto" backend for one output folder: poll on parallel and
+    network filesystems, where inotify misses writes from compute nodes.
+    """
+    if backend != "auto":
+        return backend
+    fs_type = get_filesystem_type(base_dir)
+    if fs_type is not None and (fs_type in POLLING_FILESYSTEMS or fs_type.startswith("fuse")):
+        return "poll"
+    return "inotify"
+
+def track_simulation_progress(base_dirs, store_dir=None, debounce=0.5, flush_interval=30.0, flush_rows=100,
+                              backend="auto", poll_min=1.0, poll_max=60.0, max_stat_rate=20.0, detail=False,
+                              serve_port=None, serve_host="127.0.0.1", detector_options=None, hooks=None,
+                              logs=(), job_status=None):
+    """
+    Follow cpu.txt in one or more output folders until interrupted. All runs
+    share a single watchdog observer (or are polled from the main loop), each
+    keeps its own parser state.
+
+    Inputs:
+        base_dirs: Output folder, or list of output folders
+        store_dir: Progress store location, may contain "<out_dir>/" (see get_store_dir)
+        debounce, flush_interval, flush_rows: Event merging and write batching (see CPUHandler)
+        backend: "inotify", "poll" or "auto" (chosen per run, see choose_backend)
+        poll_min, poll_max: Range of the adaptive polling interval, in seconds
+        max_stat_rate: Stat calls per second allowed over all polled runs; the
+                       shortest polling interval is raised to respect it
+        detail: Record every column of every timer (see parse_step_block)
+        serve_port: If given, serve the metrics of all runs on this port (see metrics_exporter.py)
+        serve_host: Address the metrics server listens on
+        detector_options: Keyword arguments for the StallDetector of each run
+                          (stall_factor, stall_min, collapse); None disables detection
+        hooks: AlertHooks run on alerts (default: print only)
+        logs: Other logs to record along with cpu.txt (keys of log_readers.LOG_READERS);
+              they need a store and go to sub-folders of it (see log_readers.get_log_store_dir)
+        job_status: Optional job_status.JobStatusService shared by all runs
+    """
+    if isinstance(base_dirs, str):
+        base_dirs = [base_dirs]
+    multiple_runs = len(base_dirs) > 1
+    backends = {base_dir: choose_backend(base_dir, backend) for base_dir in base_dirs}
+    num_polled = list(backends.values()).count("poll")
+    if num_polled:
+        poll_min = max(poll_min, num_polled / max_stat_rate)
+        poll_max = max(poll_max, poll_min)
+
     observer = Observer()
-    observer.schedule(event_handler, path=base_dir, recursive=False)
+    handlers = []
+    for base_dir in base_dirs:
+        # Construct paths
+        cpu_txt_path = os.path.join(base_dir, 'cpu.txt')
+        output_csv_path = os.path.join(base_dir, 'progress.csv')
+
+        detector = None
+        if detector_options is not None:
+            last_step_time = os.path.getmtime(cpu_txt_path) if os.path.exists(cpu_txt_path) else None
+            detector = StallDetector(last_step_time=last_step_time, **detector_options)
+
+        run_store_dir = get_store_dir(base_dir, store_dir)
+        store = ProgressStore(run_store_dir) if run_store_dir else None
+        log_stores = {log_name: ProgressStore(get_log_store_dir(run_store_dir, log_name))
+                      for log_name in logs} if run_store_dir else None
+        event_handler = CPUHandler(output_csv=output_csv_path, cpu_txt_path=cpu_txt_path, store=store,
+                                   name=get_run_name(base_dir) if multiple_runs else None,
+                                   debounce=debounce, flush_interval=flush_interval, flush_rows=flush_rows,
+                                   detail=detail, detector=detector, hooks=hooks, log_stores=log_stores,
+                                   job_status=job_status)
+        if backends[base_dir] == "poll":
+            event_handler.enable_polling(poll_min, poll_max)
+        else:
+            observer.schedule(event_handler, path=base_dir, recursive=False)
+        handlers.append(event_handler)
+
+    print(f"Tracking {len(handlers)} run(s), {num_polled} by polling")
+    server = None
+    if serve_port is not None:
+        server = start_metrics_server(handlers, serve_port, serve_host)
+        print(f"Serving metrics on http://{serve_host}:{serve_port}/metrics")
     observer.start()
     try:
         while True:
-            time.sleep(1)
+            time.sleep(min(1.0, debounce, poll_min))
+            for event_handler in handlers:
+                if event_handler.poll_interval is not None:
+                    event_handler.check_file()
+                event_handler.poll()
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    if server is not None:
+        server.shutdown()
+    for event_handler in handlers:
+        event_handler.close()
 
 if __name__ == "__main__":
     args = docopt(__doc__)
-    out_dir = args['--out_dir']
-    if out_dir[-1] != "/":
-        out_dir += "/"
-    
-    track_simulation_progress(out_dir)
+    if args['<out_dirs>'] or args['--manifest']:
+        out_dirs = resolve_output_dirs(args['<out_dirs>'], args['--manifest'])
+    else:
+        out_dirs = resolve_output_dirs([args['--out_dir']])
+    if not out_dirs:
+        print("No output folders to track. Exiting...")
+        exit(1)
+    if args['--backend'] not in ("inotify", "poll", "auto"):
+        print(f"Invalid backend {args['--backend']}. Exiting...")
+        exit(1)
+    logs = [name.strip() for name in args['--logs'].split(',') if name.strip() and name.strip() != "none"]
+    for log_name in logs:
+        if log_name not in LOG_READERS:
+            print(f"Unknown log {log_name}, choose from {', '.join(LOG_READERS)}. Exiting...")
+            exit(1)
+    if args['--alert_scancel'] == "ledger" and not args['--job_status']:
+        print("--alert_scancel=ledger finds the chains with --job_status. Exiting...")
+        exit(1)
+    if args['--alert_scancel'] not in (None, "ledger") and len(out_dirs) > 1:
+        print(f"--alert_scancel={args['--alert_scancel']} would cancel the same chain for all {len(out_dirs)} runs, "
+              "use --alert_scancel=ledger with --job_status. Exiting...")
+        exit(1)
+
+    if args['--backfill']:
+        for out_dir in out_dirs:
+            store_dir = get_store_dir(out_dir, args['--store_dir'])
+            store = ProgressStore(store_dir)
+            backfill_store(CPUTailReader(os.path.join(out_dir, 'cpu.txt'), args['--all_columns']), store)
+            print(f"{store.num_rows} steps in {store_dir}")
+            for log_name in logs:
+                if os.path.exists(os.path.join(out_dir, log_name)):
+                    log_store = ProgressStore(get_log_store_dir(store_dir, log_name))
+                    backfill_store(LOG_READERS[log_name](os.path.join(out_dir, log_name), args['--all_columns']),
+                                   log_store)
+                    print(f"{log_store.num_rows} {log_name} records in {log_store.path}")
+    else:
+        job_status = None
+        if args['--job_status']:
+            # job_status.py sits next to the submit scripts: in the run folder once copied by
+            # gizmo_setup.py, or in setup_scripts/system_setup_scripts of the repository
+            sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "setup_scripts",
+                                         "system_setup_scripts"))
+            try:
+                from job_status import JobStatusService
+            except ModuleNotFoundError:
+                print("job_status.py not found, copy it from setup_scripts/system_setup_scripts. Exiting...")
+                exit(1)
+            job_status = JobStatusService(ttl=float(args['--status_ttl']))
+        track_simulation_progress(out_dirs, args['--store_dir'], debounce=float(args['--debounce']),
+                                  flush_interval=float(args['--flush_interval']),
+                                  flush_rows=int(args['--flush_rows']), backend=args['--backend'],
+                                  poll_min=float(args['--poll_min']), poll_max=float(args['--poll_max']),
+                                  max_stat_rate=float(args['--max_stat_rate']), detail=args['--all_columns'],
+                                  serve_port=int(args['--serve']) if args['--serve'] else None,
+                                  serve_host=args['--host'],
+                                  detector_options={'stall_factor': float(args['--stall_factor']),
+                                                    'stall_min': float(args['--stall_min']),
+                                                    'collapse': float(args['--collapse'])},
+                                  hooks=AlertHooks(args['--on_alert'], args['--alert_flag'],
+                                                   args['--alert_scancel']),
+                                  logs=logs, job_status=job_status)
@@ -0,0 +1,460 @@
+"""
+fake_scheduler.py: "Stand-in for sbatch, squeue, scancel, scontrol, sinfo, sacct, qsub, qstat and showstart, to try the chain tools without a cluster."
+
+Jobs live in a JSON file ($FAKE_SCHEDULER_STATE, default
+/tmp/fake_scheduler.json) and only change state when told to:
+    python fake_scheduler.py install <bin_dir>    write sbatch, squeue, scancel, scontrol, sinfo, sacct, qsub,
+                                                  qstat and showstart wrappers
+    python fake_scheduler.py step [<n>]           end the running jobs and start the pending ones whose
+                                                  dependencies are met, longest eligible first (dependencies,
+                                                  singleton and array limits respected, as SLURM does)
+    python fake_scheduler.py run <job_id> [<s> [<signal>]]
+                                                  run the script of a job in its submission folder, with
+                                                  the scheduler's environment; after <s> seconds send it
+                                                  the signal of its --signal option (as at the time limit),
+                                                  or <signal> (e.g. TERM, as on preemption) to its batch shell
+    python fake_scheduler.py set <job_id> <state> set the state of a job (or of all tasks of an array)
+    python fake_scheduler.py nodes <partition> <features> <state> <count> <cpus>
+                                                  set the number of nodes sinfo reports in a state, for
+                                                  nodes with comma-separated features in a partition
+    python fake_scheduler.py delay <partition> <h> make "sbatch --test-only" in the partition (showstart
+                                                  for partition *) estimate a start in <h> hours
+    python fake_scheduler.py history <partition> <nodes> <wait h> <run h> [<days ago>]
+                                                  add a finished job of the past to the sacct output
+    python fake_scheduler.py show                 list all jobs and the number of scheduler calls
+    python fake_scheduler.py reset                forget all jobs
+With <bin_dir> first on the PATH, the submit scripts, job_status.py and
+track_job.py talk to the fake scheduler. Every call of a scheduler command
+is counted, so the number of queries a tool makes can be checked. Jobs
+submitted with --requeue can be put back in the queue with
+"scontrol requeue <job_id>" (preempt_harness.py uses this); like in SLURM a
+requeued job becomes eligible anew, so it queues behind jobs (e.g. later
+tasks of its array) that have been waiting longer. The times jobs
+are submitted, start and end are recorded for sacct and qstat -f.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import signal
+import argparse
+import subprocess
+from contextlib import contextmanager
+
+STATE_FILE = os.environ.get("FAKE_SCHEDULER_STATE", "/tmp/fake_scheduler.json")
+COMMANDS = ('sbatch', 'squeue', 'scancel', 'scontrol', 'sinfo', 'sacct', 'qsub', 'qstat', 'showstart')
+# States of jobs still in the queue
+QUEUED = ('PENDING', 'RUNNING', 'SUSPENDED')
+PBS_LETTERS = {'PENDING': 'Q', 'RUNNING': 'R', 'SUSPENDED': 'S', 'COMPLETED': 'C'}
+
+
+@contextmanager
+def scheduler_state():
+    with open(STATE_FILE + ".lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = {'next_id': 1001, 'jobs': [], 'calls': {}}
+        if os.path.exists(STATE_FILE):
+            with open(STATE_FILE, 'r') as f:
+                state = json.load(f)
+        yield state
+        with open(STATE_FILE, 'w') as f:
+            json.dump(state, f, indent=1)
+
+def read_directives(script_path, prefix):
+    """
+    Options given in the #SBATCH/#PBS lines of a job script, as a list of strings.
+    """
+    options = []
+    with open(script_path, 'r') as f:
+        for line in f:
+            if line.startswith(prefix + " "):
+                options.extend(line[len(prefix):].split())
+    return options
+
+def option_values(options, names):
+    # Values of options given as "--name=value", "--name value" or "-n value"
+    values = {}
+    i = 0
+    while i < len(options):
+        option = options[i]
+        key, _, value = option.partition("=")
+        if key in names:
+            if not value and i + 1 < len(options):
+                i += 1
+                value = options[i]
+            values[names[key]] = value
+        i += 1
+    return values
+
+def add_jobs(state, scheduler, settings, script_path):
+    """
+    Queue a job (or one job per task of an array) and return the submission ID.
+    """
+    number = state['next_id']
+    state['next_id'] += 1
+    job = {'scheduler': scheduler, 'name': settings.get('name', os.path.basename(script_path)),
+           'user': os.environ.get('USER', ''), 'state': 'PENDING', 'script': os.path.abspath(script_path),
+           'dependency': settings.get('dependency', ''), 'partition': settings.get('partition', 'default'),
+           'array': None, 'index': None, 'limit': None, 'submit_dir': os.getcwd(),
+           'signal': settings.get('signal'), 'requeue': settings.get('requeue', False), 'restarts': 0,
+           'nodes': int(settings.get('nodes', 1)), 'submitted': time.time()}
+    job['eligible'] = job['submitted']
+    if 'array' not in settings:
+        job['id'] = str(number) if scheduler == "slurm" else f"{number}.fake"
+        state['jobs'].append(job)
+        return job['id']
+    match = re.match(r"(\d+)-(\d+)(?:%(\d+))?$", settings['array'])
+    first, last, limit = int(match.group(1)), int(match.group(2)), match.group(3)
+    for index in range(first, last + 1):
+        task = dict(job, array=str(number), index=index, limit=int(limit) if limit else None)
+        task['id'] = f"{number}_{index}" if scheduler == "slurm" else f"{number}[{index}].fake"
+        state['jobs'].append(task)
+    return str(number) if scheduler == "slurm" else f"{number}[].fake"
+
+def _set_state(job, new_state):
+    # Record when the job starts and ends, for sacct and qstat -f
+    if new_state == 'RUNNING' and job['state'] != 'RUNNING':
+        job['started'] = time.time()
+    elif new_state == 'PENDING':
+        job.pop('started', None)
+        job['eligible'] = time.time()
+    elif new_state not in QUEUED:
+        job['ended'] = time.time()
+    job['state'] = new_state
+
+def _node_count(options):
+    # -N4, -N 4, --nodes=4 or --nodes 4
+    for i, option in enumerate(options):
+        match = re.match(r"(?:-N|--nodes=)(\d+)$", option)
+        if match:
+            return match.group(1)
+        if option in ('-N', '--nodes') and i + 1 < len(options):
+            return options[i + 1]
+    return None
+
+def test_only(state, settings, nodes):
+    """
+    What "sbatch --test-only" prints: the start estimated from the delay set
+    for the partition (or for *, default now). Nothing is submitted.
+    """
+    delays = state.get('delays', {})
+    partition = settings.get('partition', 'default')
+    start = time.time() + 3600 * delays.get(partition, delays.get('*', 0.0))
+    print(f"sbatch: Job {state['next_id']} to start at {time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(start))} "
+          f"using {nodes} processors on nodes fake[1-{nodes}] in partition {partition}", file=sys.stderr)
+
+def sbatch(state, args):
+    names = {'--job-name': 'name', '-J': 'name', '--array': 'array', '-a': 'array',
+             '--dependency': 'dependency', '-d': 'dependency', '--partition': 'partition', '-p': 'partition',
+             '--signal': 'signal'}
+    if "--test-only" in args:
+        test_only(state, option_values(args, names), int(_node_count(args) or 1))
+        return
+    script_path = [arg for arg in args if not arg.startswith("-")][-1]
+    directives = read_directives(script_path, "#SBATCH")
+    settings = option_values(directives, names)
+    settings.update(option_values(args[:-1], names))
+    nodes = _node_count(args[:-1]) or _node_count(directives)
+    if nodes is not None:
+        settings['nodes'] = nodes
+    settings['requeue'] = "--requeue" in directives + args
+    job_id = add_jobs(state, "slurm", settings, script_path)
+    print(job_id if "--parsable" in args else f"Submitted batch job {job_id}")
+
+def qsub(state, args):
+    names = {'-N': 'name', '-t': 'array', '-J': 'array', '-q': 'partition', '-W': 'dependency'}
+    script_path = [arg for arg in args if not arg.startswith("-")][-1]
+    directives = read_directives(script_path, "#PBS")
+    settings = option_values(directives, names)
+    settings.update(option_values(args[:-1], names))
+    match = re.search(r"nodes=(\d+)", " ".join(directives + args[:-1]))
+    if match:
+        settings['nodes'] = match.group(1)
+    settings['dependency'] = settings.get('dependency', '').replace("depend=", "")
+    print(add_jobs(state, "pbs", settings, script_path))
+
+def _matches(job, job_ids):
+    # A job ID selects a job, an array task, or all tasks of an array
+    for job_id in job_ids:
+        base = job_id.split(".")[0]
+        if job['id'] == job_id or job['id'].split(".")[0] == base or \
+            (job['array'] is not None and base in (job['array'], job['array'] + "[]")):
+            return True
+    return False
+
+def squeue(state, args):
+    values = option_values(args, {'-o': 'format', '--format': 'format', '-u': 'user', '--user': 'user',
+                                  '-j': 'jobs', '--jobs': 'jobs'})
+    jobs = [job for job in state['jobs'] if job['scheduler'] == "slurm" and job['state'] in QUEUED]
+    if 'user' in values:
+        jobs = [job for job in jobs if job['user'] == values['user']]
+    if 'jobs' in values:
+        job_ids = values['jobs'].split(",")
+        jobs = [job for job in jobs if _matches(job, job_ids)]
+        known = [job for job in state['jobs'] if _matches(job, job_ids)]
+        if not known:
+            print("slurm_load_jobs error: Invalid job id specified", file=sys.stderr)
+            exit(1)
+    rows = []
+    pending_tasks = {}
+    for job in jobs:
+        if job['array'] is not None and job['state'] == 'PENDING':
+            # squeue lists the pending tasks of an array on one line
+            if job['array'] not in pending_tasks:
+                pending_tasks[job['array']] = []
+                rows.append(('array', job))
+            pending_tasks[job['array']].append(job['index'])
+        else:
+            rows.append(('job', job))
+    if "-h" not in args and "--noheader" not in args:
+        print("JOBID STATE NAME")
+    form = values.get('format', '%i %T %j')
+    for kind, job in rows:
+        job_id = job['id']
+        if kind == 'array':
+            indices = pending_tasks[job['array']]
+            job_id = f"{job['array']}_[{indices[0]}-{indices[-1]}" + (f"%{job['limit']}]" if job['limit'] else "]")
+        fields = {'i': job_id, 'T': job['state'], 'j': job['name'], 'u': job['user'], 'P': job['partition'],
+                  't': job['state'][:2], 'r': "Dependency" if job['state'] == 'PENDING' else "None"}
+        print(re.sub(r"%\.?\d*([a-zA-Z])", lambda m: str(fields.get(m.group(1), "N/A")), form))
+
+def qstat(state, args):
+    job_ids = [arg for arg in args if not arg.startswith("-")]
+    jobs = [job for job in state['jobs'] if job['scheduler'] == "pbs" and job['state'] in QUEUED]
+    status = 0
+    if job_ids:
+        for job_id in job_ids:
+            if not any(_matches(job, [job_id]) for job in state['jobs'] if job['state'] in QUEUED):
+                print(f"qstat: Unknown Job Id {job_id}", file=sys.stderr)
+                status = 153
+        jobs = [job for job in jobs if _matches(job, job_ids)]
+    for job in jobs:
+        print(f"Job Id: {job['id']}")
+        print(f"    Job_Name = {job['name']}")
+        print(f"    Job_Owner = {job['user']}@fake")
+        print(f"    job_state = {PBS_LETTERS.get(job['state'], 'C')}")
+        print(f"    queue = {job['partition']}")
+        print(f"    Resource_List.nodect = {job.get('nodes', 1)}")
+        if 'submitted' in job:
+            print(f"    qtime = {time.ctime(job['submitted'])}")
+        if 'started' in job:
+            print(f"    start_time = {time.ctime(job['started'])}")
+        print("")
+    exit(status)
+
+def showstart(state, args):
+    # "showstart <cores>@<HH:MM:SS>", estimated from the delay set for partition *
+    start = 3600 * state.get('delays', {}).get('*', 0.0)
+    clock = f"{int(start) // 3600}:{int(start) // 60 % 60:02d}:{int(start) % 60:02d}"
+    print(f"job {args[-1] if args else ''} requires {args[-1].split('@')[0] if args else 1} procs")
+    print(f"Estimated Rsv based start in {clock} on {time.ctime(time.time() + start)}")
+
+def sacct(state, args):
+    """
+    The SLURM jobs (and the added history) submitted since -S, in the -o
+    fields JobID, Partition, NNodes, Submit, Start, End, State, JobName.
+    """
+    values = option_values(args, {'-S': 'since', '--starttime': 'since', '-o': 'format', '--format': 'format'})
+    since = time.mktime(time.strptime(values['since'], "%Y-%m-%dT%H:%M:%S")) if 'since' in values else 0.0
+    fields = values.get('format', 'JobID,Partition,NNodes,Submit,Start,End,State').split(",")
+
+    def clock(seconds):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(seconds)) if seconds is not None else "Unknown"
+    for job in state['jobs'] + state.get('history', []):
+        if job['scheduler'] != "slurm" or job.get('submitted', 0.0) < since:
+            continue
+        row = {'JobID': job['id'], 'Partition': job['partition'], 'NNodes': job.get('nodes', 1),
+               'Submit': clock(job.get('submitted')), 'Start': clock(job.get('started')),
+               'End': clock(job.get('ended')), 'State': job['state'], 'JobName': job['name']}
+        print(("|" if "-P" in args else " ").join(str(row.get(field, "")) for field in fields))
+
+def scancel(state, args):
+    for job in state['jobs']:
+        if job['state'] in QUEUED and _matches(job, args):
+            _set_state(job, 'CANCELLED')
+
+def scontrol(state, args):
+    if len(args) < 2 or args[0] != "requeue":
+        print("scontrol: only \"requeue <job_id>\" is supported", file=sys.stderr)
+        exit(1)
+    job_ids = args[1].split(",")
+    for job in state['jobs']:
+        if job['scheduler'] != "slurm" or not _matches(job, job_ids):
+            continue
+        if not job.get('requeue'):
+            print(f"scontrol: error: Requested operation is disabled for job {job['id']}", file=sys.stderr)
+            exit(1)
+        _set_state(job, 'PENDING')
+        job['restarts'] = job.get('restarts', 0) + 1
+
+def sinfo(state, args):
+    """
+    Node rows set with the nodes action, in the -o format given (%P, %f,
+    %T, %D and %c are filled in).
+    """
+    line_format = option_values(args, {'-o': 'format', '--format': 'format'}).get('format', "%P %f %T %D %c")
+    fields = {'P': 'partition', 'f': 'features', 'T': 'state', 'D': 'count', 'c': 'cpus'}
+    for row in state.get('nodes', []):
+        print(re.sub(r"%(\w)", lambda match: str(row.get(fields.get(match.group(1)), "")), line_format))
+
+def _dependencies_met(job, jobs):
+    for condition in filter(None, job['dependency'].split(",")):
+        if condition == "singleton":
+            if any(other['name'] == job['name'] and other['user'] == job['user'] and other is not job and
+                   (other['state'] in ('RUNNING', 'SUSPENDED') or
+                    (other['state'] == 'PENDING' and jobs.index(other) < jobs.index(job))) for other in jobs):
+                return False
+        else:
+            target = condition.split(":", 1)[1]
+            if any(_matches(other, [target]) and other['state'] in QUEUED for other in jobs):
+                return False
+    return True
+
+def step(state):
+    """
+    End the running jobs, then start every pending job whose dependencies
+    are met, in the order they became eligible (submission, or requeue) and
+    within the limits of their arrays.
+    """
+    jobs = state['jobs']
+    for job in jobs:
+        if job['state'] == 'RUNNING':
+            _set_state(job, 'COMPLETED')
+    pending = [job for job in jobs if job['state'] == 'PENDING']
+    pending.sort(key=lambda job: job.get('eligible', job.get('submitted', 0.0)))
+    for job in pending:
+        if not _dependencies_met(job, jobs):
+            continue
+        if job['array'] is not None and job['limit']:
+            tasks = [task for task in jobs if task['array'] == job['array'] and task['scheduler'] == job['scheduler']]
+            if sum(task['state'] == 'RUNNING' for task in tasks) >= job['limit']:
+                continue
+        _set_state(job, 'RUNNING')
+
+def _job_environment(job):
+    environment = dict(os.environ)
+    if job['scheduler'] == "slurm":
+        environment.update({'SLURM_JOB_ID': job['id'], 'SLURM_SUBMIT_DIR': job['submit_dir'],
+                            'SLURM_RESTART_COUNT': str(job.get('restarts', 0))})
+        if job['array'] is not None:
+            environment.update({'SLURM_ARRAY_JOB_ID': job['array'], 'SLURM_ARRAY_TASK_ID': str(job['index'])})
+    else:
+        environment.update({'PBS_JOBID': job['id'], 'PBS_O_WORKDIR': job['submit_dir']})
+        if job['array'] is not None:
+            environment['PBS_ARRAYID'] = str(job['index'])
+    return environment
+
+def run(job_id, signal_after=None, signal_name=None):
+    """
+    Run the script of a job (started if pending) until it exits. With
+    signal_after, the signal of the job's --signal option is sent after that
+    many seconds: to the batch shell only for "B:" signals, else to all of
+    the job's processes. A signal_name (e.g. TERM) is sent to the batch shell
+    instead. The job is COMPLETED (FAILED on a non-zero exit status) unless
+    it requeued itself meanwhile.
+
+    Returns:
+        Exit status of the script
+    """
+    with scheduler_state() as state:
+        jobs = [job for job in state['jobs'] if job['id'] == job_id]
+        if not jobs:
+            print(f"Unknown job {job_id}")
+            exit(1)
+        job = jobs[0]
+        _set_state(job, 'RUNNING')
+        restarts = job.get('restarts', 0)
+        job_signal = "B:" + signal_name if signal_name else job.get('signal')
+    output = os.path.join(job['submit_dir'], f"slurm-{job['id']}.out")
+    with open(output, 'a') as f:
+        process = subprocess.Popen(['bash', job['script']], cwd=job['submit_dir'], env=_job_environment(job),
+                                   stdout=f, stderr=subprocess.STDOUT, start_new_session=True)
+        if signal_after is not None and job_signal:
+            time.sleep(signal_after)
+            name = job_signal.split("@")[0]
+            number = getattr(signal, "SIG" + name.split(":")[-1])
+            if name.startswith("B:"):
+                process.send_signal(number)
+            else:
+                os.killpg(process.pid, number)
+            print(f"Sent {name} to {job_id}")
+        status = process.wait()
+    with scheduler_state() as state:
+        for other in state['jobs']:
+            if other['id'] == job_id and other['state'] == 'RUNNING' and other.get('restarts', 0) == restarts:
+                _set_state(other, 'COMPLETED' if status == 0 else 'FAILED')
+            if other['id'] == job_id:
+                print(f"{job_id} exited with status {status}, now {other['state']} (output in {output})")
+    return status
+
+def install(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    for command in COMMANDS:
+        path = os.path.join(bin_dir, command)
+        with open(path, 'w') as f:
+            f.write(f"#!/bin/sh\nexec {sys.executable} {os.path.abspath(__file__)} {command} \"$@\"\n")
+        os.chmod(path, 0o755)
+    print(f"Fake {', '.join(COMMANDS)} written to {bin_dir}, state in {STATE_FILE}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        command, args = sys.argv[1], sys.argv[2:]
+        with scheduler_state() as state:
+            state['calls'][command] = state['calls'].get(command, 0) + 1
+            try:
+                globals()[command](state, args)
+            except SystemExit as e:
+                status = e.code
+            else:
+                status = 0
+        exit(status)
+
+    parser = argparse.ArgumentParser(description='Fake batch scheduler for local tests')
+    parser.add_argument('action', choices=['install', 'step', 'set', 'show', 'reset', 'run', 'nodes', 'delay',
+                                           'history'])
+    parser.add_argument('arguments', nargs='*')
+    args = parser.parse_args()
+
+    if args.action == 'install':
+        install(args.arguments[0] if args.arguments else "fake_bin")
+    elif args.action == 'run':
+        run(args.arguments[0], float(args.arguments[1]) if len(args.arguments) > 1 else None,
+            args.arguments[2] if len(args.arguments) > 2 else None)
+    elif args.action == 'reset':
+        if os.path.exists(STATE_FILE):
+            os.remove(STATE_FILE)
+    else:
+        with scheduler_state() as state:
+            if args.action == 'step':
+                for _ in range(int(args.arguments[0]) if args.arguments else 1):
+                    step(state)
+            elif args.action == 'set':
+                job_id, new_state = args.arguments
+                for job in state['jobs']:
+                    if _matches(job, [job_id]):
+                        _set_state(job, new_state)
+            elif args.action == 'nodes':
+                partition, features, node_state, count, cpus = args.arguments
+                nodes = [row for row in state.get('nodes', []) if (row['partition'], row['features'],
+                                                                   row['state']) != (partition, features, node_state)]
+                nodes.append({'partition': partition, 'features': features, 'state': node_state,
+                              'count': int(count), 'cpus': int(cpus)})
+                state['nodes'] = nodes
+            elif args.action == 'delay':
+                partition, hours = args.arguments
+                state.setdefault('delays', {})[partition] = float(hours)
+            elif args.action == 'history':
+                partition, nodes, wait, run_time = args.arguments[:4]
+                submitted = time.time() - 86400 * float(args.arguments[4] if len(args.arguments) > 4 else 1)
+                history = state.setdefault('history', [])
+                history.append({'id': f"h{len(history) + 1}", 'scheduler': 'slurm', 'name': 'history',
+                                'partition': partition, 'nodes': int(nodes), 'state': 'COMPLETED',
+                                'submitted': submitted, 'started': submitted + 3600 * float(wait),
+                                'ended': submitted + 3600 * (float(wait) + float(run_time))})
+            for job in state['jobs']:
+                print(f"{job['id']:<16} {job['state']:<10} {job['name']:<24} {job['dependency']}")
+            print(f"Calls: {state['calls']}")
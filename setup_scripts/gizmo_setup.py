@@ -106,28 +106,28 @@ def copy_job_submission_scripts(path, systype):
     """
     if systype == "CITA_starq":
         try:
-            subprocess.Popen([f"cp ./system_setup_scripts/CITA_starq/* {path}"], shell=True, stdout=subprocess.PIPE,
+            subprocess.Popen([f"cp ./system_setup_scripts/CITA_starq/* ./system_setup_scripts/*.py {path}"], shell=True, stdout=subprocess.PIPE,
                                     stderr=subprocess.PIPE)
         except:
             print(f"Error copying job submission scripts to {path}")
             exit(1)
     elif systype == "SciNet":
         try:
-            subprocess.Popen([f"cp ./system_setup_scripts/Niagara/* {path}"], shell=True, stdout=subprocess.PIPE,
+            subprocess.Popen([f"cp ./system_setup_scripts/Niagara/* ./system_setup_scripts/*.py {path}"], shell=True, stdout=subprocess.PIPE,
                                     stderr=subprocess.PIPE)
         except:
             print(f"Error copying job submission scripts to {path}")
             exit(1)
     elif systype == "Frontera":
         try:
-            subprocess.Popen([f"cp ./system_setup_scripts/Frontera/* {path}"], shell=True, stdout=subprocess.PIPE,
+            subprocess.Popen([f"cp ./system_setup_scripts/Frontera/* ./system_setup_scripts/*.py {path}"], shell=True, stdout=subprocess.PIPE,
                                     stderr=subprocess.PIPE)
         except:
             print(f"Error copying job submission scripts to {path}")
             exit(1)
     elif systype == "RUSTY":
         try:
-            subprocess.Popen([f"cp ./system_setup_scripts/Rusty/* {path}"], shell=True, stdout=subprocess.PIPE,
+            subprocess.Popen([f"cp ./system_setup_scripts/Rusty/* ./system_setup_scripts/*.py {path}"], shell=True, stdout=subprocess.PIPE,
                                     stderr=subprocess.PIPE)
         except:
             print(f"Error copying job submission scripts to {path}")
@@ -0,0 +1,179 @@
+"""
+preempt_harness.py: "Run the checkpoint and requeue path of the Rusty preempt job scripts against the fake scheduler."
+
+Submits a two job chain with job_submit_rusty.py --partition preempt into a
+temporary run folder, with fake_scheduler.py standing in for SLURM and a
+fake mpirun standing in for GIZMO (it runs until the stop file appears in
+OutputDir, then "writes restart files" and ends). It then checks that
+  1. preemption (TERM) makes GIZMO stop and the job requeue itself,
+  2. the requeued job restarts from the restart files, before the next link,
+  3. the signal sent before the time limit (USR1) makes GIZMO stop without
+     a requeue, so that the chain stays num_jobs long,
+  4. the next link of the chain then starts, and restarts too.
+A second chain submitted as a job array checks that a requeued task queues
+behind the next task, as in SLURM. Run it from anywhere:
+    python preempt_harness.py [--keep]
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+SETUP_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_SCHEDULER = os.path.join(SETUP_DIR, "fake_scheduler.py")
+SUBMIT_SCRIPT = os.path.join(SETUP_DIR, "system_setup_scripts", "Rusty", "job_submit_rusty.py")
+
+# Stand-in for "mpirun ... ./GIZMO <params> [<restart flag>]"
+FAKE_MPIRUN = """#!/bin/bash
+args=("$@")
+for i in "${!args[@]}"; do
+    if [ "${args[$i]}" = "./GIZMO" ]; then
+        params=${args[$((i + 1))]}
+        flag=${args[$((i + 2))]}
+    fi
+done
+outdir=$(awk '$1 == "OutputDir" {print $2}' "$params")
+mkdir -p "$outdir"
+echo "start restart_flag=$flag" >> gizmo_log.txt
+for ((tick = 0; tick < ${FAKE_GIZMO_TICKS:-30}; tick++)); do
+    if [ -e "${outdir%/}/stop" ]; then
+        touch "${outdir%/}/restartfiles"
+        echo "stop file found, restart files written" >> gizmo_log.txt
+        exit 0
+    fi
+    sleep 0.1
+done
+echo "finished" >> gizmo_log.txt
+"""
+
+
+def fake_scheduler(environment, *arguments):
+    result = subprocess.run([sys.executable, FAKE_SCHEDULER] + list(arguments), env=environment,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    return result.stdout
+
+def load_state(environment):
+    with open(environment['FAKE_SCHEDULER_STATE'], 'r') as f:
+        return json.load(f)
+
+def read_log(run_dir):
+    path = os.path.join(run_dir, "gizmo_log.txt")
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return f.read().splitlines()
+
+def make_run(root, name):
+    # Run folder with the parameter file and a setup folder to submit from
+    run_dir = os.path.join(root, name)
+    os.makedirs(os.path.join(run_dir, "setup"))
+    with open(os.path.join(run_dir, "params.txt"), 'w') as f:
+        f.write("OutputDir                       output/\nTimeMax                         1\n")
+    with open(os.path.join(run_dir, "prep_restart.py"), 'w') as f:
+        f.write("")
+    return run_dir
+
+def submit(environment, run_dir, *options):
+    # Submit a two job chain on the preempt partition; returns the job IDs
+    known = {job['id'] for job in load_state(environment)['jobs']} \
+        if os.path.exists(environment['FAKE_SCHEDULER_STATE']) else set()
+    subprocess.run([sys.executable, SUBMIT_SCRIPT, '--partition', 'preempt', '--num-jobs', '2', '--new-sim',
+                    '--restart', '1', '--job-name', os.path.basename(run_dir), '--checkpoint-lead', '60']
+                   + list(options), cwd=os.path.join(run_dir, "setup"), env=environment, check=True,
+                   stdout=subprocess.DEVNULL)
+    return [job['id'] for job in load_state(environment)['jobs'] if job['id'] not in known]
+
+def job_states(environment):
+    return {job['id']: job for job in load_state(environment)['jobs']}
+
+def run_harness(root):
+    """
+    Set up the run folders under root and go through the preemption and the
+    time limit of the chain's first link. Returns the list of (check, passed).
+    """
+    bin_dir = os.path.join(root, "bin")
+    environment = dict(os.environ)
+    environment.update({
+        'FAKE_SCHEDULER_STATE': os.path.join(root, "fake_scheduler.json"),
+        'GIZMO_CHAIN_LEDGER': os.path.join(root, "job_chains.db"),
+        'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''),
+    })
+    fake_scheduler(environment, "install", bin_dir)
+    for name, content in (("mpirun", FAKE_MPIRUN), ("module", "#!/bin/sh\n")):
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.chmod(path, 0o755)
+
+    run_dir = make_run(root, "chain")
+    first, second = submit(environment, run_dir)
+    checks = []
+
+    # The first link is preempted (TERM to the batch shell)
+    fake_scheduler(environment, "step")
+    fake_scheduler(environment, "run", first, "1", "TERM")
+    state = job_states(environment)
+    log = read_log(run_dir)
+    checks.append(("first link started without restart flag", log[:1] == ["start restart_flag="]))
+    checks.append(("GIZMO wrote restart files on preemption", log[1:2] == ["stop file found, restart files written"]))
+    checks.append(("stop file removed", not os.path.exists(os.path.join(run_dir, "output", "stop"))))
+    checks.append(("preempted link requeued", state[first]['state'] == 'PENDING' and state[first]['restarts'] == 1))
+    checks.append(("scontrol called once", load_state(environment)['calls'].get('scontrol') == 1))
+    checks.append(("second link still waiting", state[second]['state'] == 'PENDING'))
+
+    # The requeued link runs until the time limit approaches (USR1)
+    fake_scheduler(environment, "step")
+    state = job_states(environment)
+    checks.append(("requeued link runs before the second (afterany)", state[first]['state'] == 'RUNNING'
+                   and state[second]['state'] == 'PENDING'))
+    fake_scheduler(environment, "run", first, "1")
+    state = job_states(environment)
+    log = read_log(run_dir)
+    checks.append(("requeued link restarted from the restart files", log[2:3] == ["start restart_flag=1"]))
+    checks.append(("GIZMO wrote restart files at the time limit", log[3:4] == ["stop file found, restart files written"]))
+    checks.append(("timed out link not requeued", state[first]['state'] == 'COMPLETED'
+                   and state[first]['restarts'] == 1 and load_state(environment)['calls'].get('scontrol') == 1))
+
+    # The second link follows
+    fake_scheduler(environment, "step")
+    fake_scheduler(environment, "run", second)
+    state = job_states(environment)
+    log = read_log(run_dir)
+    checks.append(("second link restarted", log[4:5] == ["start restart_flag=1"]))
+    checks.append(("chain completed after num_jobs links", log[5:] == ["finished"]
+                   and all(state[job_id]['state'] == 'COMPLETED' for job_id in (first, second))))
+
+    # As one job array, a preempted task queues again behind the next task
+    run_dir = make_run(root, "array")
+    array = submit(environment, run_dir, '--chain-mode', 'array')
+    fake_scheduler(environment, "step")
+    fake_scheduler(environment, "run", array[0], "1", "TERM")
+    fake_scheduler(environment, "step")
+    state = job_states(environment)
+    checks.append(("array: requeued task waits behind the next task", state[array[0]]['state'] == 'PENDING'
+                   and state[array[1]]['state'] == 'RUNNING'))
+    return checks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Test the checkpoint and requeue path of the preempt job scripts')
+    parser.add_argument('--keep', action='store_true',
+                      help='Keep the temporary run folder for inspection')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="preempt_harness_")
+    try:
+        checks = run_harness(root)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root)
+    for check, passed in checks:
+        print(f"{'PASS' if passed else 'FAIL'}  {check}")
+    if args.keep:
+        print(f"Run folder kept in {root}")
+    if not all(passed for _, passed in checks):
+        exit(1)
@@ -1,89 +1,69 @@
-import subprocess
 import os
-from datetime import datetime
+import sys
 import argparse
 
-def create_sbatch_script(job_number, param_file, restart, num_nodes, job_name, queue_name, ppn, dependency=None, wall_time=3):
+# job_chain.py sits next to this script once copied by gizmo_setup.py, and one folder up in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from job_chain import PBS_TORQUE, build_script, submit_chain
+from time_limits import format_wall_time, sync_time_limits
+
+def create_sbatch_script(job_number, param_file, restart, num_nodes, job_name, queue_name, ppn, dependency=None, wall_time=3, array=None, omp_threads=1):
     """
     Generate content for an sbatch script for GIZMO simulation.
     
     Args:
-        job_number: Number of the job in the sequence
+        job_number: Number of the job in the sequence (None for a job array)
         param_file: Parameter file for the GIZMO simulation
         restart: Boolean indicating if the job should restart from a snapshot
         num_nodes: Number of nodes requested
-        job_name: Base name for the job
-        dependency: Job ID this job depends on
+        job_name: Base name of the job (numbered with job_number outside job arrays)
+        dependency: Job ID this job depends on, or a list of dependency conditions (see job_chain.build_script)
         wall_time: Wall time in hours (default: 3)
+        array: (first, last) job number if the chain is submitted as one job array
+        omp_threads: OpenMP threads per MPI rank (GIZMO built with OPENMP); ppn // omp_threads ranks run per node
     """
-    num_cores = num_nodes * ppn
+    ranks_per_node = ppn // omp_threads
+    if ranks_per_node < 1:
+        raise ValueError(f"{omp_threads} threads per rank do not fit on a {ppn} core node")
+    num_cores = num_nodes * ranks_per_node
     
-    # Convert wall time to HH:MM:SS format
-    hours = int(wall_time)
-    minutes = int((wall_time - hours) * 60)
-    seconds = int(((wall_time - hours) * 60 - minutes) * 60)
-    wall_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
     
-    script = [
-        "#!/bin/bash -l",
-        f"#PBS -l nodes={num_nodes}:ppn={ppn}",
-        f"#PBS -l walltime={wall_time_str}",
-        "#PBS -r n",
-        "#PBS -j oe",
-        f"#PBS -q {queue_name}",
-        f"#PBS -N {job_name}_{job_number}",
+    directives = [
+        f"-l nodes={num_nodes}:ppn={ppn}",
+        f"-l walltime={format_wall_time(wall_time)}",
+        "-r n",
+        "-j oe",
+        f"-q {queue_name}",
     ]
 
-    if dependency:
-        #script.append(f"#SBATCH --dependency=afterany:{dependency}")
-        script.append(f"#PBS -W depend=afterany:{dependency}")
-
-    script.extend([
-        "",
+    setup = [
         "cd ${PBS_O_WORKDIR}",
         "",
         "module purge",
         "module load openmpi/4.1.6-gcc-ucx gsl/2.7.1 hdf5/1.12.1-ucx fftw/3.3.10-openmpi-ucx gcc/5.4.0",
-        "export HDF5_DISABLE_VERSION_CHECK=1"
-        "",
-        "date_today=\"$(date +'%d-%m-%Y')\"",
-        "echo $date_today",
-        "base_filename=\"shell_${date_today}\"",
-        "date_filename=\"${base_filename}.out\"",
-        "echo $date_filename",
-        "",
-        "counter=1",
-        "filename=$date_filename",
-        "",
-        "while [[ -e $filename ]]; do",
-        "    counter=$((counter + 1))",
-        "    filename=\"${base_filename}_$counter.out\"",
-        "    echo \"File exists, checking next: $filename\"",
-        "done"
-    ])
-
-    if restart:
-        script.extend([
-            "",
-            "module load python/3.10.2",
-            #"jargon",
-            f"python prep_restart.py {param_file}",
-            ""
-        ])
+        "export HDF5_DISABLE_VERSION_CHECK=1",
+    ]
 
-    restart_flag = 2 if restart else 1
-    if num_nodes>1:
-        script.append(f"mpirun -np {num_cores} -map-by node:SPAN ./GIZMO {param_file} {restart_flag} >\"$filename\"")
-    else:
-        script.append(f"mpirun -np {num_cores} ./GIZMO {param_file} {restart_flag} >\"$filename\"")
+    run_command = f"mpirun -np {num_cores} ./GIZMO"
+    if omp_threads > 1:
+        # Give every rank omp_threads consecutive cores for its threads
+        run_command = f"mpirun -np {num_cores} --map-by ppr:{ranks_per_node}:node:PE={omp_threads} --bind-to core ./GIZMO"
+    elif num_nodes>1:
+        run_command = f"mpirun -np {num_cores} -map-by node:SPAN ./GIZMO"
 
-    return "\n".join(script)
+    restart_flag = 2 if restart else 1
+    return build_script(PBS_TORQUE, job_name, directives, setup, run_command, param_file,
+                        restart=restart_flag, job_number=job_number, dependency=dependency, array=array,
+                        omp_threads=omp_threads, layout={'cluster': "CITA_starq", 'node_type': queue_name,
+                                                         'nodes': num_nodes, 'ranks_per_node': ranks_per_node},
+                        restart_setup=["module load python/3.10.2"], prep_restart=bool(restart),
+                        shell="#!/bin/bash -l")
 
     
 
-def submit_job_chain(num_jobs, param_file, restart, num_nodes, job_name, queue_name, ppn, initial_dependency=None, wall_time=3):
+def submit_job_chain(num_jobs, param_file, restart, num_nodes, job_name, queue_name, ppn, initial_dependency=None, wall_time=3, chain_mode="afterany", new_chain=False, omp_threads=1):
     """
-    Submit a chain of dependent GIZMO simulation jobs to SLURM.
+    Submit a chain of dependent GIZMO simulation jobs to PBS.
     
     Args:
         num_jobs: Number of jobs to submit in the chain
@@ -93,48 +73,20 @@ def submit_job_chain(num_jobs, param_file, restart, num_nodes, job_name, queue_n
         job_name: Base name for the job
         initial_dependency: Job ID that the first job in the chain should depend on
         wall_time: Wall time in hours (default: 3)
+        chain_mode: How the chain is submitted: array or afterany (see job_chain.py)
+        new_chain: Submit all jobs again instead of resuming the chain recorded in the chain ledger
+        omp_threads: OpenMP threads per MPI rank (GIZMO built with OPENMP)
+
+    Returns:
+        List of the submitted job IDs
     """
-    previous_job_id = initial_dependency
-    
-    for job_num in range(1, num_jobs + 1):
-        # Create script file with timestamp to avoid overwrites
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        script_path = f"{job_name}_job_{job_num}_{timestamp}.sh"
-        
-        # Create script content
-        script_content = create_sbatch_script(
-            job_number=job_num,
-            param_file=param_file,
-            restart=restart,
-            num_nodes=num_nodes,
-            job_name=job_name,
-            queue_name=queue_name,
-            ppn=ppn,
-            dependency=previous_job_id,
-            wall_time=wall_time
-        )
-        
-        # Write script to file
-        with open(script_path, 'w') as f:
-            f.write(script_content)
-        
-        # Submit job and capture job ID
-        try:
-            result = subprocess.run(
-                ['qsub', script_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                check=True
-            )
-            # Extract job ID from sbatch output
-            job_id = result.stdout.strip().split()[-1]
-            previous_job_id = job_id
-            print(f"Submitted {job_name}_{job_num} (Job ID: {job_id})")
-            
-        except subprocess.CalledProcessError as e:
-            print(f"Error submitting {job_name}_{job_num}: {e}")
-            return
+    def make_script(job_number, name, dependency, array):
+        return create_sbatch_script(job_number, param_file, restart, num_nodes, name, queue_name, ppn,
+                                    dependency=dependency, wall_time=wall_time, array=array,
+                                    omp_threads=omp_threads)
+
+    return submit_chain(PBS_TORQUE, make_script, num_jobs, job_name, mode=chain_mode,
+                        initial_dependency=initial_dependency, new_chain=new_chain)
 
 if __name__ == "__main__":
     QUEUE_PPN_MAP = {
@@ -158,12 +110,28 @@ if __name__ == "__main__":
                       help='Number of nodes to request (default: 1)')
     parser.add_argument('--ppn', type=int,
                       help='Cores per node (default: queue-specific value)')
+    parser.add_argument('--omp-threads', type=int, default=1,
+                      help='OpenMP threads per MPI rank, for GIZMO built with OPENMP (default: 1); '
+                           'see hybrid_layout.py for the best layout')
     parser.add_argument('--restart', type=int, choices=[1, 2],
                       help='Restart mode (1 or 2)')
     parser.add_argument('--initial-dependency', type=str,
                       help='Job ID for initial dependency (default: None)')
     parser.add_argument('--wall-time', type=float, default=24.0,
                       help='Wall time in hours (default: 24.0)')
+    parser.add_argument('--sync-time-limits', action='store_true',
+                      help='Set TimeLimitCPU in the parameter file to end GIZMO --time-margin minutes before '
+                           '--wall-time runs out, and CpuTimeBetRestartFile to --restart-interval if given '
+                           '(see restart_cadence.py for measured values)')
+    parser.add_argument('--time-margin', type=float, default=15.0,
+                      help='Minutes left for start-up, the last step and the final restart write (default: 15)')
+    parser.add_argument('--restart-interval', type=float, default=None,
+                      help='Hours between restart files with --sync-time-limits (default: unchanged)')
+    parser.add_argument('--chain-mode', type=str, default='afterany', choices=PBS_TORQUE.modes,
+                      help='Submit the chain as one job array or as jobs each depending on the '
+                           'previous job ID (default: afterany)')
+    parser.add_argument('--new-chain', action='store_true',
+                      help='Submit all jobs again; by default jobs of this chain already in the chain ledger are skipped')
 
     # Parse arguments
     args = parser.parse_args()
@@ -186,6 +154,8 @@ if __name__ == "__main__":
     ppn = args.ppn if args.ppn is not None else QUEUE_PPN_MAP[args.queue]
     if ppn < 1:
         raise ValueError("PPN must be positive")
+    if args.omp_threads < 1 or args.omp_threads > ppn:
+        raise ValueError("Number of OpenMP threads must be between 1 and the cores per node")
     
     total_cores = args.num_nodes * ppn
 
@@ -193,15 +163,23 @@ if __name__ == "__main__":
     print(f"Cores per node (ppn): {ppn}")
     print(f"Total cores requested: {total_cores}")
 
+    # The jobs run GIZMO in the submission folder
+    if args.sync_time_limits:
+        sync_time_limits(args.param_file, args.wall_time, args.time_margin, args.restart_interval)
+    if args.omp_threads > 1:
+        print(f"MPI ranks per node: {ppn // args.omp_threads} x {args.omp_threads} OpenMP threads")
+
     # Submit job chain
     if args.initial_dependency:
         submit_job_chain(args.num_jobs, args.param_file, args.restart, 
                         args.num_nodes, args.job_name, args.queue, ppn, 
-                        args.initial_dependency, args.wall_time)
+                        args.initial_dependency, args.wall_time, args.chain_mode, new_chain=args.new_chain,
+                        omp_threads=args.omp_threads)
     else:
         submit_job_chain(args.num_jobs, args.param_file, args.restart, 
                         args.num_nodes, args.job_name, args.queue, ppn,
-                        wall_time=args.wall_time)
+                        wall_time=args.wall_time, chain_mode=args.chain_mode, new_chain=args.new_chain,
+                        omp_threads=args.omp_threads)
 
 
 
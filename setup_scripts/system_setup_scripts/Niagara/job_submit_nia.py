@@ -1,34 +1,41 @@
-import subprocess
 import os
-from datetime import datetime
+import sys
 import argparse
 
-def create_sbatch_script(job_number, param_file, restart, num_nodes, job_name, dependency=None, account=1, cores_per_node=40, wall_time=23):
+# job_chain.py sits next to this script once copied by gizmo_setup.py, and one folder up in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from job_chain import SLURM, build_script, chain_arguments, check_chain_arguments, submit_chain
+from node_types import get_node_type
+from time_limits import format_wall_time, sync_time_limits
+
+def create_sbatch_script(job_number, param_file, restart, num_nodes, job_name, dependency=None, account=1, cores_per_node=None, wall_time=23, new_sim=False, array=None, omp_threads=1):
     """
     Generate content for an sbatch script for GIZMO simulation.
 
     Args:
-        job_number: Number of the job in the sequence
+        job_number: Number of the job in the sequence (None for a job array)
         param_file: Parameter file for the GIZMO simulation
         restart: Integer indicating restart mode (1 or 2) or None for no flag
         num_nodes: Number of nodes requested
-        job_name: Base name for the job
-        dependency: Job ID this job depends on
+        job_name: Base name of the job (numbered with job_number outside job arrays)
+        dependency: Job ID this job depends on, or a list of dependency conditions (see job_chain.build_script)
         account: Account number (1 for rrg-matzner, 2 for rrg-murray-ac)
-        cores_per_node: Number of cores per node (default: 40)
+        cores_per_node: Number of MPI ranks per node (default: 40 divided by omp_threads)
         wall_time: Wall time in hours (default: 23)
+        new_sim: If True, the first job of the chain will not use the restart flag
+        array: (first, last) job number if the chain is submitted as one job array
+        omp_threads: OpenMP threads per MPI rank (GIZMO built with OPENMP)
 
     Returns:
         String containing the sbatch script content
     """
+    node_cores = get_node_type("Niagara")[0]
+    if cores_per_node is None:
+        cores_per_node = node_cores // omp_threads
+    if cores_per_node * omp_threads > node_cores:
+        raise ValueError(f"{cores_per_node} ranks of {omp_threads} threads do not fit on a {node_cores} core node")
     num_cores = num_nodes * cores_per_node
 
-    # Convert wall time to HH:MM:SS format
-    hours = int(wall_time)
-    minutes = int((wall_time - hours) * 60)
-    seconds = int(((wall_time - hours) * 60 - minutes) * 60)
-    wall_time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-
     # Map account number to account name
     account_map = {
         1: "rrg-matzner",
@@ -36,63 +43,37 @@ def create_sbatch_script(job_number, param_file, restart, num_nodes, job_name, d
     }
     account_name = account_map.get(account, "rrg-matzner")  # Default to rrg-matzner if invalid account number
 
-    script = [
-        "#!/bin/bash",
-        f"#SBATCH --account={account_name}",
-        f"#SBATCH --nodes={num_nodes}",
-        f"#SBATCH --ntasks-per-node={cores_per_node}",
-        f"#SBATCH --time={wall_time_str}",
-        f"#SBATCH --job-name={job_name}_{job_number}",
-        "#SBATCH --output=mpi_output_%j.txt",
-        "#SBATCH --mail-type=FAIL"
+    directives = [
+        f"--account={account_name}",
+        f"--nodes={num_nodes}",
+        f"--ntasks-per-node={cores_per_node}",
+        f"--time={format_wall_time(wall_time)}",
+        "--output=mpi_output_%j.txt",
+        "--mail-type=FAIL"
     ]
 
-    if dependency:
-        script.append(f"#SBATCH --dependency=afterany:{dependency}")
-
-    script.extend([
-        "",
+    setup = [
         "cd $SLURM_SUBMIT_DIR",
         "cd ../",
         "",
         "module load intel intelmpi gsl hdf5 fftw",
-        "",
-        "date_today=\"$(date +'%d-%m-%Y')\"",
-        "echo $date_today",
-        "base_filename=\"shell_${date_today}\"",
-        "date_filename=\"${base_filename}.out\"",
-        "echo $date_filename",
-        "",
-        "counter=1",
-        "filename=$date_filename",
-        "",
-        "while [[ -e $filename ]]; do",
-        "    counter=$((counter + 1))",
-        "    filename=\"${base_filename}_$counter.out\"",
-        "    echo \"File exists, checking next: $filename\"",
-        "done"
-    ])
-
-    if restart:
-        script.extend([
-            "",
-            "module load python",
-            "jargon",
-            f"python prep_restart.py {param_file}",
-            ""
-        ])
-
-    # Only include restart flag if specified
-    mpirun_cmd = f"mpirun -np {num_cores} ./GIZMO {param_file}"
-    if restart is not None:
-        mpirun_cmd += f" {restart}"
-    mpirun_cmd += " >\"$filename\""
-    script.append(mpirun_cmd)
-
-    return "\n".join(script)
+    ]
+
+    run_command = f"mpirun -np {num_cores} ./GIZMO"
+    if omp_threads > 1:
+        directives.insert(3, f"--cpus-per-task={omp_threads}")
+        # Intel MPI pins each rank to a domain of OMP_NUM_THREADS cores
+        setup.append("export I_MPI_PIN_DOMAIN=omp")
+        run_command = f"mpirun -np {num_cores} -ppn {cores_per_node} ./GIZMO"
+
+    layout = {'cluster': "Niagara", 'node_type': "default", 'nodes': num_nodes, 'ranks_per_node': cores_per_node}
+    return build_script(SLURM, job_name, directives, setup, run_command,
+                        param_file, restart=restart, job_number=job_number, dependency=dependency, array=array,
+                        new_sim=new_sim, omp_threads=omp_threads, layout=layout, restart_setup=["module load python", "jargon"])
 
 def submit_job_chain(num_jobs, param_file, restart, num_nodes, job_name, \
-                     initial_dependency=None, account=1, cores_per_node=40, wall_time=23, new_sim=False):
+                     initial_dependency=None, account=1, cores_per_node=None, wall_time=23, new_sim=False, chain_mode="afterany", new_chain=False,
+                     omp_threads=1):
     """
     Submit a chain of dependent GIZMO simulation jobs to SLURM.
 
@@ -104,105 +85,46 @@ def submit_job_chain(num_jobs, param_file, restart, num_nodes, job_name, \
         job_name: Base name for the job
         initial_dependency: Job ID that the first job in the chain should depend on
         account: Account number (1 for rrg-matzner, 2 for rrg-murray-ac)
-        cores_per_node: Number of cores per node (default: 40)
+        cores_per_node: Number of MPI ranks per node (default: 40 divided by omp_threads)
         wall_time: Wall time in hours (default: 23)
+        new_sim: If True, first job will not use restart flag
+        chain_mode: How the chain is submitted: array, singleton or afterany (see job_chain.py)
+        new_chain: Submit all jobs again instead of resuming the chain recorded in the chain ledger
+        omp_threads: OpenMP threads per MPI rank (GIZMO built with OPENMP)
+
+    Returns:
+        List of the submitted job IDs
     """
-    previous_job_id = initial_dependency
-
-    for job_num in range(1, num_jobs + 1):
-        # Determine whether to use restart flag for this job
-        current_restart = None if (new_sim and job_num == 1) else restart
-        
-        # Create script file with timestamp to avoid overwrites
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        script_path = f"{job_name}_job_{job_num}_{timestamp}.sh"
-
-        # Create script content
-        script_content = create_sbatch_script(
-            job_number=job_num,
-            param_file=param_file,
-            restart=current_restart,
-            num_nodes=num_nodes,
-            job_name=job_name,
-            dependency=previous_job_id,
-            account=account,
-            cores_per_node=cores_per_node,
-            wall_time=wall_time
-        )
-
-        # Write script to file
-        with open(script_path, 'w') as f:
-            f.write(script_content)
-
-        # Submit job and capture job ID
-        try:
-            result = subprocess.run(
-                ['sbatch', script_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                check=True
-            )
-            # Extract job ID from sbatch output
-            job_id = result.stdout.strip().split()[-1]
-            previous_job_id = job_id
-            print(f"Submitted {job_name}_{job_num} (Job ID: {job_id})")
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error submitting {job_name}_{job_num}: {e}")
-            return
+    def make_script(job_number, name, dependency, array):
+        return create_sbatch_script(job_number, param_file, restart, num_nodes, name, dependency=dependency,
+                                    account=account, cores_per_node=cores_per_node, wall_time=wall_time,
+                                    new_sim=new_sim, array=array, omp_threads=omp_threads)
+
+    return submit_chain(SLURM, make_script, num_jobs, job_name, mode=chain_mode,
+                        initial_dependency=initial_dependency, new_chain=new_chain)
 
 if __name__ == "__main__":
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Submit a chain of GIZMO simulation jobs to SLURM')
-    parser.add_argument('--num-jobs', type=int, default=1,
-                      help='Number of jobs to submit in the chain (default: 1)')
-    parser.add_argument('--param-file', type=str, default='params.txt',
-                      help='Parameter file for the GIZMO simulation (default: params.txt)')
-    parser.add_argument('--num-nodes', type=int, default=1,
-                      help='Number of nodes to request (default: 1)')
-    parser.add_argument('--job-name', type=str, default='gizmo_sim',
-                      help='Base name for the jobs (default: gizmo_sim)')
-    parser.add_argument('--restart', type=int, choices=[1, 2],
-                      help='Restart mode (1 or 2)')
-    parser.add_argument('--new-sim', action='store_true',
-                      help='If set, first job will not use restart flag')
-    parser.add_argument('--initial-dependency', type=str,
-                      help='Job ID for initial dependency (default: None)')
+    chain_arguments(parser, wall_time=24.0)
     parser.add_argument('--account', type=int, default=1, choices=[1, 2],
                       help='Account number (1 for rrg-matzner, 2 for rrg-murray-ac) (default: 1)')
-    parser.add_argument('--cores-per-node', type=int, default=40,
-                      help='Number of cores per node (default: 40)')
-    parser.add_argument('--wall-time', type=float, default=24.0,
-                      help='Wall time in hours (default: 24.0)')
 
     # Parse arguments
     args = parser.parse_args()
 
     # Validate inputs
-    if args.num_jobs < 1:
-        raise ValueError("Number of jobs must be positive")
-    if args.num_nodes < 1:
-        raise ValueError("Number of nodes must be positive")
-    if args.cores_per_node < 1:
-        raise ValueError("Number of cores per node must be positive")
-    if args.wall_time <= 0:
-        raise ValueError("Wall time must be positive")
+    check_chain_arguments(args)
     if args.account not in [1, 2]:
         raise ValueError("Account must be either 1 (rrg-matzner) or 2 (rrg-murray-ac)")
-    if not args.param_file:
-        raise ValueError("Parameter file must be provided")
-    if not args.job_name:
-        raise ValueError("Job name must be provided")
+
+    # The jobs run GIZMO one folder up
+    if args.sync_time_limits:
+        sync_time_limits(os.path.join("..", args.param_file), args.wall_time, args.time_margin, args.restart_interval)
 
     # Submit job chain
-    if args.initial_dependency:
-        submit_job_chain(args.num_jobs, args.param_file, args.restart, 
-                        args.num_nodes, args.job_name, args.initial_dependency,
-                        args.account, args.cores_per_node, args.wall_time,
-                        args.new_sim)
-    else:
-        submit_job_chain(args.num_jobs, args.param_file, args.restart, 
-                        args.num_nodes, args.job_name, account=args.account,
-                        cores_per_node=args.cores_per_node, wall_time=args.wall_time,
-                        new_sim=args.new_sim)
\ No newline at end of file
+    submit_job_chain(args.num_jobs, args.param_file, args.restart,
+                     args.num_nodes, args.job_name, initial_dependency=args.initial_dependency or None,
+                     account=args.account, cores_per_node=args.cores_per_node, wall_time=args.wall_time,
+                     new_sim=args.new_sim, chain_mode=args.chain_mode, new_chain=args.new_chain,
+                     omp_threads=args.omp_threads)
@@ -1,113 +1,118 @@
-import subprocess
 import os
-from datetime import datetime
+import sys
 import argparse
 
-def get_cpu_info(cpu_type):
+# job_chain.py sits next to this script once copied by gizmo_setup.py, and one folder up in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from job_chain import SLURM, build_script, chain_arguments, check_chain_arguments, submit_chain
+from node_types import NODE_TYPES
+from time_limits import format_wall_time, sync_time_limits
+
+# What sets the nodes of a Flatiron cluster apart; job_submit_pop.py holds Popeye's
+RUSTY = {
+    'cluster': "Rusty",
+    # Slurm feature (-C) of the nodes of a CPU type
+    'constraint': "ib-{}",
+    'default_cpu_type': "rome",
+    'setup': [
+        "module purge",
+        "module load openmpi gsl fftw hdf5",
+        "",
+        "cd ../",
+    ],
+    'output': ">\"$filename\" 2>gizmo.err",
+    # --cpu-type auto (see node_selection.py)
+    'auto': True,
+}
+
+CPU_TYPES = list(NODE_TYPES['Rusty'])
+
+def get_cpu_info(cpu_type, profile=RUSTY):
     """
     Get CPU information based on CPU type.
-    
+
     Args:
         cpu_type: Type of CPU to use
-        
+        profile: Cluster of the node (RUSTY or job_submit_pop.POPEYE)
+
     Returns:
         tuple: (cores_per_node, constraint_flag)
     """
-    cpu_map = {
-        'genoa': (96, 'ib-genoa'),
-        'icelake': (64, 'ib-icelake'), 
-        'rome': (128, 'ib-rome'),
-        'skylake': (36, 'ib-skylake'),
-        'cascadelake': (96, 'ib-cascadelake'),
-        'cooperlake': (192, 'ib-cooperlake')
-    }
-    
-    if cpu_type not in cpu_map:
-        raise ValueError(f"Unknown CPU type: {cpu_type}. Valid options: {list(cpu_map.keys())}")
-    
-    return cpu_map[cpu_type]
-
-def create_sbatch_script(job_number, param_file, restart, num_nodes, job_name, dependency=None, partition="cca", cpu_type="rome", cores_per_node=None, wall_time=None):
+    cpu_types = NODE_TYPES[profile['cluster']]
+    if cpu_type not in cpu_types:
+        raise ValueError(f"Unknown CPU type: {cpu_type}. Valid options: {list(cpu_types.keys())}")
+
+    return cpu_types[cpu_type][0], profile['constraint'].format(cpu_type)
+
+def create_sbatch_script(job_number, param_file, restart, num_nodes, job_name, dependency=None, partition="cca", cpu_type=None, cores_per_node=None, wall_time=None, new_sim=False, array=None, omp_threads=1,
+                         checkpoint_lead=None, profile=RUSTY):
     """
     Generate content for an sbatch script for GIZMO simulation on RUSTY system.
 
     Args:
-        job_number: Number of the job in the sequence
+        job_number: Number of the job in the sequence (None for a job array)
         param_file: Parameter file for the GIZMO simulation
         restart: Integer indicating restart mode (1 or 2) or None for no flag
         num_nodes: Number of nodes requested
-        job_name: Base name for the job
-        dependency: Job ID this job depends on
+        job_name: Base name of the job (numbered with job_number outside job arrays)
+        dependency: Job ID this job depends on, or a list of dependency conditions (see job_chain.build_script)
         partition: Partition to use (cca or preempt, default: cca)
-        cpu_type: Type of CPU to use (default: rome)
-        cores_per_node: Number of cores per node (if None, uses CPU type default)
-        wall_time: Wall time in hours (not used for RUSTY system)
+        cpu_type: Type of CPU to use (default: the cluster's, rome on Rusty)
+        cores_per_node: Number of MPI ranks per node (if None, the CPU type's cores divided by omp_threads)
+        wall_time: Wall time in hours (if None, the partition's time limit)
+        new_sim: If True, the first job of the chain will not use the restart flag
+        array: (first, last) job number if the chain is submitted as one job array
+        omp_threads: OpenMP threads per MPI rank (GIZMO built with OPENMP)
+        checkpoint_lead: Seconds before the time limit at which GIZMO writes restart files
+                         and ends; on preemption it does so at once and the job requeues
+                         itself (see job_chain.py)
+        profile: Cluster to submit to (RUSTY or job_submit_pop.POPEYE)
 
     Returns:
         String containing the sbatch script content
     """
+    if cpu_type is None:
+        cpu_type = profile['default_cpu_type']
+
     # Get CPU constraint information
-    cpu_cores, constraint = get_cpu_info(cpu_type)
-    
+    cpu_cores, constraint = get_cpu_info(cpu_type, profile)
+
     # Use specified cores_per_node or default from CPU type
     if cores_per_node is None:
-        cores_per_node = cpu_cores
-    
+        cores_per_node = cpu_cores // omp_threads
+    if cores_per_node * omp_threads > cpu_cores:
+        raise ValueError(f"{cores_per_node} ranks of {omp_threads} threads do not fit on a {cpu_cores} core node")
+
     num_cores = num_nodes * cores_per_node
 
-    script = [
-        "#!/bin/bash",
-        f"#SBATCH -N{num_nodes} -C {constraint} -p {partition}",
-        f"#SBATCH --job-name={job_name}_{job_number}"
-    ]
+    directives = [f"-N{num_nodes} -C {constraint} -p {partition}"]
+    if wall_time is not None:
+        directives.append(f"--time={format_wall_time(wall_time)}")
+
+    # Spread the ranks evenly when the nodes are not fully populated (e.g. to
+    # leave each rank more memory, see memory_usage.py)
+    if cores_per_node != cpu_cores:
+        directives.append(f"--ntasks-per-node={cores_per_node}")
+    if omp_threads > 1:
+        directives.append(f"--cpus-per-task={omp_threads}")
 
     # Add preempt QoS if using preempt partition
     if partition == "preempt":
-        script.append("#SBATCH --qos=preempt")
+        directives.append("--qos=preempt")
 
-    if dependency:
-        script.append(f"#SBATCH --dependency=afterany:{dependency}")
+    run_command = f"mpirun -np {num_cores} ./GIZMO"
+    if omp_threads > 1:
+        # Give every rank omp_threads consecutive cores for its threads
+        run_command = f"mpirun -np {num_cores} --map-by ppr:{cores_per_node}:node:PE={omp_threads} --bind-to core ./GIZMO"
 
-    script.extend([
-        "",
-        "module purge",
-        "module load openmpi gsl fftw hdf5",
-        "",
-        "cd ../",
-        "date_today=\"$(date +'%d-%m-%Y')\"",
-        "echo $date_today",
-        "base_filename=\"shell_${date_today}\"",
-        "date_filename=\"${base_filename}.out\"",
-        "echo $date_filename",
-        "",
-        "counter=1",
-        "filename=$date_filename",
-        "",
-        "while [[ -e $filename ]]; do",
-        "    counter=$((counter + 1))",
-        "    filename=\"${base_filename}_$counter.out\"",
-        "    echo \"File exists, checking next: $filename\"",
-        "done"
-    ])
-
-    if restart:
-        script.extend([
-            "",
-            f"python prep_restart.py {param_file}",
-            ""
-        ])
-
-    # Build mpirun command
-    mpirun_cmd = f"mpirun -np {num_cores} ./GIZMO {param_file}"
-    if restart is not None:
-        mpirun_cmd += f" {restart}"
-    mpirun_cmd += " >\"$filename\" 2>gizmo.err"
-    script.append(mpirun_cmd)
-
-    return "\n".join(script)
+    layout = {'cluster': profile['cluster'], 'node_type': cpu_type, 'nodes': num_nodes, 'ranks_per_node': cores_per_node}
+    return build_script(SLURM, job_name, directives, profile['setup'], run_command, param_file,
+                        restart=restart, job_number=job_number, dependency=dependency, array=array,
+                        new_sim=new_sim, omp_threads=omp_threads, layout=layout, checkpoint_lead=checkpoint_lead, output=profile['output'])
 
 def submit_job_chain(num_jobs, param_file, restart, num_nodes, job_name, \
-                     initial_dependency=None, partition="cca", cpu_type="rome", cores_per_node=None, wall_time=None, new_sim=False):
+                     initial_dependency=None, partition="cca", cpu_type=None, cores_per_node=None, wall_time=None, new_sim=False,
+                     chain_mode="afterany", new_chain=False, omp_threads=1, checkpoint_lead=None, profile=RUSTY):
     """
     Submit a chain of dependent GIZMO simulation jobs to SLURM on RUSTY system.
 
@@ -119,111 +124,102 @@ def submit_job_chain(num_jobs, param_file, restart, num_nodes, job_name, \
         job_name: Base name for the job
         initial_dependency: Job ID that the first job in the chain should depend on
         partition: Partition to use (cca or preempt, default: cca)
-        cpu_type: Type of CPU to use (default: rome)
+        cpu_type: Type of CPU to use (default: the cluster's, rome on Rusty)
         cores_per_node: Number of cores per node (if None, uses CPU type default)
-        wall_time: Wall time in hours (not used for RUSTY system)
+        wall_time: Wall time in hours (if None, the partition's time limit)
         new_sim: If True, first job will not use restart flag
+        chain_mode: How the chain is submitted: array, singleton or afterany (see job_chain.py)
+        new_chain: Submit all jobs again instead of resuming the chain recorded in the chain ledger
+        omp_threads: OpenMP threads per MPI rank (GIZMO built with OPENMP)
+        checkpoint_lead: Seconds before the time limit at which GIZMO writes restart files
+                         and ends; on preemption it does so at once and the job requeues
+                         itself (see job_chain.py)
+        profile: Cluster to submit to (RUSTY or job_submit_pop.POPEYE)
+
+    Returns:
+        List of the submitted job IDs
     """
-    previous_job_id = initial_dependency
-
-    for job_num in range(1, num_jobs + 1):
-        # Determine whether to use restart flag for this job
-        current_restart = None if (new_sim and job_num == 1) else restart
-        
-        # Create script file with timestamp to avoid overwrites
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        script_path = f"{job_name}_job_{job_num}_{timestamp}.sh"
-
-        # Create script content
-        script_content = create_sbatch_script(
-            job_number=job_num,
-            param_file=param_file,
-            restart=current_restart,
-            num_nodes=num_nodes,
-            job_name=job_name,
-            dependency=previous_job_id,
-            partition=partition,
-            cpu_type=cpu_type,
-            cores_per_node=cores_per_node,
-            wall_time=wall_time
-        )
-
-        # Write script to file
-        with open(script_path, 'w') as f:
-            f.write(script_content)
-
-        # Submit job and capture job ID
-        try:
-            result = subprocess.run(
-                ['sbatch', script_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                check=True
-            )
-            # Extract job ID from sbatch output
-            job_id = result.stdout.strip().split()[-1]
-            previous_job_id = job_id
-            print(f"Submitted {job_name}_{job_num} (Job ID: {job_id})")
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error submitting {job_name}_{job_num}: {e}")
-            return
+    def make_script(job_number, name, dependency, array):
+        return create_sbatch_script(job_number, param_file, restart, num_nodes, name, dependency=dependency,
+                                    partition=partition, cpu_type=cpu_type, cores_per_node=cores_per_node,
+                                    wall_time=wall_time, new_sim=new_sim, array=array, omp_threads=omp_threads,
+                                    checkpoint_lead=checkpoint_lead, profile=profile)
+
+    return submit_chain(SLURM, make_script, num_jobs, job_name, mode=chain_mode,
+                        initial_dependency=initial_dependency, new_chain=new_chain)
+
+def main(profile=RUSTY):
+    """
+    Submit the job chain given on the command line.
+
+    Args:
+        profile: Cluster to submit to (RUSTY or job_submit_pop.POPEYE)
+    """
+    cpu_types = list(NODE_TYPES[profile['cluster']])
+    default_cpu_type = profile['default_cpu_type']
 
-if __name__ == "__main__":
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Submit a chain of GIZMO simulation jobs to SLURM')
-    parser.add_argument('--num-jobs', type=int, default=1,
-                      help='Number of jobs to submit in the chain (default: 1)')
-    parser.add_argument('--param-file', type=str, default='params.txt',
-                      help='Parameter file for the GIZMO simulation (default: params.txt)')
-    parser.add_argument('--num-nodes', type=int, default=1,
-                      help='Number of nodes to request (default: 1)')
-    parser.add_argument('--job-name', type=str, default='gizmo_sim',
-                      help='Base name for the jobs (default: gizmo_sim)')
-    parser.add_argument('--restart', type=int, choices=[1, 2],
-                      help='Restart mode (1 or 2)')
-    parser.add_argument('--new-sim', action='store_true',
-                      help='If set, first job will not use restart flag')
-    parser.add_argument('--initial-dependency', type=str,
-                      help='Job ID for initial dependency (default: None)')
+    chain_arguments(parser)
     parser.add_argument('--partition', type=str, default='cca', choices=['cca', 'preempt'],
                       help='Partition to use (cca or preempt) (default: cca)')
-    parser.add_argument('--cpu-type', type=str, default='rome', 
-                      choices=['genoa', 'icelake', 'rome', 'skylake', 'cascadelake', 'cooperlake'],
-                      help='CPU type to use (default: rome)')
-    parser.add_argument('--cores-per-node', type=int, default=None,
-                      help='Number of cores per node (if not specified, uses CPU type default)')
-    parser.add_argument('--wall-time', type=float, default=None,
-                      help='Wall time in hours (not used for RUSTY system)')
+    parser.add_argument('--checkpoint-lead', type=int, default=None,
+                      help='Seconds before the time limit at which GIZMO writes restart files and ends, '
+                           'which it also does when preempted, the job then requeueing itself; 0 to disable '
+                           '(default: 300 on the preempt partition, disabled otherwise)')
+    if profile['auto']:
+        cpu_types.append('auto')
+        parser.add_argument('--cpu-type', type=str, default=default_cpu_type, choices=cpu_types,
+                          help='CPU type to use; auto picks the type the job is expected to start and finish '
+                               'soonest on from the idle nodes of the partition (see node_selection.py) '
+                               f'(default: {default_cpu_type})')
+        parser.add_argument('--core-speed', type=str, default=None,
+                          help='Per-core speed of CPU types for --cpu-type auto, e.g. genoa:1.3,skylake:0.8 '
+                               '(default: measured by hybrid_layout.py, else equal)')
+    else:
+        parser.add_argument('--cpu-type', type=str, default=default_cpu_type, choices=cpu_types,
+                          help=f'CPU type to use (default: {default_cpu_type})')
 
     # Parse arguments
     args = parser.parse_args()
 
     # Validate inputs
-    if args.num_jobs < 1:
-        raise ValueError("Number of jobs must be positive")
-    if args.num_nodes < 1:
-        raise ValueError("Number of nodes must be positive")
-    if args.cores_per_node is not None and args.cores_per_node < 1:
-        raise ValueError("Number of cores per node must be positive")
+    check_chain_arguments(args)
     if args.partition not in ['cca', 'preempt']:
         raise ValueError("Partition must be either 'cca' or 'preempt'")
-    if args.cpu_type not in ['genoa', 'icelake', 'rome', 'skylake', 'cascadelake', 'cooperlake']:
+    if args.checkpoint_lead is None:
+        args.checkpoint_lead = 300 if args.partition == "preempt" else 0
+    if args.checkpoint_lead < 0:
+        raise ValueError("Checkpoint lead must not be negative")
+    checkpoint_lead = args.checkpoint_lead if args.checkpoint_lead > 0 else None
+    if args.cpu_type not in cpu_types:
         raise ValueError("Invalid CPU type")
-    if not args.param_file:
-        raise ValueError("Parameter file must be provided")
-    if not args.job_name:
-        raise ValueError("Job name must be provided")
+
+    if args.cpu_type == "auto":
+        from node_selection import TYPICAL_JOB_HOURS, measured_speeds, parse_speeds, select_cpu_type
+        cpu_info = {cpu_type: get_cpu_info(cpu_type, profile) for cpu_type in NODE_TYPES[profile['cluster']]}
+        # hybrid_layout.py keeps its measurements next to the parameter file
+        speeds = measured_speeds(os.path.join("..", "hybrid_layouts.json"), profile['cluster'], cpu_info)
+        speeds.update(parse_speeds(args.core_speed))
+        job_hours = args.wall_time if args.wall_time is not None else TYPICAL_JOB_HOURS
+        args.cpu_type = select_cpu_type(cpu_info, args.partition, args.num_nodes, job_hours, default_cpu_type, speeds)
+        if args.cores_per_node is not None:
+            print(f"Ignoring --cores-per-node {args.cores_per_node}, it depends on the CPU type")
+            args.cores_per_node = None
+        cores = get_cpu_info(args.cpu_type, profile)[0] // args.omp_threads
+        print(f"Using {args.cpu_type}: {args.num_nodes} node(s) x {cores} ranks = {args.num_nodes * cores} ranks")
+
+    # The jobs run GIZMO one folder up
+    if args.sync_time_limits:
+        sync_time_limits(os.path.join("..", args.param_file), args.wall_time, args.time_margin, args.restart_interval)
 
     # Submit job chain
-    if args.initial_dependency:
-        submit_job_chain(args.num_jobs, args.param_file, args.restart, 
-                        args.num_nodes, args.job_name, args.initial_dependency,
-                        args.partition, args.cpu_type, args.cores_per_node, args.wall_time,
-                        args.new_sim)
-    else:
-        submit_job_chain(args.num_jobs, args.param_file, args.restart, 
-                        args.num_nodes, args.job_name, partition=args.partition,
-                        cpu_type=args.cpu_type, cores_per_node=args.cores_per_node, wall_time=args.wall_time,
-                        new_sim=args.new_sim)
\ No newline at end of file
+    submit_job_chain(args.num_jobs, args.param_file, args.restart,
+                     args.num_nodes, args.job_name, initial_dependency=args.initial_dependency or None,
+                     partition=args.partition, cpu_type=args.cpu_type, cores_per_node=args.cores_per_node,
+                     wall_time=args.wall_time, new_sim=args.new_sim, chain_mode=args.chain_mode,
+                     new_chain=args.new_chain, omp_threads=args.omp_threads, checkpoint_lead=checkpoint_lead,
+                     profile=profile)
+
+if __name__ == "__main__":
+    main()
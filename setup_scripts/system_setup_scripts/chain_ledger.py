@@ -0,0 +1,248 @@
+"""
+chain_ledger.py: "SQLite record of the submitted job chains, so that chains can be resumed without duplicates."
+
+A chain is identified by the directory it was submitted from and its base
+job name. For every link (job) of a chain the ledger keeps the hash of its
+script (without its dependency), the job ID and the last known state.
+job_chain.submit_chain skips the links already recorded, so running the same
+submit command again resumes a chain that failed part way, and a larger
+--num-jobs extends it; the hash tells it whether the settings changed since.
+
+The ledger is shared by all runs of the user, at ~/.gizmo_job_chains.db unless
+the GIZMO_CHAIN_LEDGER environment variable points elsewhere.
+"""
+
+import os
+import time
+import fcntl
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+
+DEFAULT_LEDGER = os.path.join(os.path.expanduser("~"), ".gizmo_job_chains.db")
+# State of a link that is no longer listed by the scheduler
+ENDED = "ENDED"
+# State of a link between its submission and the first status query
+SUBMITTED = "SUBMITTED"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chains (
+    id INTEGER PRIMARY KEY,
+    run_dir TEXT NOT NULL,
+    job_name TEXT NOT NULL,
+    scheduler TEXT NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (run_dir, job_name)
+);
+CREATE TABLE IF NOT EXISTS links (
+    chain_id INTEGER NOT NULL REFERENCES chains (id),
+    link INTEGER NOT NULL,
+    script_hash TEXT NOT NULL,
+    script_path TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    submission TEXT NOT NULL,
+    state TEXT NOT NULL,
+    submitted REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (chain_id, link)
+);
+CREATE TABLE IF NOT EXISTS queries (
+    scheduler TEXT PRIMARY KEY,
+    fetched REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT PRIMARY KEY,
+    fetched REAL NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS waits (
+    cluster TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    partition TEXT NOT NULL,
+    nodes INTEGER NOT NULL,
+    submitted REAL NOT NULL,
+    wait REAL NOT NULL,
+    run REAL,
+    PRIMARY KEY (cluster, job_id)
+);
+"""
+
+
+def get_ledger_path():
+    return os.environ.get("GIZMO_CHAIN_LEDGER", DEFAULT_LEDGER)
+
+def script_hash(content):
+    """
+    Short hash identifying the content of a job script.
+    """
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+class ChainLedger:
+    """
+    Ledger of job chains and their links.
+
+    Args:
+        path: SQLite file of the ledger (default: get_ledger_path())
+    """
+    def __init__(self, path=None):
+        self.path = path or get_ledger_path()
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    @contextmanager
+    def lock(self, blocking=True):
+        """
+        Hold an exclusive lock on the ledger while a chain is submitted (so that
+        two submissions of the same chain cannot both submit a link) or while
+        the scheduler is queried (so that only one consumer queries at a time).
+        Yields whether the lock was obtained, which is always the case when
+        blocking.
+        """
+        with open(self.path + ".lock", 'w') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_chain(self, run_dir, job_name, scheduler):
+        """
+        ID of the chain submitted from run_dir under job_name, created if new.
+        """
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO chains (run_dir, job_name, scheduler, created) VALUES (?, ?, ?, ?)",
+                            (run_dir, job_name, scheduler, time.time()))
+        row = self.db.execute("SELECT id FROM chains WHERE run_dir = ? AND job_name = ?",
+                              (run_dir, job_name)).fetchone()
+        return row['id']
+
+    def chains(self, run_dir=None, job_name=None):
+        """
+        All chains, optionally restricted to one run directory and/or job name.
+        """
+        query = "SELECT * FROM chains WHERE (? IS NULL OR run_dir = ?) AND (? IS NULL OR job_name = ?) ORDER BY id"
+        return [dict(row) for row in self.db.execute(query, (run_dir, run_dir, job_name, job_name))]
+
+    def links(self, chain_id=None):
+        """
+        Links of a chain (all links if chain_id is None), in chain order.
+        """
+        query = "SELECT * FROM links WHERE (? IS NULL OR chain_id = ?) ORDER BY chain_id, link"
+        return [dict(row) for row in self.db.execute(query, (chain_id, chain_id))]
+
+    def record(self, chain_id, link, content, script_path, job_id, submission=None):
+        """
+        Record a submitted link.
+
+        Args:
+            chain_id: Chain of the link
+            link: Number of the link in the chain
+            content: Content of the job script, hashed (job_chain.submit_chain passes
+                     the script without its dependency)
+            script_path: Path of the job script
+            job_id: Scheduler ID of the link (the array task for job arrays)
+            submission: ID returned by the submission (the array ID, default: job_id)
+        """
+        now = time.time()
+        with self.db:
+            self.db.execute("INSERT INTO links VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (chain_id, link, script_hash(content), os.path.abspath(script_path), job_id,
+                             submission or job_id, SUBMITTED, now, now))
+
+    def update_states(self, states, scheduler=None):
+        """
+        Store the states of one scheduler query.
+
+        Args:
+            states: Dictionary of job ID -> state of the queued jobs, covering all live submissions
+            scheduler: Only update the chains of this scheduler (default: all)
+        Links not listed in states and not ended yet are marked ENDED.
+        """
+        now = time.time()
+        rows = self.db.execute("SELECT links.chain_id, links.link, links.job_id, links.state FROM links "
+                               "JOIN chains ON chains.id = links.chain_id "
+                               "WHERE links.state != ? AND (? IS NULL OR chains.scheduler = ?)",
+                               (ENDED, scheduler, scheduler)).fetchall()
+        with self.db:
+            for row in rows:
+                state = states.get(row['job_id'], ENDED)
+                if state != row['state']:
+                    self.db.execute("UPDATE links SET state = ?, updated = ? WHERE chain_id = ? AND link = ?",
+                                    (state, now, row['chain_id'], row['link']))
+
+    def live_submissions(self, scheduler):
+        """
+        Submission IDs (jobs or job arrays) of the scheduler's links that have not ended.
+        """
+        rows = self.db.execute("SELECT DISTINCT links.submission FROM links JOIN chains ON chains.id = links.chain_id "
+                               "WHERE links.state != ? AND chains.scheduler = ?", (ENDED, scheduler))
+        return [row['submission'] for row in rows]
+
+    def schedulers(self):
+        """
+        Schedulers with links that have not ended.
+        """
+        rows = self.db.execute("SELECT DISTINCT chains.scheduler FROM links JOIN chains ON chains.id = links.chain_id "
+                               "WHERE links.state != ?", (ENDED,))
+        return [row['scheduler'] for row in rows]
+
+    def fetched(self, scheduler):
+        """
+        Time of the last status query of a scheduler (0 if never queried).
+        """
+        row = self.db.execute("SELECT fetched FROM queries WHERE scheduler = ?", (scheduler,)).fetchone()
+        return row['fetched'] if row else 0.0
+
+    def set_fetched(self, scheduler, fetched=None):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO queries VALUES (?, ?)",
+                            (scheduler, time.time() if fetched is None else fetched))
+
+    def snapshot(self, name):
+        """
+        (time fetched, content) of a stored scheduler snapshot (e.g. the node
+        states from sinfo), or None if there is none.
+        """
+        row = self.db.execute("SELECT fetched, content FROM snapshots WHERE name = ?", (name,)).fetchone()
+        return (row['fetched'], row['content']) if row else None
+
+    def set_snapshot(self, name, content):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)", (name, time.time(), content))
+
+    def record_waits(self, cluster, rows):
+        """
+        Keep the queue waits of past jobs of a cluster (see
+        schedulers.Slurm.wait_history), which the schedulers forget.
+        """
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO waits VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [(cluster, row['job_id'], row['partition'], row['nodes'], row['submitted'],
+                                  row['wait'], row['run']) for row in rows])
+
+    def waits(self, cluster, partition=None, since=0.0):
+        """
+        Recorded queue waits of a cluster (and partition) of jobs submitted since a time.
+        """
+        query = "SELECT * FROM waits WHERE cluster = ? AND submitted >= ?"
+        values = [cluster, since]
+        if partition is not None:
+            query += " AND partition = ?"
+            values.append(partition)
+        return self.db.execute(query + " ORDER BY submitted", values).fetchall()
+
+    def forget(self, chain_id):
+        """
+        Drop the links of a chain, so that it is submitted again from its first link.
+        """
+        with self.db:
+            self.db.execute("DELETE FROM links WHERE chain_id = ?", (chain_id,))
+
+    def close(self):
+        self.db.close()
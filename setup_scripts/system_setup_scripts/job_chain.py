@@ -0,0 +1,376 @@
+"""
+job_chain.py: "Submit a chain of GIZMO jobs, each continuing the previous one, to SLURM or PBS."
+
+Shared by the cluster submit scripts (job_submit_*.py), which only describe
+their nodes, modules and MPI launch and hand them to build_script; the SLURM
+ones take their common options from chain_arguments. A chain of
+num_jobs jobs is submitted in one of three ways (--chain-mode):
+    afterany   num_jobs jobs <job_name>_<n>, each depending on the job ID of
+               the previous one, one blocking call per job (the default, and
+               the original behaviour)
+    array      one job array of num_jobs tasks running one at a time (%1),
+               submitted with a single sbatch/qsub call
+    singleton  (SLURM only) num_jobs jobs sharing a name of their own,
+               <job_name>_chain<n> with n the chain's ID in the chain ledger,
+               each held by --dependency=singleton while another job of that
+               name is queued ahead of it or running; they are submitted
+               back to back without waiting for job IDs
+Every job finds its position in the chain in $JOB_NUMBER. Jobs restart from
+the previous one, except the first job of a new simulation. Each job appends
+its layout (nodes, MPI ranks per node, OpenMP threads per rank) to
+job_layout.txt in GIZMO's directory, where hybrid_layout.py finds it.
+
+With a checkpoint lead (SLURM only, e.g. the Rusty preempt partition) GIZMO
+runs in the background while the script waits for USR1, sent that many
+seconds before the time limit, or TERM (preemption). On either the script
+creates the stop file in GIZMO's OutputDir, upon which GIZMO writes restart
+files and ends. Only a preempted job requeues itself, to restart from these
+files; a job reaching its time limit just ends and the next job of the chain
+continues, so --num-jobs still bounds the chain. In array mode a requeued
+task queues anew and may run after the next task. setup_scripts/preempt_harness.py
+runs both paths against the fake scheduler.
+
+Submitted links are recorded in the chain ledger (chain_ledger.py): running
+the same submit command again only submits the links that are missing,
+depending on the last link if it is still queued or running. It warns if the
+settings of the run (parameter file, node count, ...) changed since the last
+link was submitted. job_status.py lists the chains and the states of their links.
+"""
+
+import os
+import subprocess
+from chain_ledger import ChainLedger, ENDED, script_hash
+from schedulers import SLURM, PBS_TORQUE
+from job_status import JobStatusService
+
+CHAIN_MODES = ('array', 'singleton', 'afterany')
+
+# Record of the layout of every job, next to the parameter file
+LAYOUT_FILE = "job_layout.txt"
+
+# File in OutputDir that makes GIZMO write restart files and end
+STOP_FILE = "stop"
+
+# Unique shell_<date>[_<n>].out file for GIZMO's standard output
+OUTPUT_FILE_LINES = [
+    "date_today=\"$(date +'%d-%m-%Y')\"",
+    "echo $date_today",
+    "base_filename=\"shell_${date_today}\"",
+    "date_filename=\"${base_filename}.out\"",
+    "echo $date_filename",
+    "",
+    "counter=1",
+    "filename=$date_filename",
+    "",
+    "while [[ -e $filename ]]; do",
+    "    counter=$((counter + 1))",
+    "    filename=\"${base_filename}_$counter.out\"",
+    "    echo \"File exists, checking next: $filename\"",
+    "done",
+]
+
+
+def build_script(scheduler, job_name, directives, setup, run_command, param_file, restart=None,
+                 job_number=1, dependency=None, array=None, new_sim=False, restart_setup=(),
+                 prep_restart=True, output=">\"$filename\"", shell="#!/bin/bash", omp_threads=1, layout=None,
+                 checkpoint_lead=None):
+    """
+    Generate the content of a job script of a chain.
+
+    Args:
+        scheduler: SLURM or PBS_TORQUE
+        job_name: Base name of the chain; jobs are named <job_name>_<job_number> except
+                  in array and singleton mode, where all jobs share the base name
+        directives: Scheduler options of the cluster (without the #SBATCH/#PBS prefix)
+        setup: Shell lines run first (cd, module loads, ...)
+        run_command: MPI launch of GIZMO, e.g. "mpirun -np 128 ./GIZMO"
+        param_file: Parameter file for the GIZMO simulation
+        restart: Restart flag passed to GIZMO (1 or 2) or None for no flag
+        job_number: Number of the job in the chain (ignored for arrays)
+        dependency: List of dependency conditions, e.g. ["afterany:1234"], or the
+                    job ID this job runs after (afterany)
+        array: (first, last) job number if the chain is one job array
+        new_sim: The first job of the chain starts the simulation (no restart flag)
+        restart_setup: Shell lines run before prep_restart.py when restarting
+        prep_restart: Run prep_restart.py before restarting
+        output: Redirection of GIZMO's output
+        shell: First line of the script
+        omp_threads: OpenMP threads per MPI rank; above 1 the threads are pinned to the rank's cores
+        layout: Dictionary (e.g. nodes, ranks_per_node, cluster, node_type) appended to
+                job_layout.txt with the parameter file and omp_threads when the job starts
+        checkpoint_lead: Seconds before the time limit at which the job has GIZMO write
+                         restart files and end; on preemption the job also requeues
+                         itself (see above). None to run GIZMO directly
+
+    Returns:
+        String containing the script content
+    """
+    if checkpoint_lead is not None and scheduler.requeue_command is None:
+        raise ValueError(f"Checkpoint and requeue are not supported with {scheduler.name}")
+    if isinstance(dependency, str):
+        dependency = [f"afterany:{dependency}"]
+    if job_number is not None and not array and "singleton" not in (dependency or []):
+        job_name = f"{job_name}_{job_number}"
+    script = [shell]
+    script.extend(f"{scheduler.directive} {directive}" for directive in directives)
+    script.append(f"{scheduler.directive} {scheduler.job_name(job_name)}")
+    if array:
+        script.append(f"{scheduler.directive} {scheduler.array(*array)}")
+    if dependency:
+        script.append(f"{scheduler.directive} {scheduler.dependency(dependency)}")
+    if checkpoint_lead is not None:
+        script.append(f"{scheduler.directive} {scheduler.signal(checkpoint_lead)}")
+        script.append(f"{scheduler.directive} --requeue")
+
+    script.append("")
+    script.extend(setup)
+    if omp_threads > 1:
+        script.extend([
+            f"export OMP_NUM_THREADS={omp_threads}",
+            "export OMP_PLACES=cores",
+            "export OMP_PROC_BIND=close",
+        ])
+    if layout is not None:
+        fields = dict(layout, param_file=param_file, omp_threads=omp_threads)
+        record = " ".join(f"{key}={value}" for key, value in fields.items())
+        script.append(f"echo \"date=$(date +'%Y-%m-%dT%H:%M:%S') {record}\" >> {LAYOUT_FILE}")
+    script.append("")
+    script.extend(OUTPUT_FILE_LINES)
+
+    script.extend(["", f"JOB_NUMBER={scheduler.array_index if array else job_number}"])
+    script.append(f"RESTART_FLAG={restart}" if restart is not None else "RESTART_FLAG=\"\"")
+    if restart is not None and new_sim:
+        script.extend([
+            "if [ \"$JOB_NUMBER\" -eq 1 ]; then",
+            "    RESTART_FLAG=\"\"",
+            "fi",
+        ])
+    if checkpoint_lead is not None:
+        script.extend([
+            "# A requeued job continues from the restart files it wrote when preempted",
+            f"if [ \"{scheduler.restart_count}\" -gt 0 ]; then",
+            "    RESTART_FLAG=1",
+            "fi",
+        ])
+    if (restart is not None or checkpoint_lead is not None) and prep_restart:
+        script.append("if [ -n \"$RESTART_FLAG\" ]; then")
+        script.extend("    " + line for line in restart_setup)
+        script.extend([f"    python prep_restart.py {param_file}", "fi"])
+
+    if checkpoint_lead is None:
+        script.extend(["", f"{run_command} {param_file} $RESTART_FLAG {output}"])
+    else:
+        script.extend(["", *checkpoint_lines(scheduler, f"{run_command} {param_file} $RESTART_FLAG {output}",
+                                             param_file)])
+
+    return "\n".join(script)
+
+def checkpoint_lines(scheduler, command, param_file):
+    """
+    Shell lines running command (GIZMO) in the background until it ends; on
+    USR1 (time limit) or TERM (preemption) the stop file is created so that
+    GIZMO writes restart files and ends. After TERM the job is requeued once
+    GIZMO has ended.
+    """
+    return [
+        f"OUTPUT_DIR=$(awk '$1 == \"OutputDir\" {{print $2}}' {param_file})",
+        f"STOP_FILE=\"${{OUTPUT_DIR%/}}/{STOP_FILE}\"",
+        "rm -f \"$STOP_FILE\"",
+        "REQUEUE=\"\"",
+        "checkpoint() {",
+        "    echo \"$(date) caught $1: GIZMO writes restart files and ends\"",
+        "    touch \"$STOP_FILE\"",
+        "}",
+        "# Time limit: the next job of the chain continues",
+        "trap 'checkpoint USR1' USR1",
+        "# Preemption: this job continues once requeued",
+        "trap 'checkpoint TERM; REQUEUE=1' TERM",
+        "",
+        f"{command} &",
+        "GIZMO_PID=$!",
+        "# wait returns early whenever a trapped signal arrives",
+        "while ! wait $GIZMO_PID; do",
+        "    kill -0 $GIZMO_PID 2>/dev/null || break",
+        "done",
+        "",
+        "rm -f \"$STOP_FILE\"",
+        "if [ -n \"$REQUEUE\" ]; then",
+        f"    {scheduler.requeue_command}",
+        "fi",
+    ]
+
+def _submit(scheduler, script_path):
+    result = subprocess.run([scheduler.submit_command, script_path], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    return scheduler.parse_job_id(result.stdout)
+
+def _write_script(script_path, content):
+    with open(script_path, 'w') as f:
+        f.write(content)
+
+def submit_chain(scheduler, make_script, num_jobs, job_name, mode="afterany", initial_dependency=None,
+                 new_chain=False, ledger=None):
+    """
+    Write and submit the links of a chain that are not in the ledger yet.
+
+    Args:
+        scheduler: SLURM or PBS_TORQUE
+        make_script: Function (job_number, job_name, dependency, array) -> script content,
+                     usually the cluster's create_sbatch_script with the run's settings bound
+        num_jobs: Number of jobs in the chain
+        job_name: Base name for the jobs
+        mode: "array", "singleton" or "afterany" (see the module documentation)
+        initial_dependency: Job ID that the first job in the chain should depend on
+        new_chain: Forget the links recorded for this chain and submit all of them again
+        ledger: ChainLedger to record the chain in (default: the user's ledger)
+
+    Returns:
+        List of the job IDs of the links submitted now
+    """
+    if mode not in scheduler.modes:
+        print(f"Chain mode {mode} is not available with {scheduler.name}, using afterany")
+        mode = "afterany"
+    if ledger is None:
+        ledger = ChainLedger()
+
+    def settings(job_number):
+        # The link's script without dependency, array or chain mode, which the
+        # ledger hashes to notice changed settings
+        return make_script(job_number, job_name, None, None)
+
+    with ledger.lock():
+        chain_id = ledger.get_chain(os.getcwd(), job_name, scheduler.name)
+        if new_chain:
+            ledger.forget(chain_id)
+        links = ledger.links(chain_id)
+        first = len(links) + 1
+        if first > num_jobs:
+            print(f"All {num_jobs} jobs of {job_name} are already submitted (see the chain ledger)")
+            return []
+
+        previous_job_id = initial_dependency
+        if links:
+            if script_hash(settings(links[-1]['link'])) != links[-1]['script_hash']:
+                print(f"Warning: the settings of {job_name} differ from those job {links[-1]['link']} was submitted "
+                      f"with (e.g. parameter file or node count); the new jobs use the new ones "
+                      f"(--new-chain submits all jobs again)")
+            # Continue the chain after its last link, if that one has not ended yet
+            JobStatusService(ledger, locked=True).refresh(force=True)
+            last = ledger.links(chain_id)[-1]
+            previous_job_id = last['job_id'] if last['state'] != ENDED else None
+            print(f"Resuming {job_name} at job {first} of {num_jobs}"
+                  + (f" after job {previous_job_id}" if previous_job_id else " (previous jobs have ended)"))
+        first_dependency = [f"afterany:{previous_job_id}"] if previous_job_id else None
+
+        if mode == "array":
+            script_path = f"{job_name}_jobs_{first}-{num_jobs}.sh"
+            content = make_script(None, job_name, first_dependency, (first, num_jobs))
+            _write_script(script_path, content)
+            try:
+                array_id = _submit(scheduler, script_path)
+            except subprocess.CalledProcessError as e:
+                print(f"Error submitting {job_name}: {e}")
+                return []
+            job_ids = []
+            for job_num in range(first, num_jobs + 1):
+                job_id = scheduler.array_task(array_id, job_num)
+                ledger.record(chain_id, job_num, settings(job_num), script_path, job_id, array_id)
+                job_ids.append(job_id)
+            print(f"Submitted {job_name}_{first}-{num_jobs} as one array (Job ID: {array_id})")
+            return job_ids
+
+        name = job_name
+        if mode == "singleton":
+            # --dependency=singleton holds all of the user's jobs of one name, so
+            # each chain gets its own name instead of the shared base job name
+            name = f"{job_name}_chain{chain_id}"
+            print(f"The jobs of {job_name} are named {name}")
+
+        job_ids = []
+        for job_num in range(first, num_jobs + 1):
+            script_path = f"{job_name}_job_{job_num}.sh"
+            if mode == "singleton":
+                # SLURM runs at most one job of the name at a time. It does not promise
+                # submission order, which jobs of equal priority follow in practice
+                dependency = ["singleton"] + (first_dependency if job_num == first and first_dependency else [])
+            else:
+                dependency = [f"afterany:{previous_job_id}"] if previous_job_id else None
+            content = make_script(job_num, name, dependency, None)
+            _write_script(script_path, content)
+            try:
+                job_id = scheduler.normalize(_submit(scheduler, script_path))
+            except subprocess.CalledProcessError as e:
+                print(f"Error submitting {job_name}_{job_num}: {e}")
+                print("Run the same command again to submit the remaining jobs")
+                return job_ids
+            ledger.record(chain_id, job_num, settings(job_num), script_path, job_id)
+            previous_job_id = job_id
+            job_ids.append(job_id)
+            print(f"Submitted {job_name}_{job_num} (Job ID: {job_id})")
+        return job_ids
+
+def chain_arguments(parser, wall_time=None):
+    """
+    Add the options shared by the SLURM submit scripts (job_submit_*.py) to an
+    argparse parser; the scripts add the options of their cluster.
+
+    Args:
+        parser: argparse.ArgumentParser of the submit script
+        wall_time: Default wall time in hours (None: the partition's time limit)
+    """
+    parser.add_argument('--num-jobs', type=int, default=1,
+                      help='Number of jobs to submit in the chain (default: 1)')
+    parser.add_argument('--param-file', type=str, default='params.txt',
+                      help='Parameter file for the GIZMO simulation (default: params.txt)')
+    parser.add_argument('--num-nodes', type=int, default=1,
+                      help='Number of nodes to request (default: 1)')
+    parser.add_argument('--job-name', type=str, default='gizmo_sim',
+                      help='Base name for the jobs (default: gizmo_sim)')
+    parser.add_argument('--restart', type=int, choices=[1, 2],
+                      help='Restart mode (1 or 2)')
+    parser.add_argument('--new-sim', action='store_true',
+                      help='If set, first job will not use restart flag')
+    parser.add_argument('--initial-dependency', type=str,
+                      help='Job ID for initial dependency (default: None)')
+    parser.add_argument('--cores-per-node', type=int, default=None,
+                      help='Number of MPI ranks per node (default: the node\'s cores divided by --omp-threads)')
+    parser.add_argument('--omp-threads', type=int, default=1,
+                      help='OpenMP threads per MPI rank, for GIZMO built with OPENMP (default: 1); '
+                           'see hybrid_layout.py for the best layout')
+    parser.add_argument('--wall-time', type=float, default=wall_time,
+                      help='Wall time in hours (default: '
+                           + (f'{wall_time})' if wall_time is not None else 'the partition\'s time limit)'))
+    parser.add_argument('--sync-time-limits', action='store_true',
+                      help='Set TimeLimitCPU in the parameter file to end GIZMO --time-margin minutes before '
+                           '--wall-time runs out, and CpuTimeBetRestartFile to --restart-interval if given '
+                           '(see restart_cadence.py for measured values)')
+    parser.add_argument('--time-margin', type=float, default=15.0,
+                      help='Minutes left for start-up, the last step and the final restart write (default: 15)')
+    parser.add_argument('--restart-interval', type=float, default=None,
+                      help='Hours between restart files with --sync-time-limits (default: unchanged)')
+    parser.add_argument('--chain-mode', type=str, default='afterany', choices=CHAIN_MODES,
+                      help='Submit the chain as one job array, as jobs held by --dependency=singleton '
+                           'or as jobs each depending on the previous job ID (default: afterany)')
+    parser.add_argument('--new-chain', action='store_true',
+                      help='Submit all jobs again; by default jobs of this chain already in the chain ledger are skipped')
+
+def check_chain_arguments(args):
+    """
+    Validate the options added by chain_arguments, raising ValueError.
+    """
+    if args.num_jobs < 1:
+        raise ValueError("Number of jobs must be positive")
+    if args.num_nodes < 1:
+        raise ValueError("Number of nodes must be positive")
+    if args.cores_per_node is not None and args.cores_per_node < 1:
+        raise ValueError("Number of cores per node must be positive")
+    if args.omp_threads < 1:
+        raise ValueError("Number of OpenMP threads must be positive")
+    if not args.param_file:
+        raise ValueError("Parameter file must be provided")
+    if not args.job_name:
+        raise ValueError("Job name must be provided")
+    if args.wall_time is not None and args.wall_time <= 0:
+        raise ValueError("Wall time must be positive")
+    if args.sync_time_limits and args.wall_time is None:
+        raise ValueError("--sync-time-limits needs --wall-time")
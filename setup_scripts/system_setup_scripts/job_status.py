@@ -0,0 +1,167 @@
+"""
+job_status.py: "Scheduler states of all chains in the ledger, from one cached query per scheduler."
+
+Every consumer (the submit scripts, track_job.py, this listing) reads the
+job states from the chain ledger (chain_ledger.py). The states are refreshed
+with a single squeue/qstat call per scheduler covering the jobs of all live
+chains, at most once per TTL over all consumers: the time of the last query
+is stored in the ledger, and a consumer finding the ledger locked by another
+query or submission keeps using the stored states. The load on the scheduler
+thus does not grow with the number of runs or consumers.
+
+Run this file to list the chains and the states of their jobs, e.g.
+    python job_status.py --run-dir . --links
+"""
+
+import os
+import time
+import argparse
+import subprocess
+from chain_ledger import ChainLedger, ENDED
+from schedulers import SCHEDULERS
+
+# Seconds a scheduler query is reused
+DEFAULT_TTL = 60.0
+
+
+class JobStatusService:
+    """
+    Cached job states of the chains in the ledger.
+
+    Args:
+        ledger: ChainLedger (default: the user's ledger)
+        ttl: Seconds after which the states are queried again
+        locked: The caller already holds the ledger lock (see ChainLedger.lock)
+    """
+    def __init__(self, ledger=None, ttl=DEFAULT_TTL, locked=False):
+        self.ledger = ledger if ledger is not None else ChainLedger()
+        self.ttl = ttl
+        self.locked = locked
+        self.queries = 0
+        self._summaries = None
+        self._loaded = 0.0
+
+    def refresh(self, force=False):
+        """
+        Query every scheduler with live jobs whose states are older than the
+        TTL (or all of them if force), unless another consumer is doing so.
+        """
+        for name in self.ledger.schedulers():
+            if not force and time.time() - self.ledger.fetched(name) < self.ttl:
+                continue
+            if self.locked:
+                self._query(name)
+                continue
+            with self.ledger.lock(blocking=False) as obtained:
+                # Check again, the consumer that held the lock may just have queried
+                if obtained and (force or time.time() - self.ledger.fetched(name) >= self.ttl):
+                    self._query(name)
+        self._summaries = None
+
+    def _query(self, name):
+        scheduler = SCHEDULERS[name]
+        try:
+            states = scheduler.query(self.ledger.live_submissions(name))
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            print(f"Error querying {name} for job states: {e}")
+        else:
+            self.ledger.update_states(states, name)
+        # Failed queries are not retried before the TTL either
+        self.ledger.set_fetched(name)
+        self.queries += 1
+
+    def summaries(self):
+        """
+        Summary of every chain (see summarize), refreshed once the TTL has passed.
+        """
+        now = time.time()
+        if self._summaries is None or now - self._loaded >= self.ttl:
+            self.refresh()
+            self._summaries = [summarize(chain, self.ledger.links(chain['id'])) for chain in self.ledger.chains()]
+            self._loaded = now
+        return self._summaries
+
+    def run_status(self, out_dir):
+        """
+        Summary of the chain running the simulation that writes to out_dir, or
+        None if no chain in the ledger matches (see find_chain).
+        """
+        return find_chain(self.summaries(), out_dir)
+
+
+def summarize(chain, links):
+    """
+    Counts of the link states of a chain and its current job.
+
+    Returns:
+        The chain's ledger entry with: jobs (number of links), states (state ->
+        count), running, pending, live (links that have not ended), live_jobs
+        (their job IDs) and current (the first link that has not ended, or None)
+    """
+    states = {}
+    for link in links:
+        states[link['state']] = states.get(link['state'], 0) + 1
+    live = [link for link in links if link['state'] != ENDED]
+    summary = dict(chain)
+    summary.update({
+        'jobs': len(links),
+        'states': states,
+        'running': states.get('RUNNING', 0),
+        'pending': states.get('PENDING', 0),
+        'live': len(live),
+        'live_jobs': [link['job_id'] for link in live],
+        'current': live[0] if live else None,
+    })
+    return summary
+
+def find_chain(summaries, out_dir):
+    """
+    The chain whose jobs run GIZMO above out_dir: the job scripts start GIZMO
+    in the directory they were submitted from or its parent ("cd ../"), so
+    the parent of the chain's run directory must contain out_dir. Of several
+    matches the deepest run directory, then the latest chain, is taken.
+    """
+    out_dir = os.path.abspath(out_dir)
+    matches = [summary for summary in summaries
+               if (out_dir + os.sep).startswith(os.path.dirname(summary['run_dir']).rstrip(os.sep) + os.sep)]
+    if not matches:
+        return None
+    return max(matches, key=lambda summary: (len(summary['run_dir']), summary['created']))
+
+def print_chains(service, run_dir=None, job_name=None, links=False):
+    """
+    Print the chains of the ledger with the states of their links.
+    """
+    summaries = [summary for summary in service.summaries()
+                 if (run_dir is None or summary['run_dir'] == run_dir)
+                 and (job_name is None or summary['job_name'] == job_name)]
+    if not summaries:
+        print("No chains found in the ledger")
+        return
+    for summary in summaries:
+        counts = ", ".join(f"{count} {state}" for state, count in summary['states'].items()) or "no jobs"
+        current = summary['current']
+        print(f"{summary['run_dir']}  {summary['job_name']} ({summary['scheduler']}): {summary['jobs']} jobs, "
+              f"{counts}" + (f", current {current['job_id']} ({current['state']})" if current else ""))
+        if links:
+            for link in service.ledger.links(summary['id']):
+                print(f"    {link['link']:>4}  {link['job_id']:<16} {link['state']:<12} {link['script_hash']}  "
+                      f"{os.path.basename(link['script_path'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='List the job chains of the chain ledger and the states of their jobs')
+    parser.add_argument('--run-dir', type=str, default=None,
+                      help='Only list the chains submitted from this directory (default: all)')
+    parser.add_argument('--job-name', type=str, default=None,
+                      help='Only list the chains with this base job name (default: all)')
+    parser.add_argument('--links', action='store_true',
+                      help='List every job of the chains')
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL,
+                      help=f'Reuse job states queried less than this many seconds ago (default: {DEFAULT_TTL:.0f})')
+    parser.add_argument('--ledger', type=str, default=None,
+                      help='Path to the ledger (default: $GIZMO_CHAIN_LEDGER or ~/.gizmo_job_chains.db)')
+
+    args = parser.parse_args()
+    run_dir = os.path.abspath(args.run_dir) if args.run_dir else None
+    print_chains(JobStatusService(ChainLedger(args.ledger), ttl=args.ttl), run_dir, args.job_name, args.links)
@@ -0,0 +1,180 @@
+"""
+node_selection.py: "Pick the node type a job starts and runs soonest on, from a cached sinfo snapshot."
+
+Used by the Rusty submit scripts for --cpu-type auto. The node states come
+from one sinfo call, stored in the chain ledger (chain_ledger.py) and reused
+by every submission for DEFAULT_TTL seconds. For every node type (SLURM
+feature) of the partition the expected wait until enough nodes are free is
+estimated from its idle and busy nodes: busy nodes are assumed to free up
+evenly over TYPICAL_JOB_HOURS, so k missing nodes out of b busy ones take
+k / b of that. Drained, down and otherwise unavailable nodes count toward
+the total but are never expected to free up; a type without enough idle and
+busy nodes cannot start the job, and the ranking says why. The run time of
+the job is its wall time on the reference node type, scaled by the cores and
+the per-core speed of each type. The type with the smallest wait plus run
+time is chosen.
+
+Per-core speeds are measured by hybrid_layout.py (the best rate per node
+type in hybrid_layouts.json, per core) and can be given with --core-speed;
+node types without a speed count as fast per core as the reference type.
+"""
+
+import os
+import json
+import time
+import subprocess
+from chain_ledger import ChainLedger
+from schedulers import SLURM
+
+# Seconds a sinfo snapshot is reused
+DEFAULT_TTL = 300.0
+# Hours over which the busy nodes of a node type free up
+TYPICAL_JOB_HOURS = 24.0
+# States of nodes that are running jobs; mixed nodes are partly free but cannot
+# take a job asking for whole nodes, so only idle nodes count as free
+BUSY_STATES = ('allocated', 'mixed', 'completing')
+
+
+def cached_node_states(ledger=None, ttl=DEFAULT_TTL, scheduler=SLURM):
+    """
+    Node states (see schedulers.Slurm.node_states), queried at most once per
+    TTL over all submissions.
+    """
+    ledger = ledger if ledger is not None else ChainLedger()
+    snapshot = ledger.snapshot("sinfo")
+    if snapshot is not None and time.time() - snapshot[0] < ttl:
+        return json.loads(snapshot[1])
+    states = scheduler.node_states()
+    ledger.set_snapshot("sinfo", json.dumps(states))
+    return states
+
+def availability(node_states, partition, feature):
+    """
+    Idle, busy and total node counts of the nodes with a feature in a partition.
+    """
+    counts = {'idle': 0, 'busy': 0, 'total': 0}
+    for row in node_states:
+        if row['partition'] != partition or feature not in row['features']:
+            continue
+        counts['total'] += row['nodes']
+        if row['state'] == 'idle':
+            counts['idle'] += row['nodes']
+        elif row['state'] in BUSY_STATES:
+            counts['busy'] += row['nodes']
+    return counts
+
+def expected_wait(counts, num_nodes, typical_job_hours=TYPICAL_JOB_HOURS):
+    """
+    Hours until num_nodes nodes are free (see the module description), or
+    None if the partition does not have that many usable nodes of the type
+    (see unavailable_reason).
+    """
+    missing = num_nodes - counts['idle']
+    if missing <= 0:
+        return 0.0
+    if missing > counts['busy']:
+        return None
+    return missing / counts['busy'] * typical_job_hours
+
+def unavailable_reason(counts, num_nodes):
+    """
+    Why a job of num_nodes nodes cannot start on a node type, or None if it can.
+    """
+    if counts['total'] == 0:
+        return "no nodes of this type in the partition"
+    usable = counts['idle'] + counts['busy']
+    if usable >= num_nodes:
+        return None
+    unavailable = counts['total'] - usable
+    return (f"only {usable} usable (idle or busy) of {counts['total']} nodes, "
+            f"{unavailable} drained, down or otherwise unavailable")
+
+def measured_speeds(layouts_path, cluster, cpu_info):
+    """
+    Per-core speed of each node type measured by hybrid_layout.py: the best
+    simulation time per wall hour of the type, per core.
+
+    Returns:
+        Dictionary of node type -> simulation time per core hour (empty if
+        the layouts file does not exist)
+    """
+    if not os.path.exists(layouts_path):
+        return {}
+    with open(layouts_path, 'r') as f:
+        winners = json.load(f).get('winners', {})
+    speeds = {}
+    for key, by_nodes in winners.items():
+        winner_cluster, _, node_type = key.partition("/")
+        if winner_cluster != cluster or node_type not in cpu_info:
+            continue
+        for winner in by_nodes.values():
+            layout = winner['layout']
+            cores = layout['nodes'] * layout['ranks_per_node'] * layout['omp_threads']
+            speeds[node_type] = max(speeds.get(node_type, 0.0), winner['rate'] / cores)
+    return speeds
+
+def parse_speeds(text):
+    """
+    Per-core speeds given as e.g. genoa:1.3,skylake:0.8.
+    """
+    speeds = {}
+    for item in filter(None, (text or "").split(',')):
+        node_type, speed = item.split(':')
+        speeds[node_type] = float(speed)
+    return speeds
+
+def rank_node_types(cpu_info, node_states, partition, num_nodes, job_hours, reference, speeds=None):
+    """
+    Expected wait and run time of a job on every node type.
+
+    Args:
+        cpu_info: Dictionary of node type -> (cores per node, constraint feature)
+        node_states: Node states (see cached_node_states)
+        partition: Partition the job is submitted to
+        num_nodes: Nodes the job requests
+        job_hours: Run time of the job on the reference node type
+        reference: Node type job_hours refers to
+        speeds: Dictionary of node type -> per-core speed, in any common unit
+
+    Returns:
+        List of dictionaries with node_type, idle, busy, total, wait, run,
+        score (wait plus run, None if the job cannot start) and reason (why
+        it cannot start, see unavailable_reason), best first
+    """
+    speeds = speeds or {}
+    reference_speed = speeds.get(reference, 1.0)
+    reference_cores = cpu_info[reference][0]
+    rows = []
+    for node_type, (cores, feature) in cpu_info.items():
+        counts = availability(node_states, partition, feature)
+        wait = expected_wait(counts, num_nodes)
+        speed = speeds.get(node_type, reference_speed)
+        run = job_hours * reference_cores * reference_speed / (cores * speed)
+        rows.append(dict(counts, node_type=node_type, wait=wait, run=run,
+                         score=wait + run if wait is not None else None,
+                         reason=unavailable_reason(counts, num_nodes)))
+    rows.sort(key=lambda row: (row['score'] is None, row['score'] or 0.0))
+    return rows
+
+def select_cpu_type(cpu_info, partition, num_nodes, job_hours, reference, speeds=None, ttl=DEFAULT_TTL):
+    """
+    Node type with the smallest expected wait plus run time, printing the
+    ranking with the reason a type cannot take the job (drained and down
+    nodes are not counted as usable); the reference type if sinfo cannot be
+    queried or no type fits.
+    """
+    try:
+        node_states = cached_node_states(ttl=ttl)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"Error querying sinfo for node states ({e}), using {reference}")
+        return reference
+    rows = rank_node_types(cpu_info, node_states, partition, num_nodes, job_hours, reference, speeds)
+    print(f"{'node type':<14}{'idle':>6}{'busy':>6}{'total':>7}{'wait h':>9}{'run h':>8}")
+    for row in rows:
+        wait = f"{row['wait']:.1f}" if row['wait'] is not None else "-"
+        print(f"{row['node_type']:<14}{row['idle']:>6}{row['busy']:>6}{row['total']:>7}{wait:>9}{row['run']:>8.1f}"
+              + (f"  ({row['reason']})" if row['reason'] else ""))
+    if rows[0]['score'] is None:
+        print(f"No node type of {partition} has {num_nodes} usable nodes, using {reference}")
+        return reference
+    return rows[0]['node_type']
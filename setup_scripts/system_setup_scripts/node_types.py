@@ -0,0 +1,71 @@
+"""
+node_types.py: "Cores and memory of the node types of the clusters the submit scripts target."
+
+The submit scripts of Rusty, Popeye and Niagara take their core counts from
+here (gizmo_setup.py copies this file next to them); the queue map of
+job_submit_cita.py follows it. Memory is the nominal memory of a node in GB; only
+USABLE_MEMORY_FRACTION of it is planned for, the rest is left to the OS and
+the file system cache. Check the values on your cluster (e.g.
+sinfo -o "%f %c %m") and override them with --node_memory where needed.
+"""
+
+# Fraction of a node's nominal memory that a job can rely on
+USABLE_MEMORY_FRACTION = 0.9
+
+# cluster -> node type -> (cores per node, memory per node in GB)
+NODE_TYPES = {
+    'Niagara': {
+        'default': (40, 202),
+    },
+    'Rusty': {
+        'genoa': (96, 1536),
+        'icelake': (64, 1024),
+        'rome': (128, 1024),
+        'skylake': (36, 768),
+        'cascadelake': (96, 1536),
+        'cooperlake': (192, 6144),
+    },
+    'Popeye': {
+        'genoa': (96, 768),
+        'icelake': (64, 1024),
+        'rome': (128, 1024),
+        'skylake': (48, 768),
+        'cascadelake': (48, 768),
+        'cooperlake': (96, 1536),
+    },
+    'CITA_starq': {
+        'starq': (128, 512),
+        'greenq': (32, 128),
+        'sandyq': (16, 64),
+        'hpq': (16, 64),
+    },
+    'Frontera': {
+        'normal': (56, 192),
+    },
+}
+
+# Submit script options selecting the node type and setting nodes, ranks per node
+# and OpenMP threads per rank (job_submit_cita.py's --ppn counts cores, not ranks)
+SUBMIT_OPTIONS = {
+    'Niagara': {'type': None, 'nodes': '--num-nodes', 'ranks': '--cores-per-node', 'threads': '--omp-threads'},
+    'Rusty': {'type': '--cpu-type', 'nodes': '--num-nodes', 'ranks': '--cores-per-node', 'threads': '--omp-threads'},
+    'Popeye': {'type': '--cpu-type', 'nodes': '--num-nodes', 'ranks': '--cores-per-node', 'threads': '--omp-threads'},
+    'CITA_starq': {'type': '--queue', 'nodes': '--num-nodes', 'ranks': '--ppn', 'threads': '--omp-threads'},
+}
+
+
+def get_node_type(cluster, node_type=None):
+    """
+    (cores per node, memory per node in GB) of a node type; the cluster's
+    only node type is used if none is given.
+    """
+    if cluster not in NODE_TYPES:
+        raise ValueError(f"Unknown cluster: {cluster}. Valid options: {list(NODE_TYPES.keys())}")
+    types = NODE_TYPES[cluster]
+    if node_type is None:
+        if len(types) != 1:
+            raise ValueError(f"Cluster {cluster} has several node types, choose one of {list(types.keys())}")
+        node_type = next(iter(types))
+    if node_type not in types:
+        raise ValueError(f"Unknown node type {node_type} on {cluster}. Valid options: {list(types.keys())}")
+    return types[node_type]
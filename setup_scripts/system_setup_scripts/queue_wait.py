@@ -0,0 +1,190 @@
+"""
+queue_wait.py: "Rank clusters and partitions by queue wait plus run time of a simulation."
+
+The options to compare are listed in a JSON file, one per cluster, partition
+and job size, e.g.
+    [{"name": "rusty-rome-8", "cluster": "Rusty", "scheduler": "slurm", "partition": "cca",
+      "constraint": "ib-rome", "nodes": 8, "wall_time": 24, "run_hours": 60},
+     {"name": "niagara-16", "cluster": "Niagara", "scheduler": "slurm", "partition": "compute",
+      "nodes": 16, "wall_time": 23, "run_hours": 45, "remote": "ssh niagara"},
+     {"name": "cita-starq-4", "cluster": "CITA", "scheduler": "pbs", "partition": "starq",
+      "nodes": 4, "cores_per_node": 128, "wall_time": 48, "run_hours": 80, "remote": "ssh cita"}]
+run_hours is the measured run time of the simulation with that option
+(node_planner.py in cpu_performance_scripts predicts it from a core-count
+sweep), "remote" runs the scheduler queries on the cluster's login node and
+"submit" is an optional submit command printed for the best option.
+
+For every option the scheduler is asked when the job would start
+(sbatch --test-only for SLURM, Moab's showstart for PBS), and the queue
+waits of the user's past jobs (sacct, qstat) are recorded in the chain
+ledger (chain_ledger.py), which keeps them after the scheduler has forgotten
+them. The past jobs of the same partition with between half and twice the
+nodes give the median wait. The chain of ceil(run_hours / wall_time) jobs
+waits the start estimate for its first job (the median if there is none)
+and the median wait (the start estimate if there is none) for each later
+job, which only queues once the previous one ends. Options are ranked by
+these waits plus run_hours.
+
+Start estimates are reused for ESTIMATE_TTL seconds and the history is
+queried at most once per HISTORY_TTL seconds per cluster. With
+fake_scheduler.py first on the PATH every response can be stubbed, e.g.
+    python fake_scheduler.py delay cca 2.5
+    python fake_scheduler.py history cca 8 6.0 24
+"""
+
+import os
+import json
+import math
+import time
+import argparse
+import statistics
+import subprocess
+from chain_ledger import ChainLedger
+from schedulers import SCHEDULERS
+
+# Seconds a start estimate is reused
+ESTIMATE_TTL = 300.0
+# Seconds between history queries of a cluster
+HISTORY_TTL = 3600.0
+# Days of past jobs considered
+HISTORY_DAYS = 30
+
+
+def load_options(path):
+    """
+    Options of the JSON file (see the module description), checked for the
+    fields the estimate needs.
+    """
+    with open(path, 'r') as f:
+        options = json.load(f)
+    for option in options:
+        missing = [key for key in ('name', 'cluster', 'scheduler', 'partition', 'nodes', 'wall_time', 'run_hours')
+                   if key not in option]
+        if missing:
+            raise ValueError(f"Option {option.get('name', option)} lacks {', '.join(missing)}")
+        if option['scheduler'] not in SCHEDULERS:
+            raise ValueError(f"Unknown scheduler {option['scheduler']}. Valid options: {list(SCHEDULERS.keys())}")
+        if option['scheduler'] == "pbs" and 'cores_per_node' not in option:
+            raise ValueError(f"Option {option['name']} lacks cores_per_node, which showstart needs")
+    return options
+
+def start_estimate(ledger, option, ttl=ESTIMATE_TTL):
+    """
+    Hours until the option's job would start according to its scheduler,
+    reused for ttl seconds; None if the scheduler gives no estimate.
+    """
+    name = f"start/{option['name']}"
+    snapshot = ledger.snapshot(name)
+    if snapshot is not None and time.time() - snapshot[0] < ttl:
+        return json.loads(snapshot[1])
+    scheduler = SCHEDULERS[option['scheduler']]
+    try:
+        hours = scheduler.test_start(option['nodes'], option['partition'], option['wall_time'],
+                                     option.get('constraint'), option.get('cores_per_node'), option.get('remote'))
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError) as e:
+        print(f"No start estimate for {option['name']}: {e}")
+        hours = None
+    ledger.set_snapshot(name, json.dumps(hours))
+    return hours
+
+def refresh_history(ledger, option, ttl=HISTORY_TTL, days=HISTORY_DAYS):
+    """
+    Record the past queue waits of the option's cluster in the ledger, at
+    most once per ttl seconds per cluster.
+    """
+    name = f"history/{option['cluster']}"
+    snapshot = ledger.snapshot(name)
+    if snapshot is not None and time.time() - snapshot[0] < ttl:
+        return
+    scheduler = SCHEDULERS[option['scheduler']]
+    try:
+        rows = scheduler.wait_history(time.time() - days * 86400, option.get('remote'))
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"No queue history for {option['cluster']}: {e}")
+        return
+    ledger.record_waits(option['cluster'], rows)
+    ledger.set_snapshot(name, json.dumps(len(rows)))
+
+def typical_wait(ledger, option, days=HISTORY_DAYS):
+    """
+    Median queue wait in hours of the recorded jobs of the option's
+    partition with between half and twice its nodes, and their number.
+    """
+    waits = [row['wait'] for row in ledger.waits(option['cluster'], option['partition'], time.time() - days * 86400)
+             if option['nodes'] / 2 <= row['nodes'] <= option['nodes'] * 2]
+    return (statistics.median(waits) if waits else None), len(waits)
+
+def time_to_solution(option, estimate, median):
+    """
+    Queue waits of the option's chain of jobs plus its run time, in hours
+    (see the module description); None without estimate and history.
+
+    Returns:
+        (number of jobs, total wait, time to solution)
+    """
+    jobs = max(math.ceil(option['run_hours'] / option['wall_time']), 1)
+    first = estimate if estimate is not None else median
+    later = median if median is not None else estimate
+    if first is None:
+        return jobs, None, None
+    wait = first + (jobs - 1) * later
+    return jobs, wait, wait + option['run_hours']
+
+def rank_options(ledger, options, estimate_ttl=ESTIMATE_TTL, history_ttl=HISTORY_TTL, days=HISTORY_DAYS):
+    """
+    Estimates of every option, fastest time to solution first.
+
+    Returns:
+        List of dictionaries with the option, estimate, median, history
+        (number of past jobs), jobs, wait and total
+    """
+    ranking = []
+    for option in options:
+        estimate = start_estimate(ledger, option, estimate_ttl)
+        refresh_history(ledger, option, history_ttl, days)
+        median, history = typical_wait(ledger, option, days)
+        jobs, wait, total = time_to_solution(option, estimate, median)
+        ranking.append({'option': option, 'estimate': estimate, 'median': median, 'history': history,
+                        'jobs': jobs, 'wait': wait, 'total': total})
+    ranking.sort(key=lambda entry: (entry['total'] is None, entry['total'] or 0.0))
+    return ranking
+
+def print_ranking(ranking):
+    def hours(value):
+        return f"{value:.1f}" if value is not None else "-"
+    print(f"{'option':<20}{'cluster':<10}{'partition':<11}{'nodes':>6}{'start h':>9}{'median h':>10}{'past':>6}"
+          f"{'jobs':>6}{'wait h':>8}{'run h':>8}{'total h':>9}")
+    for entry in ranking:
+        option = entry['option']
+        print(f"{option['name']:<20}{option['cluster']:<10}{option['partition']:<11}{option['nodes']:>6}"
+              f"{hours(entry['estimate']):>9}{hours(entry['median']):>10}{entry['history']:>6}{entry['jobs']:>6}"
+              f"{hours(entry['wait']):>8}{option['run_hours']:>8.1f}{hours(entry['total']):>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rank clusters and partitions by queue wait plus run time')
+    parser.add_argument('options', type=str,
+                      help='JSON file of the options to compare (see the module description)')
+    parser.add_argument('--estimate-ttl', type=float, default=ESTIMATE_TTL,
+                      help=f'Reuse start estimates made less than this many seconds ago (default: {ESTIMATE_TTL:.0f})')
+    parser.add_argument('--history-ttl', type=float, default=HISTORY_TTL,
+                      help=f'Query the job history at most this often per cluster, in seconds (default: {HISTORY_TTL:.0f})')
+    parser.add_argument('--history-days', type=int, default=HISTORY_DAYS,
+                      help=f'Days of past jobs considered (default: {HISTORY_DAYS})')
+    parser.add_argument('--ledger', type=str, default=None,
+                      help='Path to the ledger (default: $GIZMO_CHAIN_LEDGER or ~/.gizmo_job_chains.db)')
+
+    args = parser.parse_args()
+    if not os.path.exists(args.options):
+        raise ValueError(f"Options file {args.options} not found")
+    ranking = rank_options(ChainLedger(args.ledger), load_options(args.options),
+                           args.estimate_ttl, args.history_ttl, args.history_days)
+    print_ranking(ranking)
+    best = ranking[0] if ranking and ranking[0]['total'] is not None else None
+    if best is None:
+        print("No option has a start estimate or queue history")
+        exit(1)
+    print(f"\nFastest: {best['option']['name']}, {best['total']:.1f} h to solution "
+          f"({best['wait']:.1f} h waiting over {best['jobs']} job(s))")
+    if best['option'].get('submit'):
+        print(f"Submit with: {best['option']['submit']}")
@@ -0,0 +1,389 @@
+"""
+schedulers.py: "Directives, submission and status queries of the batch schedulers the clusters use."
+
+Used by job_chain.py (submission), job_status.py (status),
+node_selection.py (node states) and queue_wait.py (start estimates and past
+queue waits). Job states are reported with SLURM's names (PENDING, RUNNING,
+COMPLETED, ...) for both schedulers. A status query lists many jobs in one
+squeue/qstat call. The queries of queue_wait.py can run on another
+cluster's login node through a command prefix such as "ssh niagara".
+"""
+
+import os
+import re
+import time
+import shlex
+import subprocess
+from datetime import datetime
+
+# Single letter qstat states as the SLURM state names
+PBS_STATES = {'Q': 'PENDING', 'H': 'PENDING', 'W': 'PENDING', 'T': 'PENDING', 'S': 'SUSPENDED',
+              'R': 'RUNNING', 'E': 'RUNNING', 'C': 'COMPLETED', 'F': 'COMPLETED'}
+
+
+class Slurm:
+    """
+    SLURM directives and submission.
+    """
+    name = "slurm"
+    directive = "#SBATCH"
+    submit_command = "sbatch"
+    array_index = "$SLURM_ARRAY_TASK_ID"
+    modes = ('array', 'singleton', 'afterany')
+    # Times the running job has been requeued, and the command requeueing it
+    restart_count = "${SLURM_RESTART_COUNT:-0}"
+    requeue_command = "scontrol requeue $SLURM_JOB_ID"
+
+    def job_name(self, name):
+        return f"--job-name={name}"
+
+    def dependency(self, conditions):
+        return "--dependency=" + ",".join(conditions)
+
+    def array(self, first, last):
+        return f"--array={first}-{last}%1"
+
+    def signal(self, lead):
+        # USR1 to the batch shell only (not to mpirun), lead seconds before the time limit
+        return f"--signal=B:USR1@{lead}"
+
+    def parse_job_id(self, output):
+        # "Submitted batch job 1234"
+        return output.strip().split()[-1]
+
+    def array_task(self, array_id, index):
+        return f"{array_id}_{index}"
+
+    def normalize(self, job_id):
+        return job_id
+
+    def query(self, job_ids=None):
+        """
+        States of queued and running jobs from one squeue call.
+
+        Args:
+            job_ids: Jobs (or job arrays) to list, default: all of the user's jobs
+
+        Returns:
+            Dictionary of job ID -> state (e.g. PENDING, RUNNING), array tasks
+            as <array id>_<index>; jobs that have left the queue are not listed
+        """
+        command = ['squeue', '-h', '-o', '%i %T']
+        if job_ids is None:
+            command += ['-u', os.environ.get('USER', '')]
+        elif not job_ids:
+            return {}
+        else:
+            command += [f"--jobs={','.join(sorted(set(job_ids)))}"]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        if result.returncode != 0:
+            # squeue fails when none of the requested jobs is known any more
+            if job_ids is not None and "Invalid job id" in result.stderr:
+                return {}
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        states = {}
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) != 2:
+                continue
+            job_id, state = parts
+            if job_id.endswith("]") and "_[" in job_id:
+                # Pending tasks of an array are listed together, e.g. 1234_[5-50%1]
+                array_id, tasks = job_id[:-1].split("_[")
+                for index in _expand_ranges(tasks.split("%")[0]):
+                    states[f"{array_id}_{index}"] = state
+            else:
+                states[job_id] = state
+        return states
+
+    def cancel(self, job_ids):
+        """
+        Cancel jobs (array tasks as <array id>_<index>) with one scancel call.
+        """
+        subprocess.run(['scancel'] + list(job_ids), check=True)
+
+    def node_states(self):
+        """
+        Node counts per partition, feature set and state from one sinfo call.
+
+        Returns:
+            List of dictionaries with partition, features (list), state (e.g.
+            idle, mixed, allocated, drained; without sinfo's flag suffixes),
+            nodes and cpus (per node)
+        """
+        command = ['sinfo', '-h', '-o', '%P|%f|%T|%D|%c']
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True)
+        rows = []
+        for line in result.stdout.splitlines():
+            parts = line.strip().split("|")
+            if len(parts) != 5:
+                continue
+            partition, features, state, nodes, cpus = parts
+            rows.append({
+                'partition': partition.rstrip("*"),
+                'features': [feature for feature in features.split(",") if feature and feature != "(null)"],
+                'state': state.rstrip("*~#!%$@^-+"),
+                'nodes': int(nodes),
+                'cpus': int(cpus.rstrip("+")),
+            })
+        return rows
+
+    def test_start(self, nodes, partition, wall_time, constraint=None, cores_per_node=None, prefix=None):
+        """
+        Hours until a job of this size would start, from "sbatch --test-only"
+        (nothing is submitted).
+
+        Args:
+            nodes: Number of nodes
+            partition: Partition to submit to
+            wall_time: Wall time in hours
+            constraint: Node feature to request (-C), if any
+            cores_per_node: Not needed by SLURM
+            prefix: Command running the query on another host, e.g. "ssh niagara"
+
+        Returns:
+            Hours from now (0 if the job would start at once)
+        """
+        command = ['sbatch', '--test-only', f"--nodes={nodes}", f"--partition={partition}",
+                   f"--time={int(wall_time * 60)}", '--wrap=true']
+        if constraint:
+            command.append(f"--constraint={constraint}")
+        result = run_command(command, prefix)
+        # "sbatch: Job 1234 to start at 2026-10-17T12:00:00 using 512 processors on nodes ... in partition cca"
+        match = re.search(r"to start at (\S+)", result.stdout + result.stderr)
+        if match is None:
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        start = datetime.fromisoformat(match.group(1)).timestamp()
+        return max(start - time.time(), 0.0) / 3600.
+
+    def wait_history(self, since, prefix=None):
+        """
+        Queue waits of the user's jobs submitted since a time, from one sacct call.
+
+        Args:
+            since: Epoch seconds
+            prefix: Command running the query on another host, e.g. "ssh niagara"
+
+        Returns:
+            List of dictionaries with job_id, partition, nodes, submitted
+            (epoch seconds), wait and run (hours, run None while running)
+        """
+        command = ['sacct', '-X', '-n', '-P', '-u', os.environ.get('USER', ''),
+                   '-S', datetime.fromtimestamp(since).strftime("%Y-%m-%dT%H:%M:%S"),
+                   '-o', 'JobID,Partition,NNodes,Submit,Start,End']
+        result = run_command(command, prefix)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        rows = []
+        for line in result.stdout.splitlines():
+            parts = line.strip().split("|")
+            if len(parts) != 6:
+                continue
+            job_id, partition, nodes, submitted, started, ended = parts
+            submitted, started, ended = (_sacct_time(value) for value in (submitted, started, ended))
+            if submitted is None or started is None:
+                continue
+            rows.append({'job_id': job_id, 'partition': partition, 'nodes': int(nodes), 'submitted': submitted,
+                         'wait': (started - submitted) / 3600.,
+                         'run': (ended - started) / 3600. if ended is not None else None})
+        return rows
+
+
+class PBS:
+    """
+    PBS/Torque directives and submission. Job arrays use Torque's slot limit
+    ("-t 1-N%1"); PBS Pro sets PBS_ARRAY_INDEX instead of PBS_ARRAYID.
+    """
+    name = "pbs"
+    directive = "#PBS"
+    submit_command = "qsub"
+    array_index = "${PBS_ARRAYID:-$PBS_ARRAY_INDEX}"
+    modes = ('array', 'afterany')
+    restart_count = None
+    requeue_command = None
+
+    def job_name(self, name):
+        return f"-N {name}"
+
+    def dependency(self, conditions):
+        return "-W depend=" + ",".join(conditions)
+
+    def array(self, first, last):
+        return f"-t {first}-{last}%1"
+
+    def parse_job_id(self, output):
+        # "1234.server" or "1234[].server"
+        return output.strip().split()[-1]
+
+    def array_task(self, array_id, index):
+        return f"{self.normalize(array_id).split('[')[0]}[{index}]"
+
+    def normalize(self, job_id):
+        # qstat shortens the server name, compare the job number (and array index) only
+        return job_id.split(".")[0]
+
+    def query(self, job_ids=None):
+        """
+        States of queued and running jobs (array tasks expanded) from one
+        "qstat -f -t" call.
+
+        Args:
+            job_ids: Jobs (or job arrays, e.g. 1234[]) to list, default: all of the user's jobs
+
+        Returns:
+            Dictionary of normalized job ID -> state (PENDING, RUNNING, ...);
+            jobs that have left the queue are not listed
+        """
+        command = ['qstat', '-f', '-t']
+        if job_ids is not None:
+            if not job_ids:
+                return {}
+            command += sorted(set(job_ids))
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        # qstat reports unknown (finished) jobs on stderr but still lists the others
+        if result.returncode != 0 and not result.stdout.strip() and "Unknown Job" not in result.stderr:
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        user = os.environ.get('USER', '')
+        states = {}
+        for job in parse_qstat_full(result.stdout):
+            if job_ids is None and job.get('Job_Owner', '').split('@')[0] != user:
+                continue
+            state = job.get('job_state', '')
+            states[self.normalize(job['Job Id'])] = PBS_STATES.get(state, state)
+        return states
+
+    def cancel(self, job_ids):
+        """
+        Cancel jobs (array tasks as <array id>[<index>]) with one qdel call.
+        """
+        subprocess.run(['qdel'] + list(job_ids), check=True)
+
+    def test_start(self, nodes, partition, wall_time, constraint=None, cores_per_node=None, prefix=None):
+        """
+        Hours until a job of this size would start, from Moab's
+        "showstart <cores>@<wall time>" (nothing is submitted). showstart
+        takes no queue, the estimate is for the cluster's default partition.
+
+        Args:
+            nodes: Number of nodes
+            partition: Queue (not used by showstart)
+            wall_time: Wall time in hours
+            constraint: Not used by PBS
+            cores_per_node: Cores per node
+            prefix: Command running the query on another host, e.g. "ssh cita"
+
+        Returns:
+            Hours from now (0 if the job would start at once)
+        """
+        command = ['showstart', f"{nodes * cores_per_node}@{_clock(wall_time * 3600)}"]
+        result = run_command(command, prefix)
+        # "Estimated Rsv based start in 1:04:59 on Fri Oct 17 13:00:00"
+        match = re.search(r"start in\s+(-?[\d:]+)", result.stdout + result.stderr)
+        if match is None:
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        return max(_seconds(match.group(1)), 0) / 3600.
+
+    def wait_history(self, since, prefix=None):
+        """
+        Queue waits of the user's jobs that have started and are still listed
+        by "qstat -f -t" (Torque keeps finished jobs only briefly, so
+        queue_wait.py accumulates them in the chain ledger).
+
+        Args:
+            since: Epoch seconds
+            prefix: Command running the query on another host, e.g. "ssh cita"
+
+        Returns:
+            List of dictionaries with job_id, partition, nodes, submitted
+            (epoch seconds), wait and run (hours, run None while running)
+        """
+        command = ['qstat', '-f', '-t']
+        result = run_command(command, prefix)
+        if result.returncode != 0 and not result.stdout.strip():
+            raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+        user = os.environ.get('USER', '')
+        rows = []
+        for job in parse_qstat_full(result.stdout):
+            if job.get('Job_Owner', '').split('@')[0] != user or 'start_time' not in job or 'qtime' not in job:
+                continue
+            submitted = time.mktime(time.strptime(job['qtime'], "%a %b %d %H:%M:%S %Y"))
+            started = time.mktime(time.strptime(job['start_time'], "%a %b %d %H:%M:%S %Y"))
+            if submitted < since:
+                continue
+            nodes = job.get('Resource_List.nodect') or job.get('Resource_List.nodes', '1').split(':')[0]
+            used = job.get('resources_used.walltime')
+            rows.append({'job_id': self.normalize(job['Job Id']), 'partition': job.get('queue', ''),
+                         'nodes': int(nodes) if nodes.isdigit() else 1, 'submitted': submitted,
+                         'wait': (started - submitted) / 3600.,
+                         'run': _seconds(used) / 3600. if used and job.get('job_state') in ('C', 'F') else None})
+        return rows
+
+
+SLURM = Slurm()
+PBS_TORQUE = PBS()
+SCHEDULERS = {scheduler.name: scheduler for scheduler in (SLURM, PBS_TORQUE)}
+
+
+def parse_qstat_full(output):
+    """
+    Parse the output of "qstat -f" into one dictionary of attributes per job
+    (the job ID under "Job Id"). Continuation lines are joined to their attribute.
+    """
+    jobs = []
+    job = None
+    name = None
+    for line in output.splitlines():
+        if line.startswith("Job Id:"):
+            job = {'Job Id': line.split(":", 1)[1].strip()}
+            jobs.append(job)
+            name = None
+        elif job is None or not line.strip():
+            continue
+        elif " = " in line:
+            name, value = line.strip().split(" = ", 1)
+            job[name] = value
+        elif name is not None:
+            job[name] += line.strip()
+    return jobs
+
+def run_command(command, prefix=None):
+    """
+    Run a scheduler command, on another host if a prefix such as
+    "ssh niagara" is given (the command is quoted for the remote shell).
+    """
+    if prefix:
+        command = shlex.split(prefix) + [" ".join(shlex.quote(part) for part in command)]
+    return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+def _sacct_time(value):
+    # "2026-10-17T12:00:00", or Unknown/None for times not reached yet
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+def _seconds(duration):
+    # "[-][[D:]HH:]MM:SS" -> seconds
+    sign = -1 if duration.startswith("-") else 1
+    seconds = 0
+    for part, scale in zip(reversed(duration.lstrip("-").split(":")), (1, 60, 3600, 86400)):
+        seconds += int(part) * scale
+    return sign * seconds
+
+def _clock(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def _expand_ranges(ranges):
+    # "5-7,9" -> [5, 6, 7, 9]
+    indices = []
+    for part in ranges.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            indices.extend(range(int(first), int(last) + 1))
+        elif part:
+            indices.append(int(part))
+    return indices
@@ -0,0 +1,91 @@
+"""
+time_limits.py: "Tie GIZMO's TimeLimitCPU and restart interval in the parameter file to a job's wall time."
+
+GIZMO ends a job once its run time passes GIZMO_STOP_FRACTION of TimeLimitCPU,
+writing restart files first, and writes restart files every
+CpuTimeBetRestartFile seconds in between. The submit scripts (--sync-time-limits)
+set TimeLimitCPU so that the job ends its last step and writes its restart
+files just before the wall time runs out, leaving a margin for start-up,
+the longest step and the restart write, and optionally set the restart
+interval. restart_cadence.py in cpu_performance_scripts measures the margin
+and the interval that minimizes the compute lost to failures and preemption.
+"""
+
+# Fraction of TimeLimitCPU after which GIZMO writes restart files and ends the job
+GIZMO_STOP_FRACTION = 0.85
+
+
+def format_wall_time(wall_time):
+    """
+    Wall time in hours as HH:MM:SS.
+    """
+    hours = int(wall_time)
+    minutes = int((wall_time - hours) * 60)
+    seconds = int(((wall_time - hours) * 60 - minutes) * 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+def time_limit_params(wall_time, margin, restart_interval=None):
+    """
+    TimeLimitCPU (and CpuTimeBetRestartFile) for a job of the given wall time.
+
+    Args:
+        wall_time: Wall time of the job in hours
+        margin: Minutes of the wall time not available to the last step: start-up,
+                restart reading, the longest step and the final restart write
+        restart_interval: Hours between restart files (default: left unchanged)
+
+    Returns:
+        Dictionary of parameter name -> value in seconds
+    """
+    usable = wall_time * 3600 - margin * 60
+    if usable <= 0:
+        raise ValueError(f"A margin of {margin} minutes leaves no time in a {wall_time} h job")
+    params = {'TimeLimitCPU': int(usable / GIZMO_STOP_FRACTION)}
+    if restart_interval is not None:
+        if restart_interval <= 0:
+            raise ValueError("Restart interval must be positive")
+        params['CpuTimeBetRestartFile'] = int(restart_interval * 3600)
+    return params
+
+def update_params(param_file, values):
+    """
+    Set parameters of a GIZMO parameter file in place, keeping the comments
+    of their lines. Parameters not in the file are appended.
+
+    Returns:
+        List of (name, old value or None, new value) of the changed parameters
+    """
+    with open(param_file, 'r') as f:
+        lines = f.readlines()
+    changes = []
+    remaining = dict(values)
+    for i, line in enumerate(lines):
+        content, percent, comment = line.partition('%')
+        parts = content.split()
+        if len(parts) >= 2 and parts[0] in remaining:
+            name, old = parts[0], parts[1]
+            new = str(remaining.pop(name))
+            if old != new:
+                changes.append((name, old, new))
+            lines[i] = f"{name:<32}{new}" + (f"    {percent}{comment.rstrip()}" if percent else "") + "\n"
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    for name, value in remaining.items():
+        lines.append(f"{name:<32}{value}\n")
+        changes.append((name, None, str(value)))
+    with open(param_file, 'w') as f:
+        f.writelines(lines)
+    return changes
+
+def sync_time_limits(param_file, wall_time, margin, restart_interval=None):
+    """
+    Write the TimeLimitCPU (and CpuTimeBetRestartFile) matching the wall
+    time to the parameter file (see time_limit_params) and print the changes.
+    """
+    if wall_time is None:
+        raise ValueError("Syncing the time limits needs a wall time")
+    changes = update_params(param_file, time_limit_params(wall_time, margin, restart_interval))
+    for name, old, new in changes:
+        print(f"{param_file}: {name} {old if old is not None else '(unset)'} -> {new}")
+    if not changes:
+        print(f"{param_file}: time limits already match a {wall_time:g} h job")
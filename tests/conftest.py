@@ -0,0 +1,12 @@
+"""
+The scripts import each other by module name from their own folder, as they
+do when run there (or from the run folder, once copied by gizmo_setup.py).
+"""
+
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "cpu_performance_scripts"))
+sys.path.insert(0, os.path.join(REPO, "setup_scripts", "system_setup_scripts"))
+sys.path.insert(0, os.path.join(REPO, "setup_scripts"))
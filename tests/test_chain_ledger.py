@@ -0,0 +1,134 @@
+import subprocess
+
+import pytest
+
+import job_chain
+from chain_ledger import ChainLedger, ENDED
+from job_chain import SLURM, submit_chain
+
+
+class FakeQueue:
+    """
+    Stands in for sbatch and squeue: numbers the submissions from 100 and
+    lists the jobs given states, all others having left the queue.
+    """
+    def __init__(self, monkeypatch):
+        self.scripts = []
+        self.states = {}
+        self.fail_at = None
+        monkeypatch.setattr(job_chain, "_submit", self.submit)
+        monkeypatch.setattr(SLURM, "query", lambda job_ids=None: dict(self.states))
+
+    def submit(self, scheduler, script_path):
+        if self.fail_at == len(self.scripts) + 1:
+            raise subprocess.CalledProcessError(1, "sbatch")
+        self.scripts.append(script_path)
+        return str(99 + len(self.scripts))
+
+
+def make_script(job_number, job_name, dependency, array):
+    return f"{job_number} {dependency} {array}"
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    return FakeQueue(monkeypatch)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = ChainLedger(str(tmp_path / "ledger.db"))
+    yield ledger
+    ledger.close()
+
+
+def links(ledger):
+    return [(link['link'], link['job_id']) for link in ledger.links()]
+
+
+def test_resume_after_failed_submission(queue, ledger):
+    queue.fail_at = 3
+    assert submit_chain(SLURM, make_script, 4, "sim", mode="afterany", ledger=ledger) == ["100", "101"]
+    assert links(ledger) == [(1, "100"), (2, "101")]
+
+    queue.fail_at = None
+    queue.states = {"101": "PENDING"}
+    assert submit_chain(SLURM, make_script, 4, "sim", mode="afterany", ledger=ledger) == ["102", "103"]
+    assert links(ledger) == [(1, "100"), (2, "101"), (3, "102"), (4, "103")]
+    # The first new link waits for the last recorded one, which is still queued
+    with open("sim_job_3.sh") as f:
+        assert f.read() == "3 ['afterany:101'] None"
+
+
+def test_resume_after_the_chain_ended(queue, ledger):
+    submit_chain(SLURM, make_script, 2, "sim", mode="afterany", ledger=ledger)
+    # Extending the chain after its jobs have left the queue
+    assert submit_chain(SLURM, make_script, 3, "sim", mode="afterany", ledger=ledger) == ["102"]
+    assert ledger.links()[0]['state'] == ENDED
+    with open("sim_job_3.sh") as f:
+        assert f.read() == "3 None None"
+
+
+def test_nothing_to_resume(queue, ledger, capsys):
+    submit_chain(SLURM, make_script, 2, "sim", mode="afterany", ledger=ledger)
+    assert submit_chain(SLURM, make_script, 2, "sim", mode="afterany", ledger=ledger) == []
+    assert "already submitted" in capsys.readouterr().out
+    assert len(queue.scripts) == 2
+
+
+def test_new_chain_submits_everything_again(queue, ledger):
+    submit_chain(SLURM, make_script, 2, "sim", mode="afterany", ledger=ledger)
+    assert submit_chain(SLURM, make_script, 2, "sim", mode="afterany", new_chain=True, ledger=ledger) == ["102", "103"]
+    assert links(ledger) == [(1, "102"), (2, "103")]
+
+
+def test_array_resume(queue, ledger):
+    assert submit_chain(SLURM, make_script, 2, "sim", mode="array", ledger=ledger) == ["100_1", "100_2"]
+    queue.states = {"100_2": "PENDING"}
+    assert submit_chain(SLURM, make_script, 4, "sim", mode="array", ledger=ledger) == ["101_3", "101_4"]
+    with open("sim_jobs_3-4.sh") as f:
+        assert f.read() == "None ['afterany:100_2'] (3, 4)"
+
+
+def test_chains_are_kept_apart(queue, ledger, tmp_path, monkeypatch):
+    submit_chain(SLURM, make_script, 1, "sim", mode="afterany", ledger=ledger)
+    submit_chain(SLURM, make_script, 1, "other", mode="afterany", ledger=ledger)
+    other_dir = tmp_path / "other_run"
+    other_dir.mkdir()
+    monkeypatch.chdir(other_dir)
+    assert submit_chain(SLURM, make_script, 1, "sim", mode="afterany", ledger=ledger) == ["102"]
+    assert len(ledger.chains()) == 3
+    assert len(ledger.chains(job_name="sim")) == 2
+
+
+def test_singleton_chains_get_names_of_their_own(queue, ledger, tmp_path, monkeypatch):
+    names = []
+
+    def make_named_script(job_number, job_name, dependency, array):
+        # Scripts without dependency are only hashed by the ledger
+        if dependency:
+            names.append(job_name)
+        return f"{job_number} {job_name} {dependency} {array}"
+
+    submit_chain(SLURM, make_named_script, 2, "sim", mode="singleton", ledger=ledger)
+    other_dir = tmp_path / "other_run"
+    other_dir.mkdir()
+    monkeypatch.chdir(other_dir)
+    submit_chain(SLURM, make_named_script, 1, "sim", mode="singleton", ledger=ledger)
+    first, second = ledger.chains(job_name="sim")
+    assert names == [f"sim_chain{first['id']}"] * 2 + [f"sim_chain{second['id']}"]
+
+
+def test_resume_warns_about_changed_settings(queue, ledger, capsys):
+    def make_script_on(nodes):
+        return lambda job_number, job_name, dependency, array: f"-N{nodes} {job_number} {dependency}"
+
+    submit_chain(SLURM, make_script_on(2), 2, "sim", mode="afterany", ledger=ledger)
+    queue.states = {"101": "PENDING"}
+    submit_chain(SLURM, make_script_on(2), 3, "sim", mode="afterany", ledger=ledger)
+    assert "Warning" not in capsys.readouterr().out
+    # A new dependency does not count as a change, a new node count does
+    submit_chain(SLURM, make_script_on(4), 4, "sim", mode="array", ledger=ledger)
+    assert "differ from those job 3 was submitted with" in capsys.readouterr().out
+    assert links(ledger)[-1] == (4, "103_4")
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from cpu_index import parse_range, query_steps
+from generate_cpu_txt import CPUTxtGenerator, MINIMAL_TIMERS, write_cpu_txt
+from progress_store import ProgressStore
+from track_job import CPUTailReader, backfill_store
+
+
+@pytest.fixture
+def run(tmp_path):
+    """
+    Output folder with 20 steps in cpu.txt, 15 of them in the progress store.
+    """
+    generator = CPUTxtGenerator(timers=MINIMAL_TIMERS, dt=1.0, seed=5)
+    cpu_txt = str(tmp_path / "cpu.txt")
+    write_cpu_txt(cpu_txt, steps=15, generator=generator)
+    backfill_store(CPUTailReader(cpu_txt, detail=True), ProgressStore(str(tmp_path / "progress_store")))
+    write_cpu_txt(cpu_txt, steps=5, generator=generator)
+    return str(tmp_path)
+
+
+def all_steps(out_dir):
+    return CPUTailReader(os.path.join(out_dir, "cpu.txt"), detail=True).read_new()
+
+
+def test_parse_range():
+    assert parse_range("3:7", int) == (3, 7)
+    assert parse_range(":0.5") == (None, 0.5)
+    assert parse_range("2:") == (2.0, None)
+    assert parse_range(None) is None
+
+
+def test_query_steps_by_step(run):
+    blocks = query_steps(run, step_range=(4, 7))
+    assert [block['Step'] for block in blocks] == [4, 5, 6, 7]
+    expected = all_steps(run)[4:8]
+    assert [block['total'] for block in blocks] == [block['total'] for block in expected]
+    assert [block['Offset'] for block in blocks] == [block['Offset'] for block in expected]
+
+
+def test_query_steps_after_the_store(run):
+    # Steps 13 and 14 come from the store, the rest from cpu.txt past its last flush
+    assert [block['Step'] for block in query_steps(run, step_range=(13, None))] == list(range(13, 20))
+
+
+def test_query_steps_by_time(run):
+    times = [block['Simulation Time'] for block in all_steps(run)]
+    blocks = query_steps(run, time_range=(times[2], times[5]))
+    assert [block['Step'] for block in blocks] == [2, 3, 4, 5]
+
+
+def test_query_steps_without_store(run, capsys):
+    blocks = query_steps(run, step_range=(18, 19), store_dir=os.path.join(run, "missing"))
+    assert [block['Step'] for block in blocks] == [18, 19]
+    assert "scanning the whole file" in capsys.readouterr().out
+
+
+def test_query_steps_leaves_no_store(run):
+    query_steps(run, step_range=(18, 19), store_dir=os.path.join(run, "missing"))
+    assert not os.path.exists(os.path.join(run, "missing"))
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from hybrid_layout import (closest_winner, compare_layouts, guess_layout, read_layout, submit_options,
+                           write_benchmark_params)
+
+
+def history(steps, seconds_per_step, sim_time_per_step=0.01, cpus=128):
+    index = np.arange(steps)
+    return {'Step': index, 'Simulation Time': sim_time_per_step * index, 'CPUs': np.full(steps, float(cpus)),
+            'total': np.full(steps, seconds_per_step), 'Wall Time': seconds_per_step * (index + 1)}
+
+
+def test_read_layout(tmp_path):
+    (tmp_path / "params.txt").write_text("OutputDir    output/\n")
+    (tmp_path / "params_omp4.txt").write_text("OutputDir    output_omp4/\n")
+    (tmp_path / "job_layout.txt").write_text(
+        "date=1 cluster=Rusty node_type=rome nodes=2 ranks_per_node=128 omp_threads=1 param_file=params.txt\n"
+        "date=2 cluster=Rusty node_type=rome nodes=2 ranks_per_node=32 omp_threads=4 param_file=params_omp4.txt\n"
+        "date=3 cluster=Rusty node_type=genoa nodes=1 ranks_per_node=96 omp_threads=1 param_file=params.txt\n")
+    (tmp_path / "output").mkdir()
+    # The last record of the parameter file writing to the folder
+    assert read_layout(str(tmp_path / "output")) == {
+        'date': "3", 'cluster': "Rusty", 'node_type': "genoa", 'nodes': 1, 'ranks_per_node': 96,
+        'omp_threads': 1, 'param_file': "params.txt"}
+    assert read_layout(str(tmp_path / "output_omp4"))['omp_threads'] == 4
+    assert read_layout(str(tmp_path / "elsewhere")) is None
+
+
+def test_guess_layout():
+    layout = guess_layout("/runs/MHD_omp4/output", history(5, 1.0, cpus=32))
+    assert layout['omp_threads'] == 4 and layout['ranks_per_node'] == 32 and layout['cluster'] == "unknown"
+    assert guess_layout("/runs/MHD/output", history(5, 1.0))['omp_threads'] == 1
+
+
+def test_compare_layouts_over_the_common_interval():
+    layout = {'omp_threads': 1}
+    runs = [("slow", history(100, 2.0), layout), ("fast", history(50, 1.0), layout),
+            ("short", history(5, 1.0), layout)]
+    results = compare_layouts(runs, skip_steps=10)
+    assert [result['name'] for result in results] == ["fast", "slow"]
+    assert results[0]['relative'] == 1.0 and results[1]['relative'] == pytest.approx(0.5)
+    # Both are compared up to the simulation time the fast run reached
+    assert results[1]['sim_time'] == pytest.approx(results[0]['sim_time'])
+
+
+def test_runs_without_steps_are_skipped(capsys):
+    assert guess_layout("/runs/MHD_omp2/output", {})['ranks_per_node'] is None
+    layout = {'omp_threads': 1}
+    results = compare_layouts([("empty", {}, layout), ("fast", history(50, 1.0), layout)], skip_steps=10)
+    assert [result['name'] for result in results] == ["fast"]
+    assert "Skipping empty" in capsys.readouterr().out
+
+
+def test_submit_options():
+    layout = {'cluster': "Rusty", 'node_type': "rome", 'nodes': 2, 'ranks_per_node': 32, 'omp_threads': 4}
+    assert submit_options(layout) == ['--cpu-type', 'rome', '--num-nodes', '2', '--cores-per-node', '32',
+                                      '--omp-threads', '4']
+    cita = dict(layout, cluster="CITA_starq", node_type="starq")
+    # --ppn counts cores
+    assert submit_options(cita)[-4:] == ['--ppn', '128', '--omp-threads', '4']
+    assert submit_options(dict(layout, cluster="unknown")) == ['--omp-threads', '4']
+
+
+def test_closest_winner():
+    layouts = {'winners': {'Rusty/rome': {'1': {'date': "2024-02", 'nodes': 1}, '8': {'date': "2024-01", 'nodes': 8}}}}
+    assert closest_winner(layouts, 'Rusty/rome', 6)['nodes'] == 8
+    assert closest_winner(layouts, 'Rusty/rome')['nodes'] == 1
+    assert closest_winner(layouts, 'Rusty/genoa') is None
+
+
+def test_write_benchmark_params(tmp_path):
+    param_file = tmp_path / "params.txt"
+    param_file.write_text("OutputDir    output/   % where\nTimeLimitCPU 86400\nResubmitOn 1\nTimeMax 1\n")
+    path = write_benchmark_params(str(param_file), 4, 20)
+    assert path == str(tmp_path / "params_omp4.txt")
+    assert open(path).read() == "OutputDir    output_omp4/\nTimeLimitCPU    1200\nResubmitOn    0\nTimeMax 1\n"
@@ -0,0 +1,106 @@
+import importlib.util
+import os
+
+import pytest
+
+from conftest import REPO
+from job_chain import PBS_TORQUE, SLURM, build_script
+
+
+def directives(script, scheduler=SLURM):
+    return [line[len(scheduler.directive) + 1:] for line in script.splitlines()
+            if line.startswith(scheduler.directive)]
+
+
+def script(**kwargs):
+    options = dict(scheduler=SLURM, job_name="sim", directives=["--nodes=2"], setup=["cd ../"],
+                   run_command="mpirun ./GIZMO", param_file="params.txt", restart=1)
+    options.update(kwargs)
+    return build_script(**options)
+
+
+def test_dependency():
+    assert SLURM.dependency(["afterany:12", "singleton"]) == "--dependency=afterany:12,singleton"
+    assert PBS_TORQUE.dependency(["afterany:12.server"]) == "-W depend=afterany:12.server"
+
+
+def test_singleton_shares_the_name():
+    lines = directives(script(job_number=4, dependency=["singleton"]))
+    assert "--job-name=sim" in lines and "--dependency=singleton" in lines
+
+
+def test_restart_flag():
+    content = script(job_number=1, new_sim=True)
+    assert "RESTART_FLAG=1" in content
+    assert "python prep_restart.py params.txt" in content
+    assert "mpirun ./GIZMO params.txt $RESTART_FLAG" in content
+    assert "RESTART_FLAG=\"\"" in script(job_number=1, restart=None)
+
+
+def test_array_shares_the_name():
+    lines = directives(script(job_number=None, array=(2, 5)))
+    assert "--job-name=sim" in lines
+    assert "--array=2-5%1" in lines
+    assert "JOB_NUMBER=$SLURM_ARRAY_TASK_ID" in script(job_number=None, array=(2, 5))
+
+
+def test_numbered_job_name():
+    lines = directives(script(job_number=2, dependency=["afterany:1234"]))
+    assert "--job-name=sim_2" in lines
+    assert directives(script(job_number=1))[-1] == "--job-name=sim_1"
+
+
+def load_submit_script(cluster, name):
+    path = os.path.join(REPO, "setup_scripts", "system_setup_scripts", cluster, name)
+    spec = importlib.util.spec_from_file_location(os.path.splitext(name)[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_dependency_job_id_means_afterany():
+    lines = directives(script(job_number=3, dependency="1234"))
+    assert "--dependency=afterany:1234" in lines
+    assert "--job-name=sim_3" in lines
+
+
+def test_create_sbatch_script_keeps_its_interface():
+    # Callers pass the previous job ID as a string and expect numbered job names
+    rusty = load_submit_script("Rusty", "job_submit_rusty.py")
+    lines = directives(rusty.create_sbatch_script(3, "params.txt", 1, 2, "sim", "1234"))
+    assert "--dependency=afterany:1234" in lines
+    assert "--job-name=sim_3" in lines
+    assert "--job-name=sim" in directives(rusty.create_sbatch_script(None, "params.txt", 1, 2, "sim",
+                                                                     array=(1, 4)))
+
+
+def test_niagara_time_limit():
+    niagara = load_submit_script("Niagara", "job_submit_nia.py")
+    lines = directives(niagara.create_sbatch_script(2, "params.txt", 1, 2, "sim", "99", wall_time=23.5))
+    assert "--dependency=afterany:99" in lines
+    assert "--job-name=sim_2" in lines
+    assert "--time=23:30:00" in lines
+
+
+def test_checkpoint_signal():
+    content = script(job_number=1, checkpoint_lead=600)
+    lines = directives(content)
+    assert "--signal=B:USR1@600" in lines and "--requeue" in lines
+    assert "trap 'checkpoint USR1' USR1" in content
+    with pytest.raises(ValueError):
+        script(scheduler=PBS_TORQUE, job_number=1, checkpoint_lead=600)
+
+
+def test_checkpoint_requeues_on_term_only():
+    content = script(job_number=1, checkpoint_lead=600)
+    assert "trap 'checkpoint TERM; REQUEUE=1' TERM" in content
+
+
+def test_popeye_shares_the_rusty_script():
+    pop = load_submit_script("Rusty", "job_submit_pop.py")
+    content = pop.create_sbatch_script(1, "params.txt", 1, 2, "sim")
+    assert "-N2 -C cascadelake -p cca" in directives(content)
+    assert "cluster=Popeye node_type=cascadelake" in content
+    assert pop.get_cpu_info("skylake") == (48, "skylake")
+    rusty = load_submit_script("Rusty", "job_submit_rusty.py")
+    assert rusty.get_cpu_info("skylake") == (36, "ib-skylake")
@@ -0,0 +1,86 @@
+import os
+import subprocess
+
+import pytest
+
+from chain_ledger import ChainLedger, ENDED
+from job_status import JobStatusService, find_chain, summarize
+from schedulers import SLURM
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = ChainLedger(str(tmp_path / "ledger.db"))
+    yield ledger
+    ledger.close()
+
+
+@pytest.fixture
+def squeue(monkeypatch):
+    """
+    Replace SLURM.query with the states set on the returned object, counting the calls.
+    """
+    class Queue:
+        states = {}
+        calls = []
+
+    queue = Queue()
+    monkeypatch.setattr(SLURM, "query", lambda job_ids=None: queue.calls.append(job_ids) or dict(queue.states))
+    return queue
+
+
+def add_chain(ledger, run_dir, job_ids, job_name="sim"):
+    chain_id = ledger.get_chain(run_dir, job_name, "slurm")
+    for link, job_id in enumerate(job_ids, start=1):
+        ledger.record(chain_id, link, f"script {link}", f"{job_name}_job_{link}.sh", job_id)
+    return chain_id
+
+
+def test_summarize():
+    links = [{'state': ENDED}, {'state': 'RUNNING', 'job_id': "2"}, {'state': 'PENDING', 'job_id': "3"}]
+    summary = summarize({'id': 1, 'job_name': "sim"}, links)
+    assert summary['job_name'] == "sim" and summary['jobs'] == 3
+    assert (summary['running'], summary['pending'], summary['live']) == (1, 1, 2)
+    assert summary['current']['job_id'] == "2"
+    assert summary['live_jobs'] == ["2", "3"]
+    assert summarize({'id': 2}, [{'state': ENDED}])['current'] is None
+
+
+def test_find_chain():
+    summaries = [{'run_dir': "/runs/a/gizmo", 'created': 1.0},
+                 {'run_dir': "/runs/a/gizmo/nested", 'created': 0.0},
+                 {'run_dir': "/runs/b/gizmo", 'created': 2.0}]
+    # Jobs start GIZMO in the parent of the directory they were submitted from
+    assert find_chain(summaries, "/runs/a/output") is summaries[0]
+    assert find_chain(summaries, "/runs/a/gizmo/output") is summaries[1]
+    assert find_chain(summaries, "/runs/c/output") is None
+
+
+def test_service_shares_one_query(ledger, squeue):
+    add_chain(ledger, "/runs/a/gizmo", ["100", "101"])
+    add_chain(ledger, "/runs/b/gizmo", ["200"])
+    squeue.states = {"100": "RUNNING", "101": "PENDING"}
+    service = JobStatusService(ledger, ttl=60.0)
+    run_a = service.run_status(os.path.join("/runs/a", "output"))
+    assert (run_a['running'], run_a['pending']) == (1, 1)
+    assert service.run_status("/runs/b/output")['live'] == 0
+    assert len(squeue.calls) == 1 and sorted(squeue.calls[0]) == ["100", "101", "200"]
+
+    # Another consumer within the TTL reads the stored states
+    JobStatusService(ledger, ttl=60.0).summaries()
+    assert len(squeue.calls) == 1
+    # Ended links are not queried again
+    JobStatusService(ledger, ttl=0.0).summaries()
+    assert sorted(squeue.calls[-1]) == ["100", "101"]
+
+
+def test_service_keeps_states_when_the_query_fails(ledger, monkeypatch, capsys):
+    def fail(job_ids=None):
+        raise subprocess.CalledProcessError(1, "squeue")
+
+    add_chain(ledger, "/runs/a/gizmo", ["100"])
+    monkeypatch.setattr(SLURM, "query", fail)
+    service = JobStatusService(ledger, ttl=60.0)
+    assert service.run_status("/runs/a/output")['live'] == 1
+    assert "Error querying slurm" in capsys.readouterr().out
+    assert service.queries == 1
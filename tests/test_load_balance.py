@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from load_balance import find_decompositions, get_waiting, imbalance_factor, recommend, steps_since
+
+
+def history(steps=40, every=10, cost=2.0, growth=0.01, base_wait=0.0, multi_domains=None):
+    """
+    Run history with a decomposition every few steps and waiting time growing
+    linearly with the number of steps since the last one.
+    """
+    index = np.arange(steps)
+    domain = np.where(index % every == 0, cost, 0.0)
+    age = index % every
+    columns = {'Step': index, 'Simulation Time': 0.1 * index, 'domain': domain,
+               'treeimbal': base_wait + growth * age, 'hydimbal': np.zeros(steps)}
+    columns['total'] = 1.0 + domain + columns['treeimbal']
+    if multi_domains is not None:
+        columns['MultiDomains'] = np.full(steps, float(multi_domains))
+    return columns
+
+
+def test_get_waiting_and_imbalance_factor():
+    columns = history(steps=3, base_wait=0.5)
+    waiting, timers = get_waiting(columns)
+    assert sorted(timers) == ['hydimbal', 'treeimbal']
+    np.testing.assert_allclose(waiting, [0.5, 0.51, 0.52])
+    assert imbalance_factor(np.array([2.0]), np.array([1.0]))[0] == 2.0
+
+
+def test_decompositions_and_steps_since():
+    decompositions = find_decompositions(np.array([3.0, 0.0, 0.01, 2.5, 0.0]))
+    assert list(decompositions) == [True, False, False, True, False]
+    np.testing.assert_array_equal(steps_since(np.array([False, True, False, False, True])), [np.nan, 0, 1, 2, 0])
+    assert not find_decompositions(np.zeros(4)).any()
+
+
+def test_interval_follows_the_cost_and_growth():
+    advice = recommend(history(cost=2.0, growth=0.01), params={'TreeDomainUpdateFrequency': 0.05})
+    interval = advice['interval']
+    assert interval['decompositions'] == 4 and interval['interval'] == 10.0
+    assert interval['growth'] == pytest.approx(0.01)
+    # sqrt(2 * 2 / 0.01) = 20 steps, twice the current interval
+    assert interval['optimal'] == pytest.approx(20.0)
+    assert advice['TreeDomainUpdateFrequency'] == pytest.approx(0.1)
+
+
+def test_no_advice_with_few_decompositions():
+    advice = recommend(history(every=100), params={'TreeDomainUpdateFrequency': 0.05})
+    assert advice['interval'] is None and advice['TreeDomainUpdateFrequency'] is None
+
+
+def test_waiting_not_growing():
+    advice = recommend(history(growth=0.0), params={'TreeDomainUpdateFrequency': 0.2})
+    assert advice['interval']['optimal'] is None
+    assert advice['TreeDomainUpdateFrequency'] == pytest.approx(0.4)
+
+
+def test_multiple_domains():
+    advice = recommend(history(cost=0.1, base_wait=1.0, multi_domains=8))
+    assert advice['MultipleDomains'] == 16
+    advice = recommend(history(cost=20.0, growth=0.0, multi_domains=8))
+    assert advice['MultipleDomains'] == 4
+    assert recommend(history(cost=0.1, growth=0.0, multi_domains=8))['MultipleDomains'] is None
+
+
+def test_frequency_at_its_limit():
+    advice = recommend(history(growth=0.0), params={'TreeDomainUpdateFrequency': 0.6})
+    assert advice['TreeDomainUpdateFrequency'] is None
+    assert any("cannot be doubled" in note for note in advice['notes'])
+    advice = recommend(history(cost=2.0, growth=0.01), params={'TreeDomainUpdateFrequency': 1.0})
+    assert advice['TreeDomainUpdateFrequency'] is None
+    assert any("already at its limit" in note for note in advice['notes'])
@@ -0,0 +1,73 @@
+from log_readers import (BalanceTailReader, EnergyTailReader, InfoTailReader, MemoryTailReader, TimingsTailReader,
+                         get_log_store_dir, parse_key_values)
+
+
+def read(reader_class, tmp_path, text, detail=False):
+    path = tmp_path / "log.txt"
+    path.write_text(text)
+    return reader_class(str(path), detail).read_new()
+
+
+def test_parse_key_values():
+    assert parse_key_values(["Nf= 0000012345  max. nodes: 12", "Nf= 7"]) == {'Nf': 12345.0, 'max. nodes': 12.0}
+
+
+def test_timings(tmp_path):
+    text = ("Step= 1234  t= 0.0123  dt= 1.2e-06\n"
+            "Nf= 0000012345  total-Nf= 0012345678  ex-frac= 0 (0) iter= 1\n"
+            "work-load balance: 1.21 (1.35 1.1)   max=0.52 avg=0.43\n"
+            "particle-load balance: 1.02\n\n")
+    [record] = read(TimingsTailReader, tmp_path, text)
+    assert record['Step'] == 1234
+    assert record['Simulation Time'] == 0.0123
+    assert record['Nf'] == 12345
+    assert record['work-load balance'] == 1.21
+    assert record['particle-load balance'] == 1.02
+    assert record['Offset'] == 0
+
+
+def test_balance(tmp_path):
+    text = ("treewalk1 = 'a' / 'A'\n"
+            "domain    = 'd' / 'D'\n"
+            "Step=   1234  sec=     0.512  Nf= 0000012345  aaaAdddD\n"
+            "Step=   1235  sec=     0.600  Nf= 0000012345  aaaaaaaa\n")
+    records = read(BalanceTailReader, tmp_path, text, detail=True)
+    assert [record['Step'] for record in records] == [1234, 1235]
+    assert records[0]['sec'] == 0.512
+    assert records[0]['Imbalance Fraction'] == 0.25
+    assert records[0]['treewalk1 share'] == 0.5
+    assert records[1]['Imbalance Fraction'] == 0.0
+
+
+def test_info_with_time_bins(tmp_path):
+    text = ("Sync-Point 1234, Time: 0.0123, Redshift: 9.1, Systemstep: 1.2e-06, Dloga: 1.3e-06\n"
+            " X  bin=20          100          10     0.000001234567         1234 <\n"
+            "    bin=21          200          20     0.000002469135         1234\n"
+            "Total active:          100          10    Sum:        110\n\n"
+            "Sync-Point 1235, Time: 0.0124, Redshift: 9.0, Systemstep: 1.2e-06, Dloga: 1.3e-06\n\n")
+    first, second = read(InfoTailReader, tmp_path, text, detail=True)
+    assert first['Step'] == 1234 and first['Simulation Time'] == 0.0123 and first['Redshift'] == 9.1
+    assert first['Active'] == 110
+    assert (first['Occupied Bins'], first['Active Bins'], first['Lowest Active Bin']) == (2, 1, 20)
+    assert first['bin 21'] == 220
+    assert second['Step'] == 1235 and 'Active' not in second
+
+
+def test_energy(tmp_path):
+    values = [0.5] + [float(i) for i in range(1, 28)]
+    [record] = read(EnergyTailReader, tmp_path, " ".join(map(str, values)) + "\n")
+    assert record == {'Simulation Time': 0.5, 'EnergyInt': 1.0, 'EnergyPot': 2.0, 'EnergyKin': 3.0, 'Offset': 0}
+
+
+def test_get_log_store_dir():
+    assert get_log_store_dir("out/progress_store", "timings.txt") == "out/progress_store/timings"
+
+
+def test_memory(tmp_path):
+    text = ("Allocated 2000 MByte for particle storage.\n"
+            "unrelated line\n"
+            "MEMORY:  Largest Allocation = 1234.5 Mbyte  |  Largest Allocation Without Generic = 1100.2 Mbyte\n")
+    allocated, largest = read(MemoryTailReader, tmp_path, text)
+    assert allocated['Allocated'] == 2000
+    assert largest['Largest Allocation'] == 1234.5
+    assert largest['Largest Allocation Without Generic'] == 1100.2
@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+from metrics_exporter import format_openmetrics
+
+
+def handler(name, snapshot, job=None):
+    return SimpleNamespace(run_name=name, snapshot=snapshot, job=job)
+
+
+SNAPSHOT = {'step': 12, 'sim_time': 0.25, 'steps_per_hour': 360.0, 'sim_time_per_hour': 0.5,
+            'timers': {'total': 2.5, 'treegrav': 1.25}, 'last_update': 990.0}
+
+
+def test_format_openmetrics():
+    text = format_openmetrics([handler("run_a", SNAPSHOT), handler("run_b", None)], now=1000.0)
+    lines = text.splitlines()
+    assert lines[-1] == "# EOF"
+    assert 'gizmo_step{run="run_a"} 12' in lines
+    assert 'gizmo_simulation_time_per_hour{run="run_a"} 0.5' in lines
+    assert 'gizmo_step_timer_seconds{run="run_a",timer="treegrav"} 1.25' in lines
+    assert 'gizmo_last_update_age_seconds{run="run_a"} 10.000' in lines
+    assert "# TYPE gizmo_step gauge" in lines
+    # A run without a step yet only has the metric headers
+    assert 'run_b' not in text
+
+
+def test_rates_unknown_and_labels_escaped():
+    snapshot = dict(SNAPSHOT, steps_per_hour=None, sim_time_per_hour=None)
+    text = format_openmetrics([handler('run "x"', snapshot)], now=1000.0)
+    assert 'gizmo_step{run="run \\"x\\""} 12' in text
+    assert "gizmo_steps_per_hour{" not in text
+
+
+def test_job_metrics():
+    text = format_openmetrics([handler("run_a", None, job={'running': 1, 'pending': 3})], now=1000.0)
+    assert 'gizmo_job_running{run="run_a"} 1' in text
+    assert 'gizmo_jobs_queued{run="run_a"} 3' in text
+    assert "gizmo_step{" not in text
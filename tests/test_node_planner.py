@@ -0,0 +1,51 @@
+import pytest
+
+from node_planner import choose, fit_scaling, plan, predict_hours
+
+
+def test_fit_recovers_amdahl():
+    cores = [128, 256, 512, 1024]
+    model = fit_scaling(cores, [0.5 + 1000.0 / p for p in cores])
+    assert model['serial'] == pytest.approx(0.5)
+    assert model['parallel'] == pytest.approx(1000.0)
+    assert model['communication'] == pytest.approx(0.0, abs=1e-9)
+    assert model['residual'] < 1e-9
+    assert predict_hours(model, 2048) == pytest.approx(0.5 + 1000.0 / 2048)
+    # Twice the per-core speed halves the compute terms
+    assert predict_hours(model, 2048, speed=2.0) == pytest.approx((0.5 + 1000.0 / 2048) / 2)
+
+
+def test_fit_keeps_coefficients_non_negative():
+    # Runs getting slower with more cores only fit with a communication term
+    model = fit_scaling([128, 256, 512], [1.0, 1.2, 1.4])
+    assert all(model[term] >= 0 for term in ('serial', 'parallel', 'communication'))
+    assert model['communication'] > 0
+    assert fit_scaling([128], [1.0])['parallel'] >= 0
+
+
+def test_plan_and_choose():
+    # One node (128 cores) takes 1 + 1000 / 128 hours
+    model = {'serial': 1.0, 'parallel': 1000.0, 'communication': 0.0}
+    plans = plan(model, remaining=1.0, cluster="Rusty", node_types=["rome"], speeds={}, max_nodes=8,
+                 measured_max=256)
+    assert [p['cores'] for p in plans] == [128 * n for n in range(1, 9)]
+    assert plans[0]['efficiency'] == pytest.approx(1.0)
+    assert plans[0]['core_hours'] == pytest.approx(plans[0]['hours'] * 128)
+    assert [p['extrapolated'] for p in plans][:5] == [False, False, False, False, True]
+
+    fastest = choose(plans, efficiency=0.0)
+    assert fastest['nodes'] == 8
+    efficient = choose(plans, efficiency=0.7)
+    assert efficient['nodes'] == 4 and efficient['efficiency'] >= 0.7
+    # The cheapest plan within the deadline, the fastest within the budget
+    assert choose(plans, deadline=4.0)['nodes'] == 3
+    assert choose(plans, budget=plans[1]['core_hours'] + 1e-9)['nodes'] == 2
+    assert choose(plans, deadline=0.1) is None
+
+
+def test_plan_scales_by_core_speed():
+    model = {'serial': 0.0, 'parallel': 1000.0, 'communication': 0.0}
+    plans = plan(model, 1.0, "Rusty", ["rome", "genoa"], {'genoa': 2.0}, 1, 128)
+    rome, genoa = plans
+    assert genoa['hours'] == pytest.approx(1000.0 / 96 / 2.0)
+    assert rome['hours'] == pytest.approx(1000.0 / 128)
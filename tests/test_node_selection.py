@@ -0,0 +1,91 @@
+import pytest
+
+import node_selection
+from chain_ledger import ChainLedger
+from node_selection import (availability, cached_node_states, expected_wait, parse_speeds, rank_node_types,
+                            unavailable_reason)
+
+CPU_INFO = {'rome': (128, 'rome'), 'icelake': (64, 'icelake'), 'genoa': (192, 'genoa')}
+NODE_STATES = [
+    {'partition': 'cca', 'features': ['rome', 'ib'], 'state': 'idle', 'nodes': 1, 'cores': 128},
+    {'partition': 'cca', 'features': ['rome', 'ib'], 'state': 'allocated', 'nodes': 4, 'cores': 128},
+    {'partition': 'cca', 'features': ['icelake'], 'state': 'idle', 'nodes': 8, 'cores': 64},
+    {'partition': 'cca', 'features': ['genoa'], 'state': 'idle', 'nodes': 2, 'cores': 192},
+    {'partition': 'cca', 'features': ['genoa'], 'state': 'drained', 'nodes': 6, 'cores': 192},
+    {'partition': 'gpu', 'features': ['icelake'], 'state': 'idle', 'nodes': 50, 'cores': 64},
+]
+
+
+def test_availability():
+    assert availability(NODE_STATES, 'cca', 'rome') == {'idle': 1, 'busy': 4, 'total': 5}
+    assert availability(NODE_STATES, 'cca', 'genoa') == {'idle': 2, 'busy': 0, 'total': 8}
+
+
+def test_expected_wait():
+    counts = {'idle': 1, 'busy': 4, 'total': 5}
+    assert expected_wait(counts, 1) == 0.0
+    assert expected_wait(counts, 3, typical_job_hours=24) == pytest.approx(12.0)
+    assert expected_wait(counts, 6) is None
+
+
+def test_parse_speeds():
+    assert parse_speeds("genoa:1.3,skylake:0.8") == {'genoa': 1.3, 'skylake': 0.8}
+    assert parse_speeds(None) == {}
+
+
+def test_rank_node_types():
+    rows = rank_node_types(CPU_INFO, NODE_STATES, 'cca', 2, 10.0, 'rome')
+    # genoa starts now on its two idle nodes; rome waits for one of its four busy nodes;
+    # icelake starts now too but has half the cores per node of rome
+    assert [row['node_type'] for row in rows] == ['genoa', 'rome', 'icelake']
+    genoa, rome, icelake = rows
+    assert genoa['wait'] == 0.0 and genoa['run'] == pytest.approx(10.0 * 128 / 192)
+    assert rome['wait'] == pytest.approx(6.0) and rome['score'] == pytest.approx(16.0)
+    assert icelake['wait'] == 0.0 and icelake['run'] == pytest.approx(20.0)
+
+
+def test_rank_node_types_with_speeds_and_unavailable_nodes():
+    rows = rank_node_types(CPU_INFO, NODE_STATES, 'cca', 4, 10.0, 'rome', speeds={'rome': 1.0, 'icelake': 1.5})
+    by_type = {row['node_type']: row for row in rows}
+    assert by_type['icelake']['run'] == pytest.approx(10.0 * 128 / (64 * 1.5))
+    assert by_type['genoa']['score'] is None
+    assert rows[-1]['node_type'] == 'genoa'
+
+
+def test_cached_node_states(tmp_path):
+    class Scheduler:
+        calls = 0
+
+        def node_states(self):
+            self.calls += 1
+            return NODE_STATES
+
+    scheduler = Scheduler()
+    ledger = ChainLedger(str(tmp_path / "ledger.db"))
+    assert cached_node_states(ledger, scheduler=scheduler) == NODE_STATES
+    assert cached_node_states(ledger, scheduler=scheduler) == NODE_STATES
+    assert scheduler.calls == 1
+    cached_node_states(ledger, ttl=0, scheduler=scheduler)
+    assert scheduler.calls == 2
+    ledger.close()
+
+
+def test_unavailable_reason():
+    assert unavailable_reason({'idle': 2, 'busy': 0, 'total': 8}, 2) is None
+    assert "6 drained" in unavailable_reason({'idle': 2, 'busy': 0, 'total': 8}, 4)
+    assert unavailable_reason({'idle': 0, 'busy': 0, 'total': 0}, 1) == "no nodes of this type in the partition"
+
+
+def test_rank_node_types_gives_reasons():
+    rows = rank_node_types(CPU_INFO, NODE_STATES, 'cca', 2, 10.0, 'rome')
+    assert all(row['reason'] is None for row in rows)
+    rows = rank_node_types(CPU_INFO, NODE_STATES, 'cca', 4, 10.0, 'rome')
+    assert "drained" in {row['node_type']: row for row in rows}['genoa']['reason']
+
+
+def test_select_cpu_type_prints_the_reason(monkeypatch, capsys):
+    monkeypatch.setattr(node_selection, "cached_node_states", lambda ttl: NODE_STATES)
+    assert node_selection.select_cpu_type(CPU_INFO, 'cca', 16, 10.0, 'rome') == 'rome'
+    out = capsys.readouterr().out
+    assert "drained, down or otherwise unavailable" in out
+    assert "No node type of cca has 16 usable nodes" in out
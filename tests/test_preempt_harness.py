@@ -0,0 +1,8 @@
+from preempt_harness import run_harness
+
+
+def test_preempted_chain_requeues_and_restarts(tmp_path):
+    checks = run_harness(str(tmp_path))
+    assert checks
+    failed = [check for check, passed in checks if not passed]
+    assert failed == []
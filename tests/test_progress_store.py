@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pytest
+
+import track_job
+from progress_store import INDEX_FILE, ProgressStore
+from track_job import CPUTailReader, backfill_store
+
+
+def rows(first, count):
+    return [{'Step': step, 'Simulation Time': step * 0.5, 'total': 2.0, 'Offset': 100 * step}
+            for step in range(first, first + count)]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "store")
+    store = ProgressStore(path)
+    store.append(rows(0, 3))
+    store.flush({'inode': 7, 'offset': 300})
+    store.append(rows(3, 2))
+    store.flush({'inode': 7, 'offset': 500})
+
+    reopened = ProgressStore(path)
+    assert reopened.num_rows == 5
+    assert reopened.source_state == {'inode': 7, 'offset': 500}
+    assert reopened.load('Step').dtype == np.int64
+    np.testing.assert_array_equal(reopened.load('Step'), np.arange(5))
+    np.testing.assert_array_equal(reopened.load('Offset'), 100 * np.arange(5))
+    # Running sum of the "total" timer, carried over between flushes
+    np.testing.assert_allclose(reopened.load('Wall Time'), 2.0 * np.arange(1, 6))
+
+
+def test_new_columns(tmp_path):
+    store = ProgressStore(str(tmp_path / "store"))
+    store.append(rows(0, 2))
+    store.flush()
+    store.append([dict(rows(2, 1)[0], hydro=0.3)])
+    store.flush()
+    # Chunks written before a column appeared read as NaN
+    hydro = store.load('hydro')
+    assert np.isnan(hydro[:2]).all() and hydro[2] == 0.3
+
+
+def test_compact(tmp_path):
+    path = str(tmp_path / "store")
+    store = ProgressStore(path)
+    for first in range(0, 6, 2):
+        store.append(rows(first, 2))
+        store.flush()
+    assert len(store.index['chunks']) == 3
+    store.compact()
+    assert len(store.index['chunks']) == 1
+    np.testing.assert_array_equal(ProgressStore(path).load('Step'), np.arange(6))
+
+
+def test_backfill_resumes(tmp_path):
+    cpu_txt = tmp_path / "cpu.txt"
+    block = "Step {0}, Time: {0}.5, CPUs: 16\n                 diff   cumulative\ntotal  1.00  100.0%  1.00  100.0%\n\n"
+    cpu_txt.write_text("".join(block.format(step) for step in range(3)))
+    store = ProgressStore(str(tmp_path / "store"))
+    backfill_store(CPUTailReader(str(cpu_txt)), store)
+    with open(cpu_txt, 'a') as f:
+        f.write(block.format(3))
+    store = ProgressStore(str(tmp_path / "store"))
+    backfill_store(CPUTailReader(str(cpu_txt)), store)
+    np.testing.assert_array_equal(store.load('Step'), np.arange(4))
+
+
+def test_backfill_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(track_job, "BACKFILL_BATCH_BYTES", 64)
+    cpu_txt = tmp_path / "cpu.txt"
+    block = "Step {0}, Time: {0}.5, CPUs: 16\n                 diff   cumulative\ntotal  1.00  100.0%  1.00  100.0%\n\n"
+    cpu_txt.write_text("".join(block.format(step) for step in range(20)))
+    store = ProgressStore(str(tmp_path / "store"), chunk_rows=4)
+    backfill_store(CPUTailReader(str(cpu_txt)), store)
+    np.testing.assert_array_equal(ProgressStore(str(tmp_path / "store")).load('Step'), np.arange(20))
+
+
+def test_unflushed_rows(tmp_path):
+    store = ProgressStore(str(tmp_path / "store"))
+    store.append(rows(0, 2))
+    store.flush()
+    store.append(rows(2, 1))
+    assert store.pending == 1
+    np.testing.assert_array_equal(store.load('Step'), [0, 1, 2])
+
+
+def test_iter_chunks(tmp_path):
+    store = ProgressStore(str(tmp_path / "store"))
+    store.append(rows(0, 2))
+    store.flush()
+    store.append(rows(2, 1))
+    chunks = list(store.iter_chunks(['Step', 'hydro']))
+    assert [list(chunk['Step']) for chunk in chunks] == [[0, 1], [2]]
+    assert np.isnan(chunks[0]['hydro']).all()
+
+
+def test_read_only(tmp_path):
+    path = str(tmp_path / "store")
+    store = ProgressStore(path, create=False)
+    assert store.num_rows == 0
+    assert len(store.load('Step')) == 0
+    store.append(rows(0, 1))
+    with pytest.raises(ValueError):
+        store.flush()
+    with pytest.raises(ValueError):
+        store.compact()
+    assert not os.path.exists(path)
+
+
+def test_created_on_first_rows(tmp_path):
+    path = str(tmp_path / "store")
+    store = ProgressStore(path)
+    store.flush({'inode': 1, 'offset': 0})
+    assert not os.path.exists(path)
+    store.append(rows(0, 1))
+    store.flush()
+    assert os.path.exists(os.path.join(path, INDEX_FILE))
@@ -0,0 +1,76 @@
+import json
+import time
+
+import pytest
+
+from chain_ledger import ChainLedger
+from queue_wait import load_options, rank_options, time_to_solution, typical_wait
+from schedulers import SLURM
+
+OPTION = {'name': 'rusty-8', 'cluster': 'Rusty', 'scheduler': 'slurm', 'partition': 'cca', 'nodes': 8,
+          'wall_time': 24, 'run_hours': 60}
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = ChainLedger(str(tmp_path / "ledger.db"))
+    yield ledger
+    ledger.close()
+
+
+def past_jobs(partition, nodes, waits):
+    now = time.time()
+    return [{'job_id': f"{partition}{nodes}{i}", 'partition': partition, 'nodes': nodes,
+             'submitted': now - 3600 * (i + 1), 'wait': wait, 'run': 1.0} for i, wait in enumerate(waits)]
+
+
+def test_time_to_solution():
+    # Three jobs: the first waits the estimate, the two later ones the median
+    assert time_to_solution(OPTION, 2.0, 5.0) == (3, 12.0, 72.0)
+    assert time_to_solution(OPTION, None, 5.0) == (3, 15.0, 75.0)
+    assert time_to_solution(OPTION, 2.0, None) == (3, 6.0, 66.0)
+    assert time_to_solution(OPTION, None, None) == (3, None, None)
+    assert time_to_solution(dict(OPTION, run_hours=10), 1.0, 5.0) == (1, 1.0, 11.0)
+
+
+def test_typical_wait(ledger):
+    ledger.record_waits('Rusty', past_jobs('cca', 8, [1.0, 2.0, 9.0]) + past_jobs('cca', 16, [4.0])
+                        + past_jobs('cca', 64, [50.0]) + past_jobs('gen', 8, [30.0]))
+    # Jobs of the same partition with between half and twice the nodes
+    assert typical_wait(ledger, OPTION) == (3.0, 4)
+
+
+def test_load_options(tmp_path):
+    path = tmp_path / "options.json"
+    path.write_text(json.dumps([OPTION]))
+    assert load_options(str(path)) == [OPTION]
+    path.write_text(json.dumps([dict(OPTION, scheduler='pbs')]))
+    with pytest.raises(ValueError, match="cores_per_node"):
+        load_options(str(path))
+    option = dict(OPTION)
+    del option['run_hours']
+    path.write_text(json.dumps([option]))
+    with pytest.raises(ValueError, match="run_hours"):
+        load_options(str(path))
+
+
+def test_rank_options(ledger, monkeypatch):
+    starts = {'cca': 1.0, 'gen': 20.0}
+    calls = []
+
+    def test_start(nodes, partition, wall_time, constraint=None, cores_per_node=None, prefix=None):
+        calls.append(partition)
+        return starts[partition]
+
+    monkeypatch.setattr(SLURM, "test_start", test_start)
+    monkeypatch.setattr(SLURM, "wait_history", lambda since, prefix=None: past_jobs('cca', 8, [3.0]))
+    options = [dict(OPTION, name='slow', partition='gen'), OPTION]
+    ranking = rank_options(ledger, options)
+    assert [entry['option']['name'] for entry in ranking] == ['rusty-8', 'slow']
+    assert ranking[0]['wait'] == 1.0 + 2 * 3.0 and ranking[0]['total'] == 67.0
+    # No history of the gen partition, the estimate stands in for the later jobs
+    assert ranking[1]['median'] is None and ranking[1]['wait'] == 60.0
+
+    # Start estimates and the history are reused within their TTL
+    rank_options(ledger, options)
+    assert calls == ['gen', 'cca']
@@ -0,0 +1,43 @@
+import math
+
+import numpy as np
+import pytest
+
+from restart_cadence import find_failures, lost_fraction, measure_restart_cost, optimal_interval
+
+
+def test_optimal_interval():
+    daly, young = optimal_interval(0.1, 100.0)
+    assert young == pytest.approx(math.sqrt(2 * 0.1 * 100.0))
+    ratio = 0.1 / 200.0
+    assert daly == pytest.approx(young * (1 + math.sqrt(ratio) / 3 + ratio / 9) - 0.1)
+    # Daly's interval stays close to Young's for cheap restarts
+    assert abs(daly - young) / young < 0.05
+    # Restarts costing more than twice the MTBF: write once per MTBF
+    assert optimal_interval(300.0, 100.0)[0] == 100.0
+
+
+def test_optimal_interval_minimizes_the_loss():
+    daly, _ = optimal_interval(0.1, 100.0)
+    loss = lost_fraction(daly, 0.1, 100.0)
+    assert loss < lost_fraction(0.5 * daly, 0.1, 100.0)
+    assert loss < lost_fraction(2 * daly, 0.1, 100.0)
+
+
+def test_find_failures():
+    # The job ending after step 5 wrote no restart files, the next one restarted at step 3
+    steps = np.array([1, 2, 3, 4, 5, 3, 4, 5, 6])
+    wall_time = np.arange(1, 10) * 10.0
+    [(index, redone)] = find_failures(steps, wall_time)
+    assert index == 5
+    # Steps 3 to 5 were redone: from the end of step 2 to the end of step 5
+    assert redone == pytest.approx(50.0 - 20.0)
+    assert find_failures(np.arange(5), np.arange(5) * 10.0) == []
+
+
+def test_measure_restart_cost():
+    io_time = np.full(100, 0.5)
+    io_time[[20, 60]] = [30.5, 40.5]
+    assert measure_restart_cost(io_time) == pytest.approx(35.0)
+    assert measure_restart_cost(np.full(10, 0.5)) is None
+    assert measure_restart_cost(np.array([np.nan])) is None
@@ -0,0 +1,68 @@
+import subprocess
+
+import pytest
+
+import schedulers
+from schedulers import PBS_TORQUE, SLURM, parse_qstat_full
+
+QSTAT = """Job Id: 1234.server.cluster
+    Job_Name = sim_1
+    Job_Owner = me@login1
+    job_state = R
+    Resource_List.walltime = 24:0
+    0:00
+
+Job Id: 1235[2].server.cluster
+    Job_Name = sim
+    Job_Owner = other@login1
+    job_state = Q
+"""
+
+
+def fake_run(monkeypatch, stdout, returncode=0, stderr=""):
+    calls = []
+
+    def run(command, **kwargs):
+        calls.append(command)
+        return subprocess.CompletedProcess(command, returncode, stdout=stdout, stderr=stderr)
+
+    monkeypatch.setattr(schedulers.subprocess, "run", run)
+    return calls
+
+
+def test_slurm_query_expands_pending_arrays(monkeypatch):
+    calls = fake_run(monkeypatch, "100 RUNNING\n101_[3-5,7%1] PENDING\n101_2 RUNNING\n")
+    states = SLURM.query(["101", "100", "100"])
+    assert calls[0][-1] == "--jobs=100,101"
+    assert states == {"100": "RUNNING", "101_2": "RUNNING", "101_3": "PENDING", "101_4": "PENDING",
+                      "101_5": "PENDING", "101_7": "PENDING"}
+    assert SLURM.query([]) == {}
+
+
+def test_slurm_query_of_finished_jobs(monkeypatch):
+    fake_run(monkeypatch, "", returncode=1, stderr="slurm_load_jobs error: Invalid job id specified")
+    assert SLURM.query(["100"]) == {}
+    fake_run(monkeypatch, "", returncode=1, stderr="slurm_load_jobs error: Unable to contact slurm controller")
+    with pytest.raises(subprocess.CalledProcessError):
+        SLURM.query(["100"])
+
+
+def test_parse_qstat_full():
+    first, second = parse_qstat_full(QSTAT)
+    assert first['Job Id'] == "1234.server.cluster"
+    assert first['Resource_List.walltime'] == "24:00:00"
+    assert second['job_state'] == "Q"
+
+
+def test_pbs_query(monkeypatch):
+    monkeypatch.setenv("USER", "me")
+    fake_run(monkeypatch, QSTAT)
+    assert PBS_TORQUE.query(["1234.server", "1235[].server"]) == {"1234": "RUNNING", "1235[2]": "PENDING"}
+    # All of the user's jobs
+    assert PBS_TORQUE.query() == {"1234": "RUNNING"}
+
+
+def test_job_ids():
+    assert SLURM.array_task("100", 3) == "100_3"
+    assert PBS_TORQUE.array_task("1235[].server", 3) == "1235[3]"
+    assert PBS_TORQUE.normalize("1234.server.cluster") == "1234"
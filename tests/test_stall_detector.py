@@ -0,0 +1,122 @@
+import subprocess
+
+import stall_detector
+from stall_detector import AlertHooks, SHORT_WINDOW_STEPS, StallDetector
+
+
+def steps(count, dt, first_time=0.0, seconds=1.0):
+    return [{'Simulation Time': first_time + dt * i, 'total': seconds} for i in range(count)]
+
+
+def test_stall_uses_the_minimum_before_steps():
+    detector = StallDetector(stall_factor=20.0, stall_min=600.0, last_step_time=0.0)
+    assert detector.check(now=500.0) == []
+    [(kind, message)] = detector.check(now=700.0)
+    assert kind == "stall" and "limit 600 s" in message
+
+
+def test_stall_limit_scales_with_the_step_time():
+    detector = StallDetector(stall_factor=20.0, stall_min=60.0)
+    detector.add_steps(steps(10, 0.1, seconds=10.0), now=1000.0)
+    assert detector.typical_step_time() == 10.0
+    assert detector.check(now=1150.0) == []
+    assert [kind for kind, _ in detector.check(now=1250.0)] == ["stall"]
+
+
+def test_alert_fires_once_and_rearms():
+    detector = StallDetector(stall_min=100.0, last_step_time=0.0)
+    assert len(detector.check(now=200.0)) == 1
+    assert detector.check(now=300.0) == []
+    detector.add_steps(steps(1, 0.1), now=310.0)
+    assert detector.check(now=320.0) == []
+    assert len(detector.check(now=500.0)) == 1
+
+
+def test_collapse():
+    detector = StallDetector(collapse=0.1, stall_min=1e9)
+    detector.add_steps(steps(3 * SHORT_WINDOW_STEPS, 1e-3), now=0.0)
+    assert detector.check(now=1.0) == []
+    last = 3 * SHORT_WINDOW_STEPS * 1e-3
+    detector.add_steps(steps(SHORT_WINDOW_STEPS, 1e-6, first_time=last), now=2.0)
+    [(kind, message)] = detector.check(now=3.0)
+    assert kind == "collapse" and "per step" in message
+
+
+def test_collapse_per_compute_hour():
+    detector = StallDetector(collapse=0.1, stall_min=1e9)
+    detector.add_steps(steps(3 * SHORT_WINDOW_STEPS, 1e-3, seconds=1.0), now=0.0)
+    last = 3 * SHORT_WINDOW_STEPS * 1e-3
+    # Same advance per step, but every step takes far longer
+    detector.add_steps(steps(SHORT_WINDOW_STEPS, 1e-3, first_time=last, seconds=100.0), now=1.0)
+    [(kind, message)] = detector.check(now=2.0)
+    assert kind == "collapse" and "compute hour" in message
+
+
+def test_hooks_flag_file_and_command(tmp_path, monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr(stall_detector.subprocess, "run", lambda command, **kwargs: calls.append((command, kwargs)))
+    hooks = AlertHooks(command="notify", flag_file="STALLED")
+    hooks.run("run_a", str(tmp_path), "stall", "no new step")
+    assert "ALERT [run_a] stall: no new step" in capsys.readouterr().out
+    assert (tmp_path / "STALLED").read_text().endswith("stall: no new step\n")
+    [(command, kwargs)] = calls
+    assert command == "notify"
+    assert kwargs['env']['GIZMO_RUN'] == "run_a" and kwargs['env']['GIZMO_ALERT'] == "stall"
+
+
+def test_hooks_report_a_failing_command(tmp_path, capsys):
+    AlertHooks(command="exit 3").run("run_a", str(tmp_path), "stall", "no new step")
+    assert "Error running alert command" in capsys.readouterr().out
+
+
+def fake_queue(monkeypatch, listing):
+    """
+    Replace squeue (listing "<job id> <job name>" lines) and scancel; returns the list of calls.
+    """
+    calls = []
+
+    def run(command, **kwargs):
+        calls.append(command)
+        return subprocess.CompletedProcess(command, 0, stdout=listing if command[0] == "squeue" else "")
+
+    monkeypatch.setattr(stall_detector.subprocess, "run", run)
+    return calls
+
+
+def test_cancel_chain_by_name(monkeypatch):
+    calls = fake_queue(monkeypatch, "100 sim_1\n101 sim_2\n102 sim_chain3\n103 sim_other\n104 simulation_1\n")
+    stall_detector.cancel_chain("sim")
+    assert calls[-1] == ["scancel", "100", "101", "102"]
+
+
+def test_stall_clock_held_while_queued():
+    detector = StallDetector(stall_min=100.0, last_step_time=0.0)
+    assert detector.check(now=500.0, queued=True) == []
+    assert detector.check(now=550.0) == []
+    assert len(detector.check(now=650.0)) == 1
+
+
+def test_cancel_chain_includes_arrays(monkeypatch):
+    calls = fake_queue(monkeypatch, "102_[3-5%1] sim\n102_2 sim\n105 sim_1\n")
+    stall_detector.cancel_chain("sim")
+    assert calls[-1] == ["scancel", "102", "105"]
+
+
+def test_ledger_cancel_uses_the_recorded_jobs(monkeypatch):
+    calls = fake_queue(monkeypatch, "100 sim_1\n200 sim_1\n")
+    job = {'job_name': "sim", 'scheduler': "pbs", 'live_jobs': ["1234[2]", "1235"]}
+    AlertHooks(scancel_name="ledger").run("run_a", ".", "stall", "no new step", job)
+    # Only the chain's own jobs, with its scheduler; no listing by name
+    assert calls == [["qdel", "1234[2]", "1235"]]
+    AlertHooks(scancel_name="ledger").run("run_a", ".", "stall", "no new step", dict(job, scheduler="slurm"))
+    assert calls[-1] == ["scancel", "1234[2]", "1235"]
+
+
+def test_ledger_cancel_without_a_chain(monkeypatch, capsys):
+    calls = fake_queue(monkeypatch, "")
+    AlertHooks(scancel_name="ledger").run("run_a", ".", "stall", "no new step", None)
+    AlertHooks(scancel_name="ledger").run("run_a", ".", "stall", "no new step",
+                                          {'job_name': "sim", 'scheduler': "slurm", 'live_jobs': []})
+    assert calls == []
+    out = capsys.readouterr().out
+    assert "nothing cancelled" in out and "No live jobs" in out
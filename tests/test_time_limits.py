@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import REPO
+from time_limits import GIZMO_STOP_FRACTION, format_wall_time, sync_time_limits, time_limit_params, update_params
+
+
+def test_format_wall_time():
+    assert format_wall_time(23.5) == "23:30:00"
+    assert format_wall_time(0.25) == "00:15:00"
+    assert format_wall_time(100) == "100:00:00"
+
+
+def test_time_limit_params():
+    params = time_limit_params(24, 30, restart_interval=2.5)
+    # GIZMO stops at GIZMO_STOP_FRACTION of TimeLimitCPU, 30 minutes before the wall time
+    assert params['TimeLimitCPU'] == int((24 * 3600 - 1800) / GIZMO_STOP_FRACTION)
+    assert params['CpuTimeBetRestartFile'] == 9000
+    assert 'CpuTimeBetRestartFile' not in time_limit_params(24, 30)
+    with pytest.raises(ValueError):
+        time_limit_params(0.5, 30)
+    with pytest.raises(ValueError):
+        time_limit_params(24, 30, restart_interval=0)
+
+
+def test_update_params_keeps_comments(tmp_path):
+    param_file = tmp_path / "params.txt"
+    param_file.write_text("TimeLimitCPU    86400   % one day\nTimeMax 1.0\nResubmitOn 0")
+    changes = update_params(str(param_file), {'TimeLimitCPU': 1000, 'TimeMax': "1.0", 'CpuTimeBetRestartFile': 7200})
+    assert changes == [('TimeLimitCPU', "86400", "1000"), ('CpuTimeBetRestartFile', None, "7200")]
+    lines = param_file.read_text().splitlines()
+    assert lines[0].split() == ["TimeLimitCPU", "1000", "%", "one", "day"]
+    assert lines[2] == "ResubmitOn 0"
+    assert lines[3].split() == ["CpuTimeBetRestartFile", "7200"]
+
+
+def test_sync_time_limits(tmp_path, capsys):
+    param_file = tmp_path / "params.txt"
+    param_file.write_text("TimeLimitCPU 86400\n")
+    sync_time_limits(str(param_file), 24, 30)
+    assert "TimeLimitCPU 86400 ->" in capsys.readouterr().out
+    sync_time_limits(str(param_file), 24, 30)
+    assert "already match" in capsys.readouterr().out
+    with pytest.raises(ValueError):
+        sync_time_limits(str(param_file), None, 30)
+
+
+@pytest.mark.parametrize("script", ["job_submit_rusty.py", "job_submit_pop.py"])
+def test_submit_scripts_need_a_wall_time_to_sync(script, tmp_path):
+    path = os.path.join(REPO, "setup_scripts", "system_setup_scripts", "Rusty", script)
+    result = subprocess.run([sys.executable, path, "--sync-time-limits", "--job-name", "sim"], cwd=str(tmp_path),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode != 0
+    assert "--sync-time-limits needs --wall-time" in result.stderr
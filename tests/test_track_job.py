@@ -0,0 +1,276 @@
+import csv
+import os
+import types
+
+import pytest
+
+import track_job
+from progress_store import ProgressStore
+from track_job import (CPUHandler, CPUTailReader, choose_backend, get_run_name, get_store_dir, get_timer_tree,
+                       parse_step_block, parse_timer_line, resolve_output_dirs)
+
+BLOCK = [
+    "Step 12, Time: 0.0125, CPUs: 128, MultiDomains: 8, HighestActiveTimeBin: 21",
+    "                          diff               cumulative",
+    "total                       1.50  100.0%      120.00  100.0%",
+    "  treegrav                  0.90   60.0%       70.00   58.3%",
+    "    treebuild               0.10    6.7%        8.69    7.2%",
+    "  domain                    0.60   40.0%       50.00   41.7%",
+]
+
+
+def step_text(step, total=1.0):
+    """
+    One "Step" block of cpu.txt, ending with the blank line.
+    """
+    return (f"Step {step}, Time: {0.5 * (step + 1)}, CPUs: 16, MultiDomains: 8, HighestActiveTimeBin: 20\n"
+            "                          diff               cumulative\n"
+            f"total                     {total:6.2f}  100.0%      {total * (step + 1):8.2f}  100.0%\n"
+            f"  treegrav                {total / 2:6.2f}   50.0%      {total * (step + 1) / 2:8.2f}   50.0%\n\n")
+
+
+def test_parse_step_block():
+    data = parse_step_block(BLOCK)
+    assert data['Step'] == 12
+    assert data['Simulation Time'] == 0.0125
+    assert data['CPUs'] == 128
+    assert data['HighestActiveTimeBin'] == 21
+    assert data['total'] == 1.5
+    assert data['treebuild'] == 0.1
+
+
+def test_tail_reader_reports_only_completed_steps(tmp_path):
+    path = tmp_path / "cpu.txt"
+    second = step_text(1)
+    # The second block is still being written
+    path.write_text(step_text(0) + second[:len(second) // 2])
+    reader = CPUTailReader(str(path))
+    assert [block['Step'] for block in reader.read_new()] == [0]
+
+    with open(path, 'a') as f:
+        f.write(second[len(second) // 2:])
+    assert [block['Step'] for block in reader.read_new()] == [1]
+    assert reader.read_new() == []
+
+
+def test_tail_reader_seek_end(tmp_path):
+    path = tmp_path / "cpu.txt"
+    path.write_text(step_text(0) + step_text(1))
+    reader = CPUTailReader(str(path))
+    reader.seek_end()
+    assert reader.read_new() == []
+    with open(path, 'a') as f:
+        f.write(step_text(2))
+    assert [block['Step'] for block in reader.read_new()] == [2]
+
+
+def test_tail_reader_restarts_on_truncated_file(tmp_path):
+    path = tmp_path / "cpu.txt"
+    path.write_text("".join(step_text(step) for step in range(4)))
+    reader = CPUTailReader(str(path))
+    reader.read_new()
+
+    path.write_text(step_text(0) + step_text(1))
+    assert [block['Step'] for block in reader.read_new()] == [0, 1]
+
+
+def test_missing_file(tmp_path):
+    assert CPUTailReader(str(tmp_path / "cpu.txt")).read_new() == []
+
+
+def test_tail_reader_resumes_from_state(tmp_path):
+    path = tmp_path / "cpu.txt"
+    second = step_text(1)
+    path.write_text(step_text(0) + second[:10])
+    reader = CPUTailReader(str(path))
+    assert len(reader.read_new()) == 1
+    # The state points at the start of the unfinished block
+    state = reader.state()
+    assert state['offset'] == len(step_text(0))
+
+    with open(path, 'a') as f:
+        f.write(second[10:] + step_text(2))
+    resumed = CPUTailReader(str(path))
+    resumed.resume(state)
+    assert [block['Step'] for block in resumed.read_new()] == [1, 2]
+
+
+def test_resolve_output_dirs(tmp_path, capsys):
+    for name in ("MHD_core64", "MHD_core128", "other"):
+        (tmp_path / name / "output").mkdir(parents=True)
+    manifest = tmp_path / "runs.txt"
+    manifest.write_text("# sweep\n\nother/output\nmissing/output\n")
+    out_dirs = resolve_output_dirs([str(tmp_path / "MHD_*" / "output"), str(tmp_path / "MHD_core64" / "output")],
+                                   str(manifest))
+    assert out_dirs == [str(tmp_path / "MHD_core128" / "output") + "/", str(tmp_path / "MHD_core64" / "output") + "/",
+                        str(tmp_path / "other" / "output") + "/"]
+    assert "missing" in capsys.readouterr().out
+
+
+def test_get_run_name():
+    assert get_run_name("/runs/MHD_core64/output/") == "MHD_core64"
+    assert get_run_name("/runs/MHD_core64/snapshots") == "snapshots"
+
+
+def test_get_store_dir():
+    assert get_store_dir("/runs/a/output/", "<out_dir>/progress_store/") == "/runs/a/output/progress_store/"
+    assert get_store_dir("/runs/a/output/", "/stores/a") == "/stores/a"
+    assert get_store_dir("/runs/a/output/", None) is None
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(track_job, "time", types.SimpleNamespace(monotonic=clock, time=lambda: clock.now,
+                                                                 sleep=lambda seconds: None))
+    return clock
+
+
+def modified(handler, tmp_path):
+    handler.on_modified(types.SimpleNamespace(src_path=str(tmp_path / "cpu.txt")))
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_events_are_coalesced(tmp_path, clock):
+    cpu_txt = tmp_path / "cpu.txt"
+    cpu_txt.write_text("")
+    handler = CPUHandler(str(tmp_path / "progress.csv"), str(cpu_txt), debounce=0.5, flush_rows=1)
+    with open(cpu_txt, 'a') as f:
+        f.write(step_text(0))
+    modified(handler, tmp_path)
+    clock.now += 0.2
+    handler.poll()
+    assert not os.path.exists(tmp_path / "progress.csv")
+
+    clock.now += 0.5
+    handler.poll()
+    assert [row['Step'] for row in read_csv(tmp_path / "progress.csv")] == ["0"]
+
+
+def test_steady_events_are_processed(tmp_path, clock):
+    cpu_txt = tmp_path / "cpu.txt"
+    cpu_txt.write_text("")
+    handler = CPUHandler(str(tmp_path / "progress.csv"), str(cpu_txt), debounce=0.5, flush_rows=1)
+    with open(cpu_txt, 'a') as f:
+        f.write(step_text(0))
+    # Events keep arriving within the debounce window
+    for _ in range(track_job.MAX_DEBOUNCE_WINDOWS * 2 + 1):
+        modified(handler, tmp_path)
+        handler.poll()
+        clock.now += 0.25
+    assert len(read_csv(tmp_path / "progress.csv")) == 1
+
+
+def test_rows_are_written_in_batches(tmp_path, clock):
+    cpu_txt = tmp_path / "cpu.txt"
+    cpu_txt.write_text("")
+    handler = CPUHandler(str(tmp_path / "progress.csv"), str(cpu_txt), debounce=0.0, flush_interval=30.0,
+                         flush_rows=3)
+    for step in range(2):
+        with open(cpu_txt, 'a') as f:
+            f.write(step_text(step))
+        modified(handler, tmp_path)
+        handler.poll()
+    assert not os.path.exists(tmp_path / "progress.csv")
+
+    # The flush interval passes
+    clock.now += 31.0
+    handler.poll()
+    assert len(read_csv(tmp_path / "progress.csv")) == 2
+
+    for step in range(2, 5):
+        with open(cpu_txt, 'a') as f:
+            f.write(step_text(step))
+    modified(handler, tmp_path)
+    handler.poll()
+    assert [row['Step'] for row in read_csv(tmp_path / "progress.csv")] == ["0", "1", "2", "3", "4"]
+
+
+def test_polling_interval_adapts(tmp_path, clock):
+    cpu_txt = tmp_path / "cpu.txt"
+    cpu_txt.write_text("")
+    handler = CPUHandler(str(tmp_path / "progress.csv"), str(cpu_txt), debounce=0.0, flush_rows=1)
+    handler.enable_polling(1.0, 4.0)
+    # An idle file is checked less and less often, up to the longest interval
+    for _ in range(5):
+        handler.check_file()
+        clock.now += handler.poll_interval
+    assert handler.poll_interval == 4.0
+    # Nothing is checked before the interval has passed
+    with open(cpu_txt, 'a') as f:
+        f.write(step_text(0))
+    clock.now -= 1.0
+    handler.check_file()
+    handler.poll()
+    assert not os.path.exists(tmp_path / "progress.csv")
+
+    clock.now += 1.0
+    handler.check_file()
+    assert handler.poll_interval == 2.0
+    handler.poll()
+    assert len(read_csv(tmp_path / "progress.csv")) == 1
+
+
+@pytest.mark.parametrize("fs_type, backend", [("lustre", "poll"), ("gpfs", "poll"), ("fuse.sshfs", "poll"),
+                                              ("ext4", "inotify"), (None, "inotify")])
+def test_choose_backend(monkeypatch, fs_type, backend):
+    monkeypatch.setattr(track_job, "get_filesystem_type", lambda path: fs_type)
+    assert choose_backend("/scratch/run/output/", "auto") == backend
+    assert choose_backend("/scratch/run/output/", "poll") == "poll"
+
+
+def test_parse_timer_line():
+    timer = parse_timer_line("    treebuild             0.10    6.7%      8.69    7.2%")
+    assert timer == {'name': 'treebuild', 'indent': 4, 'diff': 0.10, 'diff_percent': 6.7,
+                     'cumulative': 8.69, 'cumulative_percent': 7.2}
+
+
+@pytest.mark.parametrize("line", ["", "                          diff               cumulative",
+                                  "total  a  b  c  d"])
+def test_parse_timer_line_skips_other_lines(line):
+    assert parse_timer_line(line) is None
+
+
+def test_parse_step_block_detail():
+    assert "treebuild cumulative" not in parse_step_block(BLOCK)
+    data = parse_step_block(BLOCK, detail=True)
+    assert data['domain %'] == 40.0
+    assert data['domain cumulative'] == 50.0
+    assert data['domain cumulative %'] == 41.7
+
+
+def test_get_timer_tree():
+    assert get_timer_tree(BLOCK) == {'total': None, 'treegrav': 'total', 'treebuild': 'treegrav',
+                                     'domain': 'total'}
+
+
+def test_tail_reader_offsets(tmp_path):
+    path = tmp_path / "cpu.txt"
+    path.write_text(step_text(0) + step_text(1))
+    blocks = CPUTailReader(str(path)).read_new()
+    assert [block['Offset'] for block in blocks] == [0, len(step_text(0))]
+
+
+def test_real_world_time_stays_out_of_the_store(tmp_path):
+    cpu_txt = tmp_path / "cpu.txt"
+    cpu_txt.write_text("")
+    store = ProgressStore(str(tmp_path / "progress_store"))
+    handler = CPUHandler(str(tmp_path / "progress.csv"), str(cpu_txt), store=store, flush_rows=1)
+    with open(cpu_txt, 'a') as f:
+        f.write(step_text(0))
+    handler.process_new_steps()
+    handler.flush()
+    assert 'Real World Time' not in ProgressStore(str(tmp_path / "progress_store")).columns
+    assert read_csv(tmp_path / "progress.csv")[0]['Real World Time']